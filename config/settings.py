@@ -683,11 +683,90 @@ CSRF_FAILURE_VIEW = 'stockdiary.views.csrf_failure_view'
 EDINET_API_SETTINGS = {
     'API_KEY': os.getenv('EDINET_API_KEY', ''),  # 環境変数から取得
     'BASE_URL': 'https://api.edinet-fsa.go.jp/api/v2',
-    'RATE_LIMIT_DELAY': 2,  # リクエスト間隔（秒）
+    'RATE_LIMIT_DELAY': 2,  # リクエスト間隔（秒）。プロセス内の全クライアント・スレッドで共有
+    'RATE_LIMIT_BURST': 1,  # 間隔を空けずに連続で送れる最大リクエスト数
     'TIMEOUT': 120,         # タイムアウト（秒）
     'USER_AGENT': 'EarningsAnalysisBot/1.0 (https://kabu-log.net)',
 }
 
+# 開示通知: 同じ回に複数銘柄の開示があったユーザーへは1通にまとめる
+DISCLOSURE_NOTIFICATION_DIGEST = os.getenv('DISCLOSURE_NOTIFICATION_DIGEST', 'False') == 'True'
+
+# EDINET 書類ファイル（XBRL ZIP・PDF）のローカルアーカイブ
+# 同じ書類を分析・感情分析・パネル表示のたびに再ダウンロードしないよう、
+# (doc_id, 書類タイプ) 単位で gzip 圧縮して保存する。合計サイズが MAX_BYTES を
+# 超えたら最終アクセスの古いものから削除する。
+EDINET_ARCHIVE_SETTINGS = {
+    'ROOT': os.getenv('EDINET_ARCHIVE_DIR', str(BASE_DIR / 'cache' / 'edinet_archive')),
+    'MAX_BYTES': int(os.getenv('EDINET_ARCHIVE_MAX_BYTES', str(2 * 1024 ** 3))),
+}
+
+# 感情分析結果キャッシュ（earnings_analysis/services/sentiment_cache.py）
+# 本文・感情辞書・分析設定のハッシュをキーに分析結果を保存し、同じ本文の再分析を省く。
+# 辞書を編集するとキーが変わるため明示的な削除は不要。合計サイズが MAX_BYTES を
+# 超えたら最終アクセスの古いものから削除する。
+SENTIMENT_RESULT_CACHE_SETTINGS = {
+    'ENABLED': os.getenv('SENTIMENT_RESULT_CACHE_ENABLED', 'True') == 'True',
+    'ROOT': os.getenv('SENTIMENT_RESULT_CACHE_DIR', str(BASE_DIR / 'cache' / 'sentiment_results')),
+    'MAX_BYTES': int(os.getenv('SENTIMENT_RESULT_CACHE_MAX_BYTES', str(256 * 1024 ** 2))),
+}
+
+# Gemini 呼び出しの共通ゲートウェイ（earnings_analysis/services/llm_gateway.py）
+# (モデル, プロンプト, 生成設定) のハッシュをキーに応答を CACHE_TTL_SECONDS の間保存し、
+# 同じプロンプトの同時呼び出しは1回にまとめる。MODEL_LIMITS はモデル名 →
+# {'CONCURRENCY': 同時実行数, 'RPM': 毎分の呼び出し数}（ないモデルは DEFAULT_LIMITS）。
+# BACKEND='fake' なら API を呼ばない（テスト・ローカル確認用）
+LLM_GATEWAY_SETTINGS = {
+    'BACKEND': os.getenv('LLM_GATEWAY_BACKEND', 'gemini'),
+    'CACHE_ENABLED': os.getenv('LLM_RESPONSE_CACHE_ENABLED', 'True') == 'True',
+    'CACHE_ROOT': os.getenv('LLM_RESPONSE_CACHE_DIR', str(BASE_DIR / 'cache' / 'llm_responses')),
+    'CACHE_TTL_SECONDS': int(os.getenv('LLM_RESPONSE_CACHE_TTL_SECONDS', str(7 * 24 * 3600))),
+    'CACHE_MAX_BYTES': int(os.getenv('LLM_RESPONSE_CACHE_MAX_BYTES', str(128 * 1024 ** 2))),
+    'DEFAULT_LIMITS': {'CONCURRENCY': 4, 'RPM': 60},
+    'MODEL_LIMITS': {},
+}
+
+# TDNETレポートのまとめて生成（earnings_analysis/services/tdnet_report_pipeline.py）
+# FETCH_WORKERS: PDF取得・抽出のスレッド数 / LLM_WORKERS: Gemini 呼び出しのスレッド数
+# 本文が PACK_MAX_CONTENT_CHARS 以下の開示は同じ種別ごとに、本文の合計 PACK_PROMPT_CHARS・
+# PACK_MAX_ITEMS 件まで1回の呼び出しにまとめる（PACK_MAX_ITEMS=1 でまとめない）
+TDNET_REPORT_PIPELINE = {
+    'FETCH_WORKERS': int(os.getenv('TDNET_REPORT_FETCH_WORKERS', '4')),
+    'LLM_WORKERS': int(os.getenv('TDNET_REPORT_LLM_WORKERS', '4')),
+    'PACK_MAX_CONTENT_CHARS': 4000,
+    'PACK_PROMPT_CHARS': 20000,
+    'PACK_MAX_ITEMS': int(os.getenv('TDNET_REPORT_PACK_MAX_ITEMS', '5')),
+    # タスク1件あたりの開示数（Q_CLUSTER の timeout 300秒に収める）
+    'TASK_MAX_DISCLOSURES': int(os.getenv('TDNET_REPORT_TASK_MAX_DISCLOSURES', '10')),
+    # この秒数更新のない処理中のバッチは止まったものとみなす（Q_CLUSTER の retry に合わせる）
+    'STALE_AFTER_SECONDS': 900,
+}
+
+# 新規開示の自動分析パイプライン（services/analysis_pipeline.py）
+# IO_WORKERS: XBRL 取得スレッド数（API 間隔は共有トークンバケットで制御）
+# CPU_WORKERS: XBRL 解析・語彙感情分析のプロセス数（0 ならプロセスを使わず直列）
+# TASK_LIMIT: django-q タスク1回で処理する書類数（残りは cron で消化）
+DISCLOSURE_ANALYSIS_PIPELINE = {
+    'IO_WORKERS': int(os.getenv('DISCLOSURE_ANALYSIS_IO_WORKERS', '4')),
+    'CPU_WORKERS': int(os.getenv('DISCLOSURE_ANALYSIS_CPU_WORKERS', '2')),
+    'WRITE_BATCH_SIZE': 20,
+    'TASK_LIMIT': 40,
+    # 財務データ・感情分析が揃わない（取得失敗・XBRL に該当データなし）書類を試す回数
+    'MAX_ATTEMPTS': 3,
+    # 直近の実行メトリクス（run_disclosure_analysis --status で表示。プロセス間で共有するためファイルに置く）
+    'METRICS_PATH': os.getenv(
+        'DISCLOSURE_ANALYSIS_METRICS_PATH', str(BASE_DIR / 'cache' / 'disclosure_analysis' / 'last_run.json')
+    ),
+}
+
+# JPX 信用取引残高PDF（margin_tracking/services/jpx_margin_service.py）
+# PARSE_WORKERS: PDF解析のプロセス数（ページ範囲を分けて並列に解析。1 なら直列。
+#                django-q のワーカー内では子プロセスを作れないため常に直列）
+# 日次確認の間隔・404 の記憶時間の既定値は jpx_margin_service.DEFAULT_JPX_MARGIN_SETTINGS
+JPX_MARGIN_SETTINGS = {
+    'PARSE_WORKERS': int(os.getenv('JPX_MARGIN_PARSE_WORKERS', '2')),
+}
+
 # 決算予定API設定（EDINET DB /v1/calendar 等）
 # 画面表示時は使わず、日次バッチ（sync_earnings_calendar）からのみ呼び出す。
 # エンドポイント・認証ヘッダーは提供元仕様に合わせて環境変数で差し替え可能。
@@ -824,6 +903,13 @@ WEBPUSH_SETTINGS = {
     'VAPID_PUBLIC_KEY': os.getenv('VAPID_PUBLIC_KEY', ''),
     'VAPID_PRIVATE_KEY': os.getenv('VAPID_PRIVATE_KEY', ''),
     'VAPID_ADMIN_EMAIL': os.getenv('VAPID_ADMIN_EMAIL', 'kabulog.information@gmail.com'),
+    # 並列送信（stockdiary/services/push_dispatcher.py）。WORKERS: 同時送信数、
+    # BATCH_SIZE: last_used 更新・失効購読の無効化を1回の UPDATE にまとめる件数
+    'DISPATCH': {
+        'WORKERS': int(os.getenv('WEBPUSH_DISPATCH_WORKERS', '16')),
+        'TIMEOUT_SECONDS': 10,
+        'BATCH_SIZE': 500,
+    },
 }
 
 # Django-Q設定
@@ -843,6 +929,32 @@ Q_CLUSTER = {
     # True（既定）のままだと、qcluster 停止中に溜まった過去分を延々と消化しようとして
     # スケジュールが過去で凍結し、定期通知が止まる原因になる（実際に発生済み: next_run が 3ヶ月前で停止）。
     'catch_up': False,
+    # 感情分析・包括分析の専用キュー（services/analysis_jobs.py）。
+    # Q_CLUSTER_NAME=analysis / analysis_batch で別の qcluster を起動する
+    # （etc/systemd/system/django-qcluster@.service）。workers がそのキューで同時に走る分析の上限。
+    # 画面からの分析（analysis）とバッチからの分析（analysis_batch）を分け、
+    # 通知・開示パイプラインの既定キューとも互いに待たせない。
+    'ALT_CLUSTERS': {
+        'analysis': {
+            'workers': int(os.getenv('ANALYSIS_Q_WORKERS', '2')),
+            'timeout': 600,
+            'retry': 900,
+        },
+        'analysis_batch': {
+            'workers': int(os.getenv('ANALYSIS_BATCH_Q_WORKERS', '1')),
+            'timeout': 600,
+            'retry': 900,
+        },
+    },
+}
+
+# 感情分析・包括分析のジョブ投入（services/analysis_jobs.py）
+# MAX_IN_FLIGHT: 待機中・処理中セッションの上限（超えたら開始 API は 429 を返す）
+# 処理中セッションは ALT_CLUSTERS の timeout + retry の間更新がなければ落ちたジョブとみなす
+# （STALE_AFTER_SECONDS で上書き可）
+ANALYSIS_JOB_SETTINGS = {
+    'LANES': {'interactive': 'analysis', 'batch': 'analysis_batch'},
+    'MAX_IN_FLIGHT': int(os.getenv('ANALYSIS_JOB_MAX_IN_FLIGHT', '20')),
 }
 
 STATIC_VERSION = '1.2.997'
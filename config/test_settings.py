@@ -1,3 +1,5 @@
+import tempfile
+
 from .settings import *
 
 DEBUG = True
@@ -29,3 +31,22 @@ STORAGES = {
         'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
     },
 }
+# EDINET 書類アーカイブはリポジトリ配下ではなく一時ディレクトリへ
+EDINET_ARCHIVE_SETTINGS = {
+    **EDINET_ARCHIVE_SETTINGS,
+    'ROOT': os.path.join(tempfile.gettempdir(), 'stock-dialy-test-edinet-archive'),
+}
+# 感情分析結果キャッシュはテスト実行ごとに空の一時ディレクトリへ（前回の実行の結果を引かない）
+SENTIMENT_RESULT_CACHE_SETTINGS = {
+    **SENTIMENT_RESULT_CACHE_SETTINGS,
+    'ROOT': tempfile.mkdtemp(prefix='stock-dialy-test-sentiment-'),
+}
+# Gemini は呼ばず FakeLLMClient が応答する。応答キャッシュは実行ごとに空の一時ディレクトリへ
+LLM_GATEWAY_SETTINGS = {
+    **LLM_GATEWAY_SETTINGS,
+    'BACKEND': 'fake',
+    'DEFAULT_LIMITS': {'CONCURRENCY': 4, 'RPM': 0},
+    'CACHE_ROOT': tempfile.mkdtemp(prefix='stock-dialy-test-llm-'),
+}
+# 信用残高PDFはテスト内で直列に解析する（並列はテストで workers を明示して確認する）
+JPX_MARGIN_SETTINGS = {**JPX_MARGIN_SETTINGS, 'PARSE_WORKERS': 1}
@@ -39,6 +39,9 @@ urlpatterns = [
     # ✅ ads名前空間をダミーで登録
     path('ads/', include((ads_patterns, 'ads'), namespace='ads')),
 
+    # 信用倍率 API（config/urls.py と同じルート）
+    path('margin/', include('margin_tracking.urls', namespace='margin_tracking')),
+
     # 通知 API（config/urls.py と同じルート）
     path('api/notifications/logs/', api_views.get_notification_logs, name='api_notification_logs'),
     path('api/notifications/<int:log_id>/read/', api_views.mark_notification_read, name='api_mark_notification_read'),
@@ -26,6 +26,7 @@ from .models import (
     TDNETReport,
     TDNETReportSection,
 )
+from .models.tdnet import TDNETReportBatch
 
 from .models import EarningsSchedule
 
@@ -704,7 +705,7 @@ class DocumentMetadataAdmin(admin.ModelAdmin):
 class BatchExecutionAdmin(admin.ModelAdmin):
     list_display = [
         'batch_date', 'status_badge', 'processed_count_display', 
-        'duration_display', 'started_at', 'error_summary'
+        'duration_display', 'ingest_rows_per_second', 'started_at', 'error_summary'
     ]
     list_filter = ['status', 'batch_date', 'started_at']
     readonly_fields = ['duration_display', 'created_at', 'error_details']
@@ -1689,14 +1690,18 @@ class TDNETDisclosureAdmin(admin.ModelAdmin):
     pdf_url_link.short_description = 'PDF URL'
     
     def generate_report_action(self, request, queryset):
-        """レポート生成アクション"""
-        count = 0
-        for disclosure in queryset:
-            if not disclosure.report_generated:
-                # TODO: レポート生成ロジック呼び出し
-                count += 1
+        """レポート生成アクション（未生成の開示をまとめて生成）"""
+        from .services.tdnet_report_pipeline import queue_report_batch
+
+        disclosure_ids = list(
+            queryset.filter(report_generated=False).values_list('disclosure_id', flat=True)
+        )
+        if not disclosure_ids:
+            self.message_user(request, 'レポート未生成の開示がありません', level=messages.WARNING)
+            return
         
-        self.message_user(request, f'{count}件のレポート生成を開始しました')
+        queue_report_batch(disclosure_ids, user=request.user)
+        self.message_user(request, f'{len(disclosure_ids)}件のレポート生成を開始しました')
     generate_report_action.short_description = 'レポート生成'
     
     def mark_as_processed(self, request, queryset):
@@ -1997,3 +2002,47 @@ class TDNETReportSectionAdmin(admin.ModelAdmin):
     report_link.short_description = 'レポート'
 
 
+@admin.register(TDNETReportBatch)
+class TDNETReportBatchAdmin(admin.ModelAdmin):
+    """レポート一括生成の実行記録（生成速度）"""
+
+    list_display = [
+        'created_at',
+        'status',
+        'requested_count',
+        'generated_count',
+        'skipped_count',
+        'failed_count',
+        'llm_requests',
+        'elapsed_seconds',
+        'reports_per_hour',
+        'created_by',
+    ]
+    list_filter = ['status', 'created_at']
+    readonly_fields = [
+        'batch_id', 'status', 'disclosure_ids', 'report_type', 'created_by',
+        'generated_count', 'skipped_count', 'failed_count', 'llm_requests',
+        'elapsed_seconds', 'reports_per_hour', 'error_message',
+        'started_at', 'finished_at', 'created_at', 'updated_at',
+    ]
+    ordering = ['-created_at']
+
+    def requested_count(self, obj):
+        return obj.requested_count
+    requested_count.short_description = '依頼件数'
+
+    def changelist_view(self, request, extra_context=None):
+        """直近のレポート生成数（件/時）を一覧の上に表示"""
+        from .services.tdnet_report_pipeline import report_throughput
+
+        throughput = report_throughput()
+        self.message_user(
+            request,
+            f"直近1時間 {throughput['last_hour']}件 / 直近{throughput['hours']}時間平均 "
+            f"{throughput['per_hour']}件/時",
+            level=messages.INFO,
+        )
+        return super().changelist_view(request, extra_context=extra_context)
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,121 @@
+# earnings_analysis/management/commands/backfill_sentiment_history.py
+"""過去の開示書類の語彙感情分析履歴（経営トーン）を一括で作るコマンド
+
+経営トーンの前回比に使う SentimentAnalysisHistory を、書類種別・提出日の範囲・銘柄で
+選んだ過去の書類についてまとめて作る（services/sentiment_backfill.py）。
+XBRL はローカルアーカイブ経由で読み、語彙感情分析はプロセスプールで並列に行う。
+AI（Gemini）は使用しない。
+
+書込はバッチごとにコミットし、履歴のある書類は対象外なので、中断しても
+同じ引数で再実行すれば続きから処理する。本文が取れなかった書類も対象外として記録する
+（抽出を直した後などに読み直すときは --retry-skipped）。
+
+例:
+  python manage.py backfill_sentiment_history --since 2020-01-01 --held
+  python manage.py backfill_sentiment_history --symbols 7203,6758 --cpu-workers 4
+"""
+import logging
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'日付は YYYY-MM-DD 形式で指定してください: {value}')
+
+
+class Command(BaseCommand):
+    help = '過去の開示書類の語彙感情分析履歴（経営トーン）をプロセスプールで一括作成する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--doc-types', default=None,
+            help='対象の書類種別コード（カンマ区切り、既定: 有報・半報）',
+        )
+        parser.add_argument('--since', default=None, help='提出日の開始（YYYY-MM-DD）')
+        parser.add_argument('--until', default=None, help='提出日の終了（YYYY-MM-DD）')
+        parser.add_argument(
+            '--symbols', default=None,
+            help='対象銘柄の4桁コード（カンマ区切り）',
+        )
+        parser.add_argument(
+            '--held', action='store_true',
+            help='日記で記録している銘柄の書類だけを対象にする',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='処理する書類数の上限（提出日の古い順）',
+        )
+        parser.add_argument(
+            '--io-workers', type=int, default=4,
+            help='XBRL 読み込み・本文抽出のスレッド数（既定4）',
+        )
+        parser.add_argument(
+            '--cpu-workers', type=int, default=2,
+            help='語彙感情分析のプロセス数（0 で直列、既定2）',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='1回の bulk_create で保存する書類数（既定50）',
+        )
+        parser.add_argument(
+            '--retry-skipped', action='store_true',
+            help='本文がなく対象外にした書類も読み直す',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='分析せず、対象の書類数だけを表示する',
+        )
+
+    def handle(self, *args, **options):
+        from earnings_analysis.services.sentiment_backfill import (
+            DEFAULT_BATCH_SIZE, backfill_candidates, run_sentiment_backfill,
+        )
+
+        symbols = None
+        if options['symbols']:
+            symbols = [s.strip() + '0' for s in options['symbols'].split(',') if s.strip()]
+        documents = backfill_candidates(
+            doc_type_codes=options['doc_types'].split(',') if options['doc_types'] else None,
+            since=_parse_date(options['since']) if options['since'] else None,
+            until=_parse_date(options['until']) if options['until'] else None,
+            securities_codes=symbols,
+            held_only=options['held'],
+            include_skipped=options['retry_skipped'],
+        )
+        if options['limit']:
+            documents = documents[:options['limit']]
+
+        total = documents.count()
+        self.stdout.write(f'対象（履歴なし）: {total}書類')
+        if options['dry_run'] or not total:
+            return
+
+        def progress(summary):
+            self.stdout.write(
+                f"  {summary['sentiment_saved']}/{total}書類 保存 "
+                f"({summary['documents_per_second']}書類/秒)"
+            )
+
+        summary = run_sentiment_backfill(
+            documents,
+            io_workers=options['io_workers'],
+            cpu_workers=options['cpu_workers'],
+            batch_size=options['batch_size'] or DEFAULT_BATCH_SIZE,
+            progress=progress,
+        )
+        for stage, stats in summary['stages'].items():
+            self.stdout.write(
+                f"  {stage}: {stats['count']}件 平均{stats['avg_seconds']}秒 "
+                f"p95 {stats['p95_seconds']}秒 最大{stats['max_seconds']}秒"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"感情分析一括作成完了: {summary['documents']}書類 "
+            f"(保存{summary['sentiment_saved']} / テキストなし{summary['skipped']} / 失敗{summary['failed']}) "
+            f"{summary['elapsed_seconds']}秒, {summary['documents_per_second']}書類/秒"
+        ))
@@ -4,13 +4,18 @@ from django.utils import timezone
 from django.db import transaction, connection
 from django.db.utils import IntegrityError, OperationalError, DatabaseError
 from datetime import date, datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import logging
+import threading
 import time
 import random
 import gc
 
 from earnings_analysis.models import DocumentMetadata, BatchExecution
-from earnings_analysis.services import EdinetAPIClient
+from earnings_analysis.services import EdinetAPIClient, EdinetDocumentService
+from earnings_analysis.services.document_ingest import document_from_api, upsert_documents
 
 logger = logging.getLogger(__name__)
 
@@ -58,11 +63,19 @@ class Command(BaseCommand):
             default=3,
             help='デッドロック時の最大リトライ回数（デフォルト: 3）'
         )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='書類一覧を先読みする並行数（2以上で取得とDB取り込みを重ねる。API間隔は全スレッドで共有）'
+        )
     
     def handle(self, *args, **options):
         # 初期設定
         self.chunk_size = options['chunk_size']
         self.max_retries = options['max_retries']
+        self.concurrency = max(1, options['concurrency'])
+        self.api_version = options.get('api_version', 'v2')
         self.initial_memory = self._get_memory_usage()
         
         # 日付設定
@@ -206,19 +219,33 @@ class Command(BaseCommand):
             return False
     
     def _process_date_range(self, document_service, start_date, end_date):
-        """日付範囲の処理"""
-        current_date = start_date
+        """日付範囲の処理
+
+        完了済み（BatchExecution が SUCCESS）の日はチェックポイントとして飛ばすため、
+        中断したバックフィルは同じ引数で再実行すれば残りの日から再開する。
+        --concurrency 2 以上では、後続日の書類一覧取得をスレッドで先行させ、
+        API の待ち時間と前の日の DB 取り込みを重ねる（DB への書き込みはこのスレッドのみ）。
+        """
+        dates = self._pending_dates(start_date, end_date)
+        if self.concurrency > 1:
+            jobs = self._prefetched_document_lists(dates)
+        else:
+            jobs = (
+                (target_date, partial(self._fetch_documents_safe, document_service, target_date.isoformat()))
+                for target_date in dates
+            )
+        
         total_processed = 0
         success_count = 0
         error_count = 0
         
         try:
-            while current_date <= end_date:
+            for current_date, fetch in jobs:
                 self.stdout.write(f'処理中: {current_date}')
                 
                 try:
                     # デッドロック防止機能付き日次データ収集
-                    processed_count = self._collect_date_data_with_retry(document_service, current_date)
+                    processed_count = self._collect_date_data_with_retry(current_date, fetch)
                     total_processed += processed_count
                     success_count += 1
                     
@@ -242,8 +269,6 @@ class Command(BaseCommand):
                 
                 # メモリ管理
                 self._check_memory_usage(f"日次処理 {current_date}")
-                
-                current_date += timedelta(days=1)
             
             self.stdout.write(
                 self.style.SUCCESS(
@@ -261,12 +286,63 @@ class Command(BaseCommand):
                 self.style.ERROR(f'予期しないエラー: {e}')
             )
             logger.error(f"初期データ収集エラー: {e}")
+        finally:
+            # 先読み中の取得を止める（中断・連続エラー時）
+            jobs.close()
+    
+    def _pending_dates(self, start_date, end_date):
+        """範囲内で未完了の日付（完了済みの日はチェックポイントとして除く）"""
+        completed = set(
+            BatchExecution.objects
+            .filter(batch_date__range=(start_date, end_date), status='SUCCESS')
+            .values_list('batch_date', flat=True)
+        )
+        if completed:
+            self.stdout.write(f'チェックポイント: {len(completed)}日分は完了済みのためスキップします')
+        
+        dates = []
+        current_date = start_date
+        while current_date <= end_date:
+            if current_date not in completed:
+                dates.append(current_date)
+            current_date += timedelta(days=1)
+        return dates
+    
+    def _prefetched_document_lists(self, dates):
+        """書類一覧の取得を concurrency 本のスレッドで先行させ、日付順に (日付, 結果取得関数) を返す"""
+        local = threading.local()
+        
+        def fetch(target_date):
+            # requests.Session はスレッド間で共有しない（間隔制限はプロセス共有のバケットで守られる）
+            service = getattr(local, 'service', None)
+            if service is None:
+                service = local.service = EdinetDocumentService(prefer_v1=(self.api_version == 'v1'))
+            return self._fetch_documents_safe(service, target_date.isoformat())
+        
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='edinet-backfill')
+        pending = deque()
+        date_iter = iter(dates)
+        try:
+            while True:
+                while len(pending) < self.concurrency * 2:
+                    target_date = next(date_iter, None)
+                    if target_date is None:
+                        break
+                    pending.append((target_date, pool.submit(fetch, target_date)))
+                if not pending:
+                    return
+                target_date, future = pending.popleft()
+                yield target_date, future.result
+        finally:
+            for _, future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
     
-    def _collect_date_data_with_retry(self, document_service, target_date):
+    def _collect_date_data_with_retry(self, target_date, fetch):
         """リトライ機能付き日次データ収集"""
         for attempt in range(self.max_retries):
             try:
-                return self._collect_date_data_safe(document_service, target_date)
+                return self._collect_date_data_safe(target_date, fetch)
             except (OperationalError, DatabaseError) as e:
                 error_msg = str(e).lower()
                 
@@ -290,9 +366,7 @@ class Command(BaseCommand):
                 self._record_batch_failure(target_date, str(e))
                 raise
     
-    def _collect_date_data_safe(self, document_service, target_date):
-        date_str = target_date.isoformat()
-        
+    def _collect_date_data_safe(self, target_date, fetch):
         with transaction.atomic():
             batch_execution = self._get_or_create_batch_safe(target_date)
 
@@ -304,8 +378,8 @@ class Command(BaseCommand):
             batch_execution.save(update_fields=['status', 'started_at'])
         
         try:
-            # Step3: API呼び出し（トランザクション外）
-            documents_data = self._fetch_documents_safe(document_service, date_str)
+            # Step3: API呼び出し（トランザクション外。先読み済みならその結果）
+            documents_data = fetch()
             
             if not documents_data:
                 batch_execution.status = 'SUCCESS'
@@ -314,14 +388,26 @@ class Command(BaseCommand):
                 batch_execution.save(update_fields=['status', 'processed_count', 'completed_at'])
                 return 0
             
-            # Step4: チャンク単位でデータ処理
-            processed_count = self._process_documents_in_chunks(documents_data, target_date)
+            # Step4: doc_id の upsert で一括取り込み（DB エラー時のみチャンク処理）
+            started = time.monotonic()
+            try:
+                stats = upsert_documents(documents_data, target_date)
+                processed_count = stats['rows']
+            except (OperationalError, DatabaseError) as e:
+                logger.warning(f"書類一覧 upsert 失敗、チャンク処理に切り替え: {e}")
+                processed_count = self._process_documents_in_chunks(documents_data, target_date)
+            elapsed = time.monotonic() - started
             
             # Step5: 成功記録
             batch_execution.status = 'SUCCESS'
             batch_execution.processed_count = processed_count
             batch_execution.completed_at = timezone.now()
-            batch_execution.save(update_fields=['status', 'processed_count', 'completed_at'])
+            batch_execution.ingest_seconds = round(elapsed, 3)
+            batch_execution.ingest_rows_per_second = round(processed_count / elapsed, 1) if elapsed > 0 else None
+            batch_execution.save(update_fields=[
+                'status', 'processed_count', 'completed_at',
+                'ingest_seconds', 'ingest_rows_per_second',
+            ])
             
             return processed_count
             
@@ -370,7 +456,7 @@ class Command(BaseCommand):
             return response.get('results', [])
     
     def _process_documents_in_chunks(self, documents_data, file_date):
-        """チャンク単位での安全な処理"""
+        """チャンク単位での安全な処理（upsert 失敗時のフォールバック）"""
         total_processed = 0
         
         for i in range(0, len(documents_data), self.chunk_size):
@@ -542,45 +628,4 @@ class Command(BaseCommand):
     
     def _create_document_metadata(self, doc_data, file_date):
         """DocumentMetadataオブジェクト作成"""
-        return DocumentMetadata(
-            doc_id=doc_data['docID'],
-            edinet_code=doc_data['edinetCode'] or '',
-            securities_code=doc_data['secCode'] or '',
-            company_name=doc_data['filerName'] or '',
-            fund_code=doc_data['fundCode'] or '',
-            ordinance_code=doc_data['ordinanceCode'] or '',
-            form_code=doc_data['formCode'] or '',
-            doc_type_code=doc_data['docTypeCode'] or '',
-            period_start=self._parse_date(doc_data.get('periodStart')),
-            period_end=self._parse_date(doc_data.get('periodEnd')),
-            submit_date_time=self._parse_datetime(doc_data['submitDateTime']),
-            file_date=file_date,
-            doc_description=doc_data['docDescription'] or '',
-            xbrl_flag=doc_data['xbrlFlag'] == '1',
-            pdf_flag=doc_data['pdfFlag'] == '1',
-            attach_doc_flag=doc_data['attachDocFlag'] == '1',
-            english_doc_flag=doc_data['englishDocFlag'] == '1',
-            csv_flag=doc_data['csvFlag'] == '1',
-            legal_status=doc_data['legalStatus'],
-            withdrawal_status=doc_data['withdrawalStatus'],
-            doc_info_edit_status=doc_data['docInfoEditStatus'],
-            disclosure_status=doc_data['disclosureStatus'],
-        )
-    
-    def _parse_date(self, date_str):
-        """日付文字列をDateオブジェクトに変換"""
-        if not date_str:
-            return None
-        try:
-            return datetime.strptime(date_str, '%Y-%m-%d').date()
-        except (ValueError, TypeError):
-            return None
-    
-    def _parse_datetime(self, datetime_str):
-        """日時文字列をDateTimeオブジェクトに変換"""
-        if not datetime_str:
-            return timezone.now()
-        try:
-            return datetime.strptime(datetime_str, '%Y-%m-%d %H:%M')
-        except (ValueError, TypeError):
-            return timezone.now()
\ No newline at end of file
+        return document_from_api(doc_data, file_date)
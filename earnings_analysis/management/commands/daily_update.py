@@ -15,6 +15,7 @@ import pytz
 
 from earnings_analysis.models import DocumentMetadata, BatchExecution, Company
 from earnings_analysis.services import EdinetDocumentService
+from earnings_analysis.services.document_ingest import document_from_api, upsert_documents
 
 logger = logging.getLogger(__name__)
 
@@ -124,6 +125,7 @@ class Command(BaseCommand):
         self.company_update_mode = options['company_update_mode']
         self.skip_company_update = options['skip_company_update']
         self.initial_memory = self._get_memory_usage()
+        self.ingest_stats = None
         
         # 【改善】日付決定オプション取得
         target_date_str = options.get('date')
@@ -698,10 +700,31 @@ class Command(BaseCommand):
         raise last_exception
     
     def _process_documents_bulk_safe(self, documents_data, file_date):
-        """安全なバルク処理でドキュメント更新"""
+        """安全なバルク処理でドキュメント更新
+
+        doc_id の upsert（INSERT ... ON CONFLICT DO UPDATE）で1日分を1〜2往復で取り込む。
+        DB エラー時のみ、従来のチャンク単位処理にフォールバックする。
+        """
         if not documents_data:
             return 0
         
+        try:
+            self.ingest_stats = upsert_documents(documents_data, file_date)
+            self.stdout.write(
+                f"書類一覧 upsert: {self.ingest_stats['rows']}件 / {self.ingest_stats['batches']}バッチ "
+                f"({self.ingest_stats['rows_per_second']} rows/s)"
+            )
+            return self.ingest_stats['rows']
+        except (OperationalError, DatabaseError) as e:
+            logger.warning(f"書類一覧 upsert 失敗、チャンク処理に切り替え: {e}")
+            if self.stop_on_error:
+                raise
+        
+        return self._process_documents_in_chunks(documents_data, file_date)
+    
+    def _process_documents_in_chunks(self, documents_data, file_date):
+        """チャンク単位での安全な処理（upsert 失敗時のフォールバック）"""
+        started = time.monotonic()
         total_processed = 0
         
         # チャンク単位で処理
@@ -726,6 +749,13 @@ class Command(BaseCommand):
                     raise  # エラー時停止オプションが有効な場合は即座に停止
                 continue  # そうでなければ継続
         
+        elapsed = time.monotonic() - started
+        self.ingest_stats = {
+            'rows': total_processed,
+            'batches': -(-len(documents_data) // self.chunk_size),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(total_processed / elapsed, 1) if elapsed > 0 else None,
+        }
         return total_processed
     
     def _process_single_chunk_safe(self, chunk_data, file_date):
@@ -854,6 +884,9 @@ class Command(BaseCommand):
             batch_execution.status = 'SUCCESS'
             batch_execution.processed_count = processed_count
             batch_execution.completed_at = timezone.now()
+            if self.ingest_stats:
+                batch_execution.ingest_seconds = self.ingest_stats['elapsed_seconds']
+                batch_execution.ingest_rows_per_second = self.ingest_stats['rows_per_second']
             batch_execution.save()
         except Exception as e:
             logger.error(f"バッチ成功記録エラー: {e}")
@@ -994,48 +1027,7 @@ class Command(BaseCommand):
     
     def _create_document_metadata(self, doc_data, file_date):
         """DocumentMetadataオブジェクト作成"""
-        return DocumentMetadata(
-            doc_id=doc_data['docID'],
-            edinet_code=doc_data['edinetCode'] or '',
-            securities_code=doc_data['secCode'] or '',
-            company_name=doc_data['filerName'] or '',
-            fund_code=doc_data['fundCode'] or '',
-            ordinance_code=doc_data['ordinanceCode'] or '',
-            form_code=doc_data['formCode'] or '',
-            doc_type_code=doc_data['docTypeCode'] or '',
-            period_start=self._parse_date(doc_data.get('periodStart')),
-            period_end=self._parse_date(doc_data.get('periodEnd')),
-            submit_date_time=self._parse_datetime(doc_data['submitDateTime']),
-            file_date=file_date,
-            doc_description=doc_data['docDescription'] or '',
-            xbrl_flag=doc_data['xbrlFlag'] == '1',
-            pdf_flag=doc_data['pdfFlag'] == '1',
-            attach_doc_flag=doc_data['attachDocFlag'] == '1',
-            english_doc_flag=doc_data['englishDocFlag'] == '1',
-            csv_flag=doc_data['csvFlag'] == '1',
-            legal_status=doc_data['legalStatus'],
-            withdrawal_status=doc_data['withdrawalStatus'],
-            doc_info_edit_status=doc_data['docInfoEditStatus'],
-            disclosure_status=doc_data['disclosureStatus'],
-        )
-    
-    def _parse_date(self, date_str):
-        """日付文字列をDateオブジェクトに変換"""
-        if not date_str:
-            return None
-        try:
-            return datetime.strptime(date_str, '%Y-%m-%d').date()
-        except (ValueError, TypeError):
-            return None
-    
-    def _parse_datetime(self, datetime_str):
-        """日時文字列をDateTimeオブジェクトに変換"""
-        if not datetime_str:
-            return timezone.now()
-        try:
-            return datetime.strptime(datetime_str, '%Y-%m-%d %H:%M')
-        except (ValueError, TypeError):
-            return timezone.now()
+        return document_from_api(doc_data, file_date)
 
     def _update_disclosure_indicators(self):
         """株式日記の開示インジケーターを更新"""
@@ -0,0 +1,57 @@
+# earnings_analysis/management/commands/prefetch_edinet_archives.py
+"""新規の重要開示の書類ファイルをローカルアーカイブへ事前取得するコマンド
+
+直近 N 日の有価証券報告書・半期報告書（IMPORTANT_DOC_TYPE_CODES）の XBRL ZIP を
+EDINET から取得してアーカイブ（services/document_archive.py）に保存しておく。
+分析・感情分析・パネル表示の初回アクセスで EDINET のダウンロードを待たずに済む。
+
+daily_update の後に cron で実行する想定（etc/cron.d/edinet-prefetch 参照）。
+保存済みの書類は取得しないため、再実行してもAPIリクエストは増えない。
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '直近の重要開示（有報・半報）の書類ファイルをローカルアーカイブへ事前取得する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=7,
+            help='対象とする提出日の範囲（今日から遡る日数、既定7日）',
+        )
+        parser.add_argument(
+            '--pdf', action='store_true',
+            help='XBRL に加えて PDF も取得する',
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='日記で記録されていない銘柄も含め、全企業の重要開示を対象にする',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='取得する書類数の上限（新しい順）',
+        )
+
+    def handle(self, *args, **options):
+        from earnings_analysis.services.document_archive import (
+            get_archive_store,
+            prefetch_important_disclosures,
+        )
+
+        self.stdout.write(f"書類アーカイブ事前取得開始（直近{options['days']}日）")
+        result = prefetch_important_disclosures(
+            days=options['days'],
+            include_pdf=options['pdf'],
+            all_companies=options['all'],
+            limit=options['limit'],
+        )
+        stats = get_archive_store().stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"書類アーカイブ事前取得完了: 対象{result['targets']}件 "
+            f"(取得{result['fetched']} / 保存済み{result['cached']} / 失敗{result['failed']}) "
+            f"アーカイブ {stats['blobs']}件 {stats['bytes'] // (1024 * 1024)}MB"
+        ))
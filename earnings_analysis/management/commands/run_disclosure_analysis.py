@@ -0,0 +1,69 @@
+# earnings_analysis/management/commands/run_disclosure_analysis.py
+"""未分析の重要開示（有報・半報）を分析パイプラインで消化するコマンド
+
+DisclosureSync が新規イベントごとにキューする分析タスクは1回あたり TASK_LIMIT 件で
+打ち切るため、決算集中期に溜まった残り（バックログ）をこのコマンドで消化する。
+取得・解析・書込の段ごとの所要時間と、実行前後のバックログ件数を出力する。
+
+etc/cron.d/disclosure-analysis 参照。バックログが空なら件数を数えるだけで終わる。
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '未分析の重要開示（有報・半報）の財務・トーン分析をパイプラインで実行する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='処理する書類数の上限（新しい順）',
+        )
+        parser.add_argument(
+            '--io-workers', type=int, default=None,
+            help='XBRL 取得のスレッド数（既定: DISCLOSURE_ANALYSIS_PIPELINE）',
+        )
+        parser.add_argument(
+            '--cpu-workers', type=int, default=None,
+            help='XBRL 解析・語彙感情分析のプロセス数（0 で直列）',
+        )
+        parser.add_argument(
+            '--status', action='store_true',
+            help='分析せず、バックログ件数と直近の実行メトリクスだけを表示する',
+        )
+
+    def handle(self, *args, **options):
+        from earnings_analysis.services.analysis_pipeline import (
+            analysis_backlog, backlog_depth, last_run_metrics, run_analysis_pipeline,
+        )
+
+        if options['status']:
+            self.stdout.write(f'バックログ: {backlog_depth()}件')
+            self.stdout.write(f'直近の実行: {last_run_metrics()}')
+            return
+
+        documents = analysis_backlog()
+        if options['limit']:
+            documents = documents[:options['limit']]
+        if not documents.exists():
+            self.stdout.write('未分析の開示はありません')
+            return
+
+        summary = run_analysis_pipeline(
+            documents,
+            io_workers=options['io_workers'],
+            cpu_workers=options['cpu_workers'],
+        )
+        for stage, stats in summary['stages'].items():
+            self.stdout.write(
+                f"  {stage}: {stats['count']}件 平均{stats['avg_seconds']}秒 "
+                f"p95 {stats['p95_seconds']}秒 最大{stats['max_seconds']}秒"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"開示自動分析完了: {summary['documents']}書類 "
+            f"(財務{summary['financial_saved']} / 感情{summary['sentiment_saved']} / 失敗{summary['failed']}) "
+            f"{summary['elapsed_seconds']}秒, バックログ {summary['backlog_before']} → {summary['backlog_after']}"
+        ))
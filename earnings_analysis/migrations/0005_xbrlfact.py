@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-19 04:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings_analysis', '0004_earningsschedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XBRLFact',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('edinet_code', models.CharField(max_length=6, verbose_name='EDINETコード')),
+                ('element', models.CharField(help_text='名前空間を除いたローカル名（例: NetSales）', max_length=200, verbose_name='要素名')),
+                ('context_ref', models.CharField(max_length=255, verbose_name='コンテキストID')),
+                ('period_start', models.DateField(blank=True, null=True, verbose_name='期間開始日')),
+                ('period_end', models.DateField(blank=True, null=True, verbose_name='期間終了日（時点）')),
+                ('is_instant', models.BooleanField(default=False, verbose_name='時点')),
+                ('consolidated', models.BooleanField(default=True, verbose_name='連結')),
+                ('dimensional', models.BooleanField(default=False, help_text='セグメント別など、連結/個別以外の軸を持つファクト', verbose_name='ディメンションあり')),
+                ('unit', models.CharField(blank=True, max_length=50, verbose_name='単位')),
+                ('scale', models.IntegerField(blank=True, help_text='XBRL decimals 属性（-6=百万円単位）', null=True, verbose_name='丸め精度')),
+                ('value', models.DecimalField(decimal_places=6, max_digits=30, verbose_name='値')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='xbrl_facts', to='earnings_analysis.documentmetadata', verbose_name='出典書類')),
+            ],
+            options={
+                'verbose_name': 'XBRLファクト',
+                'verbose_name_plural': 'XBRLファクト一覧',
+                'db_table': 'earnings_analysis_xbrl_fact',
+                'indexes': [models.Index(fields=['element', 'period_end', 'consolidated'], name='xbrl_fact_elem_period_idx'), models.Index(fields=['edinet_code', 'element', 'period_end'], name='xbrl_fact_company_elem_idx')],
+                'constraints': [models.UniqueConstraint(fields=('document', 'element', 'context_ref'), name='uniq_xbrl_fact_document_element_context')],
+            },
+        ),
+    ]
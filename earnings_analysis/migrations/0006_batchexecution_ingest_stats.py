@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings_analysis', '0005_xbrlfact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchexecution',
+            name='ingest_rows_per_second',
+            field=models.FloatField(blank=True, null=True, verbose_name='取り込み速度（rows/s）'),
+        ),
+        migrations.AddField(
+            model_name='batchexecution',
+            name='ingest_seconds',
+            field=models.FloatField(blank=True, null=True, verbose_name='取り込み時間（秒）'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings_analysis', '0006_batchexecution_ingest_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='名前')),
+                ('value', models.DateTimeField(verbose_name='処理済み位置')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '同期ウォーターマーク',
+                'verbose_name_plural': '同期ウォーターマーク一覧',
+                'db_table': 'earnings_analysis_sync_watermark',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='documentmetadata',
+            index=models.Index(fields=['updated_at'], name='earnings_an_updated_130ff9_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-19 05:21
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings_analysis', '0007_syncwatermark'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TDNETReportBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, unique=True, verbose_name='バッチID')),
+                ('status', models.CharField(choices=[('pending', '待機中'), ('processing', '処理中'), ('done', '完了'), ('error', 'エラー')], db_index=True, default='pending', max_length=20, verbose_name='ステータス')),
+                ('disclosure_ids', models.JSONField(default=list, verbose_name='開示ID')),
+                ('report_type', models.CharField(blank=True, help_text='空なら開示種別に合わせる', max_length=50, verbose_name='レポート種別')),
+                ('generated_count', models.PositiveIntegerField(default=0, verbose_name='生成件数')),
+                ('skipped_count', models.PositiveIntegerField(default=0, help_text='重複・生成済み', verbose_name='スキップ件数')),
+                ('failed_count', models.PositiveIntegerField(default=0, verbose_name='失敗件数')),
+                ('llm_requests', models.PositiveIntegerField(default=0, verbose_name='LLM呼び出し回数')),
+                ('elapsed_seconds', models.FloatField(blank=True, null=True, verbose_name='処理時間（秒）')),
+                ('reports_per_hour', models.FloatField(blank=True, null=True, verbose_name='生成速度（件/時）')),
+                ('error_message', models.TextField(blank=True, verbose_name='エラーメッセージ')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完了日時')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tdnet_report_batches', to=settings.AUTH_USER_MODEL, verbose_name='作成者')),
+            ],
+            options={
+                'verbose_name': 'レポート一括生成',
+                'verbose_name_plural': 'レポート一括生成一覧',
+                'db_table': 'earnings_tdnet_report_batch',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings_analysis', '0008_tdnetreportbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentmetadata',
+            name='analysis_attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='自動分析の未完了回数'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings_analysis', '0009_documentmetadata_analysis_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentmetadata',
+            name='sentiment_skipped',
+            field=models.BooleanField(default=False, verbose_name='感情分析一括作成の対象外（本文なし）'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 06:23
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_reports(apps, schema_editor):
+    """同じ開示・種別のレポートが複数あれば最初に作られたものだけを残す（制約を張る前に）"""
+    TDNETReport = apps.get_model('earnings_analysis', 'TDNETReport')
+    keep = (
+        TDNETReport.objects
+        .values('disclosure_id', 'report_type')
+        .annotate(first_id=Min('id'))
+        .values_list('first_id', flat=True)
+    )
+    TDNETReport.objects.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('earnings_analysis', '0010_documentmetadata_sentiment_skipped'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_reports, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tdnetreport',
+            constraint=models.UniqueConstraint(fields=('disclosure', 'report_type'), name='uniq_tdnet_rep_disc_type'),
+        ),
+    ]
@@ -1,12 +1,13 @@
 # earnings_analysis/models/__init__.py
 from .company import Company
 from .document import DocumentMetadata, DisclosureEvent
-from .batch import BatchExecution
+from .batch import BatchExecution, SyncWatermark
 from .sentiment import SentimentAnalysisSession, SentimentAnalysisHistory
 from .financial import (
     FinancialAnalysisSession, 
     FinancialAnalysisHistory,
     CompanyFinancialData,
+    XBRLFact,
     FinancialBenchmark
 )
 from .tdnet import (
@@ -21,11 +22,13 @@ __all__ = [
     'DocumentMetadata',
     'DisclosureEvent',
     'BatchExecution',
+    'SyncWatermark',
     'SentimentAnalysisSession',
     'SentimentAnalysisHistory',
     'FinancialAnalysisSession',
     'FinancialAnalysisHistory',
     'CompanyFinancialData',
+    'XBRLFact',
     'FinancialBenchmark',
     'TDNETDisclosure',
     'TDNETReport',
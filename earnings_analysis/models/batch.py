@@ -15,6 +15,8 @@ class BatchExecution(models.Model):
     error_message = models.TextField('エラーメッセージ', blank=True)
     started_at = models.DateTimeField('開始時刻', null=True, blank=True)
     completed_at = models.DateTimeField('完了時刻', null=True, blank=True)
+    ingest_seconds = models.FloatField('取り込み時間（秒）', null=True, blank=True)
+    ingest_rows_per_second = models.FloatField('取り込み速度（rows/s）', null=True, blank=True)
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
 
     class Meta:
@@ -24,4 +26,19 @@ class BatchExecution(models.Model):
         ordering = ['-batch_date']
 
     def __str__(self):
-        return f"{self.batch_date} - {self.get_status_display()}"
\ No newline at end of file
+        return f"{self.batch_date} - {self.get_status_display()}"
+
+class SyncWatermark(models.Model):
+    """差分同期の処理済み位置（最後に処理した更新日時）"""
+
+    name = models.CharField('名前', max_length=100, unique=True)
+    value = models.DateTimeField('処理済み位置')
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+
+    class Meta:
+        db_table = 'earnings_analysis_sync_watermark'
+        verbose_name = '同期ウォーターマーク'
+        verbose_name_plural = '同期ウォーターマーク一覧'
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
@@ -53,6 +53,14 @@ class DocumentMetadata(models.Model):
     doc_info_edit_status = models.CharField('書類情報修正区分', max_length=1, default='0')
     disclosure_status = models.CharField('開示不開示区分', max_length=1, default='0')
     
+    # 自動分析（analysis_pipeline）で財務データ・語彙感情分析が揃わなかった回数。
+    # MAX_ATTEMPTS に達した書類はバックログから外す（毎回取得・解析し直さない）
+    analysis_attempts = models.PositiveSmallIntegerField('自動分析の未完了回数', default=0)
+
+    # 感情分析の一括作成（sentiment_backfill）で本文が取れず分析できなかった書類。
+    # 再実行（resume）のたびに読み直さないよう、一括作成の対象から外す
+    sentiment_skipped = models.BooleanField('感情分析一括作成の対象外（本文なし）', default=False)
+
     # 管理情報
     created_at = models.DateTimeField('作成日時', auto_now_add=True)
     updated_at = models.DateTimeField('更新日時', auto_now=True)
@@ -67,6 +75,7 @@ class DocumentMetadata(models.Model):
             models.Index(fields=['doc_type_code', 'legal_status']),
             models.Index(fields=['company_name', 'submit_date_time']),
             models.Index(fields=['edinet_code', '-submit_date_time']),
+            models.Index(fields=['updated_at']),  # 開示インジケーターの差分同期
         ]
 
     def __str__(self):
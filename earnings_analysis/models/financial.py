@@ -307,6 +307,57 @@ class CompanyFinancialData(models.Model):
         return complete_fields / total_fields
 
 
+class XBRLFact(models.Model):
+    """XBRL 数値ファクト（書類 × 要素 × コンテキスト）
+
+    CompanyFinancialData は書類ごとの要約値のみのため、XBRL から抽出した
+    数値ファクトを正規化して保持する。業界・同業比較（要素×期間の企業横断）や
+    複数年推移（企業×要素の時系列）を、書類の再ダウンロード・再解析なしに引く。
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    document = models.ForeignKey('DocumentMetadata', on_delete=models.CASCADE, verbose_name='出典書類',
+                                 related_name='xbrl_facts')
+    edinet_code = models.CharField('EDINETコード', max_length=6)
+    element = models.CharField('要素名', max_length=200, help_text='名前空間を除いたローカル名（例: NetSales）')
+    context_ref = models.CharField('コンテキストID', max_length=255)
+
+    # コンテキスト
+    period_start = models.DateField('期間開始日', null=True, blank=True)
+    period_end = models.DateField('期間終了日（時点）', null=True, blank=True)
+    is_instant = models.BooleanField('時点', default=False)
+    consolidated = models.BooleanField('連結', default=True)
+    dimensional = models.BooleanField('ディメンションあり', default=False,
+                                      help_text='セグメント別など、連結/個別以外の軸を持つファクト')
+
+    # 値
+    unit = models.CharField('単位', max_length=50, blank=True)
+    scale = models.IntegerField('丸め精度', null=True, blank=True, help_text='XBRL decimals 属性（-6=百万円単位）')
+    value = models.DecimalField('値', max_digits=30, decimal_places=6)
+
+    created_at = models.DateTimeField('作成日時', auto_now_add=True)
+
+    class Meta:
+        db_table = 'earnings_analysis_xbrl_fact'
+        verbose_name = 'XBRLファクト'
+        verbose_name_plural = 'XBRLファクト一覧'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['document', 'element', 'context_ref'],
+                name='uniq_xbrl_fact_document_element_context',
+            ),
+        ]
+        indexes = [
+            # 要素 X の期間 Y を企業横断で（業界・同業比較）
+            models.Index(fields=['element', 'period_end', 'consolidated'], name='xbrl_fact_elem_period_idx'),
+            # 企業の要素 X の推移（複数年トレンド）
+            models.Index(fields=['edinet_code', 'element', 'period_end'], name='xbrl_fact_company_elem_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.edinet_code} {self.element} {self.period_end}: {self.value}"
+
+
 class FinancialBenchmark(models.Model):
     """業界ベンチマークデータ"""
     
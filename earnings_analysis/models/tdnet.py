@@ -288,6 +288,10 @@ class TDNETReport(models.Model):
             models.Index(fields=['report_type', '-published_at'], name='idx_tdnet_rep_type_pub'),
             models.Index(fields=['disclosure', '-created_at'], name='idx_tdnet_rep_disc_date'),
         ]
+        constraints = [
+            # 同じ開示・種別のレポートは1件（並行した生成の二重保存を防ぐ）
+            models.UniqueConstraint(fields=['disclosure', 'report_type'], name='uniq_tdnet_rep_disc_type'),
+        ]
     
     def __str__(self):
         return f"{self.report_id}: {self.title[:50]}"
@@ -484,4 +488,75 @@ class TDNETPDFJob(models.Model):
 
     @property
     def is_pending(self):
-        return self.status in (self.STATUS_PENDING, self.STATUS_PROCESSING)
\ No newline at end of file
+        return self.status in (self.STATUS_PENDING, self.STATUS_PROCESSING)
+
+class TDNETReportBatch(models.Model):
+    """複数開示のレポートまとめて生成（services/tdnet_report_pipeline.py）の実行記録"""
+
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_ERROR = 'error'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '待機中'),
+        (STATUS_PROCESSING, '処理中'),
+        (STATUS_DONE, '完了'),
+        (STATUS_ERROR, 'エラー'),
+    ]
+
+    batch_id = models.UUIDField(
+        'バッチID',
+        default=uuid.uuid4,
+        unique=True,
+        db_index=True,
+        editable=False,
+    )
+    status = models.CharField(
+        'ステータス',
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        db_index=True,
+    )
+    disclosure_ids = models.JSONField('開示ID', default=list)
+    report_type = models.CharField(
+        'レポート種別',
+        max_length=50,
+        blank=True,
+        help_text='空なら開示種別に合わせる',
+    )
+    created_by = models.ForeignKey(
+        'users.CustomUser',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='tdnet_report_batches',
+        verbose_name='作成者',
+    )
+
+    generated_count = models.PositiveIntegerField('生成件数', default=0)
+    skipped_count = models.PositiveIntegerField('スキップ件数', default=0, help_text='重複・生成済み')
+    failed_count = models.PositiveIntegerField('失敗件数', default=0)
+    llm_requests = models.PositiveIntegerField('LLM呼び出し回数', default=0)
+    elapsed_seconds = models.FloatField('処理時間（秒）', null=True, blank=True)
+    reports_per_hour = models.FloatField('生成速度（件/時）', null=True, blank=True)
+    error_message = models.TextField('エラーメッセージ', blank=True)
+
+    started_at = models.DateTimeField('開始日時', null=True, blank=True)
+    finished_at = models.DateTimeField('完了日時', null=True, blank=True)
+    created_at = models.DateTimeField('作成日時', auto_now_add=True)
+    updated_at = models.DateTimeField('更新日時', auto_now=True)
+
+    class Meta:
+        db_table = 'earnings_tdnet_report_batch'
+        verbose_name = 'レポート一括生成'
+        verbose_name_plural = 'レポート一括生成一覧'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.batch_id} [{self.status}] {len(self.disclosure_ids)}件"
+
+    @property
+    def requested_count(self):
+        return len(self.disclosure_ids)
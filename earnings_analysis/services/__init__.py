@@ -11,6 +11,9 @@ from .edinet_api import EdinetAPIClient
 # ドキュメントサービス
 from .document_service import EdinetDocumentService
 
+# 書類ファイルのローカルアーカイブ
+from .document_archive import DocumentArchiveStore, get_archive_store
+
 # XBRL抽出
 from .xbrl_extractor import XBRLFinancialExtractor, EDINETXBRLService, CashFlowExtractor
 
@@ -29,6 +32,8 @@ from .earnings_calendar_sync import (
 __all__ = [
     'EdinetAPIClient',
     'EdinetDocumentService',
+    'DocumentArchiveStore',
+    'get_archive_store',
     'XBRLFinancialExtractor',
     'EDINETXBRLService',
     'CashFlowExtractor',
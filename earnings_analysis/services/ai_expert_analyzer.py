@@ -1,5 +1,4 @@
 # earnings_analysis/services/ai_expert_analyzer.py (API容量制限対応・専門家考察追加版)
-from google import genai
 import logging
 from django.conf import settings
 from django.utils import timezone
@@ -47,8 +46,8 @@ class AIExpertAnalyzer:
             return
         
         try:
-            from google import genai
-            self.client = genai.Client(api_key=api_key)
+            from .llm_gateway import get_llm_client
+            self.client = get_llm_client(api_key)
             self.model = "gemini-2.5-flash-lite"
             self.api_available = True
             logger.info("AI Expert Analyzer初期化成功")
@@ -173,6 +172,8 @@ class AIExpertAnalyzer:
             if error_check['has_error']:
                 logger.warning(f"APIレスポンスにエラー検出: {error_check}")
                 self.last_api_error = error_check
+                # 制限メッセージ等の応答がキャッシュから再生されないように消す
+                self.client.gateway.invalidate(self.model, prompt)
                 return self._create_fallback_result(
                     basic_analysis,
                     error_type=error_check['error_type'],
@@ -180,8 +181,12 @@ class AIExpertAnalyzer:
                     is_retryable=error_check['is_retryable']
                 )
             
-            # JSON応答をパース
-            result = self._parse_ai_response(response.text)
+            # JSON応答をパース（解釈できなかった応答はキャッシュから消し、再分析で取り直す）
+            try:
+                result = self._parse_ai_response(response.text)
+            except ValueError:
+                self.client.gateway.invalidate(self.model, prompt)
+                raise
             logger.info("AI応答パース完了")
             
             # 整合性チェック
@@ -0,0 +1,162 @@
+# earnings_analysis/services/analysis_jobs.py
+"""
+感情分析・包括分析のジョブ投入（django-q の専用キュー）
+
+SentimentAnalysisService.start_analysis と ComprehensiveAnalysisService.start_comprehensive_analysis は
+リクエストごとに gunicorn ワーカー内で daemon スレッドを起動していた。同時実行数に上限がなく、
+ワーカーの再起動でジョブが消え、クリックが重なるとワーカーの CPU を分析が占有して
+リクエスト処理が詰まっていた。
+
+ここではセッション（SentimentAnalysisSession / FinancialAnalysisSession）を作ったうえで
+django-q のキューへ投入し、分析は qcluster のワーカーで行う。
+
+- 優先レーン: 画面から開始した分析は interactive、バッチ（BatchService）からの分析は batch の
+  別キュー（Q_CLUSTER['ALT_CLUSTERS']）に積む。キューごとに qcluster を起動し
+  （etc/systemd/system/django-qcluster@.service）、そのワーカー数が同時に走る分析の上限になる。
+  通知・開示パイプラインの既定キューとも分かれるので、互いに待たされない
+- 重複排除: 同じ書類の分析が待機中・処理中なら新しいジョブを積まず、そのセッションを返す
+  （書類の行をロックして判定するので、同時クリックでも1件になる）
+- 背圧: 待機中・処理中のセッションが MAX_IN_FLIGHT 件以上なら AnalysisQueueBusy を送出する
+- 落ちたジョブ: 待機中（PENDING）はキューに残っている限り配送されるので、有効期限まで生きているとみなす。
+  処理中（PROCESSING）は進行状況の保存で updated_at が進むため、キューの timeout + retry
+  （ワーカーが落ちてから再配送され、次の保存が来るまで）の間更新がなければ落ちたものとみなし、
+  重複排除・背圧の対象から外す
+- 永続性: ORM ブローカーのキューに残るため、ワーカーが再起動しても retry 秒後に再配送される。
+  タスク側は完了・失敗済みのセッションを処理しない（claim_session）
+
+進行状況はこれまでどおりセッションの processing_status / analysis_result を get_progress で読む。
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT_STATUSES = ('PENDING', 'PROCESSING')
+
+LANE_INTERACTIVE = 'interactive'
+LANE_BATCH = 'batch'
+
+DEFAULT_ANALYSIS_JOB_SETTINGS = {
+    # レーン → django-q のキュー（クラスタ）名
+    'LANES': {LANE_INTERACTIVE: 'analysis', LANE_BATCH: 'analysis_batch'},
+    # 待機中・処理中のセッション数の上限（感情分析・包括分析それぞれ）
+    'MAX_IN_FLIGHT': 20,
+    # この秒数 updated_at が進まない処理中セッションは落ちたジョブとみなし、重複排除・背圧の対象外にする。
+    # None ならレーンのキューの timeout + retry（再配送を待ち切るまで）の最大値
+    'STALE_AFTER_SECONDS': None,
+}
+
+
+class AnalysisQueueBusy(Exception):
+    """分析キューが混雑していて新しいジョブを受け付けられない"""
+
+
+def job_settings() -> dict:
+    return {**DEFAULT_ANALYSIS_JOB_SETTINGS, **getattr(settings, 'ANALYSIS_JOB_SETTINGS', {})}
+
+
+def lane_cluster(lane: str) -> str:
+    lanes = job_settings()['LANES']
+    return lanes.get(lane, lanes[LANE_INTERACTIVE])
+
+
+def stale_after_seconds() -> int:
+    """処理中セッションを落ちたとみなすまでの秒数"""
+    conf = job_settings()
+    if conf['STALE_AFTER_SECONDS']:
+        return int(conf['STALE_AFTER_SECONDS'])
+    q_cluster = getattr(settings, 'Q_CLUSTER', {})
+    windows = []
+    for cluster in set(conf['LANES'].values()):
+        lane_conf = {**q_cluster, **q_cluster.get('ALT_CLUSTERS', {}).get(cluster, {})}
+        windows.append(int(lane_conf.get('timeout') or 0) + int(lane_conf.get('retry') or 0))
+    return max(windows)
+
+
+def in_flight_sessions(session_model):
+    """待機中・処理中（落ちたジョブを除く）のセッション"""
+    now = timezone.now()
+    return session_model.objects.filter(
+        Q(processing_status='PENDING')
+        | Q(processing_status='PROCESSING', updated_at__gte=now - timedelta(seconds=stale_after_seconds())),
+        expires_at__gt=now,
+    )
+
+
+def queue_position(session) -> int:
+    """待機中のセッションより前に積まれている待機中・処理中セッションの数"""
+    return (
+        in_flight_sessions(type(session))
+        .filter(created_at__lt=session.created_at)
+        .count()
+    )
+
+
+def submit_analysis_job(session_model, document, task: str, lane: str = LANE_INTERACTIVE,
+                        user_ip: str = None):
+    """書類の分析セッションを作ってキューへ投入する。
+
+    Returns:
+        tuple: (session, deduplicated) 既に待機中・処理中のセッションがあれば (そのセッション, True)
+
+    Raises:
+        AnalysisQueueBusy: 待機中・処理中のセッションが上限に達している
+    """
+    from ..models import DocumentMetadata
+
+    conf = job_settings()
+    with transaction.atomic():
+        # 同じ書類の同時クリックを直列化する
+        DocumentMetadata.objects.select_for_update().filter(pk=document.pk).first()
+
+        in_flight = in_flight_sessions(session_model)
+        existing = in_flight.filter(document=document).order_by('-created_at').first()
+        if existing:
+            logger.info(f"分析ジョブ重複のため既存セッションに合流: {existing.session_id}")
+            return existing, True
+
+        if in_flight.count() >= conf['MAX_IN_FLIGHT']:
+            raise AnalysisQueueBusy('分析が混み合っています。しばらくしてから再度お試しください')
+
+        session = session_model.objects.create(document=document, processing_status='PENDING')
+
+    try:
+        from django_q.tasks import async_task
+
+        async_task(
+            task, session.id, user_ip,
+            cluster=lane_cluster(lane),
+            task_name=f'{session_model._meta.model_name}-{session.session_id}',
+        )
+    except Exception as e:
+        logger.error(f"分析ジョブのキュー投入失敗: {session.session_id} - {e}")
+        session.processing_status = 'FAILED'
+        session.error_message = f'分析ジョブを開始できませんでした: {e}'
+        session.save(update_fields=['processing_status', 'error_message', 'updated_at'])
+        raise
+
+    logger.info(f"分析ジョブ投入: {session.session_id} lane={lane}")
+    return session, False
+
+
+def claim_session(session_model, session_id: int) -> bool:
+    """キューから受け取ったセッションを処理してよいか（完了・失敗・期限切れ・削除済みは処理しない）
+
+    ワーカー再起動後の再配送で、完了済みのセッションを分析し直さないようにする。
+    """
+    session = session_model.objects.filter(id=session_id).only('processing_status', 'expires_at').first()
+    if session is None:
+        logger.warning(f"分析ジョブ: セッションが見つかりません id={session_id}")
+        return False
+    if session.processing_status not in IN_FLIGHT_STATUSES:
+        logger.info(f"分析ジョブ: 処理済みのためスキップ id={session_id} ({session.processing_status})")
+        return False
+    if session.expires_at <= timezone.now():
+        logger.info(f"分析ジョブ: 期限切れのためスキップ id={session_id}")
+        return False
+    return True
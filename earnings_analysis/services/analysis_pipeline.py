@@ -0,0 +1,408 @@
+# earnings_analysis/services/analysis_pipeline.py
+"""
+新規開示（有報・半報）の自動分析パイプライン
+
+DisclosureSync はイベントごとに auto_analyze_disclosure_task を1件ずつキューしていたため、
+qcluster の2ワーカーが「XBRL 取得 → 解析 → 語彙感情分析 → 保存」を1書類ずつ直列に処理し、
+決算集中期の後は消化に丸1日かかっていた。
+
+ここでは処理を3段に分ける。
+
+1. 取得: スレッドプール（I/O 待ち）。EDINET へのリクエスト間隔は
+   EdinetAPIClient の共有トークンバケットが守るので、スレッドを増やしても API 制限は超えない
+2. 解析: プロセスプール（CPU）。XBRL の解析と語彙感情分析は DB に触れない
+   純粋な関数（analyze_xbrl_payload）として子プロセスで実行する。
+   django-q のワーカー（daemon プロセス）は子プロセスを作れないため、その中では直列に実行する
+3. 書込: 呼び出し元スレッド。WRITE_BATCH_SIZE 書類ごとに1トランザクションで保存する
+
+各段の所要時間（件数・平均・p95・最大）と未分析の残件数（バックログ）を
+メトリクスとしてログと METRICS_PATH の JSON ファイルに残す（Django のキャッシュは
+プロセスごとの LocMemCache なので、run_disclosure_analysis --status など別プロセスから読めない）。
+
+取得に失敗した・XBRL に財務データや本文がなく分析結果が揃わなかった書類は
+DocumentMetadata.analysis_attempts を数え、MAX_ATTEMPTS に達したらバックログから外す。
+"""
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from . import disk_cache
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('download', 'parse', 'sentiment', 'write')
+
+DEFAULT_PIPELINE_SETTINGS = {
+    'IO_WORKERS': 4,
+    'CPU_WORKERS': 2,
+    'WRITE_BATCH_SIZE': 20,
+    'TASK_LIMIT': 40,
+    'MAX_ATTEMPTS': 3,
+    # 直近の実行メトリクスの保存先（None なら BASE_DIR/cache/disclosure_analysis/last_run.json）
+    'METRICS_PATH': None,
+}
+
+
+def pipeline_settings() -> dict:
+    return {**DEFAULT_PIPELINE_SETTINGS, **getattr(settings, 'DISCLOSURE_ANALYSIS_PIPELINE', {})}
+
+
+# ------------------------------------------------------------------
+# バックログ
+# ------------------------------------------------------------------
+def analysis_backlog():
+    """未分析の開示書類（財務データか語彙感情分析のどちらかが未保存）の QuerySet
+
+    MAX_ATTEMPTS 回試しても揃わなかった書類は含めない。
+    """
+    from django.db.models import Exists, OuterRef, Q
+    from ..models import (
+        CompanyFinancialData, DisclosureEvent, DocumentMetadata, SentimentAnalysisHistory,
+    )
+    from .xbrl_analysis_service import XBRL_ANALYZABLE_DOC_TYPE_CODES
+
+    return (
+        DocumentMetadata.objects
+        .filter(
+            xbrl_flag=True,
+            doc_type_code__in=XBRL_ANALYZABLE_DOC_TYPE_CODES,
+            doc_id__in=DisclosureEvent.objects.values('doc_id'),
+            analysis_attempts__lt=pipeline_settings()['MAX_ATTEMPTS'],
+        )
+        .annotate(
+            has_financial=Exists(CompanyFinancialData.objects.filter(document=OuterRef('pk'))),
+            has_sentiment=Exists(SentimentAnalysisHistory.objects.filter(document=OuterRef('pk'))),
+        )
+        .filter(Q(has_financial=False) | Q(has_sentiment=False))
+        .order_by('-file_date', 'doc_id')
+    )
+
+
+def backlog_depth() -> int:
+    return analysis_backlog().count()
+
+
+# ------------------------------------------------------------------
+# 子プロセスで実行する解析（DB に触れない）
+# ------------------------------------------------------------------
+_xbrl_service = None
+_sentiment_analyzer = None
+
+
+def _init_worker():
+    """spawn / forkserver で起動した子プロセスでも Django の設定を読めるようにする"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def analyze_xbrl_payload(xbrl_bytes: bytes, document_info: dict,
+                         need_financial: bool, need_sentiment: bool) -> dict:
+    """XBRL のバイト列から財務データ・数値ファクト・語彙感情分析結果を求める。
+
+    プロセスプールから呼ぶため、引数・戻り値は pickle 可能な値のみとする。
+    """
+    global _xbrl_service, _sentiment_analyzer
+    from .xbrl_extractor import EDINETXBRLService
+
+    if _xbrl_service is None:
+        _xbrl_service = EDINETXBRLService()
+
+    result = {'financial_data': {}, 'facts': [], 'sentiment': None, 'timings': {}}
+    text_sections = None
+
+    if need_financial:
+        started = time.monotonic()
+        # 感情分析のテキストも同じ展開・解析から取り出す（ZIP を2回展開しない）
+        data = _xbrl_service._extract_comprehensive_from_bytes(xbrl_bytes, include_text=need_sentiment)
+        result['financial_data'] = data.get('financial_data', {})
+        result['facts'] = data.get('facts', [])
+        text_sections = data.get('xbrl_text')
+        result['timings']['parse'] = time.monotonic() - started
+
+    if need_sentiment:
+        started = time.monotonic()
+        if text_sections is None:
+            text_sections = _xbrl_service._extract_text_from_bytes(xbrl_bytes)
+        if text_sections:
+            from .sentiment_cache import analyze_with_cache
+            if _sentiment_analyzer is None:
+                from .sentiment_analyzer import TransparentSentimentAnalyzer
+                _sentiment_analyzer = TransparentSentimentAnalyzer()
+            sentiment = analyze_with_cache(
+                _sentiment_analyzer, text_sections, None, document_info, use_ai=False,
+                doc_id=document_info.get('doc_id'),
+            )
+            if sentiment and sentiment.get('overall_score') is not None:
+                result['sentiment'] = sentiment
+        result['timings']['sentiment'] = time.monotonic() - started
+
+    return result
+
+
+# ------------------------------------------------------------------
+# メトリクス
+# ------------------------------------------------------------------
+class PipelineMetrics:
+    """段ごとの所要時間を集計する"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.counts = {'documents': 0, 'financial_saved': 0, 'sentiment_saved': 0, 'failed': 0}
+        self.started = time.monotonic()
+
+    def record(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+
+    def summary(self, backlog_before: int = None, backlog_after: int = None) -> dict:
+        stages = {}
+        for stage, values in self.samples.items():
+            if not values:
+                continue
+            ordered = sorted(values)
+            stages[stage] = {
+                'count': len(ordered),
+                'avg_seconds': round(sum(ordered) / len(ordered), 3),
+                'p95_seconds': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                'max_seconds': round(ordered[-1], 3),
+            }
+        return {
+            **self.counts,
+            'elapsed_seconds': round(time.monotonic() - self.started, 3),
+            'backlog_before': backlog_before,
+            'backlog_after': backlog_after,
+            'stages': stages,
+        }
+
+
+class _InlineExecutor:
+    """CPU_WORKERS=0・daemon プロセス用: 呼び出し元スレッドでそのまま実行する"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+# ------------------------------------------------------------------
+# パイプライン本体
+# ------------------------------------------------------------------
+def _document_info(document) -> dict:
+    return {
+        'doc_id': document.doc_id,
+        'company_name': document.company_name or '不明',
+        'doc_description': document.doc_description or '不明',
+        'doc_type_code': document.doc_type_code or '不明',
+        'submit_date': document.submit_date_time.strftime('%Y-%m-%d') if document.submit_date_time else '不明',
+        'securities_code': document.securities_code or '',
+        'edinet_code': document.edinet_code or '',
+    }
+
+
+def _download(document) -> tuple:
+    from .xbrl_extractor import EDINETXBRLService
+
+    started = time.monotonic()
+    payload = EDINETXBRLService()._load_xbrl_archive(document.doc_id)
+    return payload, time.monotonic() - started
+
+
+def _pending_work(documents) -> Iterable[tuple]:
+    """(document, need_financial, need_sentiment) を返す（分析済みの書類は除く）
+
+    財務分析は財務諸表を含む書類種別（XBRL_ANALYZABLE_DOC_TYPE_CODES）のみ。
+    """
+    from ..models import CompanyFinancialData, SentimentAnalysisHistory
+    from .xbrl_analysis_service import XBRL_ANALYZABLE_DOC_TYPE_CODES
+
+    documents = list(documents)
+    ids = [d.pk for d in documents]
+    financial_done = set(
+        CompanyFinancialData.objects.filter(document_id__in=ids).values_list('document_id', flat=True)
+    )
+    sentiment_done = set(
+        SentimentAnalysisHistory.objects.filter(document_id__in=ids).values_list('document_id', flat=True)
+    )
+    for document in documents:
+        need_financial = (
+            document.pk not in financial_done
+            and document.doc_type_code in XBRL_ANALYZABLE_DOC_TYPE_CODES
+        )
+        need_sentiment = document.pk not in sentiment_done
+        if document.xbrl_flag and (need_financial or need_sentiment):
+            yield document, need_financial, need_sentiment
+
+
+def _cpu_pool(cpu_workers: int):
+    """解析用のプロセスプール（daemon プロセスは子プロセスを作れないため直列にする）"""
+    if cpu_workers <= 0 or multiprocessing.current_process().daemon:
+        return _InlineExecutor()
+    return ProcessPoolExecutor(max_workers=cpu_workers, initializer=_init_worker)
+
+
+def _record_incomplete(document_ids: list):
+    """分析結果が揃わなかった書類の試行回数を数える（updated_at は変えない）"""
+    from ..models import DocumentMetadata
+
+    if document_ids:
+        DocumentMetadata.objects.filter(pk__in=document_ids).update(
+            analysis_attempts=F('analysis_attempts') + 1
+        )
+
+
+def _write_results(results: list, metrics: PipelineMetrics):
+    """解析結果を1トランザクションで保存する"""
+    from ..models import SentimentAnalysisHistory
+    from .comprehensive_analyzer import ComprehensiveAnalysisService
+    from .xbrl_fact_store import save_document_facts
+
+    started = time.monotonic()
+    comprehensive = ComprehensiveAnalysisService()
+    histories = []
+    with transaction.atomic():
+        for document, result in results:
+            if result['financial_data']:
+                comprehensive._save_financial_data(document, result['financial_data'])
+                save_document_facts(document, result['facts'])
+                metrics.counts['financial_saved'] += 1
+            if result['sentiment']:
+                sentiment = result['sentiment']
+                histories.append(SentimentAnalysisHistory(
+                    document=document,
+                    overall_score=sentiment['overall_score'],
+                    sentiment_label=sentiment['sentiment_label'],
+                    analysis_result=sentiment,
+                ))
+        SentimentAnalysisHistory.objects.bulk_create(histories)
+    metrics.counts['sentiment_saved'] += len(histories)
+    metrics.record('write', time.monotonic() - started)
+
+
+def run_analysis_pipeline(documents, io_workers: int = None, cpu_workers: int = None,
+                          write_batch_size: int = None, record_backlog: bool = True) -> dict:
+    """書類群を 取得 → 解析 → 書込 のパイプラインで分析する。
+
+    取得済み・解析中の書類は io_workers + 2 × cpu_workers 件までに抑え、
+    メモリに ZIP を溜め込まないようにする。
+
+    Returns:
+        dict: PipelineMetrics.summary()（保存件数・段ごとの所要時間・バックログ）
+    """
+    config = pipeline_settings()
+    io_workers = max(1, io_workers or config['IO_WORKERS'])
+    cpu_workers = config['CPU_WORKERS'] if cpu_workers is None else cpu_workers
+    write_batch_size = max(1, write_batch_size or config['WRITE_BATCH_SIZE'])
+    max_in_flight = io_workers + 2 * max(1, cpu_workers)
+
+    metrics = PipelineMetrics()
+    backlog_before = backlog_depth() if record_backlog else None
+
+    work = iter(_pending_work(documents))
+    io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='xbrl-download')
+    cpu_pool = _cpu_pool(cpu_workers)
+    in_flight = {}  # future -> (stage, document, need_financial, need_sentiment)
+    pending_writes = []
+    incomplete = []  # 取得・解析に失敗したか、必要な結果が揃わなかった書類
+
+    def submit_downloads():
+        while len(in_flight) < max_in_flight:
+            item = next(work, None)
+            if item is None:
+                return
+            metrics.counts['documents'] += 1
+            in_flight[io_pool.submit(_download, item[0])] = ('download', *item)
+
+    try:
+        submit_downloads()
+        while in_flight:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, document, need_financial, need_sentiment = in_flight.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    metrics.counts['failed'] += 1
+                    incomplete.append(document.pk)
+                    logger.warning(f'開示自動分析失敗（{stage}）: doc_id={document.doc_id}, {e}')
+                    continue
+
+                if stage == 'download':
+                    payload, seconds = value
+                    metrics.record('download', seconds)
+                    analysis = cpu_pool.submit(
+                        analyze_xbrl_payload, payload, _document_info(document),
+                        need_financial, need_sentiment,
+                    )
+                    in_flight[analysis] = ('analyze', document, need_financial, need_sentiment)
+                else:
+                    for name, seconds in value['timings'].items():
+                        metrics.record(name, seconds)
+                    if ((need_financial and not value['financial_data'])
+                            or (need_sentiment and not value['sentiment'])):
+                        incomplete.append(document.pk)
+                    pending_writes.append((document, value))
+                    if len(pending_writes) >= write_batch_size:
+                        _write_results(pending_writes, metrics)
+                        _record_incomplete(incomplete)
+                        pending_writes, incomplete = [], []
+            submit_downloads()
+
+        if pending_writes:
+            _write_results(pending_writes, metrics)
+        _record_incomplete(incomplete)
+    finally:
+        io_pool.shutdown(wait=True, cancel_futures=True)
+        cpu_pool.shutdown(wait=True, cancel_futures=True)
+
+    summary = metrics.summary(
+        backlog_before=backlog_before,
+        backlog_after=backlog_depth() if record_backlog else None,
+    )
+    _save_metrics(summary)
+    logger.info(
+        f"開示自動分析パイプライン: {summary['documents']}書類 "
+        f"(財務{summary['financial_saved']} / 感情{summary['sentiment_saved']} / 失敗{summary['failed']}) "
+        f"{summary['elapsed_seconds']}秒, バックログ {backlog_before} → {summary['backlog_after']}, "
+        f"段別 {summary['stages']}"
+    )
+    return summary
+
+
+def metrics_path() -> Path:
+    path = pipeline_settings()['METRICS_PATH']
+    return Path(path) if path else Path(settings.BASE_DIR) / 'cache' / 'disclosure_analysis' / 'last_run.json'
+
+
+def _save_metrics(summary: dict):
+    """直近の実行メトリクスを全プロセスから読めるファイルに書く（失敗しても分析は止めない）"""
+    try:
+        disk_cache.atomic_write(metrics_path(), json.dumps(summary, ensure_ascii=False).encode('utf-8'))
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f'開示自動分析メトリクス保存失敗: {e}')
+
+
+def last_run_metrics() -> Optional[dict]:
+    """直近のパイプライン実行メトリクス（未実行・読めなければ None）"""
+    try:
+        return json.loads(metrics_path().read_bytes())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f'開示自動分析メトリクス読み込み失敗: {e}')
+        return None
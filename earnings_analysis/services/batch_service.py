@@ -296,14 +296,18 @@ class BatchService:
     def _execute_financial_analysis(self, document):
         """個別の財務分析実行"""
         try:
+            from .analysis_jobs import LANE_BATCH
             from .comprehensive_analyzer import ComprehensiveAnalysisService
             
             service = ComprehensiveAnalysisService()
             result = service.start_comprehensive_analysis(
                 document.doc_id, 
                 force=False, 
-                user_ip='127.0.0.1'  # バッチ処理用
+                user_ip='127.0.0.1',  # バッチ処理用
+                lane=LANE_BATCH,  # 画面からの分析より後回しにする
             )
+            if result.get('status') == 'busy':
+                return {'success': False, 'error': result['message']}
             
             return {'success': True, 'result': result}
             
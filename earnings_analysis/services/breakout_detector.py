@@ -77,8 +77,8 @@ class BreakoutDetector:
         if not api_key:
             return
         try:
-            from google import genai
-            self.client = genai.Client(api_key=api_key)
+            from .llm_gateway import get_llm_client
+            self.client = get_llm_client(api_key)
             self.model = "gemini-2.5-flash-lite"
         except Exception as e:
             logger.warning(f"BreakoutDetector Gemini初期化失敗（ルールベース分析のみ実行）: {e}")
@@ -306,7 +306,11 @@ class BreakoutDetector:
             response = self.client.models.generate_content(model=self.model, contents=prompt)
             if not response or not response.text:
                 return None
-            return self._parse_gemini_response(response.text)
+            insights = self._parse_gemini_response(response.text)
+            if insights is None:
+                # 解釈できなかった応答はキャッシュから消し、次の判定で取り直す
+                self.client.gateway.invalidate(self.model, prompt)
+            return insights
         except Exception as e:
             logger.warning(f"BreakoutDetector Gemini分析失敗（スキップ）: {e}")
             return None
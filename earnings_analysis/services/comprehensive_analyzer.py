@@ -1,11 +1,11 @@
 # earnings_analysis/services/comprehensive_analyzer.py（新規作成）
-import threading
 import time
 import logging
 from typing import Dict, Any, Optional
 from django.utils import timezone
 from datetime import timedelta
 
+from .analysis_jobs import LANE_INTERACTIVE, AnalysisQueueBusy, queue_position, submit_analysis_job
 from .sentiment_analyzer import SentimentAnalysisService, TransparentSentimentAnalyzer
 from .financial_analyzer import FinancialAnalyzer
 from .xbrl_extractor import EDINETXBRLService
@@ -20,8 +20,9 @@ class ComprehensiveAnalysisService:
         self.financial_analyzer = FinancialAnalyzer()
         self.xbrl_service = EDINETXBRLService()
     
-    def start_comprehensive_analysis(self, document_id: str, force: bool = False, user_ip: str = None) -> Dict[str, Any]:
-        """包括的分析開始"""
+    def start_comprehensive_analysis(self, document_id: str, force: bool = False, user_ip: str = None,
+                                     lane: str = LANE_INTERACTIVE) -> Dict[str, Any]:
+        """包括的分析開始（django-q の analysis キューで実行。混雑時は status='busy'）"""
         from ..models import DocumentMetadata, FinancialAnalysisSession
         
         try:
@@ -43,25 +44,25 @@ class ComprehensiveAnalysisService:
                         'message': '2時間以内に包括分析済みです'
                     }
             
-            # 新しいセッション作成
-            session = FinancialAnalysisSession.objects.create(
-                document=document,
-                processing_status='PENDING'
+            # セッションを作成して analysis キューへ投入（同じ書類の分析中ジョブがあれば合流）
+            session, deduplicated = submit_analysis_job(
+                FinancialAnalysisSession, document,
+                'earnings_analysis.tasks.run_comprehensive_analysis_task',
+                lane=lane, user_ip=user_ip,
             )
             
-            # バックグラウンドで分析実行
-            threading.Thread(
-                target=self._execute_comprehensive_analysis,
-                args=(session.id, user_ip),
-                daemon=True
-            ).start()
-            
             return {
                 'status': 'started',
                 'session_id': str(session.session_id),
-                'message': '包括的分析（感情分析 + 財務分析）を開始しました'
+                'deduplicated': deduplicated,
+                'message': (
+                    '同じ書類の包括分析が進行中です' if deduplicated
+                    else '包括的分析（感情分析 + 財務分析）を開始しました'
+                )
             }
             
+        except AnalysisQueueBusy as e:
+            return {'status': 'busy', 'message': str(e)}
         except DocumentMetadata.DoesNotExist:
             raise Exception('指定された書類が見つかりません')
         except Exception as e:
@@ -90,7 +91,8 @@ class ComprehensiveAnalysisService:
                 message = f'分析失敗: {session.error_message}'
             else:
                 progress = 0
-                message = '分析待機中...'
+                position = queue_position(session)
+                message = f'分析の順番待ち中（前に{position}件）...' if position else '分析待機中...'
             
             return {
                 'progress': progress,
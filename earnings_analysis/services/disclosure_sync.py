@@ -14,11 +14,15 @@ StockDiary.latest_disclosure_date / latest_disclosure_doc_type_name を更新す
   - Stage 1: 銘柄単位の差分検知（全日記を list() でメモリに載せない）
   - Stage 2: DB内バルクINSERTでのファンアウト（Pythonループでユーザーを回さない設計を
     崩さないよう、銘柄ごとに values + bulk_create のみで処理する）
+- 前回処理した DocumentMetadata / StockDiary の updated_at をウォーターマークとして保存し、
+  それ以降に更新された書類・日記の銘柄だけを再計算する。新着がなければ1クエリで終わる
 """
 import logging
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 from django.db import connection
+from django.db.models import Case, DateField, DateTimeField, Max, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Concat
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
@@ -37,59 +41,57 @@ IMPORTANT_DOC_TYPE_CODES = {
 EVENT_MAX_AGE_DAYS = 7
 
 # ファンアウト時の bulk_create バッチサイズ
-FANOUT_BATCH_SIZE = 500
+FANOUT_BATCH_SIZE = 2000
 
+# 日記の一括 UPDATE 1文あたりの銘柄数（CASE 式の分岐数）
+DIARY_UPDATE_BATCH_SIZE = 500
 
-def update_diary_disclosure_status() -> int:
+# SyncWatermark の名前
+DOCUMENT_WATERMARK = 'disclosure_sync.documents'
+DIARY_WATERMARK = 'disclosure_sync.diaries'
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def update_diary_disclosure_status(full: bool = False) -> int:
     """
-    全ユーザーの StockDiary に最新開示日と書類種別を更新し、
+    StockDiary に最新開示日と書類種別を更新し、
     新規開示のイベント記録とアプリ内通知ファンアウトを行う。
 
+    前回以降に更新された重要書類・日記の銘柄だけを対象にする（full=True で全銘柄）。
+
     Returns:
         int: 更新した StockDiary レコード数
     """
+    from earnings_analysis.models import SyncWatermark
     from stockdiary.models import StockDiary
 
-    # ユニーク銘柄コードのみ取得（4桁数字 = 日本株。日記数に依存しない）
-    symbols = list(
-        StockDiary.objects
-        .filter(stock_symbol__regex=r'^\d{4}$')
-        .values_list('stock_symbol', flat=True)
-        .distinct()
-    )
-
-    if not symbols:
-        logger.info('開示インジケーター更新: 対象銘柄なし')
+    touched_codes, watermarks = _fetch_touched_codes()
+    if full:
+        touched_codes = None
+    elif not touched_codes:
+        logger.info('開示インジケーター更新: 前回以降の更新なし')
         return 0
 
-    # 4桁コード → 5桁証券コード（末尾に '0' を付加）
-    securities_codes = [s + '0' for s in symbols]
+    # 日記で記録されている銘柄（4桁数字 = 日本株。日記数に依存しない）
+    diary_symbols = StockDiary.objects.filter(stock_symbol__regex=r'^\d{4}$')
+    if touched_codes is not None:
+        diary_symbols = diary_symbols.filter(stock_symbol__in=[code[:-1] for code in touched_codes])
+    symbols = list(diary_symbols.values_list('stock_symbol', flat=True).distinct())
 
-    # 銘柄ごとの最新開示（securities_code → row dict）
-    disclosure_map = _fetch_latest_disclosures(securities_codes)
-
-    # Stage 1a: StockDiary を銘柄単位で更新（変更がある行のみ UPDATE）
     updated_count = 0
-    for symbol in symbols:
-        info = disclosure_map.get(symbol + '0')
-        new_date = info['file_date'] if info else None
-        new_name = info['doc_type_name'] if info else ''
+    new_events = []
+    if symbols:
+        # 4桁コード → 5桁証券コード（末尾に '0' を付加）
+        disclosure_map = _fetch_latest_disclosures([s + '0' for s in symbols])
 
-        updated_count += (
-            StockDiary.objects
-            .filter(stock_symbol=symbol)
-            .exclude(
-                latest_disclosure_date=new_date,
-                latest_disclosure_doc_type_name=new_name,
-            )
-            .update(
-                latest_disclosure_date=new_date,
-                latest_disclosure_doc_type_name=new_name,
-            )
-        )
+        # Stage 1a: StockDiary を一括更新（変更がある行のみ）
+        updated_count = _apply_diary_disclosures(symbols, disclosure_map)
 
-    # Stage 1b: 新規開示をイベント化（銘柄×書類で一意、再実行しても重複しない）
-    new_events = _record_disclosure_events(disclosure_map)
+        # Stage 1b: 新規開示をイベント化（銘柄×書類で一意、再実行しても重複しない）
+        new_events = _record_disclosure_events(disclosure_map)
+    else:
+        logger.info('開示インジケーター更新: 対象銘柄なし')
 
     # Stage 2: 該当銘柄を記録中のユーザーへアプリ内通知をファンアウト
     notified_count = fan_out_disclosure_notifications(new_events)
@@ -97,16 +99,101 @@ def update_diary_disclosure_status() -> int:
     # 新規開示の XBRL 財務分析を非同期実行（決算レビュー素材の事前準備）
     _queue_auto_analysis(new_events)
 
+    for name, value in watermarks.items():
+        SyncWatermark.objects.update_or_create(name=name, defaults={'value': value})
+
     logger.info(
-        f'開示インジケーター更新完了: 日記更新={updated_count}件, '
+        f'開示インジケーター更新完了: 対象銘柄={len(symbols)}件, 日記更新={updated_count}件, '
         f'新規イベント={len(new_events)}件, 通知={notified_count}件'
     )
     return updated_count
 
 
+def _watermark(name):
+    """SyncWatermark の値（未保存なら最古）を返すサブクエリ式"""
+    from earnings_analysis.models import SyncWatermark
+
+    return Coalesce(
+        Subquery(SyncWatermark.objects.filter(name=name).values('value')[:1]),
+        Value(_EPOCH, output_field=DateTimeField()),
+    )
+
+
+def _fetch_touched_codes():
+    """前回のウォーターマーク以降に更新された重要書類・日記の証券コード（5桁）を1クエリで取得する。
+
+    Returns:
+        tuple: (証券コードの set, {ウォーターマーク名: 新しい値})
+    """
+    from earnings_analysis.models import DocumentMetadata
+    from stockdiary.models import StockDiary
+
+    documents = (
+        DocumentMetadata.objects
+        .filter(updated_at__gt=_watermark(DOCUMENT_WATERMARK),
+                doc_type_code__in=IMPORTANT_DOC_TYPE_CODES)
+        .exclude(securities_code='')
+        .order_by()
+        .values('securities_code')
+        .annotate(source=Value(DOCUMENT_WATERMARK), touched_at=Max('updated_at'))
+        .values_list('source', 'securities_code', 'touched_at')
+    )
+    diaries = (
+        StockDiary.objects
+        .filter(updated_at__gt=_watermark(DIARY_WATERMARK), stock_symbol__regex=r'^\d{4}$')
+        .order_by()
+        .annotate(code=Concat('stock_symbol', Value('0')))
+        .values('code')
+        .annotate(source=Value(DIARY_WATERMARK), touched_at=Max('updated_at'))
+        .values_list('source', 'code', 'touched_at')
+    )
+
+    codes = set()
+    watermarks = {}
+    for source, code, touched_at in documents.union(diaries, all=True):
+        codes.add(code)
+        if source not in watermarks or touched_at > watermarks[source]:
+            watermarks[source] = touched_at
+    return codes, watermarks
+
+
+def _apply_diary_disclosures(symbols, disclosure_map) -> int:
+    """銘柄ごとの最新開示を StockDiary に反映する（CASE 式の一括 UPDATE、変更がある行のみ）"""
+    from stockdiary.models import StockDiary
+
+    updated_count = 0
+    for i in range(0, len(symbols), DIARY_UPDATE_BATCH_SIZE):
+        chunk = symbols[i:i + DIARY_UPDATE_BATCH_SIZE]
+        changed = Q()
+        date_cases = []
+        name_cases = []
+        for symbol in chunk:
+            info = disclosure_map.get(symbol + '0')
+            new_date = info['file_date'] if info else None
+            new_name = info['doc_type_name'] if info else ''
+            changed |= Q(stock_symbol=symbol) & ~Q(
+                latest_disclosure_date=new_date,
+                latest_disclosure_doc_type_name=new_name,
+            )
+            date_cases.append(When(stock_symbol=symbol, then=Value(new_date, output_field=DateField())))
+            name_cases.append(When(stock_symbol=symbol, then=Value(new_name)))
+
+        updated_count += (
+            StockDiary.objects
+            .filter(changed)
+            .update(
+                latest_disclosure_date=Case(*date_cases, default=None, output_field=DateField()),
+                latest_disclosure_doc_type_name=Case(*name_cases, default=Value('')),
+            )
+        )
+    return updated_count
+
+
 def _queue_auto_analysis(events):
-    """新規 DisclosureEvent ごとに XBRL 財務分析タスクを django-q にキューする。
+    """新規 DisclosureEvent 群の財務・トーン分析を1つの django-q タスクとしてキューする。
 
+    イベントごとにタスクを積むと qcluster のワーカー数だけしか並列にならないため、
+    まとめて分析パイプライン（services/analysis_pipeline.py）に渡す。
     キュー投入の失敗（qcluster 未稼働・テーブル未作成等）はバッチ全体を
     止めないよう握りつぶしてログのみ残す。
     """
@@ -117,13 +204,13 @@ def _queue_auto_analysis(events):
     except ImportError:
         return
 
-    for event in events:
-        try:
-            async_task(
-                'earnings_analysis.tasks.auto_analyze_disclosure_task', event.id
-            )
-        except Exception as e:
-            logger.warning(f'XBRL自動分析のキュー投入失敗: event_id={event.id}, {e}')
+    event_ids = [event.id for event in events]
+    try:
+        async_task(
+            'earnings_analysis.tasks.run_disclosure_analysis_pipeline_task', event_ids
+        )
+    except Exception as e:
+        logger.warning(f'XBRL自動分析のキュー投入失敗: event_ids={event_ids}, {e}')
 
 
 def _fetch_latest_disclosures(securities_codes) -> dict:
@@ -225,53 +312,116 @@ def _record_disclosure_events(disclosure_map: dict) -> list:
     ]
 
 
-def fan_out_disclosure_notifications(events) -> int:
+def fan_out_disclosure_notifications(events, digest: bool = None) -> int:
     """新規開示イベントを該当銘柄の記録ユーザーへアプリ内通知として展開する。
 
-    - ユーザーごとに1通（同一銘柄の日記が複数あっても最新更新の日記に誘導）
+    - 全イベントの銘柄について (銘柄, ユーザー, 日記) を1クエリで取得し、
+      ユーザー・銘柄順のストリームで (user, event) ごとに1通へ絞る
+      （同一銘柄の日記が複数あっても最新更新の日記に誘導）
     - (user, disclosure_event) の一意制約 + ignore_conflicts で重複送信を防ぐ
+    - digest=True（既定は settings.DISCLOSURE_NOTIFICATION_DIGEST）なら、
+      (ユーザー, 提出日) ごとに複数の開示を1通にまとめる
+      （その日の先頭イベントに紐付けるため、再ファンアウトしても重複しない）
     - プッシュ配信はここでは行わない（Stage 3 のダイジェスト配信で対応予定）
 
     Returns:
         int: 作成したアプリ内通知数
     """
+    from django.conf import settings
     from stockdiary.models import StockDiary, NotificationLog
 
-    total = 0
-    for event in events:
-        symbol = event.securities_code[:-1]  # 5桁 → 4桁
+    if not events:
+        return 0
+    if digest is None:
+        digest = getattr(settings, 'DISCLOSURE_NOTIFICATION_DIGEST', False)
 
-        rows = (
-            StockDiary.objects
-            .filter(stock_symbol=symbol, is_excluded=False)
-            .order_by('user_id', '-updated_at')
-            .values('id', 'user_id', 'stock_name')
-            .iterator(chunk_size=1000)
-        )
+    events_by_symbol = {}
+    for event in sorted(events, key=lambda e: e.id):
+        events_by_symbol.setdefault(event.securities_code[:-1], []).append(event)  # 5桁 → 4桁
+
+    rows = (
+        StockDiary.objects
+        .filter(stock_symbol__in=list(events_by_symbol), is_excluded=False)
+        .order_by('user_id', 'stock_symbol', '-updated_at')
+        .values_list('user_id', 'stock_symbol', 'id', 'stock_name')
+        .iterator(chunk_size=2000)
+    )
 
-        logs = []
-        seen_users = set()
-        for row in rows:
-            if row['user_id'] in seen_users:
-                continue
-            seen_users.add(row['user_id'])
-            logs.append(NotificationLog(
-                user_id=row['user_id'],
-                disclosure_event=event,
-                title=f"📄 {row['stock_name']} の確定決算が出ました",
-                message=(
-                    f"{event.file_date.strftime('%Y/%m/%d')} に「{event.doc_type_name}」"
-                    "が提出されました。仮説を見直して決算レビューを記録しませんか？"
-                ),
-                url=f"/stockdiary/{row['id']}/",
-            ))
-            if len(logs) >= FANOUT_BATCH_SIZE:
-                NotificationLog.objects.bulk_create(logs, ignore_conflicts=True)
-                total += len(logs)
-                logs = []
+    total = 0
+    logs = []
 
+    def flush():
+        nonlocal total, logs
         if logs:
             NotificationLog.objects.bulk_create(logs, ignore_conflicts=True)
             total += len(logs)
+            logs = []
+
+    def emit(user_id, items):
+        # items: [(event, diary_id, stock_name)]（ユーザー内で銘柄順）
+        if digest:
+            by_date = {}
+            for item in items:
+                by_date.setdefault(item[0].file_date, []).append(item)
+            for day_items in by_date.values():
+                if len(day_items) > 1:
+                    logs.append(_digest_notification(user_id, day_items))
+                else:
+                    logs.append(_event_notification(user_id, *day_items[0]))
+        else:
+            logs.extend(_event_notification(user_id, *item) for item in items)
+        if len(logs) >= FANOUT_BATCH_SIZE:
+            flush()
+
+    current_user = None
+    last_symbol = None
+    items = []
+    for user_id, symbol, diary_id, stock_name in rows:
+        if user_id != current_user:
+            if items:
+                emit(current_user, items)
+            current_user, last_symbol, items = user_id, None, []
+        if symbol == last_symbol:
+            continue  # 同一銘柄の2冊目以降（先頭が最新更新の日記）
+        last_symbol = symbol
+        items.extend((event, diary_id, stock_name) for event in events_by_symbol[symbol])
+    if items:
+        emit(current_user, items)
+    flush()
 
     return total
+
+
+def _event_notification(user_id, event, diary_id, stock_name):
+    from stockdiary.models import NotificationLog
+
+    return NotificationLog(
+        user_id=user_id,
+        disclosure_event=event,
+        title=f"📄 {stock_name} の確定決算が出ました",
+        message=(
+            f"{event.file_date.strftime('%Y/%m/%d')} に「{event.doc_type_name}」"
+            "が提出されました。仮説を見直して決算レビューを記録しませんか？"
+        ),
+        url=f"/stockdiary/{diary_id}/",
+    )
+
+
+def _digest_notification(user_id, items):
+    """同じ提出日の複数の開示を1通にまとめる（イベント ID の最も小さいものに紐付ける）"""
+    from stockdiary.models import NotificationLog
+
+    anchor = min(items, key=lambda item: item[0].id)[0]
+    names = list(dict.fromkeys(stock_name for _, _, stock_name in items))
+    listed = '、'.join(names[:5]) + (f' ほか{len(names) - 5}銘柄' if len(names) > 5 else '')
+    title = f"📄 確定決算が{len(items)}件出ました"
+    return NotificationLog(
+        user_id=user_id,
+        disclosure_event=anchor,
+        title=title[:100],
+        message=(
+            f"{anchor.file_date.strftime('%Y/%m/%d')} に {listed} の有報・半報が提出されました。"
+            "仮説を見直して決算レビューを記録しませんか？"
+        )[:500],
+        url="/stockdiary/",
+    )
@@ -0,0 +1,120 @@
+# earnings_analysis/services/disk_cache.py
+"""
+ディスクキャッシュの共通部品（原子的な書き込み・gzip・mtime による LRU）
+
+書類アーカイブ（document_archive）・感情分析結果（sentiment_cache）・LLM 応答（llm_gateway）・
+PDF のテキスト抽出（pdf_processor）は、どれも Web と qcluster のプロセス間で共有する
+ディスクキャッシュで、同じ書き方をしている:
+
+- 書き込みは同一ディレクトリの一時ファイル → os.replace で原子的に行う
+  （並行ワーカーや途中クラッシュで壊れたファイルを読ませない）
+- ファイルの mtime を最終アクセス時刻として扱い、読んだら更新する
+- ディレクトリ内の合計サイズが上限を超えたら、最終アクセスの古いものから消す
+
+キーの作り方・ファイルの中身・参照（refs）の扱いは各キャッシュ側に残し、ここはファイル操作だけを持つ。
+"""
+import gzip
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(path: Path, data: bytes):
+    """一時ファイルに書いてから os.replace で置き換える"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def write_gzip(path: Path, data: bytes, compresslevel: int = 6):
+    atomic_write(path, gzip.compress(data, compresslevel=compresslevel))
+
+
+def read_gzip(path: Path) -> bytes:
+    """gzip ファイルを展開して返す（無ければ FileNotFoundError、壊れていれば CORRUPT_ERRORS）"""
+    return gzip.decompress(path.read_bytes())
+
+
+# read_gzip で壊れたファイルとみなす例外（FileNotFoundError は先に捕まえること）
+CORRUPT_ERRORS = (OSError, EOFError, gzip.BadGzipFile)
+
+
+def unlink(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def touch(path: Path):
+    """LRU 用に最終アクセス時刻を更新する"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+class LRUDirectory:
+    """directory 配下の pattern に合うファイルを、合計 max_bytes 以内に保つ"""
+
+    def __init__(self, directory, pattern: str, max_bytes: int, label: str):
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.max_bytes = int(max_bytes)
+        self.label = label
+
+    def entries(self) -> List[Tuple[float, int, Path]]:
+        """(mtime, サイズ, パス) のリスト"""
+        if not self.directory.exists():
+            return []
+        entries = []
+        for path in self.directory.glob(self.pattern):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self, max_bytes: int = None) -> int:
+        """合計サイズが上限を超えていれば、最終アクセスの古いファイルから削除する。
+
+        Returns:
+            int: 削除したファイル数
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= limit:
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= limit:
+                break
+            unlink(path)
+            total -= size
+            removed += 1
+        logger.info(f"{self.label} LRU 削除: {removed}件（残り {total} bytes）")
+        return removed
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {
+            'files': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
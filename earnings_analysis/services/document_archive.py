@@ -0,0 +1,215 @@
+# earnings_analysis/services/document_archive.py
+"""
+EDINET 書類ファイル（XBRL ZIP・PDF）のローカルアーカイブ
+
+同じ doc_id の XBRL ZIP を、包括分析・感情分析・パネル表示・再分析のたびに
+EDINET API からダウンロードし直していた（1回あたり数MB + レート制限待ち2秒）。
+ここでは (doc_id, 書類タイプ) をキーに、取得済みファイルをディスクへ保存して再利用する。
+
+レイアウト（ROOT 配下）:
+- objects/<sha256先頭2文字>/<sha256>.gz : 書類本体を gzip 圧縮したもの（内容アドレス。同一内容は1つ）
+- refs/<doc_id>-<type>                   : 対応する blob の sha256
+
+方針:
+- 書き込みは同一ディレクトリの一時ファイル → os.replace で原子的に行う
+  （並行ワーカーや途中クラッシュで壊れたファイルを読ませない。disk_cache の部品）
+- 読み出し時に sha256 を再計算して照合し、不一致・展開失敗はミスとして破棄する
+- blob の mtime を最終アクセス時刻として扱い、合計サイズが MAX_BYTES を超えたら
+  古いものから削除する（LRU）。参照先が消えた ref は次回読み出し時に掃除する
+"""
+import hashlib
+import logging
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import disk_cache
+
+logger = logging.getLogger(__name__)
+
+# EDINET API の書類タイプ（EdinetDocumentService.type_code_map と同じ番号）
+DOC_TYPE_XBRL = 1
+DOC_TYPE_PDF = 2
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+class DocumentArchiveStore:
+    """(doc_id, type) → 書類バイト列のディスクキャッシュ（内容アドレス + LRU）"""
+
+    def __init__(self, root, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.objects_dir = self.root / 'objects'
+        self.refs_dir = self.root / 'refs'
+        self._lru = disk_cache.LRUDirectory(self.objects_dir, '*/*.gz', self.max_bytes, 'アーカイブ')
+
+    # ---- パス ----
+
+    @staticmethod
+    def _key(doc_id: str, doc_type) -> str:
+        return f"{doc_id}-{int(doc_type)}"
+
+    def _ref_path(self, doc_id: str, doc_type) -> Path:
+        return self.refs_dir / self._key(doc_id, doc_type)
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}.gz"
+
+    # ---- 読み書き ----
+
+    def get(self, doc_id: str, doc_type):
+        """保存済みの書類バイト列を返す。無い・壊れている場合は None。"""
+        ref_path = self._ref_path(doc_id, doc_type)
+        try:
+            digest = ref_path.read_text().strip()
+        except (FileNotFoundError, OSError):
+            return None
+
+        blob_path = self._blob_path(digest)
+        try:
+            data = disk_cache.read_gzip(blob_path)
+        except FileNotFoundError:
+            # LRU で blob だけ消えた ref
+            disk_cache.unlink(ref_path)
+            return None
+        except disk_cache.CORRUPT_ERRORS as e:
+            logger.warning(f"アーカイブ展開失敗のため破棄: {doc_id} type={doc_type} - {e}")
+            disk_cache.unlink(blob_path)
+            disk_cache.unlink(ref_path)
+            return None
+
+        if hashlib.sha256(data).hexdigest() != digest:
+            logger.warning(f"アーカイブのハッシュ不一致のため破棄: {doc_id} type={doc_type}")
+            disk_cache.unlink(blob_path)
+            disk_cache.unlink(ref_path)
+            return None
+
+        disk_cache.touch(blob_path)
+        return data
+
+    def put(self, doc_id: str, doc_type, data: bytes) -> str:
+        """書類を保存して sha256 を返す。同一内容の blob があれば再利用する。"""
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(digest)
+        if blob_path.exists():
+            disk_cache.touch(blob_path)
+        else:
+            disk_cache.write_gzip(blob_path, data)
+        disk_cache.atomic_write(self._ref_path(doc_id, doc_type), digest.encode('ascii'))
+        self.evict()
+        return digest
+
+    def get_or_fetch(self, doc_id: str, doc_type, fetch):
+        """保存済みならそれを返し、無ければ fetch() で取得して保存してから返す。
+
+        fetch の例外はそのまま呼び出し元へ伝える（エラー応答はキャッシュしない）。
+        """
+        data = self.get(doc_id, doc_type)
+        if data is not None:
+            logger.debug(f"アーカイブヒット: {doc_id} type={doc_type}")
+            return data
+
+        data = fetch()
+        if self._is_storable(data):
+            try:
+                self.put(doc_id, doc_type, data)
+            except OSError as e:
+                # ディスク書き込みの失敗で本処理を止めない
+                logger.warning(f"アーカイブ保存失敗: {doc_id} type={doc_type} - {e}")
+        return data
+
+    @staticmethod
+    def _is_storable(data) -> bool:
+        """空応答や JSON のエラー応答（EDINET は 200 で返すことがある）は保存しない。"""
+        return bool(data) and not data.lstrip()[:1] == b'{'
+
+    # ---- 容量管理 ----
+
+    def evict(self, max_bytes: int = None) -> int:
+        """合計サイズが上限を超えていれば、最終アクセスの古い blob から削除する（削除数を返す）"""
+        return self._lru.evict(max_bytes)
+
+    def stats(self) -> dict:
+        stats = self._lru.stats()
+        return {'blobs': stats['files'], 'bytes': stats['bytes'], 'max_bytes': stats['max_bytes']}
+
+
+def get_archive_store() -> DocumentArchiveStore:
+    """settings.EDINET_ARCHIVE_SETTINGS からアーカイブを作る（呼び出しごとに設定を読む）。"""
+    conf = getattr(settings, 'EDINET_ARCHIVE_SETTINGS', {})
+    root = conf.get('ROOT') or Path(settings.BASE_DIR) / 'cache' / 'edinet_archive'
+    return DocumentArchiveStore(root, conf.get('MAX_BYTES', DEFAULT_MAX_BYTES))
+
+
+def prefetch_important_disclosures(days: int = 7, include_pdf: bool = False,
+                                   all_companies: bool = False, limit: int = None) -> dict:
+    """直近の重要開示（有報・半報）の書類ファイルを事前にアーカイブへ取得する。
+
+    既定では日記で記録されている銘柄のみが対象。分析・感情分析・パネル表示の
+    初回アクセス時に EDINET を待たずに済むようにする。
+
+    Returns:
+        dict: {'targets', 'fetched', 'cached', 'failed'}
+    """
+    from earnings_analysis.models import DocumentMetadata
+    from .disclosure_sync import IMPORTANT_DOC_TYPE_CODES
+    from .edinet_api import EdinetAPIClient
+
+    since = timezone.now().date() - timedelta(days=days)
+    qs = (
+        DocumentMetadata.objects
+        .filter(
+            doc_type_code__in=IMPORTANT_DOC_TYPE_CODES,
+            file_date__gte=since,
+            legal_status__in=['1', '2'],
+            withdrawal_status='0',
+        )
+        .order_by('-file_date', 'doc_id')
+    )
+    if not all_companies:
+        from stockdiary.models import StockDiary
+        symbols = (
+            StockDiary.objects
+            .filter(stock_symbol__regex=r'^\d{4}$')
+            .values_list('stock_symbol', flat=True)
+            .distinct()
+        )
+        qs = qs.filter(securities_code__in=[s + '0' for s in symbols])
+
+    docs = list(qs.values('doc_id', 'xbrl_flag', 'pdf_flag'))
+    if limit:
+        docs = docs[:limit]
+
+    store = get_archive_store()
+    client = None
+    result = {'targets': 0, 'fetched': 0, 'cached': 0, 'failed': 0}
+
+    for doc in docs:
+        types = []
+        if doc['xbrl_flag']:
+            types.append(DOC_TYPE_XBRL)
+        if include_pdf and doc['pdf_flag']:
+            types.append(DOC_TYPE_PDF)
+
+        for doc_type in types:
+            result['targets'] += 1
+            if store.get(doc['doc_id'], doc_type) is not None:
+                result['cached'] += 1
+                continue
+            if client is None:
+                client = EdinetAPIClient.create_v2_client()
+            try:
+                store.get_or_fetch(
+                    doc['doc_id'], doc_type,
+                    lambda: client.get_document(doc['doc_id'], doc_type=doc_type),
+                )
+                result['fetched'] += 1
+            except Exception as e:
+                logger.warning(f"アーカイブ事前取得失敗: {doc['doc_id']} type={doc_type} - {e}")
+                result['failed'] += 1
+
+    logger.info(f"アーカイブ事前取得完了: {result}")
+    return result
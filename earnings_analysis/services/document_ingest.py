@@ -0,0 +1,133 @@
+# earnings_analysis/services/document_ingest.py
+"""
+EDINET 書類一覧（documents.json の results）の DocumentMetadata への一括取り込み
+
+daily_update / collect_initial_data はチャンク（既定100件）ごとに
+select_for_update → Python 側で差分 → bulk_update(batch_size=50) → bulk_create(ignore_conflicts)
+を行い、チャンク間で sleep していた。1日分（1〜3千件）で数十往復になる。
+
+ここでは doc_id をキーにした INSERT ... ON CONFLICT DO UPDATE（bulk_create(update_conflicts=True)）を
+大きなバッチで発行し、1日分を1〜2往復で取り込む。PostgreSQL・SQLite とも同じ経路
+（SQLite は Django がパラメータ上限に合わせて文を分割する）。
+
+既存行で更新するのは従来と同じく縦覧・取下・修正・開示区分のみで、
+提出者名・書類概要などは初回取り込み時の値を保持する。
+"""
+import logging
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Iterable
+
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# 1文あたりの行数（22列 × 2000行 = 44,000 パラメータ。PostgreSQL の上限 65,535 以内）
+INGEST_BATCH_SIZE = 2000
+
+# 既存行（doc_id 衝突時）に上書きする列
+UPSERT_UPDATE_FIELDS = [
+    'legal_status', 'withdrawal_status', 'doc_info_edit_status',
+    'disclosure_status', 'updated_at',
+]
+
+
+def _parse_date(date_str):
+    if not date_str:
+        return None
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return None
+
+
+def _parse_datetime(datetime_str):
+    if not datetime_str:
+        return timezone.now()
+    try:
+        return datetime.strptime(datetime_str, '%Y-%m-%d %H:%M')
+    except (ValueError, TypeError):
+        return timezone.now()
+
+
+def document_from_api(doc_data: dict, file_date):
+    """書類一覧 API の1件から DocumentMetadata（未保存）を作る"""
+    from ..models import DocumentMetadata
+
+    return DocumentMetadata(
+        doc_id=doc_data['docID'],
+        edinet_code=doc_data['edinetCode'] or '',
+        securities_code=doc_data['secCode'] or '',
+        company_name=doc_data['filerName'] or '',
+        fund_code=doc_data['fundCode'] or '',
+        ordinance_code=doc_data['ordinanceCode'] or '',
+        form_code=doc_data['formCode'] or '',
+        doc_type_code=doc_data['docTypeCode'] or '',
+        period_start=_parse_date(doc_data.get('periodStart')),
+        period_end=_parse_date(doc_data.get('periodEnd')),
+        submit_date_time=_parse_datetime(doc_data['submitDateTime']),
+        file_date=file_date,
+        doc_description=doc_data['docDescription'] or '',
+        xbrl_flag=doc_data['xbrlFlag'] == '1',
+        pdf_flag=doc_data['pdfFlag'] == '1',
+        attach_doc_flag=doc_data['attachDocFlag'] == '1',
+        english_doc_flag=doc_data['englishDocFlag'] == '1',
+        csv_flag=doc_data['csvFlag'] == '1',
+        legal_status=doc_data['legalStatus'],
+        withdrawal_status=doc_data['withdrawalStatus'],
+        doc_info_edit_status=doc_data['docInfoEditStatus'],
+        disclosure_status=doc_data['disclosureStatus'],
+    )
+
+
+def upsert_documents(documents_data: Iterable[dict], file_date,
+                     batch_size: int = INGEST_BATCH_SIZE) -> dict:
+    """書類一覧を doc_id で upsert する。
+
+    documents_data は順に読むだけなので、リストでもジェネレータでもよい。
+    同じバッチ内で doc_id が重複した場合は後の行を採る
+    （ON CONFLICT DO UPDATE は1文で同じ行を2回更新できないため）。
+
+    Returns:
+        dict: {'rows', 'batches', 'elapsed_seconds', 'rows_per_second'}
+    """
+    from ..models import DocumentMetadata
+
+    started = time.monotonic()
+    rows = 0
+    batches = 0
+    iterator = iter(documents_data)
+
+    while True:
+        chunk = list(islice(iterator, batch_size))
+        if not chunk:
+            break
+        objs = {}
+        for doc_data in chunk:
+            objs[doc_data['docID']] = document_from_api(doc_data, file_date)
+
+        with transaction.atomic():
+            DocumentMetadata.objects.bulk_create(
+                list(objs.values()),
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['doc_id'],
+                update_fields=UPSERT_UPDATE_FIELDS,
+            )
+        rows += len(objs)
+        batches += 1
+
+    elapsed = time.monotonic() - started
+    stats = {
+        'rows': rows,
+        'batches': batches,
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed > 0 else None,
+    }
+    logger.info(
+        f"書類一覧 upsert: {file_date} - {rows}件 / {batches}バッチ / "
+        f"{stats['elapsed_seconds']}秒 ({stats['rows_per_second']} rows/s)"
+    )
+    return stats
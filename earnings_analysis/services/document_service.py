@@ -1,6 +1,7 @@
 import requests
 from typing import Dict, Any
 from .edinet_api import EdinetAPIClient
+from .document_archive import get_archive_store
 import logging
 
 logger = logging.getLogger(__name__)
@@ -49,6 +50,23 @@ class EdinetDocumentService:
             else:
                 raise e
     
+    def _fetch_document(self, doc_id: str, type_code: int) -> bytes:
+        """メインAPI → フォールバックAPIの順に書類ファイルを取得"""
+        try:
+            document_data = self.edinet_client.get_document(doc_id, type_code)
+            logger.info(f"メインAPI ({self.edinet_client.api_version}) でダウンロード成功")
+            return document_data
+        except Exception as e:
+            logger.warning(f"メインAPI ({self.edinet_client.api_version}) でダウンロード失敗: {e}")
+            
+            # フォールバックAPIで試行
+            if self.fallback_client:
+                logger.info(f"フォールバックAPI ({self.fallback_client.api_version}) でダウンロード再試行中...")
+                document_data = self.fallback_client.get_document(doc_id, type_code)
+                logger.info(f"フォールバックAPI ({self.fallback_client.api_version}) でダウンロード成功")
+                return document_data
+            raise
+    
     def download_document(self, doc_id: str, doc_type: str) -> Dict[str, Any]:
         """書類ダウンロード実行（CSV削除版）"""
         # CSVダウンロードを明示的に拒否
@@ -60,20 +78,10 @@ class EdinetDocumentService:
         try:
             logger.info(f"書類ダウンロード開始: {doc_id} ({doc_type})")
             
-            # メインAPIで試行
-            try:
-                document_data = self.edinet_client.get_document(doc_id, type_code)
-                logger.info(f"メインAPI ({self.edinet_client.api_version}) でダウンロード成功")
-            except Exception as e:
-                logger.warning(f"メインAPI ({self.edinet_client.api_version}) でダウンロード失敗: {e}")
-                
-                # フォールバックAPIで試行
-                if self.fallback_client:
-                    logger.info(f"フォールバックAPI ({self.fallback_client.api_version}) でダウンロード再試行中...")
-                    document_data = self.fallback_client.get_document(doc_id, type_code)
-                    logger.info(f"フォールバックAPI ({self.fallback_client.api_version}) でダウンロード成功")
-                else:
-                    raise e
+            # ローカルアーカイブ経由で取得（未取得時のみメイン→フォールバックAPIで取得）
+            document_data = get_archive_store().get_or_fetch(
+                doc_id, type_code, lambda: self._fetch_document(doc_id, type_code)
+            )
             
             content_type = 'application/pdf' if doc_type == 'pdf' else 'application/zip'
             
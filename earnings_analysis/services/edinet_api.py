@@ -3,6 +3,9 @@ import time
 from django.conf import settings
 from typing import Dict, Any
 import logging
+from urllib.parse import urlparse
+
+from .rate_limiter import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +27,14 @@ class EdinetAPIClient:
         self.session = requests.Session()
         self.last_request_time = 0
         self.min_interval = settings_dict.get('RATE_LIMIT_DELAY', 2)
+        # 間隔制限はホスト単位でプロセス全体に共有する（クライアント・スレッドをまたいで守る）
+        self.rate_limiter = None
+        if self.min_interval > 0:
+            self.rate_limiter = get_rate_limiter(
+                f"edinet:{urlparse(self.base_url).netloc}",
+                rate=1 / self.min_interval,
+                capacity=settings_dict.get('RATE_LIMIT_BURST', 1),
+            )
         self.timeout = settings_dict.get('TIMEOUT', 120)
         
         # User-Agentを設定
@@ -43,13 +54,9 @@ class EdinetAPIClient:
         return cls(api_version='v2')
     
     def _wait_for_rate_limit(self):
-        """レート制限対応"""
-        current_time = time.time()
-        time_since_last_request = current_time - self.last_request_time
-        
-        if time_since_last_request < self.min_interval:
-            time.sleep(self.min_interval - time_since_last_request)
-        
+        """レート制限対応（プロセス共有のトークンバケット）"""
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
         self.last_request_time = time.time()
     
     def get_document_list(self, date: str, type: int = 2) -> Dict[str, Any]:
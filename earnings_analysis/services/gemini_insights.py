@@ -1,5 +1,4 @@
 # earnings_analysis/services/gemini_insights.py（メタデータ強化版）
-from google import genai
 import logging
 from django.conf import settings
 from django.utils import timezone
@@ -7,6 +6,8 @@ from typing import Dict, Any, Optional
 import json
 import re
 
+from .llm_gateway import get_llm_client
+
 logger = logging.getLogger(__name__)
 
 class GeminiInsightsGenerator:
@@ -26,7 +27,7 @@ class GeminiInsightsGenerator:
             return
 
         try:
-            self.client = genai.Client(api_key=api_key)
+            self.client = get_llm_client(api_key)
             self.model = "gemini-2.5-flash-lite"
             logger.info("Gemini APIが正常に初期化されました")
         except Exception as e:
@@ -63,6 +64,9 @@ class GeminiInsightsGenerator:
             if hasattr(response, "text") and response.text:
                 logger.info("Gemini APIから有効な応答を受信")
                 parsed_result = self._parse_gemini_response(response.text, analysis_result)
+                if not parsed_result.get('successful_parses'):
+                    # 1つもポイントを拾えなかった応答はキャッシュから消し、再生成で取り直す
+                    self.client.gateway.invalidate(self.model, prompt)
                 api_call_success = True
                 points_generated = len(parsed_result.get('investment_points', []))
                 
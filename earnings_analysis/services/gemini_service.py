@@ -3,13 +3,98 @@
 from google import genai
 from django.conf import settings
 from django.utils import timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import json
 import re
 import logging
 
+from .llm_gateway import get_llm_client
+
 logger = logging.getLogger('earnings_analysis.tdnet')
 
+# 出力形式・採点基準（1件ずつの生成とまとめて生成で共通）
+REPORT_FORMAT_INSTRUCTIONS = """# 出力形式（JSON）
+以下のJSON形式で出力してください。**簡潔さが最重要**です。
+
+{
+  "overall_score": 0-100の整数（投資魅力度。50が中立、80以上が非常に良い、20以下が非常に悪い）,
+  "signal": "strong_positive" | "positive" | "neutral" | "negative" | "strong_negative",
+  "one_line_summary": "15文字以内の一言評価（例：「増収増益で好調」「減益だが想定内」）",
+  "summary": "【何が起きたか】開示内容の客観的事実を3文以内で。売上・利益・発表事項などの数値を具体的に記載。評価や示唆は書かない。",
+  "key_points": [
+    "📈 ポイント1（20文字以内、絵文字で始める。投資家視点での示唆）",
+    "💰 ポイント2（20文字以内。事実の"意味"を解釈）",
+    "⚠️ ポイント3（20文字以内、リスクや注意点）"
+  ],
+  "score_details": {
+    "growth": {"score": 0-100, "label": "成長性", "comment": "10文字以内"},
+    "profitability": {"score": 0-100, "label": "収益性", "comment": "10文字以内"},
+    "stability": {"score": 0-100, "label": "安定性", "comment": "10文字以内"},
+    "outlook": {"score": 0-100, "label": "見通し", "comment": "10文字以内"}
+  },
+  "sections": [
+    {
+      "section_type": "overview",
+      "title": "ポイント",
+      "content": "最も重要な情報を3行以内で。数値があれば含める。"
+    },
+    {
+      "section_type": "analysis", 
+      "title": "注目点",
+      "content": "投資家が注目すべき点を2-3行で。"
+    },
+    {
+      "section_type": "risk",
+      "title": "リスク・注意",
+      "content": "リスクや懸念点を2行以内で。なければ「特になし」"
+    }
+  ]
+}
+
+# 採点基準
+- **overall_score**: 
+  - 80-100: 非常にポジティブ（大幅増益、上方修正、増配など）
+  - 60-79: ややポジティブ（小幅増益、計画通り進捗）
+  - 40-59: 中立（横ばい、特筆事項なし）
+  - 20-39: ややネガティブ（小幅減益、下方修正）
+  - 0-19: 非常にネガティブ（大幅減益、無配など）
+
+- **signal**:
+  - strong_positive: 買い推奨レベル
+  - positive: やや強気
+  - neutral: 様子見
+  - negative: やや弱気
+  - strong_negative: 警戒レベル
+
+# summary と key_points の役割分担（最重要）
+**両者を絶対に重複させないこと。** 役割が明確に異なります。
+
+| 項目 | 役割 | 書くべき内容 | 書いてはいけない内容 |
+|------|------|------------|-------------------|
+| summary | 📰 **客観的事実** | 何が発表されたか。売上・利益・配当などの数値、増減率、発表の骨子 | 評価・解釈・投資判断 |
+| key_points | 💡 **投資家視点の示唆（So What）** | 事実が投資家にとって何を意味するか。注目すべき観点、強み・弱み、リスク | summaryと同じ数値の羅列 |
+
+## 悪い例（重複している）
+- summary: 「売上2,000億円（前年比+10%）、営業利益300億円（前年比+15%）と発表。」
+- key_points: ["📈 売上2,000億円（+10%）", "💰 営業利益300億円（+15%）", "⚠️ 注視が必要"]
+→ **NG**: key_pointsがsummaryの数値を繰り返しているだけ
+
+## 良い例（役割が分離されている）
+- summary: 「2026年3月期通期で売上2,000億円（前年比+10%）、営業利益300億円（前年比+15%）と発表。北米事業と為替影響が寄与。」
+- key_points: ["📈 利益率改善で増収超の増益", "💴 円安メリットが想定以上", "⚠️ 北米依存上昇は集中リスク"]
+→ **OK**: summaryは事実、key_pointsは事実から読み取れる"含意"を示している
+
+# 重要な指示
+1. **スマホ画面で読める長さ**を最優先。各フィールドの文字数制限を厳守。
+2. summaryには数値を必ず含める（売上〇億円、前年比+〇%など）
+3. key_pointsはsummaryと異なる視点（解釈・示唆・リスク評価）で書く
+4. 専門用語は避け、一般投資家にわかる表現で
+5. 開示内容に財務数値がない場合は、内容の重要度で採点
+6. 絵文字を効果的に使用（key_pointsの先頭など）
+7. **必ずJSON形式のみで出力**（余計な説明文は不要）
+"""
+
+
 
 class GeminiReportGenerator:
     """
@@ -35,7 +120,7 @@ class GeminiReportGenerator:
             return
         
         try:
-            self.client = genai.Client(api_key=self.api_key)
+            self.client = get_llm_client(self.api_key)
             self.model = self.model_name
             logger.info(f"GEMINI API初期化完了: {self.model_name}")
         except Exception as e:
@@ -65,13 +150,14 @@ class GeminiReportGenerator:
             prompt = self._create_prompt(disclosure_dict, report_type)
             logger.info(f"レポート生成開始: {report_type}, model={self.model_name}")
             
+            config = genai.types.GenerateContentConfig(
+                max_output_tokens=self.max_tokens,
+                temperature=self.temperature,
+            )
             response = self.client.models.generate_content(
                 model=self.model_name,
                 contents=prompt,
-                config=genai.types.GenerateContentConfig(
-                    max_output_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                )
+                config=config,
             )
             
             if not hasattr(response, "text") or not response.text:
@@ -80,7 +166,8 @@ class GeminiReportGenerator:
             result = self._parse_response(response.text)
             
             if result['success']:
-                token_count = len(prompt) + len(response.text)
+                usage = getattr(response, 'usage_metadata', None)
+                token_count = getattr(usage, 'total_token_count', 0) or len(prompt) + len(response.text)
                 logger.info(f"レポート生成成功: {report_type}")
                 
                 return {
@@ -96,6 +183,8 @@ class GeminiReportGenerator:
                     'error': None
                 }
             else:
+                # 解釈できなかった応答はキャッシュから消し、再生成で取り直す
+                self.client.gateway.invalidate(self.model_name, prompt, config)
                 raise Exception(f"Response parsing failed: {result['error']}")
             
         except Exception as e:
@@ -113,6 +202,109 @@ class GeminiReportGenerator:
         })
         return fallback_result
     
+    def generate_reports_batch(self, disclosure_dicts: List[Dict[str, Any]], report_type: str) -> List[Optional[Dict[str, Any]]]:
+        """
+        同じ種別の小さな開示を1回のプロンプトでまとめて生成する。
+
+        入力と同じ順の結果のリストを返す。解釈できなかった開示は None
+        （呼び出し側で generate_report に回す）。APIが使えなければすべて None。
+        """
+        if not self.model or not disclosure_dicts:
+            return [None] * len(disclosure_dicts)
+
+        prompt = self._create_batch_prompt(disclosure_dicts, report_type)
+        config = genai.types.GenerateContentConfig(
+            max_output_tokens=self.max_tokens * len(disclosure_dicts),
+            temperature=self.temperature,
+        )
+        try:
+            logger.info(f"まとめてレポート生成開始: {report_type} {len(disclosure_dicts)}件, model={self.model_name}")
+            response = self.client.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=config,
+            )
+            reports = self._parse_batch_response(getattr(response, 'text', None) or '', len(disclosure_dicts))
+        except Exception as e:
+            logger.error(f"まとめてレポート生成エラー: {e}")
+            return [None] * len(disclosure_dicts)
+
+        if not any(reports):
+            # 解釈できなかった応答はキャッシュから消し、再実行で取り直す
+            self.client.gateway.invalidate(self.model_name, prompt, config)
+            return reports
+
+        usage = getattr(response, 'usage_metadata', None)
+        token_count = getattr(usage, 'total_token_count', 0) or len(prompt) + len(response.text)
+        now = timezone.now().isoformat()
+        return [
+            {
+                'success': True,
+                'data': data,
+                'prompt': prompt,
+                'token_count': token_count // len(disclosure_dicts),
+                'api_available': True,
+                'api_success': True,
+                'fallback_used': False,
+                'model_used': self.model_name,
+                'generation_timestamp': now,
+                'batch_size': len(disclosure_dicts),
+                'error': None,
+            } if data else None
+            for data in reports
+        ]
+
+    def _create_batch_prompt(self, disclosures: List[Dict[str, Any]], report_type: str) -> str:
+        """まとめて生成用のプロンプト（各開示の入力を並べ、出力形式は1件ずつと共通）"""
+        inputs = []
+        for i, disclosure in enumerate(disclosures, 1):
+            content = disclosure.get('content', disclosure.get('summary', ''))
+            inputs.append(f"""## 開示{i}
+- 企業名: {disclosure.get('company_name', '不明')}
+- 証券コード: {disclosure.get('company_code', '')}
+- 開示日時: {disclosure.get('disclosure_date', '')}
+- タイトル: {disclosure.get('title', '')}
+- 開示種別: {report_type}
+
+### 開示内容
+{content[:20000]}
+""")
+        return f"""# 役割
+あなたは機関投資家向けの証券アナリストです。
+以下の{len(disclosures)}件のTDNET開示情報を**1件ずつ独立に**分析し、それぞれについて**スマホ画面で一目で把握できる**簡潔なレポートを作成してください。
+他の開示の内容を混ぜないでください。
+
+# 入力データ
+{chr(10).join(inputs)}
+# まとめて出力する形式
+{{"reports": [開示1のレポート, 開示2のレポート, ...]}} のJSONで、入力と同じ順に{len(disclosures)}件を出力してください。
+各レポートには "index": 開示番号（1から）を含め、それ以外の項目は下記の出力形式に従ってください。
+
+""" + REPORT_FORMAT_INSTRUCTIONS
+
+    def _parse_batch_response(self, response_text: str, count: int) -> List[Optional[Dict[str, Any]]]:
+        """まとめて生成の応答を開示ごとに分ける（構造が不正なレポートは None）"""
+        results: List[Optional[Dict[str, Any]]] = [None] * count
+        json_match = re.search(r'```json\s*(\{.*\})\s*```', response_text, re.DOTALL)
+        json_str = json_match.group(1) if json_match else response_text[response_text.find('{'):response_text.rfind('}') + 1]
+        try:
+            reports = json.loads(json_str).get('reports')
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.error(f"まとめて生成のJSON解析エラー: {e}")
+            return results
+        if not isinstance(reports, list):
+            return results
+
+        for position, data in enumerate(reports):
+            if not isinstance(data, dict):
+                continue
+            index = data.pop('index', position + 1)
+            if not isinstance(index, int) or not 1 <= index <= count or results[index - 1] is not None:
+                continue
+            if self._validate_report_structure(data):
+                results[index - 1] = data
+        return results
+
     def _create_prompt(self, disclosure: Dict[str, Any], report_type: str) -> str:
         """スマホ最適化プロンプト生成"""
         company_name = disclosure.get('company_name', '不明')
@@ -135,86 +327,7 @@ TDNET開示情報を分析し、**スマホ画面で一目で把握できる**
 ## 開示内容
 {content[:20000]}
 
-# 出力形式（JSON）
-以下のJSON形式で出力してください。**簡潔さが最重要**です。
-
-{{
-  "overall_score": 0-100の整数（投資魅力度。50が中立、80以上が非常に良い、20以下が非常に悪い）,
-  "signal": "strong_positive" | "positive" | "neutral" | "negative" | "strong_negative",
-  "one_line_summary": "15文字以内の一言評価（例：「増収増益で好調」「減益だが想定内」）",
-  "summary": "【何が起きたか】開示内容の客観的事実を3文以内で。売上・利益・発表事項などの数値を具体的に記載。評価や示唆は書かない。",
-  "key_points": [
-    "📈 ポイント1（20文字以内、絵文字で始める。投資家視点での示唆）",
-    "💰 ポイント2（20文字以内。事実の"意味"を解釈）",
-    "⚠️ ポイント3（20文字以内、リスクや注意点）"
-  ],
-  "score_details": {{
-    "growth": {{"score": 0-100, "label": "成長性", "comment": "10文字以内"}},
-    "profitability": {{"score": 0-100, "label": "収益性", "comment": "10文字以内"}},
-    "stability": {{"score": 0-100, "label": "安定性", "comment": "10文字以内"}},
-    "outlook": {{"score": 0-100, "label": "見通し", "comment": "10文字以内"}}
-  }},
-  "sections": [
-    {{
-      "section_type": "overview",
-      "title": "ポイント",
-      "content": "最も重要な情報を3行以内で。数値があれば含める。"
-    }},
-    {{
-      "section_type": "analysis", 
-      "title": "注目点",
-      "content": "投資家が注目すべき点を2-3行で。"
-    }},
-    {{
-      "section_type": "risk",
-      "title": "リスク・注意",
-      "content": "リスクや懸念点を2行以内で。なければ「特になし」"
-    }}
-  ]
-}}
-
-# 採点基準
-- **overall_score**: 
-  - 80-100: 非常にポジティブ（大幅増益、上方修正、増配など）
-  - 60-79: ややポジティブ（小幅増益、計画通り進捗）
-  - 40-59: 中立（横ばい、特筆事項なし）
-  - 20-39: ややネガティブ（小幅減益、下方修正）
-  - 0-19: 非常にネガティブ（大幅減益、無配など）
-
-- **signal**:
-  - strong_positive: 買い推奨レベル
-  - positive: やや強気
-  - neutral: 様子見
-  - negative: やや弱気
-  - strong_negative: 警戒レベル
-
-# summary と key_points の役割分担（最重要）
-**両者を絶対に重複させないこと。** 役割が明確に異なります。
-
-| 項目 | 役割 | 書くべき内容 | 書いてはいけない内容 |
-|------|------|------------|-------------------|
-| summary | 📰 **客観的事実** | 何が発表されたか。売上・利益・配当などの数値、増減率、発表の骨子 | 評価・解釈・投資判断 |
-| key_points | 💡 **投資家視点の示唆（So What）** | 事実が投資家にとって何を意味するか。注目すべき観点、強み・弱み、リスク | summaryと同じ数値の羅列 |
-
-## 悪い例（重複している）
-- summary: 「売上2,000億円（前年比+10%）、営業利益300億円（前年比+15%）と発表。」
-- key_points: ["📈 売上2,000億円（+10%）", "💰 営業利益300億円（+15%）", "⚠️ 注視が必要"]
-→ **NG**: key_pointsがsummaryの数値を繰り返しているだけ
-
-## 良い例（役割が分離されている）
-- summary: 「2026年3月期通期で売上2,000億円（前年比+10%）、営業利益300億円（前年比+15%）と発表。北米事業と為替影響が寄与。」
-- key_points: ["📈 利益率改善で増収超の増益", "💴 円安メリットが想定以上", "⚠️ 北米依存上昇は集中リスク"]
-→ **OK**: summaryは事実、key_pointsは事実から読み取れる"含意"を示している
-
-# 重要な指示
-1. **スマホ画面で読める長さ**を最優先。各フィールドの文字数制限を厳守。
-2. summaryには数値を必ず含める（売上〇億円、前年比+〇%など）
-3. key_pointsはsummaryと異なる視点（解釈・示唆・リスク評価）で書く
-4. 専門用語は避け、一般投資家にわかる表現で
-5. 開示内容に財務数値がない場合は、内容の重要度で採点
-6. 絵文字を効果的に使用（key_pointsの先頭など）
-7. **必ずJSON形式のみで出力**（余計な説明文は不要）
-"""
+""" + REPORT_FORMAT_INSTRUCTIONS
     
     def _parse_response(self, response_text: str) -> Dict[str, Any]:
         """GEMINIレスポンスを解析"""
@@ -0,0 +1,155 @@
+# earnings_analysis/services/lexicon_matcher.py
+"""
+感情辞書の多パターン照合
+
+LexiconMatcher: 語彙（トライを1本の正規表現にコンパイル）
+ContextPatternMatcher: 改善・悪化・否定の文脈パターン（コンパイル済み・一致を文レベルでも再利用）
+
+TransparentSentimentAnalyzer._find_basic_words は辞書の語彙ごとに本文全体を text.find で走査し、
+出現のたびに処理済み位置の集合全体と重なりを調べていた（語彙数 × 本文長 + ヒット数²）。
+
+ここでは辞書を1度だけトライにし、トライを「各位置で最長の語彙に一致する」正規表現
+（例: 増(?:収|益)、赤字(?:転落|縮小)?）に変換して先読みで1回走査する。各位置で一致する語彙は
+「その位置の最長一致語の接頭辞のうち辞書にある語」なので、語彙ごとの接頭辞表から全出現
+（重なりも含む、text.find を1文字ずつ進めた場合と同じ集合）を復元できる。
+走査自体は re の C 実装で行うため、純 Python の Aho–Corasick より速い。
+"""
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class LexiconMatcher:
+    """語彙集合の全出現位置を1回の走査で求める"""
+
+    def __init__(self, words: Iterable[str]):
+        self.words = frozenset(w for w in words if w)
+        trie: dict = {}
+        for word in self.words:
+            node = trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[''] = True  # 終端
+
+        # 最長一致語 → その位置で一致する語彙（最長一致語の接頭辞のうち辞書にある語）
+        self._prefixes: Dict[str, List[str]] = {}
+        for word in self.words:
+            self._prefixes[word] = [word[:i] for i in range(1, len(word) + 1) if word[:i] in self.words]
+
+        self._regex = re.compile(f'(?=({self._trie_pattern(trie)}))') if self.words else None
+
+    @classmethod
+    def _trie_pattern(cls, node: dict) -> str:
+        branches = [
+            re.escape(ch) + cls._trie_pattern(child)
+            for ch, child in sorted(node.items()) if ch
+        ]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if '' in node:
+            # 終端でも更に長い語を優先して試す（欲張りの ?）
+            return f'(?:{body})?'
+        return body
+
+    def find_all(self, text: str) -> Dict[str, List[int]]:
+        """語彙 → 出現開始位置（昇順・重なりを含む）。出現しない語彙は含まない。"""
+        positions: Dict[str, List[int]] = {}
+        if self._regex is None or not text:
+            return positions
+        for match in self._regex.finditer(text):
+            start = match.start()
+            for word in self._prefixes[match.group(1)]:
+                positions.setdefault(word, []).append(start)
+        return positions
+
+    @staticmethod
+    def count_non_overlapping(word: str, starts: List[int]) -> int:
+        """str.count と同じ（左から重ならないように数える）出現回数"""
+        count = 0
+        next_free = 0
+        for start in starts:
+            if start >= next_free:
+                count += 1
+                next_free = start + len(word)
+        return count
+
+
+class ContextHit(NamedTuple):
+    pattern: int  # ContextPatternMatcher.patterns の添字
+    start: int
+    end: int
+    text: str
+
+
+class ContextPatternMatcher:
+    """文脈パターン群の一致をまとめて求め、文書・文の両方で使い回す
+
+    _find_context_patterns はパターン文字列ごとに re.finditer(pattern, text, re.IGNORECASE) を呼び
+    （毎回 re のキャッシュ経由でコンパイル済みパターンを引く）、文レベル分析では同じ走査を
+    文ごとにやり直していた。
+
+    ここではパターンを辞書読み込み時に1度だけコンパイルし、文書全体の一致（分類・位置・文字列）を
+    1回集めて、文レベル分析はその中から文の範囲に収まる一致を切り出す（hits_within）。
+    全パターンを1本の選言にまとめる方式は、CPython の re ではパターンごとの先頭文字・接頭辞の
+    最適化が効かなくなり、18パターンの個別走査より数倍遅かったため採らない。
+    パターンは先読み・後読みを使わない前提（使う場合、文単位の切り出しが文の外の文字に依存しうる）。
+    """
+
+    # (分類, スコア) 否定表現のスコアは一致した語で決まる（score_for 参照）
+    IMPROVEMENT = ('改善表現', 0.7)
+    DETERIORATION = ('悪化表現', -0.6)
+    NEGATION = ('否定表現', None)
+    NEGATED_POSITIVE_WORDS = ('成長', '増収', '増益', '改善', '回復', '向上')
+
+    def __init__(self, improvement: Sequence[str], deterioration: Sequence[str],
+                 negation: Sequence[str], flags: int = re.IGNORECASE):
+        self.patterns: List[Tuple[re.Pattern, Tuple[str, Optional[float]]]] = (
+            [(re.compile(p, flags), self.IMPROVEMENT) for p in improvement]
+            + [(re.compile(p, flags), self.DETERIORATION) for p in deterioration]
+            + [(re.compile(p, flags), self.NEGATION) for p in negation]
+        )
+
+    def scan(self, text: str) -> List[ContextHit]:
+        """全パターンの一致（パターンごとに左から重ならない = re.finditer と同じ）を返す"""
+        hits: List[ContextHit] = []
+        if not text:
+            return hits
+        for index, (pattern, _) in enumerate(self.patterns):
+            hits.extend(
+                ContextHit(index, match.start(), match.end(), match.group())
+                for match in pattern.finditer(text)
+            )
+        return hits
+
+    @staticmethod
+    def hits_within(hits: List[ContextHit], start: int, end: int) -> Optional[List[ContextHit]]:
+        """[start, end) に収まる一致を返す。境界をまたぐ一致があれば None（その範囲だけ再走査する）"""
+        inside = []
+        for hit in hits:
+            if hit.end <= start or hit.start >= end:
+                continue
+            if hit.start < start or hit.end > end:
+                return None
+            inside.append(hit)
+        return inside
+
+    def score_for(self, index: int, matched_text: str) -> float:
+        type_name, score = self.patterns[index][1]
+        if score is not None:
+            return score
+        # ポジティブ語の否定はネガティブ、ネガティブ語の否定はポジティブ
+        lowered = matched_text.lower()
+        return -0.4 if any(word in lowered for word in self.NEGATED_POSITIVE_WORDS) else 0.4
+
+    def summarize(self, hits: List[ContextHit]) -> List[Tuple[str, float, str, int]]:
+        """パターン順に (最初の一致文字列, スコア, 分類, 件数) を返す"""
+        first: Dict[int, str] = {}
+        counts: Dict[int, int] = {}
+        for hit in hits:
+            first.setdefault(hit.pattern, hit.text)
+            counts[hit.pattern] = counts.get(hit.pattern, 0) + 1
+        return [
+            (first[index], self.score_for(index, first[index]), self.patterns[index][1][0], counts[index])
+            for index in sorted(first)
+        ]
+
@@ -0,0 +1,496 @@
+# earnings_analysis/services/llm_gateway.py
+"""
+LLM（Gemini）呼び出しの共通ゲートウェイ
+
+レポート生成・感情分析の見解・AI Expert・ブレイクアウト判定・銘柄比較は、それぞれ
+genai.Client を作って generate_content を直接呼んでいた。同じプロンプト（レポートの再生成、
+同じ開示を2人の管理者が分析、同じ銘柄の組み合わせの再比較）でも毎回フルの待ち時間と
+クォータを使っていた。各サービスは get_llm_client() の返すクライアントを genai.Client の
+代わりに使い（client.models.generate_content の呼び方はそのまま）、呼び出しはすべてここを通る。
+
+- 応答キャッシュ: (モデル, プロンプトのハッシュ, 生成設定) をキーに、応答テキストと
+  トークン数を CACHE_TTL_SECONDS の間ディスクに保存する。Web と qcluster で共有するため
+  プロセスごとの LocMemCache ではなくディスクに置き、合計が CACHE_MAX_BYTES を超えたら
+  最終アクセスの古いものから消す（sentiment_cache と同じ disk_cache の部品）。
+- シングルフライト: 同じキーの呼び出しが同時に来たら、プロセス内は先行の結果を待って共有し、
+  別プロセスはキーごとのファイルロックで待ってからキャッシュを引く。
+- モデルごとの同時実行数（CONCURRENCY）と毎分の呼び出し数（RPM。rate_limiter のトークンバケット）。
+- メトリクス: モデルごとの呼び出し・キャッシュヒット・共有・失敗の回数、待ち時間、トークン数。
+  プロセス内で集計し、バッチ（TDNETレポートのまとめて生成など）の終わりに log_llm_metrics() で
+  ログに出してリセットする。
+
+BACKEND='fake' にすると API を呼ばずに FakeLLMClient が応答する（テスト・ローカル確認用）。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+
+from . import disk_cache
+from .rate_limiter import get_rate_limiter
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間のシングルフライトなし（プロセス内のみ）
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LLM_GATEWAY_SETTINGS = {
+    # 'gemini' または 'fake'
+    'BACKEND': 'gemini',
+    'CACHE_ENABLED': True,
+    'CACHE_ROOT': None,  # None なら BASE_DIR/cache/llm_responses
+    'CACHE_TTL_SECONDS': 7 * 24 * 3600,
+    'CACHE_MAX_BYTES': 128 * 1024 ** 2,
+    # モデルごとの上限（MODEL_LIMITS にないモデルは DEFAULT_LIMITS）
+    'DEFAULT_LIMITS': {'CONCURRENCY': 4, 'RPM': 60},
+    'MODEL_LIMITS': {},
+    # 同じプロンプトの先行呼び出しを待つ最大秒数（過ぎたら自分で呼ぶ）
+    'SINGLE_FLIGHT_TIMEOUT_SECONDS': 180,
+}
+
+# キーの作り方・保存形式を変えたら上げる（既存のキャッシュは引かれなくなる）
+CACHE_SCHEMA_VERSION = 1
+
+# この秒数使われていないロックファイルは evict で消す（シングルフライトの待ちより十分長く）
+LOCK_IDLE_SECONDS = 3600
+
+
+def gateway_settings() -> Dict[str, Any]:
+    conf = getattr(settings, 'LLM_GATEWAY_SETTINGS', {}) or {}
+    return {**DEFAULT_LLM_GATEWAY_SETTINGS, **conf}
+
+
+# ------------------------------------------------------------------
+# 応答
+# ------------------------------------------------------------------
+@dataclass
+class LLMResponse:
+    """generate_content の応答（genai の応答と同じく .text / .usage_metadata を持つ）"""
+    text: str
+    model: str
+    usage_metadata: SimpleNamespace = field(default_factory=SimpleNamespace)
+    latency: float = 0.0
+    cached: bool = False   # ディスクキャッシュから返した
+    deduped: bool = False  # 同時に来た同じ呼び出しの結果を共有した
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'text': self.text, 'model': self.model, 'usage': vars(self.usage_metadata)}
+
+
+def _usage(response) -> SimpleNamespace:
+    usage = getattr(response, 'usage_metadata', None)
+    return SimpleNamespace(
+        prompt_token_count=getattr(usage, 'prompt_token_count', None) or 0,
+        candidates_token_count=getattr(usage, 'candidates_token_count', None) or 0,
+        total_token_count=getattr(usage, 'total_token_count', None) or 0,
+    )
+
+
+def _config_dict(config) -> Any:
+    if config is None:
+        return None
+    if hasattr(config, 'model_dump'):
+        return config.model_dump(exclude_none=True, mode='json')
+    if isinstance(config, dict):
+        return config
+    return repr(config)
+
+
+def cache_key(model: str, contents, config=None) -> str:
+    """(モデル, プロンプトのハッシュ, 生成設定) のキー"""
+    prompt_hash = hashlib.sha256(
+        json.dumps(contents, ensure_ascii=False, default=str).encode('utf-8')
+    ).hexdigest()
+    material = {
+        'schema': CACHE_SCHEMA_VERSION,
+        'model': model,
+        'prompt': prompt_hash,
+        'config': _config_dict(config),
+    }
+    return hashlib.sha256(
+        json.dumps(material, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+
+# ------------------------------------------------------------------
+# キャッシュ
+# ------------------------------------------------------------------
+class LLMResponseCache:
+    """キー → 応答のディスクキャッシュ（TTL + LRU）"""
+
+    def __init__(self, root, ttl_seconds: int, max_bytes: int):
+        self.root = Path(root)
+        self.ttl_seconds = int(ttl_seconds)
+        self.max_bytes = int(max_bytes)
+        self.results_dir = self.root / 'responses'
+        self.locks_dir = self.root / 'locks'
+        self._lru = disk_cache.LRUDirectory(self.results_dir, '*/*.json.gz', self.max_bytes, 'LLM応答キャッシュ')
+
+    def _path(self, key: str) -> Path:
+        return self.results_dir / key[:2] / f"{key}.json.gz"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            entry = json.loads(disk_cache.read_gzip(path))
+        except FileNotFoundError:
+            return None
+        except (*disk_cache.CORRUPT_ERRORS, ValueError) as e:
+            logger.warning(f"LLM応答キャッシュ展開失敗のため破棄: {key} - {e}")
+            disk_cache.unlink(path)
+            return None
+        if entry.get('expires_at', 0) < time.time():
+            disk_cache.unlink(path)
+            return None
+        disk_cache.touch(path)
+        return entry
+
+    def put(self, key: str, response: LLMResponse):
+        entry = {**response.to_dict(), 'expires_at': time.time() + self.ttl_seconds}
+        disk_cache.write_gzip(self._path(key), json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+        self.evict()
+
+    def delete(self, key: str):
+        disk_cache.unlink(self._path(key))
+
+    @contextmanager
+    def lock(self, key: str):
+        """キーごとのプロセス間ロック（fcntl がなければ何もしない）"""
+        if fcntl is None:
+            yield
+            return
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.locks_dir / f"{key}.lock", 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                os.utime(f.fileno())  # 使用中の目印（evict の掃除対象から外す）
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def evict(self, max_bytes: int = None) -> int:
+        """合計サイズが上限を超えていれば、最終アクセスの古い応答から削除する（削除数を返す）"""
+        removed = self._lru.evict(max_bytes)
+        self._remove_idle_locks()
+        return removed
+
+    def _remove_idle_locks(self):
+        """LOCK_IDLE_SECONDS 使われていないロックファイルを消す（プロンプトごとに増え続けないように）"""
+        if fcntl is None:
+            return
+        cutoff = time.time() - LOCK_IDLE_SECONDS
+        for path in self.locks_dir.glob('*.lock'):
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+                with open(path, 'a') as f:
+                    # 誰かが持っているロックは消さない
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    disk_cache.unlink(path)
+            except (BlockingIOError, FileNotFoundError):
+                continue
+
+
+# ------------------------------------------------------------------
+# メトリクス
+# ------------------------------------------------------------------
+class LLMMetrics:
+    """モデルごとの呼び出し回数・待ち時間・トークン数（プロセス内で集計）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+
+    def _model(self, model: str) -> Dict[str, Any]:
+        return self._models.setdefault(model, {
+            'calls': 0, 'cache_hits': 0, 'deduped': 0, 'errors': 0,
+            'prompt_tokens': 0, 'output_tokens': 0, 'latencies': [],
+        })
+
+    def record(self, model: str, outcome: str, latency: float = 0.0, usage: SimpleNamespace = None):
+        """outcome: 'call' / 'cache_hit' / 'deduped' / 'error'"""
+        with self._lock:
+            stats = self._model(model)
+            if outcome == 'call':
+                stats['calls'] += 1
+                stats['latencies'].append(latency)
+                if usage is not None:
+                    stats['prompt_tokens'] += usage.prompt_token_count
+                    stats['output_tokens'] += usage.candidates_token_count
+            elif outcome == 'cache_hit':
+                stats['cache_hits'] += 1
+            elif outcome == 'deduped':
+                stats['deduped'] += 1
+            else:
+                stats['errors'] += 1
+
+    def summary(self, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        """モデルごとの集計（reset=True なら集計を返したあと 0 に戻す）"""
+        with self._lock:
+            result = {}
+            for model, stats in self._models.items():
+                ordered = sorted(stats['latencies'])
+                result[model] = {
+                    key: value for key, value in stats.items() if key != 'latencies'
+                }
+                if ordered:
+                    result[model].update({
+                        'avg_seconds': round(sum(ordered) / len(ordered), 3),
+                        'p95_seconds': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                        'max_seconds': round(ordered[-1], 3),
+                    })
+            if reset:
+                self._models.clear()
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._models.clear()
+
+
+# ------------------------------------------------------------------
+# ゲートウェイ
+# ------------------------------------------------------------------
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[LLMResponse] = None
+
+
+class LLMGateway:
+    """キャッシュ・シングルフライト・モデルごとの上限をかけて backend を呼ぶ"""
+
+    def __init__(self, backend, cache: Optional[LLMResponseCache] = None,
+                 limits: Dict[str, Dict[str, Any]] = None, default_limits: Dict[str, Any] = None,
+                 single_flight_timeout: float = 180, metrics: LLMMetrics = None):
+        self.backend = backend
+        self.cache = cache
+        self.limits = limits or {}
+        self.default_limits = default_limits or DEFAULT_LLM_GATEWAY_SETTINGS['DEFAULT_LIMITS']
+        self.single_flight_timeout = single_flight_timeout
+        self.metrics = metrics or LLMMetrics()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    def generate_content(self, model: str, contents, config=None, cache: bool = True) -> LLMResponse:
+        """
+        backend.models.generate_content と同じ引数で呼ぶ。
+
+        cache=False ならキャッシュ・シングルフライトを使わない（毎回違う応答が欲しい場合）。
+        backend の例外はそのまま送出する（失敗・空の応答は保存しない）。
+        """
+        if not cache:
+            return self._call(model, contents, config)
+
+        key = cache_key(model, contents, config)
+        cached = self._cache_get(key, model)
+        if cached:
+            return cached
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.done.wait(self.single_flight_timeout)
+            if flight.response is not None:
+                self.metrics.record(model, 'deduped')
+                return LLMResponse(**{**vars(flight.response), 'deduped': True})
+            # 先行の呼び出しが失敗・時間切れなら自分で呼ぶ
+            return self._call(model, contents, config)
+
+        try:
+            with (self.cache.lock(key) if self.cache else _null_context()):
+                # 別プロセスの同じ呼び出しが保存し終えているかもしれない
+                response = self._cache_get(key, model)
+                if response is None:
+                    response = self._call(model, contents, config)
+                    if response.text and self.cache:
+                        try:
+                            self.cache.put(key, response)
+                        except (OSError, TypeError, ValueError) as e:
+                            logger.warning(f"LLM応答キャッシュ保存失敗: {key[:12]} - {e}")
+            flight.response = response
+            return response
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, model: str, contents, config=None):
+        """保存した応答を消す（応答を解釈できなかった場合、再生成で同じ応答を返さないように）"""
+        if self.cache:
+            self.cache.delete(cache_key(model, contents, config))
+
+    def _cache_get(self, key: str, model: str) -> Optional[LLMResponse]:
+        if not self.cache:
+            return None
+        try:
+            entry = self.cache.get(key)
+        except OSError as e:
+            logger.warning(f"LLM応答キャッシュ読み込み失敗: {key[:12]} - {e}")
+            return None
+        if not entry:
+            return None
+        self.metrics.record(model, 'cache_hit')
+        logger.info(f"LLM応答キャッシュヒット: model={model} key={key[:12]}")
+        return LLMResponse(text=entry['text'], model=entry['model'],
+                           usage_metadata=SimpleNamespace(**entry.get('usage', {})), cached=True)
+
+    def _call(self, model: str, contents, config) -> LLMResponse:
+        limits = {**self.default_limits, **self.limits.get(model, {})}
+        concurrency = int(limits.get('CONCURRENCY') or 1)
+        with self._semaphore(model, concurrency):
+            if limits.get('RPM'):
+                # 同時実行数ぶんまでは続けて呼べる（RPM=0 なら間隔の制限なし）
+                get_rate_limiter(f"llm:{model}", rate=float(limits['RPM']) / 60,
+                                 capacity=concurrency).acquire()
+            started = time.monotonic()
+            try:
+                raw = self.backend.models.generate_content(model=model, contents=contents, config=config)
+            except Exception:
+                self.metrics.record(model, 'error')
+                raise
+            latency = time.monotonic() - started
+
+        usage = _usage(raw)
+        self.metrics.record(model, 'call', latency, usage)
+        logger.info(
+            f"LLM呼び出し: model={model} {latency:.2f}s "
+            f"tokens in={usage.prompt_token_count} out={usage.candidates_token_count}"
+        )
+        return LLMResponse(text=getattr(raw, 'text', None) or '', model=model,
+                           usage_metadata=usage, latency=latency)
+
+    def _semaphore(self, model: str, concurrency: int) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(model)
+            if semaphore is None:
+                semaphore = self._semaphores[model] = threading.BoundedSemaphore(concurrency)
+            return semaphore
+
+
+@contextmanager
+def _null_context():
+    yield
+
+
+class _GatewayModels:
+    def __init__(self, gateway: LLMGateway):
+        self._gateway = gateway
+
+    def generate_content(self, model: str, contents, config=None, **kwargs) -> LLMResponse:
+        return self._gateway.generate_content(model=model, contents=contents, config=config, **kwargs)
+
+
+class GatewayClient:
+    """genai.Client の代わりに使うクライアント（client.models.generate_content のみ）"""
+
+    def __init__(self, gateway: LLMGateway):
+        self.gateway = gateway
+        self.models = _GatewayModels(gateway)
+
+
+# ------------------------------------------------------------------
+# テスト・ローカル用のクライアント
+# ------------------------------------------------------------------
+class FakeLLMClient:
+    """
+    API を呼ばない genai.Client 互換のクライアント。
+
+    responder(model, prompt) が返した文字列を応答にする（既定は空の JSON）。
+    呼び出しは calls に (model, prompt, config) で記録する。delay 秒待ってから返す。
+    """
+
+    def __init__(self, responder: Callable[[str, Any], str] = None, delay: float = 0.0):
+        self.responder = responder or (lambda model, prompt: '{}')
+        self.delay = delay
+        self.calls: List[tuple] = []
+        self._lock = threading.Lock()
+        self.models = self
+
+    def generate_content(self, model: str, contents, config=None):
+        with self._lock:
+            self.calls.append((model, contents, config))
+        if self.delay:
+            time.sleep(self.delay)
+        text = self.responder(model, contents)
+        prompt_tokens = len(str(contents)) // 4
+        output_tokens = len(text) // 4
+        return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        ))
+
+
+# ------------------------------------------------------------------
+# 入口
+# ------------------------------------------------------------------
+_gateways: Dict[tuple, LLMGateway] = {}
+_gateways_lock = threading.Lock()
+
+
+def get_llm_gateway(api_key: str = None) -> LLMGateway:
+    """設定・APIキーごとのプロセス共有ゲートウェイ（設定が変わっていれば反映する）"""
+    conf = gateway_settings()
+    backend_name = conf['BACKEND']
+    with _gateways_lock:
+        gateway = _gateways.get((backend_name, api_key))
+        if gateway is None:
+            if backend_name == 'fake':
+                backend = FakeLLMClient()
+            else:
+                from google import genai
+                backend = genai.Client(api_key=api_key)
+            gateway = _gateways[(backend_name, api_key)] = LLMGateway(backend)
+
+    cache = None
+    if conf['CACHE_ENABLED']:
+        root = conf['CACHE_ROOT'] or Path(settings.BASE_DIR) / 'cache' / 'llm_responses'
+        cache = LLMResponseCache(root, conf['CACHE_TTL_SECONDS'], conf['CACHE_MAX_BYTES'])
+    gateway.cache = cache
+    gateway.limits = conf['MODEL_LIMITS']
+    gateway.default_limits = conf['DEFAULT_LIMITS']
+    gateway.single_flight_timeout = conf['SINGLE_FLIGHT_TIMEOUT_SECONDS']
+    return gateway
+
+
+def log_llm_metrics(label: str) -> Dict[str, Dict[str, Any]]:
+    """
+    このプロセスのゲートウェイのメトリクスをモデルごとにログへ出し、集計をリセットする。
+
+    バッチの終わりに呼ぶ（前回呼んでからの、このプロセス内の呼び出しが対象）。
+    """
+    with _gateways_lock:
+        gateways = list(_gateways.values())
+    merged: Dict[str, Dict[str, Any]] = {}
+    for gateway in gateways:
+        merged.update(gateway.metrics.summary(reset=True))
+    for model, stats in merged.items():
+        logger.info(
+            f"LLMメトリクス（{label}）: model={model} 呼び出し{stats['calls']} "
+            f"キャッシュ{stats['cache_hits']} 共有{stats['deduped']} 失敗{stats['errors']} "
+            f"tokens in={stats['prompt_tokens']} out={stats['output_tokens']} "
+            f"平均{stats.get('avg_seconds')}s p95 {stats.get('p95_seconds')}s 最大{stats.get('max_seconds')}s"
+        )
+    return merged
+
+
+def get_llm_client(api_key: str) -> GatewayClient:
+    """genai.Client(api_key=...) の代わり。呼び出しはゲートウェイを通る"""
+    return GatewayClient(get_llm_gateway(api_key))
@@ -1,18 +1,103 @@
 # earnings_analysis/services/pdf_processor.py
 
 import requests
-from typing import Dict, Optional
+from collections import deque
+from contextlib import closing
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
 from django.conf import settings
 import os
 import hashlib
+import json
 import logging
+import re
+import tempfile
+import time
 try:
     import pymupdf as fitz  # 新しいバージョン
 except ImportError:
     import fitz  # 古いバージョン
+
+from . import disk_cache
+
 logger = logging.getLogger('earnings_analysis.tdnet')
 
 
+# 抽出テキストのキャッシュ（CACHE_DIR 配下）
+#   text/<sha256>.json   : PDF本体のハッシュ → ページごとのテキスト（別URLの同一PDFも共有）
+#   urls/<md5(url)>.json : URL → ハッシュ・ETag / Last-Modified・最終確認時刻
+# 確認から TEXT_CACHE_MAX_AGE_HOURS 以内は問い合わせず、過ぎたら条件付きGETで確認する。
+# text/ と urls/ はそれぞれ合計 TEXT_CACHE_MAX_BYTES / URL_CACHE_MAX_BYTES を超えたら
+# 最終アクセスの古いものから消す（disk_cache の LRU。消えたテキストは次回取得し直す）。
+DEFAULT_TEXT_CACHE_MAX_AGE_HOURS = 24
+DEFAULT_TEXT_CACHE_MAX_BYTES = 512 * 1024 ** 2
+DEFAULT_URL_CACHE_MAX_BYTES = 16 * 1024 ** 2
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# 要点抽出（summary_only=True）
+# 決算短信などの要点・数値は前半（サマリー〜経営成績・財務諸表）にあるため、
+# 注記事項・補足資料の見出しが出たところで打ち切り、プロンプトに入る文字数に達したら止める。
+SUMMARY_MAX_CHARS = 20000  # GeminiReportGenerator のプロンプトに入る本文の上限
+SUMMARY_MIN_PAGES = 2      # 先頭（サマリー）ページでは打ち切らない
+_SUMMARY_STOP_RE = re.compile(
+    r'^\s*(?:[（(]\s*[\d０-９]+\s*[）)]|[\d０-９]+\s*[．.]|[○◯●■※])?\s*'
+    r'(?:(?:四半期)?(?:連結)?財務諸表(?:等)?に関する注記事項|補足(?:資料|情報)|参考資料)'
+)
+# 目次の行（「(5) 連結財務諸表に関する注記事項 ……… 10」）は見出しとみなさない。
+# リーダーのない目次はページ番号だけが次の行に抽出される（_is_toc_entry 参照）。
+_TOC_LINE_RE = re.compile(r'…|‥|・・|\.{3}|[\d０-９]\s*$')
+_PAGE_NUMBER_LINE_RE = re.compile(r'^[\d０-９]+$')
+
+# ページを EXTRACT_CHUNK_PAGES ずつプロセスプールで抽出する（1 なら直列）
+DEFAULT_EXTRACT_WORKERS = 2
+EXTRACT_CHUNK_PAGES = 4
+
+
+def _summary_cut(text: str) -> Optional[int]:
+    """注記事項・補足資料の見出し行の位置（なければ None）"""
+    lines = text.splitlines(keepends=True)
+    offset = 0
+    for i, line in enumerate(lines):
+        if _SUMMARY_STOP_RE.match(line) and not _is_toc_entry(lines, i):
+            return offset
+        offset += len(line)
+    return None
+
+
+def _is_numbered_entry(text: str, number: str) -> bool:
+    """「見出し」「ページ番号だけの行」の組か"""
+    return bool(_PAGE_NUMBER_LINE_RE.match(number)) and not _PAGE_NUMBER_LINE_RE.match(text)
+
+
+def _is_toc_entry(lines: List[str], i: int) -> bool:
+    """lines[i] が目次の行か。
+
+    次の行がページ番号だけの形は、本文の見出しがページ末にありフッターのページ番号が
+    続いた場合と同じになるので、直前か直後にも「見出し」「番号」の組が続く（目次の並び）
+    ときだけ目次とみなす。
+    """
+    if _TOC_LINE_RE.search(lines[i].strip()):
+        return True
+    before = [line.strip() for line in lines[:i] if line.strip()]
+    rest = [line.strip() for line in lines[i:] if line.strip()]
+    if len(rest) < 2 or not _is_numbered_entry(*rest[:2]):
+        return False
+    return (
+        (len(before) >= 2 and _is_numbered_entry(*before[-2:]))
+        or (len(rest) >= 4 and _is_numbered_entry(*rest[2:4]))
+    )
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """ワーカープロセスで [start, stop) ページのテキストを抽出する"""
+    doc = fitz.open(pdf_path)
+    try:
+        return [doc[page_num].get_text() for page_num in range(start, stop)]
+    finally:
+        doc.close()
+
+
 class PDFProcessor:
     """
     PDFファイルの処理
@@ -23,13 +108,25 @@ class PDFProcessor:
     def __init__(self):
         tdnet_settings = getattr(settings, 'TDNET_API_SETTINGS', {})
         self.cache_dir = tdnet_settings.get('CACHE_DIR', 'media/tdnet_cache')
+        self.cache_max_age = tdnet_settings.get(
+            'TEXT_CACHE_MAX_AGE_HOURS', DEFAULT_TEXT_CACHE_MAX_AGE_HOURS) * 3600
+        self.extract_workers = tdnet_settings.get('EXTRACT_WORKERS', DEFAULT_EXTRACT_WORKERS)
+        self.text_cache_dir = os.path.join(self.cache_dir, 'text')
+        self.url_cache_dir = os.path.join(self.cache_dir, 'urls')
+        self._text_lru = disk_cache.LRUDirectory(
+            self.text_cache_dir, '*.json',
+            tdnet_settings.get('TEXT_CACHE_MAX_BYTES', DEFAULT_TEXT_CACHE_MAX_BYTES), '抽出テキストキャッシュ')
+        self._url_lru = disk_cache.LRUDirectory(
+            self.url_cache_dir, '*.json',
+            tdnet_settings.get('URL_CACHE_MAX_BYTES', DEFAULT_URL_CACHE_MAX_BYTES), 'PDF URLキャッシュ')
         
         # キャッシュディレクトリ作成
-        os.makedirs(self.cache_dir, exist_ok=True)
+        os.makedirs(self.text_cache_dir, exist_ok=True)
+        os.makedirs(self.url_cache_dir, exist_ok=True)
     
     def download_pdf(self, pdf_url: str) -> Optional[str]:
         """
-        PDFを一時ファイルとしてダウンロード（テキスト抽出後に破棄される）
+        PDFを一時ファイルとしてダウンロード（呼び出し側で破棄する）
 
         Args:
             pdf_url: PDF URL
@@ -37,30 +134,59 @@ class PDFProcessor:
         Returns:
             ダウンロードしたPDFの一時ローカルパス or None
         """
+        download = self._download(pdf_url)
+        return download['path'] if download else None
+
+    def _download(self, pdf_url: str, headers: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        PDFをチャンク単位で一時ファイルへ書き出しながら SHA-256 を計算する
+        （メモリ使用量がPDFのサイズに比例しない）。
+
+        Returns:
+            {'not_modified': True} （304）
+            {'not_modified': False, 'path', 'sha256', 'size', 'etag', 'last_modified'}
+            失敗時は None
+        """
+        local_path = None
         try:
             logger.info(f"PDFダウンロード開始: {pdf_url}")
 
-            # URLからファイル名を生成（ハッシュ化）
-            url_hash = hashlib.md5(pdf_url.encode(), usedforsecurity=False).hexdigest()
-            local_path = os.path.join(self.cache_dir, f"{url_hash}.pdf")
+            with requests.get(pdf_url, headers=headers or {}, timeout=60, stream=True) as response:
+                if response.status_code == 304:
+                    logger.info(f"PDF未更新 (304): {pdf_url}")
+                    return {'not_modified': True}
+                response.raise_for_status()
 
-            # PDFをダウンロード（キャッシュしない）
-            response = requests.get(pdf_url, timeout=60)
-            response.raise_for_status()
+                digest = hashlib.sha256()
+                size = 0
+                with tempfile.NamedTemporaryFile(
+                        'wb', dir=self.cache_dir, suffix='.pdf', delete=False) as f:
+                    local_path = f.name
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                            digest.update(chunk)
+                            size += len(chunk)
 
-            # 一時ファイル保存
-            with open(local_path, 'wb') as f:
-                f.write(response.content)
+                etag = response.headers.get('ETag', '')
+                last_modified = response.headers.get('Last-Modified', '')
 
-            logger.info(f"PDFダウンロード完了: {len(response.content)} bytes -> {local_path}")
-            return local_path
+            logger.info(f"PDFダウンロード完了: {size} bytes -> {local_path}")
+            return {
+                'not_modified': False,
+                'path': local_path,
+                'sha256': digest.hexdigest(),
+                'size': size,
+                'etag': etag,
+                'last_modified': last_modified,
+            }
 
         except requests.exceptions.RequestException as e:
             logger.error(f"PDFダウンロードエラー: {e}")
-            return None
         except Exception as e:
             logger.error(f"予期しないエラー: {e}")
-            return None
+        self._remove(local_path)
+        return None
     
     def extract_text_from_pdf(self, pdf_path: str, max_pages: int = 50) -> Dict:
         """
@@ -79,34 +205,8 @@ class PDFProcessor:
             }
         """
         try:
-            logger.info(f"テキスト抽出開始: {pdf_path}")
-            
-            # PDFを開く
-            doc = fitz.open(pdf_path)
-            total_pages = len(doc)
-            
-            # テキスト抽出（最大ページ数まで）
-            extracted_text = []
-            pages_to_process = min(total_pages, max_pages)
-            
-            for page_num in range(pages_to_process):
-                page = doc[page_num]
-                text = page.get_text()
-                extracted_text.append(text)
-            
-            doc.close()
-            
-            full_text = "\n\n".join(extracted_text)
-            
-            logger.info(f"テキスト抽出完了: {total_pages}ページ中{pages_to_process}ページ処理, {len(full_text)}文字")
-            
-            return {
-                'success': True,
-                'text': full_text,
-                'pages': total_pages,
-                'processed_pages': pages_to_process,
-                'error': None
-            }
+            texts, total_pages = self._extract_pages(pdf_path, max_pages)
+            return self._text_result(texts, total_pages)
             
         except Exception as e:
             logger.error(f"テキスト抽出エラー: {e}")
@@ -117,27 +217,154 @@ class PDFProcessor:
                 'processed_pages': 0,
                 'error': str(e)
             }
+
+    def _extract_pages(self, pdf_path: str, max_pages: int):
+        """先頭 max_pages ページのテキスト（ページごと）と総ページ数"""
+        logger.info(f"テキスト抽出開始: {pdf_path}")
+        
+        # PDFを開く
+        doc = fitz.open(pdf_path)
+        try:
+            total_pages = len(doc)
+            pages_to_process = min(total_pages, max_pages)
+            texts = [doc[page_num].get_text() for page_num in range(pages_to_process)]
+        finally:
+            doc.close()
+        
+        logger.info(f"テキスト抽出完了: {total_pages}ページ中{pages_to_process}ページ処理")
+        return texts, total_pages
+
+    def _extract_summary_pages(self, pdf_path: str, max_pages: int):
+        """
+        要点抽出したページごとのテキスト・総ページ数・途中で打ち切ったか。
+
+        ページは1ページずつ抽出しながら読み、注記事項・補足資料の見出しが出たページ
+        （見出しの手前まで）か、SUMMARY_MAX_CHARS 文字に達したページで止める
+        （残りのページは抽出しない）。
+        """
+        logger.info(f"テキスト抽出開始（要点）: {pdf_path}")
+        total_pages = self._page_count(pdf_path)
+        pages = min(total_pages, max_pages)
+        texts = []
+        chars = 0
+        with closing(self._iter_raw_pages(pdf_path, pages)) as raw_pages:
+            for page_num, text in enumerate(raw_pages):
+                cut = _summary_cut(text) if page_num >= SUMMARY_MIN_PAGES else None
+                if cut is not None:
+                    if text[:cut].strip():
+                        texts.append(text[:cut])
+                    logger.info(f"注記事項・補足資料で抽出を打ち切り: {page_num + 1}/{pages}ページ")
+                    return texts, total_pages, True
+                texts.append(text)
+                chars += len(text)
+                if chars >= SUMMARY_MAX_CHARS:
+                    logger.info(f"文字数上限で抽出を打ち切り: {page_num + 1}/{pages}ページ")
+                    return texts, total_pages, True
+        return texts, total_pages, False
+
+    @staticmethod
+    def _page_count(pdf_path: str) -> int:
+        doc = fitz.open(pdf_path)
+        try:
+            return len(doc)
+        finally:
+            doc.close()
+
+    def _iter_raw_pages(self, pdf_path: str, pages: int) -> Iterator[str]:
+        """
+        先頭 pages ページのテキスト。並列時は EXTRACT_CHUNK_PAGES ページ単位で
+        ワーカー数分だけ先行して抽出し、読み終えたチャンクの分だけ次を投入する。
+        """
+        workers = self._effective_workers()
+        if workers <= 1 or pages <= EXTRACT_CHUNK_PAGES:
+            doc = fitz.open(pdf_path)
+            try:
+                for page_num in range(pages):
+                    yield doc[page_num].get_text()
+            finally:
+                doc.close()
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        ranges = iter([(start, min(start + EXTRACT_CHUNK_PAGES, pages))
+                       for start in range(0, pages, EXTRACT_CHUNK_PAGES)])
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            pending = deque(executor.submit(_extract_page_range, pdf_path, *r)
+                            for r in islice(ranges, workers))
+            while pending:
+                texts = pending.popleft().result()
+                for r in islice(ranges, 1):
+                    pending.append(executor.submit(_extract_page_range, pdf_path, *r))
+                yield from texts
+        finally:
+            # 打ち切り時は未着手のチャンクを取り消す（実行中の分は待たない）
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _effective_workers(self) -> int:
+        """daemon プロセス（django-q のワーカー）は子プロセスを起動できないため直列にする"""
+        import multiprocessing
+
+        if multiprocessing.current_process().daemon:
+            return 1
+        return max(1, int(self.extract_workers or 1))
+
+    @staticmethod
+    def _text_result(texts, total_pages: int, cache: Optional[str] = None) -> Dict:
+        result = {
+            'success': True,
+            'text': "\n\n".join(texts),
+            'pages': total_pages,
+            'processed_pages': len(texts),
+            'error': None
+        }
+        if cache:
+            result['cache'] = cache
+        return result
     
-    def process_pdf_url(self, pdf_url: str, max_pages: int = 50) -> Dict:
+    def process_pdf_url(self, pdf_url: str, max_pages: int = 50, summary_only: bool = False) -> Dict:
         """
-        PDF URLからダウンロード→テキスト抽出を一括実行
+        PDF URLからダウンロード→テキスト抽出を一括実行（抽出テキストはキャッシュする）
         
         Args:
             pdf_url: PDF URL
             max_pages: 抽出する最大ページ数
+            summary_only: 注記事項・補足資料の手前まで（_extract_summary_pages 参照）
         
         Returns:
             {
                 'success': True/False,
                 'text': 抽出したテキスト,
-                'pdf_path': ローカルPDFパス,
+                'pdf_path': ローカルPDFパス（常に None。PDFは抽出後に破棄）,
                 'pages': ページ数,
+                'cache': 'hit'（問い合わせなし）/ 'revalidated'（304）/
+                         'dedup'（別URLで抽出済みの同一PDF）/ 'miss',
                 'error': エラーメッセージ
             }
         """
-        # PDFダウンロード
-        pdf_path = self.download_pdf(pdf_url)
-        if not pdf_path:
+        entry = self._load_url_entry(pdf_url)
+        cached_texts = None
+        headers = {}
+        if entry:
+            cached_texts = self._load_texts(entry['sha256'], max_pages, summary_only)
+            if cached_texts:
+                if time.time() - entry.get('checked_at', 0) < self.cache_max_age:
+                    return self._cached_result(cached_texts, 'hit')
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+        download = self._download(pdf_url, headers)
+        if download and download['not_modified'] and cached_texts:
+            entry['checked_at'] = time.time()
+            self._write_json(self._url_entry_path(pdf_url), entry, self._url_lru)
+            return self._cached_result(cached_texts, 'revalidated')
+        if download and download['not_modified']:
+            # 検証子を送っていないのに 304 が返った場合は取り直す
+            download = self._download(pdf_url)
+        if not download or download['not_modified']:
             return {
                 'success': False,
                 'text': '',
@@ -145,22 +372,29 @@ class PDFProcessor:
                 'pages': 0,
                 'error': 'PDFのダウンロードに失敗しました'
             }
-        
-        # テキスト抽出
-        result = self.extract_text_from_pdf(pdf_path, max_pages)
 
-        # テキスト抽出後に一時ファイルを破棄（成否に関わらず）
+        pdf_path = download['path']
         try:
-            if os.path.exists(pdf_path):
-                os.remove(pdf_path)
-                logger.info(f"一時PDFファイルを削除: {pdf_path}")
-        except Exception as del_err:
-            logger.warning(f"一時PDFファイル削除失敗（処理は継続）: {del_err}")
+            cached_texts = self._load_texts(download['sha256'], max_pages, summary_only)
+            if cached_texts:
+                result = self._cached_result(cached_texts, 'dedup')
+            else:
+                try:
+                    if summary_only:
+                        texts, total_pages, stopped = self._extract_summary_pages(pdf_path, max_pages)
+                    else:
+                        (texts, total_pages), stopped = self._extract_pages(pdf_path, max_pages), False
+                except Exception as e:
+                    logger.error(f"テキスト抽出エラー: {e}")
+                    result = {'success': False, 'error': str(e)}
+                else:
+                    self._save_texts(download['sha256'], texts, total_pages, summary_only, stopped)
+                    result = self._text_result(texts, total_pages, 'miss')
+        finally:
+            # テキスト抽出後に一時ファイルを破棄（成否に関わらず）
+            self._remove(pdf_path)
 
-        if result['success']:
-            result['pdf_path'] = None  # ファイルは破棄済み
-            return result
-        else:
+        if not result['success']:
             return {
                 'success': False,
                 'text': '',
@@ -168,6 +402,98 @@ class PDFProcessor:
                 'pages': 0,
                 'error': result['error']
             }
+
+        self._write_json(self._url_entry_path(pdf_url), {
+            'url': pdf_url,
+            'sha256': download['sha256'],
+            'size': download['size'],
+            'etag': download['etag'],
+            'last_modified': download['last_modified'],
+            'checked_at': time.time(),
+        }, self._url_lru)
+        result['pdf_path'] = None  # ファイルは破棄済み
+        return result
+
+    def cached_text(self, pdf_url: str, max_pages: int = 50, summary_only: bool = False) -> Optional[str]:
+        """抽出済みのテキスト（問い合わせはしない）。未抽出なら None"""
+        entry = self._load_url_entry(pdf_url)
+        if not entry:
+            return None
+        cached_texts = self._load_texts(entry['sha256'], max_pages, summary_only)
+        return self._cached_result(cached_texts, 'hit')['text'] if cached_texts else None
+
+    # ------------------------------------------------------------------
+    # キャッシュファイル
+    # ------------------------------------------------------------------
+    def _url_entry_path(self, pdf_url: str) -> str:
+        url_hash = hashlib.md5(pdf_url.encode(), usedforsecurity=False).hexdigest()
+        return os.path.join(self.url_cache_dir, f"{url_hash}.json")
+
+    def _load_url_entry(self, pdf_url: str) -> Optional[Dict]:
+        entry = self._read_json(self._url_entry_path(pdf_url))
+        if entry and entry.get('url') == pdf_url and entry.get('sha256'):
+            return entry
+        return None
+
+    def _text_cache_path(self, sha256: str, summary_only: bool) -> str:
+        suffix = '.summary' if summary_only else ''
+        return os.path.join(self.text_cache_dir, f"{sha256}{suffix}.json")
+
+    def _load_texts(self, sha256: str, max_pages: int, summary_only: bool = False) -> Optional[Dict]:
+        """max_pages ページ分を満たす抽出済みテキスト {'pages', 'texts'}"""
+        cached = self._read_json(self._text_cache_path(sha256, summary_only))
+        if not cached:
+            return None
+        needed = min(cached['pages'], max_pages)
+        # 要点抽出で打ち切った結果は、より多くのページを求められても同じ
+        if len(cached['texts']) < needed and not cached.get('stopped'):
+            return None
+        return {'pages': cached['pages'], 'texts': cached['texts'][:needed]}
+
+    def _save_texts(self, sha256: str, texts, total_pages: int,
+                    summary_only: bool = False, stopped: bool = False) -> None:
+        self._write_json(self._text_cache_path(sha256, summary_only), {
+            'pages': total_pages,
+            'texts': texts,
+            'stopped': stopped,
+        }, self._text_lru)
+
+    def _cached_result(self, cached: Dict, cache: str) -> Dict:
+        logger.info(f"抽出テキストのキャッシュを使用 ({cache}): {len(cached['texts'])}ページ")
+        result = self._text_result(cached['texts'], cached['pages'], cache)
+        result['pdf_path'] = None
+        return result
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Dict]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"キャッシュ読込失敗（無視して取得し直す）: {path} {e}")
+            return None
+        disk_cache.touch(Path(path))
+        return data
+
+    @staticmethod
+    def _write_json(path: str, data: Dict, lru: disk_cache.LRUDirectory) -> None:
+        """一時ファイルに書いてから置き換え（並行プロセスが書きかけを読まないように）、上限を超えたら古いものを消す"""
+        try:
+            disk_cache.atomic_write(Path(path), json.dumps(data, ensure_ascii=False).encode('utf-8'))
+            lru.evict()
+        except OSError as e:
+            logger.warning(f"キャッシュ書込失敗（処理は継続）: {path} {e}")
+
+    @staticmethod
+    def _remove(path: Optional[str]) -> None:
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+                logger.info(f"一時PDFファイルを削除: {path}")
+        except Exception as del_err:
+            logger.warning(f"一時PDFファイル削除失敗（処理は継続）: {del_err}")
     
     def extract_metadata_from_text(self, text: str) -> Dict:
         """
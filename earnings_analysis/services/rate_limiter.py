@@ -0,0 +1,66 @@
+# earnings_analysis/services/rate_limiter.py
+"""
+プロセス内で共有するトークンバケット
+
+EdinetAPIClient はインスタンスごとに last_request_time を持っていたため、
+クライアントを複数作る（スレッドごと・サービスごと）と間隔制限が効かなかった。
+ここでは名前（API のホスト）ごとに1つのバケットをプロセス全体で共有し、
+スレッドをまたいで「平均 rate 回/秒・最大 capacity 回の連続」を守る。
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット（acquire は必要なだけ待つ）"""
+
+    def __init__(self, rate: float, capacity: float = 1, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """トークンを予約し、使えるまでの待ち時間を返す（ロック内で呼ぶ）"""
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= tokens
+        # 残高がマイナスなら、その分が補充されるまで待つ（予約済みなので他スレッドは後ろに並ぶ）
+        return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, tokens: float = 1) -> float:
+        """トークンを取得する。待った秒数を返す。"""
+        with self._lock:
+            wait = self._reserve(tokens)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def configure(self, rate: float, capacity: Optional[float] = None):
+        with self._lock:
+            self.rate = float(rate)
+            if capacity is not None:
+                self.capacity = float(capacity)
+                self._tokens = min(self._tokens, self.capacity)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, rate: float, capacity: float = 1) -> TokenBucket:
+    """name ごとのプロセス共有バケットを返す（設定が変わっていれば反映する）"""
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None:
+            bucket = _buckets[name] = TokenBucket(rate, capacity)
+        elif bucket.rate != rate or bucket.capacity != capacity:
+            bucket.configure(rate, capacity)
+        return bucket
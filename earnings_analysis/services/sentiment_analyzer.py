@@ -5,6 +5,8 @@
 
 import re
 import csv
+import hashlib
+import json
 import os
 import threading
 import traceback
@@ -18,6 +20,9 @@ from django.utils import timezone
 from datetime import timedelta
 
 from .xbrl_extractor import EDINETXBRLService
+from .lexicon_matcher import ContextPatternMatcher, LexiconMatcher
+from .sentiment_cache import analyze_with_cache
+from .analysis_jobs import LANE_INTERACTIVE, AnalysisQueueBusy, queue_position, submit_analysis_job
 from .gemini_insights import GeminiInsightsGenerator
 
 from .ai_expert_analyzer import AIExpertAnalyzer
@@ -78,10 +83,15 @@ class TransparentSentimentDictionary:
         self.deterioration_patterns = []
         self.negation_patterns = []
         self._last_modified = 0
+        self._matcher = None
+        self._matcher_size = 0
+        self.words_by_length: List[str] = []
         self.load_dictionary()
     
     def load_dictionary(self) -> None:
-        """感情辞書の読み込み"""
+        """感情辞書の読み込み（再読み込みでは語彙を入れ替え、照合器も作り直す）"""
+        self.sentiment_dict = {}
+        self._matcher = None
         if os.path.exists(self.dict_path):
             try:
                 self._load_from_file()
@@ -198,6 +208,11 @@ class TransparentSentimentDictionary:
             r'(成長|増収|増益|改善|回復|向上)(?:の)?勢い(?:は|に)?(鈍化|減速|失速)',
         ]
         
+        # 全パターンを1度だけコンパイルし、候補位置を1回の走査で求める照合器にまとめる
+        self.context_matcher = ContextPatternMatcher(
+            self.improvement_patterns, self.deterioration_patterns, self.negation_patterns
+        )
+        
         logger.info(f"文脈パターン構築完了: 改善{len(self.improvement_patterns)}個, "
                    f"悪化{len(self.deterioration_patterns)}個, "
                    f"否定{len(self.negation_patterns)}個")
@@ -209,12 +224,37 @@ class TransparentSentimentDictionary:
             logger.debug(f"語彙スコア取得: '{word}' → {score}")
         return score
     
+    @property
+    def matcher(self) -> LexiconMatcher:
+        """語彙の照合器（load_dictionary で破棄し、語彙数が変わったときも作り直す）"""
+        if self._matcher is None or self._matcher_size != len(self.sentiment_dict):
+            self._matcher = LexiconMatcher(self.sentiment_dict)
+            self._matcher_size = len(self.sentiment_dict)
+            # 複合語優先の処理順（長い順・同じ長さは辞書順）
+            self.words_by_length = sorted(self.sentiment_dict, key=len, reverse=True)
+        return self._matcher
+
+    @property
+    def version(self) -> str:
+        """語彙・スコア・文脈パターンのハッシュ（感情分析結果キャッシュのキーに使う）
+
+        辞書を編集すると値が変わり、以前の辞書で分析したキャッシュは引かれなくなる。
+        """
+        material = json.dumps(
+            [sorted(self.sentiment_dict.items()), self.improvement_patterns,
+             self.deterioration_patterns, self.negation_patterns],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()[:16]
+
     def search_words(self, text: str) -> List[Tuple[str, float]]:
-        """テキスト内の感情語彙を検索"""
+        """テキスト内の感情語彙を検索（出現回数は text.count と同じく重ならない数え方）"""
+        occurrences = self.matcher.find_all(text)
         found_words = []
         for word, score in self.sentiment_dict.items():
-            if word in text:
-                count = text.count(word)
+            starts = occurrences.get(word)
+            if starts:
+                count = LexiconMatcher.count_non_overlapping(word, starts)
                 found_words.append((word, score, count))
                 logger.debug(f"語彙発見: '{word}' (スコア: {score}, 出現: {count}回)")
         
@@ -904,8 +944,9 @@ class TransparentSentimentAnalyzer:
             
             analysis_steps = []
             
-            # ステップ1: 文脈パターンの検出
-            context_matches = self._find_context_patterns(cleaned_text)
+            # ステップ1: 文脈パターンの検出（一致位置は文レベル分析でも使う）
+            context_hits = self.dictionary.context_matcher.scan(cleaned_text)
+            context_matches = self._find_context_patterns(cleaned_text, context_hits)
             if context_matches:
                 analysis_steps.append({
                     'step': '文脈パターン検出（強化版）',
@@ -936,8 +977,15 @@ class TransparentSentimentAnalyzer:
             keyword_analysis = self._analyze_enhanced_keywords(all_matches)
             keyword_frequency_data = self._analyze_enhanced_keyword_frequency(all_matches)
             
-            sentences = self._split_sentences(cleaned_text)
-            sentence_analysis = self._analyze_sentences(sentences)
+            sentence_spans = self._split_sentence_spans(cleaned_text)
+            sentences = [sentence for sentence, _ in sentence_spans]
+            sentence_analysis = self._analyze_sentences(
+                sentences,
+                [
+                    self.dictionary.context_matcher.hits_within(context_hits, start, start + len(sentence))
+                    for sentence, start in sentence_spans[:self.config.max_sample_sentences]
+                ],
+            )
             
             # 基本結果の構築（既存構造を完全保持）
             basic_result = {
@@ -1375,94 +1423,56 @@ class TransparentSentimentAnalyzer:
             raise Exception(f"感情分析処理中にエラーが発生しました: {str(e)}")
     
     # 以下、既存のヘルパーメソッド（変更なし）
-    def _find_context_patterns(self, text: str) -> List[Tuple[str, float, str, int]]:
-        """文脈パターンの検出（新形式：word, score, type, count）"""
-        matches = []
-        
+    def _find_context_patterns(self, text: str, hits: Optional[List] = None) -> List[Tuple[str, float, str, int]]:
+        """文脈パターンの検出（新形式：word, score, type, count）
+
+        hits に文書全体の走査結果（ContextPatternMatcher.scan）の該当部分を渡すと再走査しない。
+        """
         try:
-            # 改善パターンの検出
-            for pattern in self.dictionary.improvement_patterns:
-                pattern_matches = list(re.finditer(pattern, text, re.IGNORECASE))
-                if pattern_matches:
-                    matched_text = pattern_matches[0].group()
-                    count = len(pattern_matches)
-                    score = 0.7
-                    matches.append((matched_text, score, '改善表現', count))
-            
-            # 悪化パターンの検出
-            for pattern in self.dictionary.deterioration_patterns:
-                pattern_matches = list(re.finditer(pattern, text, re.IGNORECASE))
-                if pattern_matches:
-                    matched_text = pattern_matches[0].group()
-                    count = len(pattern_matches)
-                    score = -0.6
-                    matches.append((matched_text, score, '悪化表現', count))
-            
-            # 否定パターンの検出
-            for pattern in self.dictionary.negation_patterns:
-                pattern_matches = list(re.finditer(pattern, text, re.IGNORECASE))
-                if pattern_matches:
-                    matched_text = pattern_matches[0].group()
-                    count = len(pattern_matches)
-                    
-                    # 否定パターンのスコア調整
-                    if any(pos_word in matched_text.lower() for pos_word in ['成長', '増収', '増益', '改善', '回復', '向上']):
-                        score = -0.4  # ポジティブ語の否定はネガティブ
-                    else:
-                        score = 0.4   # ネガティブ語の否定はポジティブ
-                    
-                    matches.append((matched_text, score, '否定表現', count))
-            
-            return matches
+            matcher = self.dictionary.context_matcher
+            if hits is None:
+                hits = matcher.scan(text)
+            return matcher.summarize(hits)
             
         except Exception as e:
             logger.debug(f"文脈パターン検出エラー: {e}")
             return []
 
     def _find_basic_words(self, text: str, context_matches: List) -> List[Tuple[str, float, str, int]]:
-        """基本語彙の検出（新形式：word, score, type, count）"""
+        """基本語彙の検出（新形式：word, score, type, count）
+
+        全語彙の出現位置は辞書の照合器で1回の走査で求め、複合語優先（長い語彙から順）に
+        まだ他の語彙に取られていない出現だけを数える。
+        """
         matches = []
         
         try:
             # 文脈パターンで検出された語句を除外対象とする
             context_words = {word for word, _, _, _ in context_matches}
             
-            # 複合語を優先してチェック（長い語彙から先に処理）
-            sorted_words = sorted(self.dictionary.sentiment_dict.items(), key=lambda x: len(x[0]), reverse=True)
-            processed_positions = set()  # 処理済み位置を記録
+            occurrences = self.dictionary.matcher.find_all(text)
+            if not occurrences:
+                return matches
             
-            for word, score in sorted_words:
-                if len(word) < 1:
-                    continue
-                    
-                if word in context_words:
+            # 長い語彙に取られた文字位置（同じ語彙どうしの重なりは数える）
+            claimed = bytearray(len(text))
+            
+            for word in self.dictionary.words_by_length:
+                starts = occurrences.get(word)
+                if not starts or word in context_words:
                     continue
                 
-                # テキスト内での出現位置と回数をカウント
-                word_positions = []
-                start = 0
-                while True:
-                    pos = text.find(word, start)
-                    if pos == -1:
-                        break
-                    
-                    # 既に処理済みの位置と重複しないかチェック
-                    word_end = pos + len(word)
-                    is_overlapping = any(pos < end and word_end > start_pos 
-                                       for start_pos, end in processed_positions)
-                    
-                    if not is_overlapping:
-                        word_positions.append((pos, word_end))
-                    
-                    start = pos + 1
+                length = len(word)
+                word_positions = [pos for pos in starts if claimed.find(1, pos, pos + length) < 0]
                 
                 if word_positions:
                     # 出現回数を制限（最大重み適用）
                     count = min(len(word_positions), self.config.max_word_count_weight)
-                    matches.append((word, score, '基本語彙', count))
+                    matches.append((word, self.dictionary.sentiment_dict[word], '基本語彙', count))
                     
                     # 処理済み位置を記録
-                    processed_positions.update(word_positions)
+                    for pos in word_positions:
+                        claimed[pos:pos + length] = b'\x01' * length
             
             return matches
             
@@ -1779,18 +1789,31 @@ class TransparentSentimentAnalyzer:
     
     def _split_sentences(self, text: str) -> List[str]:
         """文分割"""
-        sentences = re.split(r'[。！？\n]', text)
-        return [s.strip() for s in sentences if len(s.strip()) >= self.config.min_sentence_length and 
-                len(re.findall(r'[ぁ-んァ-ヶ一-龯]', s)) > 2]
+        return [sentence for sentence, _ in self._split_sentence_spans(text)]
+    
+    def _split_sentence_spans(self, text: str) -> List[Tuple[str, int]]:
+        """文分割（各文の text 内の開始位置つき）"""
+        spans = []
+        for piece in re.finditer(r'[^。！？\n]*', text):
+            raw = piece.group()
+            s = raw.strip()
+            if len(s) >= self.config.min_sentence_length and len(re.findall(r'[ぁ-んァ-ヶ一-龯]', raw)) > 2:
+                spans.append((s, piece.start() + (len(raw) - len(raw.lstrip()))))
+        return spans
     
-    def _analyze_sentences(self, sentences: List[str]) -> List[Dict]:
-        """文章レベル分析"""
+    def _analyze_sentences(self, sentences: List[str], sentence_hits: Optional[List] = None) -> List[Dict]:
+        """文章レベル分析
+
+        sentence_hits は文ごとの文脈パターン一致（文書全体の走査結果から切り出したもの）。
+        None の文は文単体で走査する。
+        """
         sentence_analysis = []
         analyzed_texts = set()
         
-        for sentence in sentences[:self.config.max_sample_sentences]:
+        for i, sentence in enumerate(sentences[:self.config.max_sample_sentences]):
             # 文章スコア計算
-            context_matches = self._find_context_patterns(sentence)
+            hits = sentence_hits[i] if sentence_hits is not None and i < len(sentence_hits) else None
+            context_matches = self._find_context_patterns(sentence, hits)
             basic_matches = self._find_basic_words(sentence, context_matches)
             
             all_scores = []
@@ -1926,8 +1949,13 @@ class SentimentAnalysisService:
         self.analyzer = TransparentSentimentAnalyzer()
         self.xbrl_service = EDINETXBRLService()
     
-    def start_analysis(self, document_id: str, force: bool = False, user_ip: str = None) -> Dict[str, Any]:
-        """感情分析開始（期限切れセッション対応版）"""
+    def start_analysis(self, document_id: str, force: bool = False, user_ip: str = None,
+                       lane: str = LANE_INTERACTIVE) -> Dict[str, Any]:
+        """感情分析開始（期限切れセッション対応版）
+
+        分析は django-q の analysis キューで実行する（services/analysis_jobs.py）。
+        キューが混雑している場合は status='busy' を返す。
+        """
         from ..models import DocumentMetadata, SentimentAnalysisSession
         
         try:
@@ -1964,26 +1992,27 @@ class SentimentAnalysisService:
                     if expired_session:
                         logger.info(f"期限切れセッションを無視して新規分析開始: 期限切れID={expired_session.session_id}")
             
-            # 新しいセッションを作成
-            session = SentimentAnalysisSession.objects.create(
-                document=document,
-                processing_status='PENDING'
+            # セッションを作成して analysis キューへ投入（同じ書類の分析中ジョブがあれば合流）
+            session, deduplicated = submit_analysis_job(
+                SentimentAnalysisSession, document,
+                'earnings_analysis.tasks.run_sentiment_analysis_task',
+                lane=lane, user_ip=user_ip,
             )
             
-            logger.info(f"新規感情分析セッション作成: {session.session_id}")
-            
-            threading.Thread(
-                target=self._execute_analysis,
-                args=(session.id, user_ip),
-                daemon=True
-            ).start()
+            logger.info(f"感情分析セッション: {session.session_id} (合流: {deduplicated})")
             
             return {
                 'status': 'started',
                 'session_id': str(session.session_id),
-                'message': 'API呼び出し最適化版感情分析を開始しました（Gemini API呼び出し: 1回）'
+                'deduplicated': deduplicated,
+                'message': (
+                    '同じ書類の感情分析が進行中です' if deduplicated
+                    else 'API呼び出し最適化版感情分析を開始しました（Gemini API呼び出し: 1回）'
+                )
             }
             
+        except AnalysisQueueBusy as e:
+            return {'status': 'busy', 'message': str(e)}
         except DocumentMetadata.DoesNotExist:
             raise Exception('指定された書類が見つかりません')
         except Exception as e:
@@ -2026,8 +2055,8 @@ class SentimentAnalysisService:
             'securities_code': document.securities_code or '',
             'edinet_code': document.edinet_code or '',
         }
-        result = self.analyzer.analyze_text_sections(
-            text_sections, None, document_info, use_ai=False
+        result = analyze_with_cache(
+            self.analyzer, text_sections, None, document_info, use_ai=False, doc_id=document.doc_id
         )
         if not result or result.get('overall_score') is None:
             return False
@@ -2096,7 +2125,8 @@ class SentimentAnalysisService:
                 message = f'分析失敗: {session.error_message}'
             else:
                 progress = 0
-                message = 'API最適化版エンジン待機中...'
+                position = queue_position(session)
+                message = f'分析の順番待ち中（前に{position}件）...' if position else 'API最適化版エンジン待機中...'
             
             return {
                 'progress': progress,
@@ -2172,11 +2202,15 @@ class SentimentAnalysisService:
                 xbrl_text_sections = None
             
             # 分析実行
+            # 本文・辞書・設定が同じなら以前の結果を使う（services/sentiment_cache.py）
             if not xbrl_text_sections:
-                document_text = self._extract_enhanced_document_text(session.document)
-                result = self.analyzer.analyze_text(document_text, str(session.session_id), document_info)
+                content = self._extract_enhanced_document_text(session.document)
             else:
-                result = self.analyzer.analyze_text_sections(xbrl_text_sections, str(session.session_id), document_info)
+                content = xbrl_text_sections
+            result = analyze_with_cache(
+                self.analyzer, content, str(session.session_id), document_info,
+                doc_id=session.document.doc_id,
+            )
             
             # ===== 新規追加: AI分析ステータスのログ出力 =====
             ai_meta = result.get('analysis_metadata', {}).get('ai_analysis', {})
@@ -0,0 +1,252 @@
+# earnings_analysis/services/sentiment_backfill.py
+"""
+過去の開示書類の語彙感情分析（経営トーン履歴）の一括作成
+
+経営トーンの前回比は SentimentAnalysisHistory に依存するが、履歴を作る手段は
+run_lexicon_analysis で1書類ずつ分析するか、新規開示の自動分析パイプラインしかなく、
+過去分（バックカタログ）の履歴を揃えられなかった。
+
+ここでは対象書類（書類種別・提出日の範囲・日記で記録している銘柄）を選び、
+
+1. 本文抽出: スレッドプール。XBRL はローカルアーカイブ経由で読み（未取得分のみ EDINET へ）、
+   その場でテキストセクションに展開する（子プロセスへは ZIP ではなくセクションだけ渡す）
+2. 語彙感情分析: プロセスプール。感情辞書は子プロセスの起動時に1度だけ読み込む
+3. 書込: BATCH_SIZE 書類ごとに bulk_create
+
+の順に処理する。書込はバッチごとにコミットし、対象は「履歴のない書類」なので、
+中断しても同じ条件で再実行すれば続きから処理する（resume）。本文が取れず分析できなかった
+書類は同じバッチで DocumentMetadata.sentiment_skipped を立て、再実行では読み直さない。
+"""
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import date
+from typing import Iterable, Optional
+
+from django.db import transaction
+
+from .analysis_pipeline import PipelineMetrics, _document_info, _init_worker, _InlineExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 50
+
+
+def backfill_candidates(doc_type_codes: Iterable[str] = None, since: Optional[date] = None,
+                        until: Optional[date] = None, securities_codes: Iterable[str] = None,
+                        held_only: bool = False, include_skipped: bool = False):
+    """語彙感情分析の履歴がない書類の QuerySet（提出日の古い順・再実行しても同じ順）
+
+    include_skipped: 本文がなく対象外にした書類（sentiment_skipped）も含める
+    """
+    from django.db.models import Exists, OuterRef
+    from ..models import DocumentMetadata, SentimentAnalysisHistory
+    from .disclosure_sync import IMPORTANT_DOC_TYPE_CODES
+
+    qs = (
+        DocumentMetadata.objects
+        .filter(
+            xbrl_flag=True,
+            doc_type_code__in=list(doc_type_codes or IMPORTANT_DOC_TYPE_CODES),
+            legal_status__in=['1', '2'],
+            withdrawal_status='0',
+        )
+        .annotate(has_sentiment=Exists(SentimentAnalysisHistory.objects.filter(document=OuterRef('pk'))))
+        .filter(has_sentiment=False)
+    )
+    if not include_skipped:
+        qs = qs.filter(sentiment_skipped=False)
+    if since:
+        qs = qs.filter(file_date__gte=since)
+    if until:
+        qs = qs.filter(file_date__lte=until)
+    if securities_codes:
+        qs = qs.filter(securities_code__in=list(securities_codes))
+    if held_only:
+        from stockdiary.models import StockDiary
+        symbols = (
+            StockDiary.objects
+            .filter(stock_symbol__regex=r'^\d{4}$')
+            .values_list('stock_symbol', flat=True)
+            .distinct()
+        )
+        qs = qs.filter(securities_code__in=[s + '0' for s in symbols])
+    return qs.order_by('file_date', 'doc_id')
+
+
+# ------------------------------------------------------------------
+# 本文抽出（スレッド）
+# ------------------------------------------------------------------
+# EDINETXBRLService（抽出器の状態を持つ）はスレッドをまたいで共有せず、スレッドごとに作る
+_local = threading.local()
+
+
+def _load_sections(document) -> tuple:
+    """アーカイブ経由で XBRL を読み、テキストセクションを返す"""
+    from .xbrl_extractor import EDINETXBRLService
+
+    service = getattr(_local, 'xbrl_service', None)
+    if service is None:
+        service = _local.xbrl_service = EDINETXBRLService()
+    started = time.monotonic()
+    payload = service._load_xbrl_archive(document.doc_id)
+    sections = service._extract_text_from_bytes(payload) if payload else {}
+    return sections, time.monotonic() - started
+
+
+# ------------------------------------------------------------------
+# 語彙感情分析（子プロセス）
+# ------------------------------------------------------------------
+_analyzer = None
+
+
+def _init_backfill_worker():
+    """子プロセスの起動時に感情辞書を1度だけ読み込む"""
+    global _analyzer
+    _init_worker()
+    from .sentiment_analyzer import TransparentSentimentAnalyzer
+
+    _analyzer = TransparentSentimentAnalyzer()
+
+
+def analyze_sections_payload(text_sections: dict, document_info: dict) -> tuple:
+    """テキストセクションの語彙感情分析（AI不使用）。プロセスプールから呼ぶ。"""
+    from .sentiment_cache import analyze_with_cache
+
+    if _analyzer is None:
+        _init_backfill_worker()
+    started = time.monotonic()
+    result = analyze_with_cache(
+        _analyzer, text_sections, None, document_info, use_ai=False,
+        doc_id=document_info.get('doc_id'),
+    )
+    if not result or result.get('overall_score') is None:
+        result = None
+    return result, time.monotonic() - started
+
+
+# ------------------------------------------------------------------
+# 本体
+# ------------------------------------------------------------------
+def _write_histories(results: list, skipped: list, metrics: PipelineMetrics):
+    """分析結果を bulk_create し、本文のなかった書類を対象外にする（並行して履歴ができた書類は除く）"""
+    from ..models import DocumentMetadata, SentimentAnalysisHistory
+
+    started = time.monotonic()
+    with transaction.atomic():
+        if skipped:
+            DocumentMetadata.objects.filter(pk__in=skipped).update(sentiment_skipped=True)
+        done = set(
+            SentimentAnalysisHistory.objects
+            .filter(document_id__in=[document.pk for document, _ in results])
+            .values_list('document_id', flat=True)
+        )
+        histories = [
+            SentimentAnalysisHistory(
+                document=document,
+                overall_score=result['overall_score'],
+                sentiment_label=result['sentiment_label'],
+                analysis_result=result,
+            )
+            for document, result in results if document.pk not in done
+        ]
+        SentimentAnalysisHistory.objects.bulk_create(histories)
+    metrics.counts['sentiment_saved'] += len(histories)
+    metrics.record('write', time.monotonic() - started)
+
+
+def run_sentiment_backfill(documents, io_workers: int = 4, cpu_workers: int = 2,
+                           batch_size: int = DEFAULT_BATCH_SIZE, progress=None) -> dict:
+    """書類群の語彙感情分析履歴を 本文抽出 → 分析 → 書込 の順に作る。
+
+    Args:
+        progress: バッチを書き込むたびに summary を受け取る関数（進捗表示用）
+
+    Returns:
+        dict: PipelineMetrics.summary() に documents_per_second・skipped を加えたもの
+    """
+    io_workers = max(1, io_workers)
+    batch_size = max(1, batch_size)
+    max_in_flight = io_workers + 2 * max(1, cpu_workers)
+
+    metrics = PipelineMetrics()
+    metrics.counts['skipped'] = 0  # テキストセクションがない書類
+
+    work = iter(documents)
+    io_pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='sentiment-backfill')
+    cpu_pool = (
+        ProcessPoolExecutor(max_workers=cpu_workers, initializer=_init_backfill_worker)
+        if cpu_workers > 0 else _InlineExecutor()
+    )
+    in_flight = {}  # future -> (stage, document)
+    pending_writes = []
+    pending_skips = []  # 本文がなく分析できなかった書類の pk
+
+    def summary():
+        result = metrics.summary()
+        elapsed = result['elapsed_seconds']
+        result['documents_per_second'] = round(result['documents'] / elapsed, 2) if elapsed else None
+        return result
+
+    def flush():
+        nonlocal pending_writes, pending_skips
+        if pending_writes or pending_skips:
+            _write_histories(pending_writes, pending_skips, metrics)
+            pending_writes, pending_skips = [], []
+            if progress:
+                progress(summary())
+
+    def submit_loads():
+        while len(in_flight) < max_in_flight:
+            document = next(work, None)
+            if document is None:
+                return
+            metrics.counts['documents'] += 1
+            in_flight[io_pool.submit(_load_sections, document)] = ('download', document)
+
+    try:
+        submit_loads()
+        while in_flight:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, document = in_flight.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    metrics.counts['failed'] += 1
+                    logger.warning(f'感情分析一括作成失敗（{stage}）: doc_id={document.doc_id}, {e}')
+                    continue
+
+                if stage == 'download':
+                    sections, seconds = value
+                    metrics.record('download', seconds)
+                    if sections:
+                        analysis = cpu_pool.submit(analyze_sections_payload, sections, _document_info(document))
+                        in_flight[analysis] = ('sentiment', document)
+                    else:
+                        metrics.counts['skipped'] += 1
+                        pending_skips.append(document.pk)
+                else:
+                    result, seconds = value
+                    metrics.record('sentiment', seconds)
+                    if result is None:
+                        metrics.counts['skipped'] += 1
+                        pending_skips.append(document.pk)
+                    else:
+                        pending_writes.append((document, result))
+                if len(pending_writes) >= batch_size or len(pending_skips) >= batch_size:
+                    flush()
+            submit_loads()
+        flush()
+    finally:
+        io_pool.shutdown(wait=True, cancel_futures=True)
+        cpu_pool.shutdown(wait=True, cancel_futures=True)
+
+    result = summary()
+    logger.info(
+        f"感情分析一括作成: {result['documents']}書類 "
+        f"(保存{result['sentiment_saved']} / テキストなし{result['skipped']} / 失敗{result['failed']}) "
+        f"{result['elapsed_seconds']}秒 ({result['documents_per_second']}書類/秒), 段別 {result['stages']}"
+    )
+    return result
@@ -0,0 +1,204 @@
+# earnings_analysis/services/sentiment_cache.py
+"""
+感情分析結果のキャッシュ（本文の内容ハッシュ + 辞書バージョン + 設定 をキーにする）
+
+SentimentAnalysisService.start_analysis は同じ書類の完了セッションを1時間だけ再利用し、
+それ以降の再表示や、セクション本文が変わらない訂正報告書でも、語彙分析と AI 分析を
+最初からやり直していた。語彙分析の結果は本文・辞書・設定だけで決まるので、
+ここでは分析結果をそれらのハッシュで引けるようにディスクへ保存する。
+
+キー（sha256）に含めるもの:
+- 本文: セクション名と本文の組（analyze_text_sections）または本文1つ（analyze_text）
+- 辞書バージョン: TransparentSentimentDictionary.version（語彙・スコア・文脈パターンのハッシュ。
+  辞書を編集するとキーが変わるので、古い結果は引かれなくなり LRU で消える）
+- AnalysisConfig の全項目と RESULT_SCHEMA_VERSION（スコア計算の変更時に上げる）
+- AI を使う場合は書類情報（AI の見解は企業名・提出日などにも依存する）
+
+レイアウト（ROOT 配下）:
+- results/<キー先頭2文字>/<キー>.json.gz : 分析結果（JSON を gzip 圧縮）
+- refs/<doc_id>                          : その書類で最後に保存した結果のキー
+
+書き込み・LRU は DocumentArchiveStore と同じ disk_cache の部品を使い、
+結果ファイルの合計サイズが MAX_BYTES を超えたら最終アクセスの古いものから消す。
+Web と qcluster（プロセスプールの子プロセスを含む）で共有するため、プロセスごとの
+LocMemCache ではなくディスクに置く。
+"""
+import dataclasses
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import disk_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+# スコア計算・結果の形を変えたら上げる（既存のキャッシュは引かれなくなる）
+RESULT_SCHEMA_VERSION = 1
+
+
+class SentimentResultCache:
+    """キー → 感情分析結果のディスクキャッシュ（LRU）"""
+
+    def __init__(self, root, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.results_dir = self.root / 'results'
+        self.refs_dir = self.root / 'refs'
+        self._lru = disk_cache.LRUDirectory(self.results_dir, '*/*.json.gz', self.max_bytes, '感情分析キャッシュ')
+
+    # ---- パス ----
+
+    def _result_path(self, key: str) -> Path:
+        return self.results_dir / key[:2] / f"{key}.json.gz"
+
+    def _ref_path(self, doc_id: str) -> Path:
+        return self.refs_dir / doc_id
+
+    # ---- 読み書き ----
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """保存済みの結果を返す。無い・壊れている場合は None。"""
+        path = self._result_path(key)
+        try:
+            result = json.loads(disk_cache.read_gzip(path))
+        except FileNotFoundError:
+            return None
+        except (*disk_cache.CORRUPT_ERRORS, ValueError) as e:
+            logger.warning(f"感情分析キャッシュ展開失敗のため破棄: {key} - {e}")
+            disk_cache.unlink(path)
+            return None
+
+        disk_cache.touch(path)
+        return result
+
+    def put(self, key: str, result: Dict[str, Any], doc_id: str = None):
+        """結果を保存する。doc_id を渡すと書類からも引けるようにする（get_for_document）。"""
+        data = json.dumps(result, ensure_ascii=False, cls=DjangoJSONEncoder).encode('utf-8')
+        disk_cache.write_gzip(self._result_path(key), data)
+        if doc_id:
+            self.link(doc_id, key)
+        self.evict()
+
+    def link(self, doc_id: str, key: str):
+        """書類 → 結果キーの参照を書く（同じ本文の別書類がキャッシュを引いたときも更新する）"""
+        disk_cache.atomic_write(self._ref_path(doc_id), key.encode('ascii'))
+
+    def get_for_document(self, doc_id: str, dictionary_version: str) -> Optional[Dict[str, Any]]:
+        """書類の最新の結果のうち、指定の辞書バージョンで分析したものを返す。"""
+        ref_path = self._ref_path(doc_id)
+        try:
+            key = ref_path.read_text().strip()
+        except (FileNotFoundError, OSError):
+            return None
+        result = self.get(key)
+        if result is None:
+            # LRU で結果だけ消えた ref
+            disk_cache.unlink(ref_path)
+            return None
+        if result.get('analysis_metadata', {}).get('dictionary_version') != dictionary_version:
+            return None
+        return result
+
+    # ---- 容量管理 ----
+
+    def evict(self, max_bytes: int = None) -> int:
+        """合計サイズが上限を超えていれば、最終アクセスの古い結果から削除する（削除数を返す）"""
+        return self._lru.evict(max_bytes)
+
+    def stats(self) -> dict:
+        stats = self._lru.stats()
+        return {'results': stats['files'], 'bytes': stats['bytes'], 'max_bytes': stats['max_bytes']}
+
+
+def get_result_cache() -> Optional[SentimentResultCache]:
+    """settings.SENTIMENT_RESULT_CACHE_SETTINGS からキャッシュを作る。無効化されていれば None。"""
+    conf = getattr(settings, 'SENTIMENT_RESULT_CACHE_SETTINGS', {})
+    if not conf.get('ENABLED', True):
+        return None
+    root = conf.get('ROOT') or Path(settings.BASE_DIR) / 'cache' / 'sentiment_results'
+    return SentimentResultCache(root, conf.get('MAX_BYTES', DEFAULT_MAX_BYTES))
+
+
+def result_cache_key(analyzer, content, use_ai: bool, document_info: Dict[str, str] = None) -> str:
+    """本文（セクション dict または文字列）・辞書バージョン・設定からキャッシュキーを作る。"""
+    if isinstance(content, dict):
+        body = ['sections', sorted(content.items())]
+    else:
+        body = ['text', content]
+    material = {
+        'schema': RESULT_SCHEMA_VERSION,
+        'content': hashlib.sha256(
+            json.dumps(body, ensure_ascii=False).encode('utf-8')
+        ).hexdigest(),
+        'dictionary': analyzer.dictionary.version,
+        'config': dataclasses.asdict(analyzer.config),
+        'use_ai': bool(use_ai),
+        'document_info': sorted((document_info or {}).items()) if use_ai else None,
+    }
+    return hashlib.sha256(
+        json.dumps(material, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+def _is_cacheable(result: Dict[str, Any], use_ai: bool) -> bool:
+    """語彙分析のみの結果か、AI 分析まで成功した結果だけを保存する。
+
+    AI の失敗（API 不通・レート制限など）は再試行で直りうるので保存しない。
+    """
+    if not result or result.get('overall_score') is None:
+        return False
+    if not use_ai:
+        return True
+    return bool(result.get('analysis_metadata', {}).get('ai_analysis', {}).get('success'))
+
+
+def analyze_with_cache(analyzer, content, session_id: str = None,
+                       document_info: Dict[str, str] = None, use_ai: bool = True,
+                       doc_id: str = None) -> Dict[str, Any]:
+    """キャッシュにあればそれを返し、無ければ分析して保存する。
+
+    content がセクション dict なら analyze_text_sections、文字列なら analyze_text を使う。
+    キャッシュの読み書きに失敗しても分析自体は続ける。
+    """
+    store = get_result_cache()
+    key = result_cache_key(analyzer, content, use_ai, document_info) if store else None
+
+    if store:
+        try:
+            cached = store.get(key)
+        except OSError as e:
+            logger.warning(f"感情分析キャッシュ読み込み失敗: {key} - {e}")
+            cached = None
+        if cached is not None:
+            logger.info(f"感情分析キャッシュヒット: doc_id={doc_id} key={key[:12]}")
+            metadata = cached.setdefault('analysis_metadata', {})
+            metadata['session_id'] = session_id
+            metadata['cache_hit'] = True
+            if doc_id:
+                try:
+                    store.link(doc_id, key)
+                except OSError:
+                    pass
+            return cached
+
+    if isinstance(content, dict):
+        result = analyzer.analyze_text_sections(content, session_id, document_info, use_ai=use_ai)
+    else:
+        result = analyzer.analyze_text(content, session_id, document_info, use_ai=use_ai)
+
+    if isinstance(result, dict) and 'analysis_metadata' in result:
+        result['analysis_metadata']['dictionary_version'] = analyzer.dictionary.version
+    if store and _is_cacheable(result, use_ai):
+        try:
+            store.put(key, result, doc_id)
+        except (OSError, TypeError, ValueError) as e:
+            # ディスク書き込みの失敗で本処理を止めない
+            logger.warning(f"感情分析キャッシュ保存失敗: {key} - {e}")
+    return result
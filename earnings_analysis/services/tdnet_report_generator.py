@@ -2,7 +2,7 @@
 
 from typing import Dict, Any, Optional
 from django.utils import timezone
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from .gemini_service import GeminiReportGenerator
 from .pdf_processor import PDFProcessor
 from ..models import TDNETDisclosure, TDNETReport, TDNETReportSection
@@ -30,7 +30,8 @@ class TDNETReportGeneratorService:
         """PDF URLから直接レポート生成"""
         try:
             logger.info(f"PDF処理開始: {pdf_url}")
-            pdf_result = self.pdf_processor.process_pdf_url(pdf_url, max_pdf_pages)
+            # プロンプトに使うのは前半の要点だけなので、注記事項・補足資料の手前で抽出を止める
+            pdf_result = self.pdf_processor.process_pdf_url(pdf_url, max_pdf_pages, summary_only=True)
             
             if not pdf_result['success']:
                 return {
@@ -169,16 +170,9 @@ class TDNETReportGeneratorService:
                 else:
                     extracted_text = disclosure.summary
             else:
-                extracted_text = disclosure.raw_data.get('extracted_text', disclosure.summary)
+                extracted_text = self._stored_text(disclosure)
             
-            disclosure_dict = {
-                'company_name': disclosure.company_name,
-                'company_code': disclosure.company_code,
-                'disclosure_date': disclosure.disclosure_date.isoformat(),
-                'title': disclosure.title,
-                'summary': disclosure.summary,
-                'content': extracted_text[:20000] if extracted_text else disclosure.summary,
-            }
+            disclosure_dict = self._disclosure_dict(disclosure, extracted_text)
             
             generation_result = self.gemini_generator.generate_report(
                 disclosure_dict,
@@ -223,17 +217,36 @@ class TDNETReportGeneratorService:
                 'error': str(e)
             }
     
-    @transaction.atomic
-    def _save_report(self,
+    def _stored_text(self, disclosure: TDNETDisclosure) -> str:
+        """
+        開示のテキスト。生成時に抽出したテキスト全体が PDFProcessor のキャッシュにあれば使い
+        （PDFは取得し直さない）、なければ raw_data に残した先頭部分。
+        """
+        pdf_url = disclosure.pdf_url or disclosure.raw_data.get('pdf_url')
+        cached = self.pdf_processor.cached_text(pdf_url, summary_only=True) if pdf_url else None
+        return cached or disclosure.raw_data.get('extracted_text', disclosure.summary)
+
+    def _disclosure_dict(self, disclosure: TDNETDisclosure, extracted_text: str) -> Dict[str, Any]:
+        """プロンプト用の開示情報"""
+        return {
+            'company_name': disclosure.company_name,
+            'company_code': disclosure.company_code,
+            'disclosure_date': disclosure.disclosure_date.isoformat(),
+            'title': disclosure.title,
+            'summary': disclosure.summary,
+            'content': extracted_text[:20000] if extracted_text else disclosure.summary,
+        }
+
+    def _new_report(self,
                     disclosure: TDNETDisclosure,
                     report_type: str,
                     generation_result: Dict,
                     user) -> TDNETReport:
-        """レポートをDB保存"""
+        """生成結果から未保存のレポートを作る"""
         report_id = f"TDNET-{disclosure.company_code}-{disclosure.disclosure_date.strftime('%Y%m%d')}-{uuid.uuid4().hex[:8]}"
         report_data = generation_result['data']
         
-        report = TDNETReport.objects.create(
+        return TDNETReport(
             report_id=report_id,
             disclosure=disclosure,
             title=f"{disclosure.company_name} - {disclosure.title}",
@@ -251,10 +264,12 @@ class TDNETReportGeneratorService:
             generation_prompt=generation_result.get('prompt', ''),
             generation_token_count=generation_result.get('token_count', 0),
         )
-        
-        sections_data = report_data.get('sections', [])
-        for i, section_data in enumerate(sections_data):
-            TDNETReportSection.objects.create(
+
+    @staticmethod
+    def _section_rows(report: TDNETReport, sections_data) -> list:
+        """レポートのセクション（bulk_create 用の未保存の行）"""
+        return [
+            TDNETReportSection(
                 report=report,
                 section_type=section_data.get('section_type', 'other'),
                 title=section_data.get('title', f'セクション{i+1}'),
@@ -262,8 +277,28 @@ class TDNETReportGeneratorService:
                 order=i,
                 data=section_data.get('data', {})
             )
+            for i, section_data in enumerate(sections_data or [])
+        ]
+
+    @transaction.atomic
+    def _save_report(self,
+                    disclosure: TDNETDisclosure,
+                    report_type: str,
+                    generation_result: Dict,
+                    user) -> TDNETReport:
+        """レポートをDB保存（同時に生成された同じ開示・種別のレポートがあればそれを返す）"""
+        report = self._new_report(disclosure, report_type, generation_result, user)
+        try:
+            with transaction.atomic():
+                report.save()
+        except IntegrityError:
+            logger.info(f"生成済みのレポートを返却: {disclosure.disclosure_id} ({report_type})")
+            return TDNETReport.objects.get(disclosure=disclosure, report_type=report_type)
+        TDNETReportSection.objects.bulk_create(
+            self._section_rows(report, generation_result['data'].get('sections', []))
+        )
         
-        logger.info(f"レポート保存完了: {report_id}, score={report.overall_score}, signal={report.signal}")
+        logger.info(f"レポート保存完了: {report.report_id}, score={report.overall_score}, signal={report.signal}")
         return report
     
     def regenerate_report(self, report_id: str, user) -> Dict[str, Any]:
@@ -275,16 +310,9 @@ class TDNETReportGeneratorService:
             
             report.sections.all().delete()
             
-            extracted_text = report.disclosure.raw_data.get('extracted_text', report.disclosure.summary)
-            
-            disclosure_dict = {
-                'company_name': report.disclosure.company_name,
-                'company_code': report.disclosure.company_code,
-                'disclosure_date': report.disclosure.disclosure_date.isoformat(),
-                'title': report.disclosure.title,
-                'summary': report.disclosure.summary,
-                'content': extracted_text[:20000] if extracted_text else report.disclosure.summary,
-            }
+            extracted_text = self._stored_text(report.disclosure)
+
+            disclosure_dict = self._disclosure_dict(report.disclosure, extracted_text)
             
             generation_result = self.gemini_generator.generate_report(
                 disclosure_dict,
@@ -305,15 +333,9 @@ class TDNETReportGeneratorService:
             report.generation_token_count = generation_result.get('token_count', 0)
             report.save()
             
-            for i, section_data in enumerate(report_data.get('sections', [])):
-                TDNETReportSection.objects.create(
-                    report=report,
-                    section_type=section_data.get('section_type', 'other'),
-                    title=section_data.get('title', f'セクション{i+1}'),
-                    content=section_data.get('content', ''),
-                    order=i,
-                    data=section_data.get('data', {})
-                )
+            TDNETReportSection.objects.bulk_create(
+                self._section_rows(report, report_data.get('sections', []))
+            )
             
             return {'success': True, 'report': report, 'message': 'レポートを再生成しました', 'error': None}
             
@@ -0,0 +1,312 @@
+# earnings_analysis/services/tdnet_report_pipeline.py
+"""
+TDNETレポートのまとめて生成
+
+generate_report_from_disclosure / generate_report_from_pdf_url_task は1開示ずつ
+PDF取得 → 抽出 → Gemini → 保存 を直列に行い、1件で django-q のワーカーを1分以上占有していた。
+ここでは複数の開示をまとめて受け取り、
+
+1. 開示IDの重複と、同じ種別のレポートが既にある開示を除く（並行したバッチが先に保存した
+   レポートは、(開示, 種別) の一意制約で保存時に弾いてスキップに数える）
+2. PDFの取得・抽出をスレッドで並列に行う（PDFProcessor のキャッシュが効く）
+3. 本文の短い開示は同じ種別ごとにプロンプトの文字数上限まで1回の LLM 呼び出しにまとめ、
+   長い開示は1件ずつ呼ぶ（呼び出しは並列。上限は llm_gateway のモデルごとの同時実行数）
+4. LLM 呼び出しが終わったまとまりから順にレポートを保存し、セクションはまとまりごとに
+   bulk_create で1回に書く（途中でワーカーが止まっても、保存済みのレポートは残る）
+
+DB へのアクセスはすべて呼び出し元のスレッドで行う（ワーカースレッドは PDF と LLM のみ）。
+実行記録は TDNETReportBatch に残し、件/時を管理画面に出す。LLM の呼び出し・待ち時間・
+トークン数は実行の終わりに llm_gateway.log_llm_metrics でログに出す。
+django-q のタスクは TASK_MAX_DISCLOSURES 件ごとに分けて投入し、qcluster のタイムアウトに
+収める。保存のたびに更新日時を進め、STALE_AFTER_SECONDS 更新のない処理中のバッチは
+止まったものとみなす（再配送なら処理し直し、管理画面を開いたときにエラーにする）。
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import TDNETDisclosure, TDNETReport, TDNETReportSection
+from .llm_gateway import log_llm_metrics
+from .tdnet_report_generator import TDNETReportGeneratorService
+
+logger = logging.getLogger('earnings_analysis.tdnet')
+
+DEFAULT_TDNET_REPORT_PIPELINE = {
+    'FETCH_WORKERS': 4,
+    'LLM_WORKERS': 4,
+    'MAX_PDF_PAGES': 50,
+    # これ以下の文字数の開示はまとめて生成の対象
+    'PACK_MAX_CONTENT_CHARS': 4000,
+    # まとめて生成1回あたりの本文の合計文字数・件数の上限
+    'PACK_PROMPT_CHARS': 20000,
+    'PACK_MAX_ITEMS': 5,
+    # django-q のタスク1件で生成する開示数の上限（qcluster の timeout に収める）
+    'TASK_MAX_DISCLOSURES': 10,
+    # この秒数更新のない処理中のバッチは止まった（タイムアウトで落ちた）ものとみなす
+    'STALE_AFTER_SECONDS': 900,
+}
+
+
+def pipeline_settings() -> Dict[str, Any]:
+    conf = getattr(settings, 'TDNET_REPORT_PIPELINE', {}) or {}
+    return {**DEFAULT_TDNET_REPORT_PIPELINE, **conf}
+
+
+def report_type_for(disclosure: TDNETDisclosure) -> str:
+    """開示種別に対応するレポート種別（ないものは other）"""
+    report_types = dict(TDNETReport.REPORT_TYPE_CHOICES)
+    return disclosure.disclosure_type if disclosure.disclosure_type in report_types else 'other'
+
+
+@dataclass
+class _Item:
+    disclosure: TDNETDisclosure
+    report_type: str
+    text: str = ''
+    result: Optional[Dict[str, Any]] = None
+
+
+class TDNETReportPipeline:
+    """複数開示のレポートをまとめて生成する"""
+
+    def __init__(self, generator_service: TDNETReportGeneratorService = None):
+        self.service = generator_service or TDNETReportGeneratorService()
+        self.conf = pipeline_settings()
+
+    def run(self, disclosure_ids: Iterable[str], report_type: str = None, user=None,
+            progress: Callable[[Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """
+        disclosure_ids のレポートを生成して件数を返す。
+
+        report_type を省略すると開示ごとに開示種別から決める。
+        progress を渡すと、まとまりを保存するたびにその時点の件数で呼ぶ。
+        """
+        started = time.monotonic()
+        requested = list(disclosure_ids)
+        items = self._pending_items(requested, report_type)
+        stats = {
+            'requested': len(requested),
+            'skipped': len(requested) - len(items),
+            'generated': 0,
+            'failed': 0,
+            'llm_requests': 0,
+            'packed': 0,
+        }
+
+        if items:
+            self._fetch_texts(items)
+            groups = self._pack(items)
+            stats['llm_requests'] = len(groups)
+            stats['packed'] = sum(len(group) for group in groups if len(group) > 1)
+            retry = []
+
+            def save_group(group: List[_Item]):
+                saved, duplicates = self._save([item for item in group if item.result], user)
+                stats['generated'] += saved
+                stats['skipped'] += duplicates
+                # まとめて生成で解釈できなかった開示は1件ずつ生成し直す
+                if len(group) > 1:
+                    retry.extend([item] for item in group if item.result is None)
+                if progress:
+                    progress(stats)
+
+            self._generate(groups, save_group)
+            if retry:
+                stats['llm_requests'] += len(retry)
+                self._generate(list(retry), save_group)
+            stats['failed'] = len(requested) - stats['skipped'] - stats['generated']
+
+        elapsed = time.monotonic() - started
+        stats['elapsed_seconds'] = round(elapsed, 2)
+        stats['reports_per_hour'] = round(stats['generated'] * 3600 / elapsed, 1) if elapsed > 0 else None
+        logger.info(
+            f"レポートまとめて生成: {stats['generated']}/{stats['requested']}件 "
+            f"(スキップ {stats['skipped']}, 失敗 {stats['failed']}, LLM {stats['llm_requests']}回, "
+            f"{stats['elapsed_seconds']}s, {stats['reports_per_hour']}件/時)"
+        )
+        stats['llm'] = log_llm_metrics('レポートまとめて生成')
+        return stats
+
+    def _pending_items(self, disclosure_ids: List[str], report_type: Optional[str]) -> List[_Item]:
+        """重複と、同じ種別のレポートが既にある開示を除く"""
+        unique_ids = list(dict.fromkeys(disclosure_ids))
+        disclosures = TDNETDisclosure.objects.in_bulk(unique_ids, field_name='disclosure_id')
+        existing = set(
+            TDNETReport.objects.filter(disclosure__in=disclosures.values())
+            .values_list('disclosure_id', 'report_type')
+        )
+        items = []
+        for disclosure_id in unique_ids:
+            disclosure = disclosures.get(disclosure_id)
+            if disclosure is None:
+                logger.warning(f"レポートまとめて生成: 開示情報が見つかりません {disclosure_id}")
+                continue
+            item_type = report_type or report_type_for(disclosure)
+            if (disclosure.pk, item_type) not in existing:
+                items.append(_Item(disclosure, item_type))
+        return items
+
+    def _fetch_texts(self, items: List[_Item]):
+        with ThreadPoolExecutor(max_workers=max(1, int(self.conf['FETCH_WORKERS']))) as pool:
+            for item, text in zip(items, pool.map(self._text, [item.disclosure for item in items])):
+                item.text = text
+
+    def _text(self, disclosure: TDNETDisclosure) -> str:
+        """プロンプトに使う本文（PDFの要点抽出。取得できなければ保存済みのテキスト）"""
+        pdf_url = disclosure.pdf_url or (disclosure.raw_data or {}).get('pdf_url')
+        if pdf_url:
+            try:
+                result = self.service.pdf_processor.process_pdf_url(
+                    pdf_url, self.conf['MAX_PDF_PAGES'], summary_only=True
+                )
+                if result['success']:
+                    return result['text']
+            except Exception as e:
+                logger.warning(f"PDF処理失敗のため保存済みテキストを使用: {disclosure.disclosure_id} - {e}")
+        return self.service._stored_text(disclosure) or disclosure.summary
+
+    def _pack(self, items: List[_Item]) -> List[List[_Item]]:
+        """短い開示を同じ種別ごとに文字数・件数の上限までまとめる（長い開示は1件ずつ）"""
+        max_content = int(self.conf['PACK_MAX_CONTENT_CHARS'])
+        budget = int(self.conf['PACK_PROMPT_CHARS'])
+        max_items = max(1, int(self.conf['PACK_MAX_ITEMS']))
+        groups, open_groups = [], {}
+        for item in items:
+            size = len(item.text or item.disclosure.summary)
+            if max_items == 1 or size > max_content:
+                groups.append([item])
+                continue
+            group = open_groups.get(item.report_type)
+            if group and (len(group[0]) >= max_items or group[1] + size > budget):
+                group = None
+            if group is None:
+                group = open_groups[item.report_type] = [[], 0]
+                groups.append(group[0])
+            group[0].append(item)
+            group[1] += size
+        return groups
+
+    def _generate(self, groups: List[List[_Item]], on_done: Callable[[List[_Item]], None]):
+        """まとまりごとに並列に生成し、終わった順に on_done を呼び出し元のスレッドで呼ぶ"""
+        with ThreadPoolExecutor(max_workers=max(1, int(self.conf['LLM_WORKERS']))) as pool:
+            futures = {pool.submit(self._generate_group, group): group for group in groups}
+            for future in as_completed(futures):
+                on_done(futures[future])
+
+    def _generate_group(self, group: List[_Item]):
+        generator = self.service.gemini_generator
+        dicts = [self.service._disclosure_dict(item.disclosure, item.text) for item in group]
+        try:
+            if len(group) == 1:
+                result = generator.generate_report(dicts[0], group[0].report_type)
+                group[0].result = result if result.get('success') else None
+            else:
+                for item, result in zip(group, generator.generate_reports_batch(dicts, group[0].report_type)):
+                    item.result = result
+        except Exception as e:
+            logger.error(f"レポート生成エラー: {[item.disclosure.disclosure_id for item in group]} - {e}")
+
+    @transaction.atomic
+    def _save(self, items: List[_Item], user) -> tuple:
+        """
+        レポートを保存し、セクションを1回の bulk_create で書く。
+
+        Returns:
+            (保存した件数, 並行したバッチが先に保存していた件数)
+        """
+        if not items:
+            return 0, 0
+        sections = []
+        saved = 0
+        for item in items:
+            report = self.service._new_report(item.disclosure, item.report_type, item.result, user)
+            try:
+                with transaction.atomic():
+                    report.save()
+            except IntegrityError:
+                logger.info(f"レポートまとめて生成: 生成済みのためスキップ {item.disclosure.disclosure_id}")
+                continue
+            saved += 1
+            sections += self.service._section_rows(report, item.result['data'].get('sections', []))
+        TDNETReportSection.objects.bulk_create(sections)
+        TDNETDisclosure.objects.filter(pk__in=[item.disclosure.pk for item in items]).update(
+            report_generated=True, is_processed=True, updated_at=timezone.now()
+        )
+        return saved, len(items) - saved
+
+
+def stale_before():
+    """これより前から更新のない処理中のバッチは止まったものとみなす"""
+    return timezone.now() - timedelta(seconds=int(pipeline_settings()['STALE_AFTER_SECONDS']))
+
+
+def fail_stale_batches() -> int:
+    """処理中のまま止まったバッチ（qcluster のタイムアウトで落ちたタスクなど）をエラーにする"""
+    from ..models.tdnet import TDNETReportBatch
+
+    now = timezone.now()
+    count = TDNETReportBatch.objects.filter(
+        status=TDNETReportBatch.STATUS_PROCESSING, updated_at__lt=stale_before(),
+    ).update(
+        status=TDNETReportBatch.STATUS_ERROR,
+        error_message='処理が止まったため中断しました（保存済みのレポートは残っています）',
+        finished_at=now,
+        updated_at=now,
+    )
+    if count:
+        logger.warning(f"レポートまとめて生成: 止まったバッチ {count}件をエラーにしました")
+    return count
+
+
+def report_throughput(hours: int = 24) -> Dict[str, Any]:
+    """管理画面用: 直近のレポート生成数（件/時）と最近のまとめて生成の速度"""
+    from ..models.tdnet import TDNETReportBatch
+
+    fail_stale_batches()
+    now = timezone.now()
+    recent = TDNETReport.objects.filter(created_at__gte=now - timedelta(hours=hours))
+    last_hour = recent.filter(created_at__gte=now - timedelta(hours=1)).count()
+    return {
+        'hours': hours,
+        'last_hour': last_hour,
+        'per_hour': round(recent.count() / hours, 1),
+        'recent_batches': list(
+            TDNETReportBatch.objects.filter(status=TDNETReportBatch.STATUS_DONE)
+            .order_by('-finished_at')[:5]
+        ),
+    }
+
+
+def queue_report_batch(disclosure_ids: Iterable[str], report_type: str = '', user=None) -> list:
+    """
+    まとめて生成の実行記録を作り、django-q へ投入する（重複した開示IDは1件にする）。
+
+    qcluster のタイムアウトに収まるよう TASK_MAX_DISCLOSURES 件ごとに分け、
+    分けたバッチのリストを返す。
+    """
+    from django_q.tasks import async_task
+    from ..models.tdnet import TDNETReportBatch
+    from ..tasks import generate_tdnet_reports_task
+
+    unique_ids = list(dict.fromkeys(disclosure_ids))
+    size = max(1, int(pipeline_settings()['TASK_MAX_DISCLOSURES']))
+    batches = [
+        TDNETReportBatch.objects.create(
+            disclosure_ids=unique_ids[start:start + size],
+            report_type=report_type or '',
+            created_by=user,
+        )
+        for start in range(0, len(unique_ids), size)
+    ]
+    for batch in batches:
+        transaction.on_commit(
+            lambda batch_id=str(batch.batch_id): async_task(generate_tdnet_reports_task, batch_id)
+        )
+    return batches
@@ -3,6 +3,7 @@ XBRL 財務分析サービス（AI 不使用・ルールベースのみ）
 
 EDINETXBRLService → FinancialAnalyzer の順に呼び出し、
 CompanyFinancialData に永続保存した上で指標 dict を返す。
+数値ファクトは XBRLFact にも保存し、複数年推移・企業横断の位置を結果に添える。
 """
 import logging
 from decimal import Decimal
@@ -46,6 +47,7 @@ class XBRLAnalysisService:
                 'risk_level': str,
                 'investment_stance': str,
                 'data_completeness': float,
+                'fact_insights': dict,     # 保存済みファクトからの推移・企業横断分布
             }
         """
         if document.doc_type_code not in XBRL_ANALYZABLE_DOC_TYPE_CODES:
@@ -99,8 +101,19 @@ class XBRLAnalysisService:
         except Exception as e:
             logger.warning(f"財務データ保存失敗（分析結果は返す）: {document.doc_id} — {e}")
 
-        # ④ 結果を整理して返す
-        return self._build_result(financial_data, analysis, fin_record)
+        # ④ 数値ファクトを XBRLFact に保存し、推移・企業横断の位置を求める
+        fact_insights = {}
+        try:
+            from .xbrl_fact_store import save_document_facts, build_fact_insights
+            save_document_facts(document, xbrl_data.get('facts', []))
+            fact_insights = build_fact_insights(document)
+        except Exception as e:
+            logger.warning(f"XBRLファクト保存失敗（分析結果は返す）: {document.doc_id} — {e}")
+
+        # ⑤ 結果を整理して返す
+        result = self._build_result(financial_data, analysis, fin_record)
+        result['fact_insights'] = fact_insights
+        return result
 
     # ------------------------------------------------------------------
     def _build_result(self, financial_data: dict, analysis: dict, fin_record) -> Dict[str, Any]:
@@ -11,6 +11,8 @@ from typing import Dict, List, Optional, Tuple
 from django.core.cache import cache
 from decimal import Decimal, InvalidOperation
 
+from .xbrl_index import XBRLElementIndex, dedupe_elements
+
 logger = logging.getLogger(__name__)
 
 class CashFlowExtractor:
@@ -83,13 +85,25 @@ class CashFlowExtractor:
             ]
         }
 
-    def extract_cashflow_for_comprehensive_analysis(self, root: ET.Element) -> Dict[str, Decimal]:
-        """包括分析用のキャッシュフローデータ抽出（既存システム互換）"""
+    @property
+    def text_patterns(self) -> List[str]:
+        """テキスト一致で検索するパターン（要素インデックスへ事前登録する）"""
+        return [
+            pattern for patterns in self.cashflow_elements.values() for pattern in patterns
+            if any(char in pattern for char in ['営業', '投資', '財務'])
+        ]
+
+    def extract_cashflow_for_comprehensive_analysis(self, root) -> Dict[str, Decimal]:
+        """包括分析用のキャッシュフローデータ抽出（既存システム互換）
+
+        root には ET.Element か、作成済みの XBRLElementIndex を渡せる。
+        """
         financial_data = {}
         
         try:
+            index = root if isinstance(root, XBRLElementIndex) else XBRLElementIndex(root, self.text_patterns)
             for cf_type, element_patterns in self.cashflow_elements.items():
-                cf_data = self._extract_single_cf_item_enhanced(root, cf_type, element_patterns)
+                cf_data = self._extract_single_cf_item_enhanced(index, cf_type, element_patterns)
                 
                 if cf_data['value'] is not None:
                     financial_data[cf_type] = cf_data['value']
@@ -107,7 +121,7 @@ class CashFlowExtractor:
             
         return financial_data
 
-    def _extract_single_cf_item_enhanced(self, root: ET.Element, cf_type: str, element_patterns: List[str]) -> Dict[str, any]:
+    def _extract_single_cf_item_enhanced(self, index: XBRLElementIndex, cf_type: str, element_patterns: List[str]) -> Dict[str, any]:
         """単一キャッシュフロー項目の高精度抽出"""
         extraction_result = {
             'value': None,
@@ -122,7 +136,7 @@ class CashFlowExtractor:
             candidates = []
             
             for pattern in element_patterns:
-                elements = self._find_cf_elements_smart(root, pattern)
+                elements = self._find_cf_elements_smart(index, pattern)
                 
                 for element in elements:
                     candidate = self._analyze_cf_element_detailed(element, cf_type, pattern)
@@ -147,42 +161,16 @@ class CashFlowExtractor:
             
         return extraction_result
 
-    def _find_cf_elements_smart(self, root: ET.Element, pattern: str) -> List[ET.Element]:
-        """スマートなキャッシュフロー要素検索"""
-        elements = []
-        
+    def _find_cf_elements_smart(self, index: XBRLElementIndex, pattern: str) -> List[ET.Element]:
+        """スマートなキャッシュフロー要素検索（タグ一致 → 日本語はテキスト一致も）"""
         try:
-            # 1. 直接マッチング
-            for elem in root.iter():
-                if pattern in elem.tag:
-                    elements.append(elem)
-            
-            # 2. 名前空間考慮検索
-            namespaces = [
-                'http://disclosure.edinet-fsa.go.jp/taxonomy/jpigp/',
-                'http://disclosure.edinet-fsa.go.jp/taxonomy/jpcrp/', 
-                'http://disclosure.edinet-fsa.go.jp/taxonomy/jppfs/',
-            ]
+            elements = index.find(pattern)
             
-            for ns in namespaces:
-                try:
-                    found = root.findall(f".//{{{ns}*}}{pattern}")
-                    elements.extend(found)
-                    found = root.findall(f".//{{*}}{pattern}")
-                    elements.extend(found)
-                except:
-                    continue
-            
-            # 3. 日本語テキスト検索
+            # 日本語テキスト検索
             if any(char in pattern for char in ['営業', '投資', '財務']):
-                for elem in root.iter():
-                    if elem.text and pattern in elem.text:
-                        elements.append(elem)
-            
-            # 重複除去
-            unique_elements = list({(elem.tag, elem.text): elem for elem in elements}.values())
+                elements = dedupe_elements(elements + index.find_text(pattern))
             
-            return unique_elements
+            return elements
             
         except Exception as e:
             logger.debug(f"要素検索エラー ({pattern}): {e}")
@@ -519,7 +507,13 @@ class CashFlowExtractor:
 class XBRLFinancialExtractor:
     """XBRLファイルから財務データを抽出するクラス（完全版）"""
     
-    def __init__(self):
+    # ZIP 内のインスタンス文書がこのサイズ（展開後）以上なら iterparse でストリーミング抽出する
+    STREAMING_THRESHOLD_BYTES = 16 * 1024 * 1024
+    
+    def __init__(self, streaming: Optional[bool] = None):
+        # streaming: None=サイズで自動判定, True=常にストリーミング, False=常にツリー全体を構築
+        self.streaming = streaming
+        
         # キャッシュフロー専用抽出器
         try:
             self.cashflow_extractor = CashFlowExtractor()
@@ -614,17 +608,104 @@ class XBRLFinancialExtractor:
             'jpdei': 'http://disclosure.edinet-fsa.go.jp/taxonomy/jpdei/2019-11-01/',
         }
 
+    @property
+    def index_text_patterns(self) -> List[str]:
+        """テキスト一致で検索するパターン（財務要素の別名 + キャッシュフローの日本語要素）"""
+        text_patterns = [p for patterns in self.financial_elements.values() for p in patterns]
+        if self.cashflow_extractor:
+            text_patterns += self.cashflow_extractor.text_patterns
+        return text_patterns
+    
+    @property
+    def index_tag_patterns(self) -> List[str]:
+        """タグ一致で検索するパターン（テキスト要素 + 財務要素 + キャッシュフロー要素）"""
+        tag_patterns = list(self.text_element_patterns)
+        tag_patterns += [p for patterns in self.financial_elements.values() for p in patterns]
+        if self.cashflow_extractor:
+            tag_patterns += [p for patterns in self.cashflow_extractor.cashflow_elements.values() for p in patterns]
+        return tag_patterns
+    
+    def build_index(self, root: ET.Element, keep_facts: bool = False) -> XBRLElementIndex:
+        """文書を1回走査して要素インデックスを作る（財務・テキスト検索はすべてこれを引く）
+
+        keep_facts: collect_facts 用に数値ファクトも控える（包括分析のみ。テキスト抽出では不要）
+        """
+        return XBRLElementIndex(root, self.index_text_patterns, keep_facts=keep_facts)
+    
+    def build_stream_index(self, stream, keep_facts: bool = False) -> XBRLElementIndex:
+        """iterparse で読みながら検索対象の要素だけを残した索引を作る（ツリー全体を保持しない）"""
+        return XBRLElementIndex.from_stream(stream, self.index_tag_patterns, self.index_text_patterns,
+                                            keep_facts=keep_facts)
+    
+    def collect_facts(self, index: XBRLElementIndex) -> List[Dict[str, any]]:
+        """数値ファクトを context（期間・連結/個別・ディメンション）と単位付きで正規化する。
+
+        値は報告されたまま（円単位）。decimals は丸め精度（-6=百万円単位で丸め）として scale に残す。
+        """
+        facts = []
+        for name, context_ref, unit_ref, decimals, text in index.numeric_facts:
+            context = index.context(context_ref)
+            if context is None or not text:
+                continue
+            try:
+                value = Decimal(text)
+            except (InvalidOperation, ValueError):
+                continue
+            dimensions = context['dimensions']
+            non_consolidated = any(
+                'ConsolidatedOrNonConsolidatedAxis' in axis and 'NonConsolidated' in member
+                for axis, member in dimensions.items()
+            )
+            facts.append({
+                'element': name,
+                'context_ref': context_ref,
+                'period_start': context['start'] or None,
+                'period_end': context['period_end'] or None,
+                'is_instant': bool(context['instant']),
+                'consolidated': not non_consolidated,
+                'dimensional': any(
+                    'ConsolidatedOrNonConsolidatedAxis' not in axis for axis in dimensions
+                ),
+                'unit': index.units.get(unit_ref, unit_ref),
+                'scale': int(decimals) if decimals and decimals.lstrip('-').isdigit() else None,
+                'value': value,
+            })
+        return facts
+    
+    def _use_streaming(self, file_info) -> bool:
+        if self.streaming is not None:
+            return self.streaming
+        return file_info.file_size >= self.STREAMING_THRESHOLD_BYTES
+    
+    def _index_zip_member(self, zip_file, file_info, keep_facts: bool = False) -> XBRLElementIndex:
+        """ZIP メンバーの索引を作る（大きいものはメンバーを展開しながらストリーミング）"""
+        with zip_file.open(file_info) as xbrl_file:
+            if self._use_streaming(file_info):
+                logger.info(f"ストリーミング抽出: {file_info.filename} ({file_info.file_size} bytes)")
+                return self.build_stream_index(xbrl_file, keep_facts=keep_facts)
+            return self.build_index(_defused_ET.fromstring(xbrl_file.read()), keep_facts=keep_facts)
+
     def _extract_from_xml(self, xml_content: bytes) -> Dict[str, str]:
         """XMLファイルからテキストを抽出"""
-        extracted_text = {}
-        
         try:
             # XMLパース
             root = _defused_ET.fromstring(xml_content)
-            
+        except ET.ParseError as e:
+            logger.error(f"XML解析エラー: {e}")
+            return {}
+        except Exception as e:
+            logger.error(f"テキスト抽出エラー: {e}")
+            return {}
+        return self._extract_text_from_index(self.build_index(root))
+    
+    def _extract_text_from_index(self, index: XBRLElementIndex) -> Dict[str, str]:
+        """要素インデックスからテキストを抽出"""
+        extracted_text = {}
+        
+        try:
             # 各テキスト要素を検索
             for pattern in self.text_element_patterns:
-                elements = self._find_elements_by_pattern(root, pattern)
+                elements = self._find_elements_by_pattern(index, pattern)
                 
                 for element in elements:
                     text_content = self._extract_element_text(element)
@@ -633,11 +714,9 @@ class XBRLFinancialExtractor:
                         extracted_text[section_name] = text_content
             
             # その他のテキスト要素も検索
-            additional_text = self._extract_additional_text_elements(root)
+            additional_text = self._extract_additional_text_elements(index)
             extracted_text.update(additional_text)
             
-        except ET.ParseError as e:
-            logger.error(f"XML解析エラー: {e}")
         except Exception as e:
             logger.error(f"テキスト抽出エラー: {e}")
             
@@ -652,19 +731,31 @@ class XBRLFinancialExtractor:
                 for file_info in zip_file.filelist:
                     if file_info.filename.endswith('.xbrl'):
                         # XBRLファイルを読み込み
-                        with zip_file.open(file_info) as xbrl_file:
-                            xbrl_content = xbrl_file.read()
-                            file_text = self._extract_from_xml(xbrl_content)
-                            extracted_text.update(file_text)
+                        try:
+                            index = self._index_zip_member(zip_file, file_info)
+                        except ET.ParseError as e:
+                            logger.error(f"XML解析エラー: {e}")
+                            continue
+                        except Exception as e:
+                            logger.error(f"テキスト抽出エラー: {e}")
+                            continue
+                        file_text = self._extract_text_from_index(index)
+                        extracted_text.update(file_text)
                             
         except Exception as e:
             logger.error(f"ZIP展開エラー: {e}")
             
         return extracted_text
     
-    def _extract_comprehensive_from_zip(self, zip_content: bytes) -> Dict[str, any]:
-        """ZIPファイルから財務データとテキストを抽出（緊急修正版）"""
+    def _extract_comprehensive_from_zip(self, zip_content: bytes, include_text: bool = False) -> Dict[str, any]:
+        """ZIPファイルから財務データとテキストを抽出（緊急修正版）
+
+        include_text: 感情分析用のテキスト（_extract_from_zip と同じもの）も同じ索引から
+        xbrl_text に入れる（ZIP の展開・解析を1回で済ませる）
+        """
         comprehensive_data = {'financial_data': {}, 'text_sections': {}, 'table_unit': 'yen'}
+        if include_text:
+            comprehensive_data['xbrl_text'] = {}
         
         try:
             import zipfile
@@ -685,25 +776,36 @@ class XBRLFinancialExtractor:
                 
                 best_financial_data = {}
                 all_text_sections = {}
+                all_facts = {}
+                file_texts = {}  # ファイル名 → 感情分析用テキスト（include_text 時）
                 
                 for file_info in prioritized_files:
                     try:
                         logger.info(f"XBRLファイル処理: {file_info.filename}")
                         
-                        with zip_file.open(file_info) as xbrl_file:
-                            xbrl_content = xbrl_file.read()
-                            file_data = self._extract_comprehensive_from_xml(xbrl_content)
-                            
-                            # 財務データのマージ（上書き防止）
-                            file_financial = file_data.get('financial_data', {})
-                            for key, value in file_financial.items():
-                                if value is not None and (key not in best_financial_data or best_financial_data[key] is None):
-                                    best_financial_data[key] = value
-                                    logger.info(f"  財務データ取得: {key} = {value}")
-                            
-                            # テキストデータのマージ
-                            file_text = file_data.get('text_sections', {})
-                            all_text_sections.update(file_text)
+                        try:
+                            index = self._index_zip_member(zip_file, file_info, keep_facts=True)
+                        except ET.ParseError as e:
+                            logger.error(f"XML解析エラー: {e}")
+                            continue
+                        file_data = self._extract_comprehensive_from_index(index)
+                        if include_text:
+                            file_texts[file_info.filename] = self._extract_text_from_index(index)
+                        
+                        # 財務データのマージ（上書き防止）
+                        file_financial = file_data.get('financial_data', {})
+                        for key, value in file_financial.items():
+                            if value is not None and (key not in best_financial_data or best_financial_data[key] is None):
+                                best_financial_data[key] = value
+                                logger.info(f"  財務データ取得: {key} = {value}")
+                        
+                        # テキストデータのマージ
+                        file_text = file_data.get('text_sections', {})
+                        all_text_sections.update(file_text)
+                        
+                        # 数値ファクトのマージ（同一要素・同一コンテキストは先勝ち）
+                        for fact in file_data.get('facts', []):
+                            all_facts.setdefault((fact['element'], fact['context_ref']), fact)
                             
                     except Exception as e:
                         logger.error(f"XBRLファイル処理エラー ({file_info.filename}): {e}")
@@ -711,6 +813,11 @@ class XBRLFinancialExtractor:
                 
                 comprehensive_data['financial_data'] = best_financial_data
                 comprehensive_data['text_sections'] = all_text_sections
+                comprehensive_data['facts'] = list(all_facts.values())
+                if include_text:
+                    # _extract_from_zip と同じく ZIP 内の並び順で後のファイルを優先する
+                    for file_info in xbrl_files:
+                        comprehensive_data['xbrl_text'].update(file_texts.get(file_info.filename, {}))
                 
                 logger.info(f"ZIP処理完了: 財務データ{len(best_financial_data)}項目, "
                           f"テキスト{len(all_text_sections)}セクション")
@@ -720,31 +827,13 @@ class XBRLFinancialExtractor:
             
         return comprehensive_data
 
-    def _find_elements_by_pattern(self, root: ET.Element, pattern: str) -> List[ET.Element]:
+    def _find_elements_by_pattern(self, index: XBRLElementIndex, pattern: str) -> List[ET.Element]:
         """パターンに一致する要素を検索"""
-        elements = []
-        
         try:
-            # 直接検索
-            for elem in root.iter():
-                if pattern in elem.tag:
-                    elements.append(elem)
-            
-            # 名前空間を考慮した検索
-            for ns_prefix, ns_uri in self.namespaces.items():
-                try:
-                    found = root.findall(f".//{{{ns_uri}}}{pattern}")
-                    elements.extend(found)
-                except:
-                    continue
-            
-            # 重複除去
-            unique_elements = list({(elem.tag, elem.text): elem for elem in elements}.values())
-            
+            return index.find(pattern)
         except Exception as e:
             logger.debug(f"要素検索エラー ({pattern}): {e}")
-            
-        return unique_elements
+            return []
 
     def _extract_element_text(self, element: ET.Element) -> str:
         """要素からテキストを抽出"""
@@ -776,17 +865,13 @@ class XBRLFinancialExtractor:
         
         return cleaned_text
     
-    def _extract_additional_text_elements(self, root: ET.Element) -> Dict[str, str]:
+    def _extract_additional_text_elements(self, index: XBRLElementIndex) -> Dict[str, str]:
         """その他のテキスト要素を抽出"""
         additional_text = {}
         
         try:
-            # テキストを含む可能性のある要素を広く検索
-            text_elements = []
-            for elem in root.iter():
-                # テキストが長い要素を対象
-                if elem.text and len(elem.text.strip()) > 100:
-                    text_elements.append(elem)
+            # テキストが長い要素を対象
+            text_elements = list(index.long_text_elements)
             
             # テキストの長さでソートして上位を採用
             text_elements.sort(key=lambda e: len(e.text.strip()) if e.text else 0, reverse=True)
@@ -834,45 +919,64 @@ class XBRLFinancialExtractor:
             
         return sorted_files
 
-    def _extract_comprehensive_from_xml(self, xml_content: bytes) -> Dict[str, any]:
-        """XMLファイルから財務データとテキストを抽出（緊急修正版）"""
+    def _extract_comprehensive_from_xml(self, xml_content: bytes, include_text: bool = False) -> Dict[str, any]:
+        """XMLファイルから財務データとテキストを抽出（緊急修正版。include_text は ZIP 版と同じ）"""
+        empty = {'financial_data': {}, 'text_sections': {}, 'table_unit': 'yen'}
+        if include_text:
+            empty['xbrl_text'] = {}
+        try:
+            root = _defused_ET.fromstring(xml_content)
+        except ET.ParseError as e:
+            logger.error(f"XML解析エラー: {e}")
+            return empty
+        except Exception as e:
+            logger.error(f"包括データ抽出エラー: {e}")
+            return empty
+        index = self.build_index(root, keep_facts=True)
+        comprehensive_data = self._extract_comprehensive_from_index(index)
+        if include_text:
+            comprehensive_data['xbrl_text'] = self._extract_text_from_index(index)
+        return comprehensive_data
+    
+    def _extract_comprehensive_from_index(self, index: XBRLElementIndex) -> Dict[str, any]:
+        """要素インデックスから財務データとテキストを抽出"""
         comprehensive_data = {'financial_data': {}, 'text_sections': {}, 'table_unit': 'yen'}
         
         try:
-            root = _defused_ET.fromstring(xml_content)
-            logger.info(f"XML解析開始: ルート要素={root.tag}")
+            logger.info(f"XML解析開始: ルート要素={index.root.tag}")
             
             # 財務データ抽出（キャッシュフロー強化版）
             if self.cashflow_extractor:
                 # 高精度キャッシュフロー抽出
                 try:
-                    cashflow_data = self.cashflow_extractor.extract_cashflow_for_comprehensive_analysis(root)
+                    cashflow_data = self.cashflow_extractor.extract_cashflow_for_comprehensive_analysis(index)
                     comprehensive_data['financial_data'].update(cashflow_data)
                     logger.info(f"高精度キャッシュフロー抽出: {len(cashflow_data)}項目")
                 except Exception as e:
                     logger.warning(f"高精度抽出失敗、基本抽出にフォールバック: {e}")
-                    basic_financial = self._extract_financial_data_emergency(root)
+                    basic_financial = self._extract_financial_data_emergency(index)
                     comprehensive_data['financial_data'].update(basic_financial)
             else:
                 # 基本財務データ抽出
-                basic_financial = self._extract_financial_data_emergency(root)
+                basic_financial = self._extract_financial_data_emergency(index)
                 comprehensive_data['financial_data'].update(basic_financial)
                 logger.info(f"基本財務データ抽出: {len(basic_financial)}項目")
             
             # テキストデータ抽出
-            text_sections = self._extract_text_sections_emergency(root)
+            text_sections = self._extract_text_sections_emergency(index)
             comprehensive_data['text_sections'] = text_sections
             
+            # 数値ファクト（XBRLFact として永続化する元データ）
+            comprehensive_data['facts'] = self.collect_facts(index)
+            
             logger.info(f"XML処理完了: 財務データ{len(comprehensive_data['financial_data'])}項目")
             
-        except ET.ParseError as e:
-            logger.error(f"XML解析エラー: {e}")
         except Exception as e:
             logger.error(f"包括データ抽出エラー: {e}")
             
         return comprehensive_data
 
-    def _extract_financial_data_emergency(self, root: ET.Element) -> Dict[str, Decimal]:
+    def _extract_financial_data_emergency(self, index: XBRLElementIndex) -> Dict[str, Decimal]:
         """緊急用財務データ抽出（現実性チェック強化版）"""
         financial_data = {}
         
@@ -881,7 +985,7 @@ class XBRLFinancialExtractor:
                 values = []
                 
                 for element_name in element_names:
-                    elements = self._find_financial_elements_by_pattern_emergency(root, element_name)
+                    elements = self._find_financial_elements_by_pattern_emergency(index, element_name)
                     
                     for element in elements:
                         value = self._extract_financial_value_emergency(element, data_type)
@@ -899,31 +1003,13 @@ class XBRLFinancialExtractor:
             
         return financial_data
 
-    def _find_financial_elements_by_pattern_emergency(self, root: ET.Element, pattern: str) -> List[ET.Element]:
-        """緊急用要素検索"""
-        elements = []
-        
+    def _find_financial_elements_by_pattern_emergency(self, index: XBRLElementIndex, pattern: str) -> List[ET.Element]:
+        """緊急用要素検索（タグまたはテキストにパターンを含む要素）"""
         try:
-            # 1. 直接検索
-            for elem in root.iter():
-                if pattern in elem.tag or (elem.text and pattern in elem.text):
-                    elements.append(elem)
-            
-            # 2. 名前空間検索
-            for ns_prefix, ns_uri in self.namespaces.items():
-                try:
-                    found = root.findall(f".//{{{ns_uri}}}{pattern}")
-                    elements.extend(found)
-                except:
-                    continue
-            
-            # 重複除去
-            unique_elements = list({(elem.tag, elem.text): elem for elem in elements}.values())
-            
+            return index.find_tag_or_text(pattern)
         except Exception as e:
             logger.debug(f"要素検索エラー ({pattern}): {e}")
-            
-        return unique_elements
+            return []
 
     def _extract_financial_value_emergency(self, element: ET.Element, data_type: str) -> Optional[Decimal]:
         """緊急用財務値抽出（単位問題対応）"""
@@ -1037,16 +1123,13 @@ class XBRLFinancialExtractor:
             logger.warning(f"{data_type} 最小値を選択: {selected} (現実的な候補なし)")
             return selected
 
-    def _extract_text_sections_emergency(self, root: ET.Element) -> Dict[str, str]:
+    def _extract_text_sections_emergency(self, index: XBRLElementIndex) -> Dict[str, str]:
         """緊急用テキスト抽出"""
         text_sections = {}
         
         try:
-            # 長いテキストを含む要素を検索
-            text_elements = []
-            for elem in root.iter():
-                if elem.text and len(elem.text.strip()) > 100:
-                    text_elements.append(elem)
+            # 長いテキストを含む要素
+            text_elements = list(index.long_text_elements)
             
             # 長い順にソート
             text_elements.sort(key=lambda e: len(e.text.strip()), reverse=True)
@@ -1153,7 +1236,17 @@ class EDINETXBRLService:
     
     def __init__(self):
         self.extractor = XBRLFinancialExtractor()
-    
+
+    def _load_xbrl_archive(self, doc_id: str) -> bytes:
+        """XBRL ZIP をローカルアーカイブ経由で取得（未取得時のみ EDINET API から取得）"""
+        from .document_archive import DOC_TYPE_XBRL, get_archive_store
+        from .edinet_api import EdinetAPIClient
+
+        return get_archive_store().get_or_fetch(
+            doc_id, DOC_TYPE_XBRL,
+            lambda: EdinetAPIClient.create_v2_client().get_document(doc_id, doc_type=DOC_TYPE_XBRL),
+        )
+
     def get_comprehensive_analysis_from_document(self, document) -> Dict[str, any]:
         """DocumentMetadataから包括的な分析データを取得（キャッシュフロー強化版）"""
         try:
@@ -1161,13 +1254,9 @@ class EDINETXBRLService:
                 logger.warning(f"XBRLファイルが利用できません: {document.doc_id}")
                 return {'financial_data': {}, 'text_sections': {}, 'table_unit': 'yen'}
             
-            # EDINET APIからXBRLファイルを取得
-            from .edinet_api import EdinetAPIClient
-            api_client = EdinetAPIClient.create_v2_client()
-            
             logger.info(f"包括分析用XBRLファイル取得開始: {document.doc_id}")
-            xbrl_data = api_client.get_document(document.doc_id, doc_type=1)
-            
+            xbrl_data = self._load_xbrl_archive(document.doc_id)
+
             # バイトデータから包括データ抽出
             comprehensive_data = self._extract_comprehensive_from_bytes(xbrl_data)
             
@@ -1186,17 +1275,23 @@ class EDINETXBRLService:
             logger.error(f"包括分析データ取得エラー: {document.doc_id} - {e}")
             return {'financial_data': {}, 'text_sections': {}, 'table_unit': 'yen'}
     
-    def _extract_comprehensive_from_bytes(self, xbrl_bytes: bytes) -> Dict[str, any]:
-        """バイトデータから包括データを抽出"""
+    def _extract_comprehensive_from_bytes(self, xbrl_bytes: bytes, include_text: bool = False) -> Dict[str, any]:
+        """バイトデータから包括データを抽出
+
+        include_text: _extract_text_from_bytes の結果も xbrl_text に入れる（解析は1回）
+        """
         try:
             if xbrl_bytes[:4] == b'PK\x03\x04':
-                return self.extractor._extract_comprehensive_from_zip(xbrl_bytes)
+                return self.extractor._extract_comprehensive_from_zip(xbrl_bytes, include_text=include_text)
             else:
-                return self.extractor._extract_comprehensive_from_xml(xbrl_bytes)
+                return self.extractor._extract_comprehensive_from_xml(xbrl_bytes, include_text=include_text)
                 
         except Exception as e:
             logger.error(f"包括データバイト解析エラー: {e}")
-            return {'financial_data': {}, 'text_sections': {}, 'table_unit': 'yen'}
+            empty = {'financial_data': {}, 'text_sections': {}, 'table_unit': 'yen'}
+            if include_text:
+                empty['xbrl_text'] = {}
+            return empty
 
     def get_xbrl_text_from_document(self, document) -> Dict[str, str]:
         """DocumentMetadataからXBRLテキストを取得"""
@@ -1205,14 +1300,9 @@ class EDINETXBRLService:
                 logger.warning(f"XBRLファイルが利用できません: {document.doc_id}")
                 return {}
             
-            # EDINET APIからXBRLファイルを取得
-            from .edinet_api import EdinetAPIClient
-            api_client = EdinetAPIClient.create_v2_client()
-            
-            # XBRLファイルダウンロード
             logger.info(f"XBRLファイル取得開始: {document.doc_id}")
-            xbrl_data = api_client.get_document(document.doc_id, doc_type=1)  # 1=XBRL
-            
+            xbrl_data = self._load_xbrl_archive(document.doc_id)
+
             # バイトデータからテキスト抽出
             extracted_text = self._extract_text_from_bytes(xbrl_data)
             
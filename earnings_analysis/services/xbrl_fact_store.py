@@ -0,0 +1,215 @@
+# earnings_analysis/services/xbrl_fact_store.py
+"""
+XBRL 数値ファクトの保存・照会サービス
+
+XBRLAnalysisService.analyze_document で抽出した数値ファクト（要素 × コンテキスト）を
+XBRLFact へ保存し、企業横断・複数年の照会を書類の再ダウンロード・再解析なしに行う。
+
+- 要素 X の期間 Y を企業横断で（同業比較・業界分布）: period_distribution
+- 企業の要素 X の推移（複数年トレンド）: company_series
+- 分析結果に添える推移・分布のまとめ: build_fact_insights
+
+要素名は会計基準（日本基準 / IFRS）や書類によって揺れるため、KEY_ELEMENTS の
+優先順に候補を並べ、同じ期間に複数ある場合は優先順位 → 新しい書類の順で1つを採る。
+"""
+import logging
+import statistics
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# bulk_create のバッチサイズ（有報1件で数千ファクト）
+FACT_BATCH_SIZE = 1000
+
+# DecimalField(max_digits=30, decimal_places=6) に収まる上限
+_MAX_ABS_VALUE = Decimal(10) ** 24
+
+# 指標キー → XBRL 要素名の候補（優先順）
+KEY_ELEMENTS = {
+    'net_sales': ['NetSales', 'Revenue', 'RevenueIFRS', 'OperatingRevenue1', 'NetSalesOfCompletedConstructionContracts'],
+    'operating_income': ['OperatingIncome', 'OperatingProfitLossIFRS'],
+    'ordinary_income': ['OrdinaryIncome'],
+    'net_income': ['ProfitLossAttributableToOwnersOfParent', 'ProfitLossAttributableToOwnersOfParentIFRS', 'ProfitLoss'],
+    'total_assets': ['Assets', 'AssetsIFRS', 'TotalAssets'],
+    'total_liabilities': ['Liabilities', 'LiabilitiesIFRS'],
+    'net_assets': ['NetAssets', 'EquityIFRS'],
+    'operating_cf': ['NetCashProvidedByUsedInOperatingActivities', 'NetCashProvidedByUsedInOperatingActivitiesIFRS'],
+    'investing_cf': ['NetCashProvidedByUsedInInvestingActivities', 'NetCashProvidedByUsedInInvestingActivitiesIFRS'],
+    'financing_cf': ['NetCashProvidedByUsedInFinancingActivities', 'NetCashProvidedByUsedInFinancingActivitiesIFRS'],
+}
+
+# 分析結果に推移・分布を添える指標
+INSIGHT_KEYS = ['net_sales', 'operating_income', 'net_income', 'operating_cf']
+
+
+def _candidates(key_or_element: str) -> List[str]:
+    return KEY_ELEMENTS.get(key_or_element, [key_or_element])
+
+
+def save_document_facts(document, facts: Iterable[dict]) -> int:
+    """書類の数値ファクトを XBRLFact へ upsert する。
+
+    Args:
+        facts: XBRLFinancialExtractor.collect_facts の戻り値
+    Returns:
+        int: 保存件数
+    """
+    from ..models import XBRLFact
+
+    rows = {}
+    for fact in facts:
+        value = fact.get('value')
+        if value is None or abs(value) >= _MAX_ABS_VALUE:
+            continue
+        element = (fact.get('element') or '')[:200]
+        context_ref = (fact.get('context_ref') or '')[:255]
+        if not element or not context_ref:
+            continue
+        rows[(element, context_ref)] = XBRLFact(
+            document=document,
+            edinet_code=document.edinet_code,
+            element=element,
+            context_ref=context_ref,
+            period_start=fact.get('period_start'),
+            period_end=fact.get('period_end'),
+            is_instant=fact.get('is_instant', False),
+            consolidated=fact.get('consolidated', True),
+            dimensional=fact.get('dimensional', False),
+            unit=(fact.get('unit') or '')[:50],
+            scale=fact.get('scale'),
+            value=value.quantize(Decimal('0.000001')),
+        )
+    if not rows:
+        return 0
+
+    XBRLFact.objects.bulk_create(
+        list(rows.values()),
+        batch_size=FACT_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['document', 'element', 'context_ref'],
+        update_fields=[
+            'edinet_code', 'period_start', 'period_end', 'is_instant',
+            'consolidated', 'dimensional', 'unit', 'scale', 'value',
+        ],
+    )
+    logger.info(f"XBRLファクト保存: {document.doc_id} - {len(rows)}件")
+    return len(rows)
+
+
+def _pick_per(rows, key_func, candidates):
+    """同じキー（期間・企業）の候補から、要素の優先順 → 長い期間 → 新しい書類の順で1件を採る"""
+    priority = {name: i for i, name in enumerate(candidates)}
+    best = {}
+    for row in rows:
+        rank = (
+            priority.get(row['element'], len(priority)),
+            row['period_start'] or row['period_end'],
+            -(row['document__submit_date_time'].timestamp() if row['document__submit_date_time'] else 0),
+        )
+        key = key_func(row)
+        if key not in best or rank < best[key][0]:
+            best[key] = (rank, row)
+    return {key: row for key, (_, row) in best.items()}
+
+
+def _base_queryset(candidates, consolidated):
+    from ..models import XBRLFact
+
+    return (
+        XBRLFact.objects
+        .filter(element__in=candidates, consolidated=consolidated, dimensional=False,
+                period_end__isnull=False)
+        .values('edinet_code', 'element', 'period_start', 'period_end', 'value',
+                'document__submit_date_time')
+    )
+
+
+def company_series(edinet_code: str, key_or_element: str, consolidated: bool = True,
+                   limit: int = 5) -> List[dict]:
+    """企業の指標の推移（古い順、直近 limit 期）。
+
+    Returns:
+        [{'period_start', 'period_end', 'element', 'value'}]
+    """
+    candidates = _candidates(key_or_element)
+    rows = _base_queryset(candidates, consolidated).filter(edinet_code=edinet_code)
+    picked = _pick_per(rows, lambda r: r['period_end'], candidates)
+    series = [
+        {
+            'period_start': row['period_start'],
+            'period_end': row['period_end'],
+            'element': row['element'],
+            'value': row['value'],
+        }
+        for _, row in sorted(picked.items())
+    ]
+    return series[-limit:] if limit else series
+
+
+def period_distribution(key_or_element: str, period_end, consolidated: bool = True,
+                        edinet_codes: Optional[Iterable[str]] = None) -> dict:
+    """指標の期間 period_end における企業横断の分布。
+
+    Args:
+        edinet_codes: 比較対象を同業他社などに絞る場合の EDINET コード
+    Returns:
+        {'sample_size', 'median', 'p25', 'p75', 'values': {edinet_code: value}}
+    """
+    candidates = _candidates(key_or_element)
+    rows = _base_queryset(candidates, consolidated).filter(period_end=period_end)
+    if edinet_codes is not None:
+        rows = rows.filter(edinet_code__in=list(edinet_codes))
+    picked = _pick_per(rows, lambda r: r['edinet_code'], candidates)
+    values = {code: row['value'] for code, row in picked.items()}
+
+    result = {'sample_size': len(values), 'median': None, 'p25': None, 'p75': None, 'values': values}
+    if values:
+        ordered = sorted(values.values())
+        result['median'] = statistics.median(ordered)
+        if len(ordered) >= 2:
+            q1, _, q3 = statistics.quantiles(ordered, n=4, method='inclusive')
+            result['p25'], result['p75'] = q1, q3
+        else:
+            result['p25'] = result['p75'] = ordered[0]
+    return result
+
+
+def percentile_rank(value, values: Iterable) -> Optional[float]:
+    """value が values の中で何%点か（0〜100、同値は半分として数える）"""
+    values = list(values)
+    if value is None or not values:
+        return None
+    below = sum(1 for v in values if v < value)
+    equal = sum(1 for v in values if v == value)
+    return round((below + equal / 2) / len(values) * 100, 1)
+
+
+def build_fact_insights(document, keys: Iterable[str] = INSIGHT_KEYS, years: int = 5) -> Dict[str, dict]:
+    """分析結果に添える、保存済みファクトからの推移と企業横断の位置。
+
+    Returns:
+        {key: {'series': [{'period_end', 'value'}], 'peers': {'sample_size', 'median',
+               'p25', 'p75', 'percentile'}}}
+    """
+    insights = {}
+    for key in keys:
+        series = company_series(document.edinet_code, key, limit=years)
+        if not series:
+            continue
+        latest = series[-1]
+        distribution = period_distribution(key, latest['period_end'])
+        insights[key] = {
+            'series': [
+                {'period_end': p['period_end'].isoformat(), 'value': float(p['value'])}
+                for p in series
+            ],
+            'peers': {
+                'sample_size': distribution['sample_size'],
+                'median': float(distribution['median']) if distribution['median'] is not None else None,
+                'p25': float(distribution['p25']) if distribution['p25'] is not None else None,
+                'p75': float(distribution['p75']) if distribution['p75'] is not None else None,
+                'percentile': percentile_rank(latest['value'], distribution['values'].values()),
+            },
+        }
+    return insights
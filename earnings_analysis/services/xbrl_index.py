@@ -0,0 +1,322 @@
+# earnings_analysis/services/xbrl_index.py
+"""
+XBRL インスタンス文書の要素インデックス
+
+XBRLFinancialExtractor / CashFlowExtractor は、テキスト要素パターン（約40）と
+財務要素の別名（約30）ごとに root.iter() で全要素を走査し、さらに名前空間ごとに
+findall していた。数MBのインスタンス文書では「パターン数 × 要素数」の走査になる。
+
+ここでは文書を1回だけ走査して次を作り、以降の検索はすべてこのインデックスを引く。
+- タグ（{名前空間}ローカル名）→ 要素（文書順）
+- ローカル名 → 要素
+- context / unit の解析結果（期間・ディメンション有無・単位）
+- 100文字超のテキストを持つ要素（テキストセクション抽出用）
+- 登録済みテキストパターンを含む要素（結合正規表現で1回の走査で前絞り）
+- 数値ファクト（unitRef を持つ要素）の (ローカル名, contextRef, unitRef, decimals, 値) 一覧
+
+検索結果は従来の実装と同じ順序・同じ重複除去（(tag, text) 単位で最後の要素を採用）になる。
+
+大きなインスタンス文書向けに、ZIP メンバーのストリームを iterparse で読みながら
+「検索対象になりうる要素」だけを残して他のサブツリーを破棄する from_stream も用意する
+（ツリー全体をメモリに載せない。検索結果は fromstring 版と同一）。
+"""
+import heapq
+import re
+from typing import Dict, Iterable, List, Optional
+
+import defusedxml.ElementTree as _defused_ET
+
+XBRLI_NS = 'http://www.xbrl.org/2003/instance'
+
+_CONTEXT_TAG = f'{{{XBRLI_NS}}}context'
+_UNIT_TAG = f'{{{XBRLI_NS}}}unit'
+
+# テキストセクション抽出の対象とするテキスト長
+LONG_TEXT_MIN_LENGTH = 100
+
+# ストリーミング時に保持する長文テキスト要素の件数（テキストセクション抽出は長い順に上位10件を使う）
+STREAM_LONG_TEXT_KEEP = 10
+
+
+def local_name(tag: str) -> str:
+    """'{ns}Name' → 'Name'"""
+    return tag.rsplit('}', 1)[-1] if tag[:1] == '{' else tag
+
+
+def dedupe_elements(elements) -> list:
+    """従来実装と同じ重複除去（(tag, text) が同じなら後勝ち、並びは初出順）"""
+    return list({(elem.tag, elem.text): elem for elem in elements}.values())
+
+
+class XBRLElementIndex:
+    """1回の走査で作る XBRL 要素インデックス"""
+
+    def __init__(self, root, text_patterns: Iterable[str] = (), keep_facts: bool = False,
+                 _build: bool = True):
+        self.root = root
+        self.keep_facts = keep_facts
+        self._by_tag: Dict[str, list] = {}
+        self._by_local: Dict[str, list] = {}
+        self._positions: Dict[int, int] = {}
+        self._texted: list = []
+        self.long_text_elements: list = []
+        self.contexts: Dict[str, dict] = {}
+        self.units: Dict[str, str] = {}
+        self.numeric_facts: list = []
+
+        self._find_cache: Dict[str, list] = {}
+        self._text_hits: Dict[str, list] = {}
+        self._text_patterns = [p for p in dict.fromkeys(text_patterns) if p]
+        self._prefilter = None
+        if self._text_patterns:
+            self._prefilter = re.compile('|'.join(map(re.escape, self._text_patterns)))
+            self._text_hits = {p: [] for p in self._text_patterns}
+
+        if _build:
+            for pos, elem in enumerate(root.iter()):
+                if isinstance(elem.tag, str):
+                    self._add(pos, elem)
+
+    # ---- 構築 ----
+
+    def _add(self, pos: int, elem):
+        tag = elem.tag
+        self._positions[id(elem)] = pos
+        self._by_tag.setdefault(tag, []).append(elem)
+        self._by_local.setdefault(local_name(tag), []).append(elem)
+
+        if tag == _CONTEXT_TAG:
+            self._parse_context(elem)
+        elif tag == _UNIT_TAG:
+            self._parse_unit(elem)
+
+        if self.keep_facts:
+            self._add_numeric_fact(elem)
+
+        text = elem.text
+        if not text:
+            return
+        self._texted.append(elem)
+        if len(text.strip()) > LONG_TEXT_MIN_LENGTH:
+            self.long_text_elements.append(elem)
+        self._add_text_hits(elem, text)
+
+    def _add_numeric_fact(self, elem):
+        unit_ref = elem.get('unitRef')
+        if unit_ref is None:
+            return
+        self.numeric_facts.append((
+            local_name(elem.tag), elem.get('contextRef'), unit_ref,
+            elem.get('decimals'), (elem.text or '').strip(),
+        ))
+
+    def _add_text_hits(self, elem, text) -> bool:
+        if self._prefilter is None or not self._prefilter.search(text):
+            return False
+        for pattern in self._text_patterns:
+            if pattern in text:
+                self._text_hits[pattern].append(elem)
+        return True
+
+    @classmethod
+    def from_stream(cls, source, tag_patterns: Iterable[str], text_patterns: Iterable[str] = (),
+                    long_text_keep: int = STREAM_LONG_TEXT_KEEP,
+                    keep_facts: bool = False) -> 'XBRLElementIndex':
+        """ファイルオブジェクトを iterparse で読み、検索対象になりうる要素だけを残して索引を作る。
+
+        残す要素:
+        - タグに tag_patterns のいずれかを含む要素（サブツリーごと）
+        - テキストに text_patterns のいずれかを含む要素
+        - 長文テキスト要素のうち長い順に long_text_keep 件
+        context / unit は解析結果だけ、数値ファクト（keep_facts 時）は値のタプルだけを残す。それ以外の要素は end イベントで
+        clear し、ルート直下から外すため、メモリは文書サイズではなく対象要素の量で決まる。
+        find / find_text / find_tag_or_text は tag_patterns・text_patterns に含まれる
+        パターンについて fromstring 版と同じ結果を返す。
+        """
+        index = cls(None, text_patterns, keep_facts=keep_facts, _build=False)
+        tag_patterns = [p for p in dict.fromkeys(tag_patterns) if p]
+        tag_matcher = re.compile('|'.join(map(re.escape, tag_patterns))) if tag_patterns else None
+        tag_is_target: Dict[str, bool] = {}
+
+        stack = []          # 開いている要素
+        positions = {}      # id(elem) → start 順の位置（= root.iter() の順）
+        protected = 0       # サブツリーを保持すべき祖先（対象タグ・context・unit）の深さ
+        # (テキスト長, -位置, elem) の最小ヒープ。同じ長さなら後ろの要素（-位置が小さい）から
+        # 押し出され、先に出た要素が残る。位置は一意なので elem 同士は比較されない
+        long_heap = []
+        counter = 0
+
+        for event, elem in _defused_ET.iterparse(source, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                positions[id(elem)] = counter
+                counter += 1
+                if index.root is None:
+                    index.root = elem
+                stack.append(elem)
+                if isinstance(tag, str):
+                    target = tag_is_target.get(tag)
+                    if target is None:
+                        target = bool(tag_matcher and tag_matcher.search(tag))
+                        tag_is_target[tag] = target
+                    if target or tag in (_CONTEXT_TAG, _UNIT_TAG):
+                        protected += 1
+                continue
+
+            stack.pop()
+            if not isinstance(tag, str):
+                continue
+            pos = positions.pop(id(elem))
+            is_target = tag_is_target[tag]
+            if is_target or tag in (_CONTEXT_TAG, _UNIT_TAG):
+                protected -= 1
+
+            keep = is_target
+            in_heap = False
+            if tag == _CONTEXT_TAG:
+                index._parse_context(elem)
+            elif tag == _UNIT_TAG:
+                index._parse_unit(elem)
+            elif keep_facts:
+                index._add_numeric_fact(elem)
+            if tag not in (_CONTEXT_TAG, _UNIT_TAG) and elem.text:
+                text = elem.text
+                if index._add_text_hits(elem, text):
+                    keep = True
+                length = len(text.strip())
+                if length > LONG_TEXT_MIN_LENGTH and long_text_keep > 0:
+                    item = (length, -pos, elem)
+                    if len(long_heap) < long_text_keep:
+                        heapq.heappush(long_heap, item)
+                        in_heap = True
+                    elif item[:2] > long_heap[0][:2]:
+                        heapq.heapreplace(long_heap, item)
+                        in_heap = True
+
+            if keep:
+                index._positions[id(elem)] = pos
+                index._by_tag.setdefault(tag, []).append(elem)
+                index._by_local.setdefault(local_name(tag), []).append(elem)
+                if elem.text:
+                    index._texted.append(elem)
+            elif stack and not protected and not in_heap:
+                elem.clear()
+
+            # 処理済みのルート直下要素を外す（保持する要素は索引側が参照を持つ）
+            if len(stack) == 1:
+                stack[0].remove(elem)
+
+        long_positions = {id(item[2]): -item[1] for item in long_heap}
+        index._positions.update(long_positions)
+        index.long_text_elements = [item[2] for item in long_heap]
+        index._finalize_stream()
+        return index
+
+    def _finalize_stream(self):
+        """end イベント順（後順）で集めた一覧を文書順（前順）へ並べ直す"""
+        order = self._in_document_order
+        for tag, elements in self._by_tag.items():
+            self._by_tag[tag] = order(elements)
+        for name, elements in self._by_local.items():
+            self._by_local[name] = order(elements)
+        self._texted = order(self._texted)
+        self.long_text_elements = order(self.long_text_elements)
+        for pattern, hits in self._text_hits.items():
+            self._text_hits[pattern] = order(hits)
+
+    def _parse_context(self, elem):
+        context_id = elem.get('id')
+        if not context_id:
+            return
+        info = {'instant': None, 'start': None, 'end': None, 'dimensions': {}}
+        for child in elem.iter():
+            name = local_name(child.tag) if isinstance(child.tag, str) else ''
+            if name == 'instant':
+                info['instant'] = (child.text or '').strip()
+            elif name == 'startDate':
+                info['start'] = (child.text or '').strip()
+            elif name == 'endDate':
+                info['end'] = (child.text or '').strip()
+            elif name in ('explicitMember', 'typedMember'):
+                info['dimensions'][child.get('dimension', '')] = (child.text or '').strip()
+        info['period_end'] = info['instant'] or info['end']
+        self.contexts[context_id] = info
+
+    def _parse_unit(self, elem):
+        unit_id = elem.get('id')
+        if not unit_id:
+            return
+        measures = [
+            (child.text or '').strip() for child in elem.iter()
+            if isinstance(child.tag, str) and local_name(child.tag) == 'measure'
+        ]
+        self.units[unit_id] = '/'.join(local_name(m.split(':')[-1]) for m in measures if m)
+
+    # ---- 検索 ----
+
+    def _in_document_order(self, elements) -> list:
+        return sorted(elements, key=lambda e: self._positions.get(id(e), 0))
+
+    def find(self, pattern: str) -> List:
+        """タグにパターンを含む要素（従来の `pattern in elem.tag` + 名前空間 findall 相当）"""
+        cached = self._find_cache.get(pattern)
+        if cached is not None:
+            return cached
+        matched_tags = [tag for tag in self._by_tag if pattern in tag]
+        if len(matched_tags) == 1:
+            elements = list(self._by_tag[matched_tags[0]])
+        else:
+            elements = self._in_document_order(
+                elem for tag in matched_tags for elem in self._by_tag[tag]
+            )
+        result = dedupe_elements(elements)
+        self._find_cache[pattern] = result
+        return result
+
+    def find_text(self, pattern: str) -> List:
+        """テキストにパターンを含む要素（文書順）"""
+        hits = self._text_hits.get(pattern)
+        if hits is None:
+            # 事前登録されていないパターンは一度だけ走査してキャッシュ
+            hits = [elem for elem in self._texted if pattern in elem.text]
+            self._text_hits[pattern] = hits
+        return hits
+
+    def find_tag_or_text(self, pattern: str) -> List:
+        """タグまたはテキストにパターンを含む要素（従来の緊急用検索と同じ順序）"""
+        tag_hits = [elem for tag in self._by_tag if pattern in tag for elem in self._by_tag[tag]]
+        text_hits = self.find_text(pattern)
+        if not text_hits:
+            return dedupe_elements(self._in_document_order(tag_hits))
+        seen = {id(e) for e in tag_hits}
+        merged = tag_hits + [e for e in text_hits if id(e) not in seen]
+        return dedupe_elements(self._in_document_order(merged))
+
+    def elements(self, name: str) -> List:
+        """ローカル名が完全一致する要素（文書順）"""
+        return list(self._by_local.get(name, []))
+
+    def facts(self, name: str) -> List[dict]:
+        """ローカル名が完全一致する要素を context / unit / decimals 付きで返す"""
+        result = []
+        for elem in self._by_local.get(name, []):
+            context_ref = elem.get('contextRef')
+            unit_ref = elem.get('unitRef')
+            result.append({
+                'element': elem,
+                'name': name,
+                'text': elem.text,
+                'context_ref': context_ref,
+                'context': self.contexts.get(context_ref) if context_ref else None,
+                'unit_ref': unit_ref,
+                'unit': self.units.get(unit_ref) if unit_ref else None,
+                'decimals': elem.get('decimals'),
+            })
+        return result
+
+    def context(self, context_ref: Optional[str]) -> Optional[dict]:
+        return self.contexts.get(context_ref) if context_ref else None
+
+    @property
+    def element_count(self) -> int:
+        return len(self._positions)
@@ -15,9 +15,9 @@ logger = logging.getLogger('earnings_analysis.tdnet')
 def auto_analyze_disclosure_task(event_id: int):
     """新規開示イベント（有報・半報）の財務・トーン分析を自動実行する。
 
-    DisclosureSync が新規 DisclosureEvent を作成した際に async_task で
-    キューされる。対象は記録中銘柄の重要開示のみ（年2回×ユニーク銘柄）
-    のため件数は少ない。AI（Gemini）は使用しない。
+    1イベント分を直列に処理する。DisclosureSync は現在
+    run_disclosure_analysis_pipeline_task にまとめてキューするため、
+    キュー済みの旧タスクの消化と手動再実行用。AI（Gemini）は使用しない。
 
     - XBRL 財務分析 → CompanyFinancialData（detail 開示タブの財務バッジ・
       決算レビュー下書きの財務サマリー）
@@ -54,6 +54,51 @@ def auto_analyze_disclosure_task(event_id: int):
         logger.warning(f'語彙感情分析失敗: doc_id={event.doc_id}, {e}')
 
 
+def run_disclosure_analysis_pipeline_task(event_ids=None):
+    """新規開示イベント群の財務・トーン分析をパイプラインでまとめて実行する。
+
+    DisclosureSync が1回の同期で作成したイベントの ID をまとめて渡す。
+    event_ids が None の場合は未分析のバックログから TASK_LIMIT 件を処理する。
+    qcluster のタイムアウトを超えないよう TASK_LIMIT 件で打ち切り、
+    残りは run_disclosure_analysis（cron）が消化する。
+    """
+    from .models import DisclosureEvent
+    from .services.analysis_pipeline import (
+        analysis_backlog, pipeline_settings, run_analysis_pipeline,
+    )
+
+    limit = pipeline_settings()['TASK_LIMIT']
+    documents = analysis_backlog()
+    if event_ids is not None:
+        documents = documents.filter(
+            doc_id__in=DisclosureEvent.objects.filter(pk__in=event_ids).values('doc_id')
+        )
+    return run_analysis_pipeline(documents[:limit])
+
+
+def run_sentiment_analysis_task(session_id: int, user_ip: str = None):
+    """画面から開始した感情分析（SentimentAnalysisService.start_analysis）を実行する。
+
+    services/analysis_jobs.py が analysis キューへ投入する。
+    """
+    from .models import SentimentAnalysisSession
+    from .services.analysis_jobs import claim_session
+    from .services.sentiment_analyzer import SentimentAnalysisService
+
+    if claim_session(SentimentAnalysisSession, session_id):
+        SentimentAnalysisService()._execute_analysis(session_id, user_ip)
+
+
+def run_comprehensive_analysis_task(session_id: int, user_ip: str = None):
+    """包括分析（ComprehensiveAnalysisService.start_comprehensive_analysis）を実行する。"""
+    from .models import FinancialAnalysisSession
+    from .services.analysis_jobs import claim_session
+    from .services.comprehensive_analyzer import ComprehensiveAnalysisService
+
+    if claim_session(FinancialAnalysisSession, session_id):
+        ComprehensiveAnalysisService()._execute_comprehensive_analysis(session_id, user_ip)
+
+
 def generate_report_from_pdf_url_task(
     job_id: str,
     pdf_url: str,
@@ -124,3 +169,56 @@ def generate_report_from_pdf_url_task(
             job.save(update_fields=['status', 'error_message', 'updated_at'])
         except Exception:
             pass
+
+
+def generate_tdnet_reports_task(batch_id: str):
+    """
+    複数開示のレポートをまとめて生成するバックグラウンドタスク。
+
+    services/tdnet_report_pipeline.queue_report_batch から投入される。
+    待機中のバッチと、止まった（STALE_AFTER_SECONDS 更新のない）処理中のバッチだけを処理し
+    （処理中の再配送で二重に生成しない）、件数と件/時を TDNETReportBatch に残す。
+    まとまりを保存するたびに件数と更新日時を進める。
+    """
+    from django.db.models import Q
+    from django.utils import timezone
+    from .models.tdnet import TDNETReportBatch
+    from .services.tdnet_report_pipeline import TDNETReportPipeline, stale_before
+
+    now = timezone.now()
+    claimed = TDNETReportBatch.objects.filter(
+        Q(status=TDNETReportBatch.STATUS_PENDING)
+        | Q(status=TDNETReportBatch.STATUS_PROCESSING, updated_at__lt=stale_before()),
+        batch_id=batch_id,
+    ).update(status=TDNETReportBatch.STATUS_PROCESSING, started_at=now, updated_at=now)
+    if not claimed:
+        logger.warning(f"レポート一括生成: 待機中のバッチがありません batch_id={batch_id}")
+        return
+
+    batch = TDNETReportBatch.objects.select_related('created_by').get(batch_id=batch_id)
+
+    def progress(stats):
+        TDNETReportBatch.objects.filter(pk=batch.pk).update(
+            generated_count=stats['generated'],
+            llm_requests=stats['llm_requests'],
+            updated_at=timezone.now(),
+        )
+
+    try:
+        stats = TDNETReportPipeline().run(
+            batch.disclosure_ids, batch.report_type or None, batch.created_by, progress=progress
+        )
+        batch.status = TDNETReportBatch.STATUS_DONE
+        batch.generated_count = stats['generated']
+        batch.skipped_count = stats['skipped']
+        batch.failed_count = stats['failed']
+        batch.llm_requests = stats['llm_requests']
+        batch.elapsed_seconds = stats['elapsed_seconds']
+        batch.reports_per_hour = stats['reports_per_hour']
+    except Exception as e:
+        logger.error(f"レポート一括生成例外: batch_id={batch_id}, error={e}", exc_info=True)
+        batch.status = TDNETReportBatch.STATUS_ERROR
+        batch.error_message = str(e)
+    batch.finished_at = timezone.now()
+    batch.save()
+    return batch.status
@@ -106,6 +106,11 @@ urlpatterns = [
          tdnet_admin.TDNETDisclosureListView.as_view(), 
          name='tdnet-admin-disclosure-list'),
     
+    # レポートまとめて生成（選択した開示）
+    path('admin_xyz/tdnet/disclosures/generate/',
+         tdnet_admin.TDNETReportBatchGenerateView.as_view(),
+         name='tdnet-admin-generate-batch'),
+    
     # 開示情報詳細
     path('admin_xyz/tdnet/disclosure/<str:disclosure_id>/', 
          tdnet_admin.TDNETDisclosureDetailView.as_view(), 
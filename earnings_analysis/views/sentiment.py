@@ -42,6 +42,8 @@ class SentimentAnalysisStartView(APIView):
             
             if result['status'] == 'already_analyzed':
                 return Response(result, status=status.HTTP_200_OK)
+            elif result['status'] == 'busy':
+                return Response(result, status=status.HTTP_429_TOO_MANY_REQUESTS)
             else:
                 return Response(result, status=status.HTTP_202_ACCEPTED)
                 
@@ -11,6 +11,7 @@ from ..forms import PDFUploadForm
 from ..models import TDNETDisclosure, TDNETReport
 from ..models.tdnet import TDNETPDFJob
 from ..services.tdnet_report_generator import TDNETReportGeneratorService
+from ..services.tdnet_report_pipeline import queue_report_batch, report_throughput
 import logging
 
 logger = logging.getLogger('earnings_analysis.tdnet')
@@ -153,6 +154,7 @@ class TDNETDisclosureListView(AdminRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         context['page_title'] = 'TDNET開示情報一覧'
         context['disclosure_types'] = TDNETDisclosure.DISCLOSURE_TYPE_CHOICES
+        context['throughput'] = report_throughput()
         return context
 
 
@@ -242,6 +244,24 @@ class TDNETReportGenerateView(AdminRequiredMixin, View):
             return redirect('copomo:tdnet-admin-disclosure-list')
 
 
+class TDNETReportBatchGenerateView(AdminRequiredMixin, View):
+    """選択した開示のレポートをまとめて生成（バックグラウンド）"""
+
+    def post(self, request):
+        disclosure_ids = [d for d in request.POST.getlist('disclosure_ids') if d]
+        if not disclosure_ids:
+            messages.error(request, '開示情報を選択してください')
+            return redirect('copomo:tdnet-admin-disclosure-list')
+
+        batches = queue_report_batch(disclosure_ids, request.POST.get('report_type', ''), request.user)
+        messages.info(
+            request,
+            f'{sum(batch.requested_count for batch in batches)}件のレポート生成をバックグラウンドで開始しました'
+            '（生成済みの開示はスキップします）'
+        )
+        return redirect('copomo:tdnet-admin-disclosure-list')
+
+
 class TDNETReportListView(AdminRequiredMixin, ListView):
     """レポート一覧（管理者用）"""
     model = TDNETReport
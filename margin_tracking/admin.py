@@ -61,7 +61,7 @@ class MarginDataAdmin(admin.ModelAdmin):
 
 @admin.register(MarginFetchLog)
 class MarginFetchLogAdmin(admin.ModelAdmin):
-    list_display = ['record_date', 'status', 'records_created', 'records_updated', 'total_records', 'started_at', 'completed_at']
+    list_display = ['record_date', 'status', 'records_created', 'records_updated', 'total_records', 'next_check_at', 'started_at', 'completed_at']
     list_filter = ['status']
     ordering = ['-record_date']
     readonly_fields = ['started_at', 'completed_at']
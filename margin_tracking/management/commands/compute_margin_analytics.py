@@ -0,0 +1,38 @@
+"""
+信用残高の分析値（前週比・52週zスコア・52週パーセンタイル）を計算し直す。
+
+通常は取込時（fetch_margin_data / 日次タスク）に計算される。
+マイグレーション直後の既存データや、fix_margin_ratio で倍率を直した後に使う。
+
+使用法:
+  python manage.py compute_margin_analytics                     # 全期間
+  python manage.py compute_margin_analytics --since 2026-01-01  # 指定日以降
+"""
+
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from margin_tracking.services.margin_analytics import refresh_margin_analytics
+
+
+class Command(BaseCommand):
+    help = '信用残高の前週比・52週zスコア・52週パーセンタイルを計算し直す'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='この申込日以降を計算する (YYYY-MM-DD)。省略時は全期間',
+        )
+
+    def handle(self, *args, **options):
+        since = date.min
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError(f"日付形式が不正です: {options['since']} (YYYY-MM-DD)")
+
+        updated = refresh_margin_analytics(since)
+        self.stdout.write(self.style.SUCCESS(f'完了: {updated} 件の分析値を更新'))
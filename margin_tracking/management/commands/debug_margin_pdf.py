@@ -4,10 +4,14 @@ JPX信用倍率PDF解析デバッグコマンド
 使い方:
   python manage.py debug_margin_pdf --date 2026-03-19
   python manage.py debug_margin_pdf --date 2026-03-19 --dump-rows 3
+
+  # 保存済みPDFのパース時間を計測（直列と --workers 指定の並列を比較）
+  python manage.py debug_margin_pdf --pdf /path/to/syumatsu2026031900.pdf --benchmark --workers 4
 """
 
 import os
 import tempfile
+import time
 import requests
 from datetime import datetime
 from django.core.management.base import BaseCommand, CommandError
@@ -17,8 +21,16 @@ class Command(BaseCommand):
     help = 'JPX信用残高PDFの解析状況を詳細に表示する（デバッグ用）'
 
     def add_arguments(self, parser):
-        parser.add_argument('--date', type=str, required=True,
-                            help='対象日付（YYYY-MM-DD形式）')
+        parser.add_argument('--date', type=str, default=None,
+                            help='対象日付（YYYY-MM-DD形式）。--pdf 未指定時は必須')
+        parser.add_argument('--pdf', type=str, default=None,
+                            help='ダウンロードせず保存済みのPDFファイルを解析する')
+        parser.add_argument('--benchmark', action='store_true',
+                            help='詳細ダンプの代わりにパース時間（直列・並列）を計測する')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='--benchmark の並列解析のプロセス数（デフォルト:4）')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='--benchmark の計測回数（最短時間を表示、デフォルト:3）')
         parser.add_argument('--dump-rows', type=int, default=3,
                             help='各テーブルの先頭N行を表示（デフォルト:3）')
         parser.add_argument('--page', type=int, default=2,
@@ -32,31 +44,21 @@ class Command(BaseCommand):
         except ImportError:
             import fitz
 
-        try:
-            target_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
-        except ValueError:
-            raise CommandError(f"日付形式エラー: {options['date']}")
+        if options['pdf']:
+            path = options['pdf']
+            if not os.path.exists(path):
+                raise CommandError(f"PDFファイルが見つかりません: {path}")
+            self.stdout.write(f"ファイル: {path} ({os.path.getsize(path):,} bytes)\n")
+        else:
+            if not options['date']:
+                raise CommandError("--date または --pdf を指定してください")
+            path = self._download(options['date'])
 
-        from margin_tracking.services.jpx_margin_service import build_jpx_pdf_url
-        pdf_url = build_jpx_pdf_url(target_date)
-        self.stdout.write(f"URL: {pdf_url}\n")
-
-        # ダウンロード
-        self.stdout.write("PDFダウンロード中...")
         try:
-            resp = requests.get(pdf_url, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
-            }, timeout=60)
-            resp.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            raise CommandError(f"ダウンロード失敗: {e}")
-
-        fd, path = tempfile.mkstemp(suffix='.pdf', prefix='jpx_debug_')
-        with os.fdopen(fd, 'wb') as f:
-            f.write(resp.content)
-        self.stdout.write(f"ダウンロード完了: {len(resp.content):,} bytes\n")
+            if options['benchmark']:
+                self._benchmark(path, options['workers'], options['repeat'])
+                return
 
-        try:
             doc = fitz.open(path)
             total_pages = len(doc)
             self.stdout.write(f"=== ページ数: {total_pages} ===\n")
@@ -173,7 +175,57 @@ class Command(BaseCommand):
             self.stdout.write(f"  テキスト中の5桁コード行数: {total_text_rows}（期待される銘柄数の目安）")
 
         finally:
-            try:
-                os.unlink(path)
-            except Exception:
-                pass
+            if not options['pdf']:
+                try:
+                    os.unlink(path)
+                except Exception:
+                    pass
+
+    def _download(self, date_str):
+        """JPXからPDFをダウンロードして一時ファイルパスを返す"""
+        try:
+            target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"日付形式エラー: {date_str}")
+
+        from margin_tracking.services.jpx_margin_service import build_jpx_pdf_url
+        pdf_url = build_jpx_pdf_url(target_date)
+        self.stdout.write(f"URL: {pdf_url}\n")
+
+        # ダウンロード
+        self.stdout.write("PDFダウンロード中...")
+        try:
+            resp = requests.get(pdf_url, headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
+            }, timeout=60)
+            resp.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            raise CommandError(f"ダウンロード失敗: {e}")
+
+        fd, path = tempfile.mkstemp(suffix='.pdf', prefix='jpx_debug_')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(resp.content)
+        self.stdout.write(f"ダウンロード完了: {len(resp.content):,} bytes\n")
+        return path
+
+    def _benchmark(self, path, workers, repeat):
+        """直列・並列それぞれのパース時間（repeat 回の最短）と件数を表示する"""
+        from margin_tracking.services.jpx_margin_service import JPXMarginPDFParser
+
+        results = {}
+        for label, n in (('直列', 1), (f'並列({workers}プロセス)', workers)):
+            parser = JPXMarginPDFParser(workers=n)
+            best = None
+            for _ in range(max(1, repeat)):
+                started = time.perf_counter()
+                records = parser.parse_pdf_file(path)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results[label] = records
+            self.stdout.write(f"  {label}: {best:.3f}秒/ファイル  {len(records)} 件")
+
+        serial, parallel = results.values()
+        if serial != parallel:
+            self.stdout.write(self.style.ERROR("  直列と並列の解析結果が一致しません"))
+        else:
+            self.stdout.write(self.style.SUCCESS("  直列と並列の解析結果は一致"))
@@ -1,11 +1,11 @@
 """
 JPX 信用取引残高データ取得コマンド
 
-JPXの公開日は木曜が多いが固定ではないため、
-過去N日分を日次で総当たりチェックして取得する。
+申込日は週の最終営業日（通常は金曜、祝日なら前の営業日）。
+過去N日分は週ごとに未取得の申込日だけを確認し、404（未公開）は記憶して間隔を空ける。
 
 使い方:
-  # 過去40日分をチェック（デフォルト）
+  # 過去40日分の未取得の週をチェック（デフォルト）
   python manage.py fetch_margin_data
 
   # チェック日数を変更
@@ -30,11 +30,12 @@ logger = logging.getLogger(__name__)
 
 
 def get_dates_in_range(start_date: date, end_date: date):
-    """指定期間内の全日付を返す（古い順）"""
+    """指定期間内の平日を返す（古い順）。土日の申込日はないため問い合わせない。"""
     dates = []
     current = start_date
     while current <= end_date:
-        dates.append(current)
+        if current.weekday() < 5:
+            dates.append(current)
         current += timedelta(days=1)
     return dates
 
@@ -83,6 +84,10 @@ class Command(BaseCommand):
         delay = options['delay']
         service = JPXMarginService()
 
+        if not (options.get('date') or options.get('start_date') or options.get('end_date')):
+            self._fetch_recent(service, options['days'], force)
+            return
+
         # 取得対象日リストを決定
         target_dates = self._resolve_target_dates(options)
         if not target_dates:
@@ -158,6 +163,27 @@ class Command(BaseCommand):
                 )
             )
 
+    def _fetch_recent(self, service, days, force):
+        """過去N日分を週ごとの申込日候補で確認する"""
+        if days < 1:
+            raise CommandError('--days は1以上の整数を指定してください。')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"取得対象: 過去{days}日分の申込日"))
+        result = service.fetch_recent(days=days, force=force)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('=== 取得完了 ==='))
+        self.stdout.write(
+            f"  取得: {result['success']}週  取得済み: {result['skipped']}週  "
+            f"未公開(404): {result['not_found']}日  エラー: {result['fail']}日  "
+            f"JPXへのリクエスト: {result['requests']}回"
+        )
+        if result['fail'] > 0:
+            self.stdout.write(
+                self.style.ERROR(
+                    f"{result['fail']}日分でエラーが発生しました。ログを確認してください。"
+                )
+            )
+
     def _resolve_target_dates(self, options) -> list:
         """オプションから取得対象日リストを決定する"""
         # 個別日付指定
@@ -181,11 +207,4 @@ class Command(BaseCommand):
                 raise CommandError('--start-date は --end-date より前の日付を指定してください。')
             return get_dates_in_range(start, end)
 
-        # 過去N日分（デフォルト）
-        days = options.get('days', 40)
-        if days < 1:
-            raise CommandError('--days は1以上の整数を指定してください。')
-
-        today = date.today()
-        dates = [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
-        return dates
+        return []
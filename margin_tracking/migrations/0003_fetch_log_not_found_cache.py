@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-19 04:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('margin_tracking', '0002_rename_margin_trac_stock_c_idx_margin_trac_stock_c_d6f83f_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marginfetchlog',
+            name='etag',
+            field=models.CharField(blank=True, max_length=200, verbose_name='ETag'),
+        ),
+        migrations.AddField(
+            model_name='marginfetchlog',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Last-Modified'),
+        ),
+        migrations.AddField(
+            model_name='marginfetchlog',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='次回確認日時'),
+        ),
+        migrations.AddField(
+            model_name='marginfetchlog',
+            name='not_found_count',
+            field=models.IntegerField(default=0, verbose_name='未公開の確認回数'),
+        ),
+        migrations.AlterField(
+            model_name='marginfetchlog',
+            name='status',
+            field=models.CharField(choices=[('running', '実行中'), ('success', '成功'), ('failed', '失敗'), ('partial', '一部成功'), ('not_found', '未公開')], default='running', max_length=10, verbose_name='ステータス'),
+        ),
+    ]
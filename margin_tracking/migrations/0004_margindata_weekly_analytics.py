@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-19 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('margin_tracking', '0003_fetch_log_not_found_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='margindata',
+            name='long_change',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='買い残高 前週比'),
+        ),
+        migrations.AddField(
+            model_name='margindata',
+            name='ratio_change',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='信用倍率 前週比'),
+        ),
+        migrations.AddField(
+            model_name='margindata',
+            name='ratio_percentile_52w',
+            field=models.FloatField(blank=True, null=True, verbose_name='信用倍率 52週パーセンタイル'),
+        ),
+        migrations.AddField(
+            model_name='margindata',
+            name='ratio_zscore_52w',
+            field=models.FloatField(blank=True, null=True, verbose_name='信用倍率 52週zスコア'),
+        ),
+        migrations.AddField(
+            model_name='margindata',
+            name='short_change',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='売り残高 前週比'),
+        ),
+    ]
@@ -22,6 +22,16 @@ class MarginData(models.Model):
         max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='信用倍率'
     )
 
+    # 取込時に計算する分析値（services/margin_analytics.py）
+    # 前週比は直前の申込日の同銘柄との差。52週は直近52申込日（当週を含む）の信用倍率が対象
+    long_change = models.BigIntegerField(null=True, blank=True, verbose_name='買い残高 前週比')
+    short_change = models.BigIntegerField(null=True, blank=True, verbose_name='売り残高 前週比')
+    ratio_change = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='信用倍率 前週比'
+    )
+    ratio_zscore_52w = models.FloatField(null=True, blank=True, verbose_name='信用倍率 52週zスコア')
+    ratio_percentile_52w = models.FloatField(null=True, blank=True, verbose_name='信用倍率 52週パーセンタイル')
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -56,6 +66,7 @@ class MarginFetchLog(models.Model):
         ('success', '成功'),
         ('failed', '失敗'),
         ('partial', '一部成功'),
+        ('not_found', '未公開'),
     ]
 
     record_date = models.DateField(verbose_name='対象申込日', unique=True)
@@ -65,6 +76,15 @@ class MarginFetchLog(models.Model):
     total_records = models.IntegerField(default=0, verbose_name='処理件数合計')
     pdf_url = models.URLField(blank=True, verbose_name='取得元PDF URL')
     error_message = models.TextField(blank=True, verbose_name='エラーメッセージ')
+
+    # 404（未公開）の記憶。next_check_at までは再取得しない（回数に応じて間隔を延ばす）
+    not_found_count = models.IntegerField(default=0, verbose_name='未公開の確認回数')
+    next_check_at = models.DateTimeField(null=True, blank=True, verbose_name='次回確認日時')
+
+    # 条件付きリクエスト用（取得済みPDFの ETag / Last-Modified）
+    etag = models.CharField(max_length=200, blank=True, verbose_name='ETag')
+    last_modified = models.CharField(max_length=100, blank=True, verbose_name='Last-Modified')
+
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
@@ -34,7 +34,10 @@ import requests
 import os
 import tempfile
 from datetime import date, timedelta
-from typing import List, Dict, Optional, Tuple
+from decimal import Decimal
+from typing import List, Dict, Optional, Sequence, Tuple
+
+import numpy as np
 
 try:
     import pymupdf as fitz
@@ -50,12 +53,122 @@ JPX_MARGIN_PDF_BASE_URL = (
 )
 
 
+# 既定値（settings.JPX_MARGIN_SETTINGS で上書き）
+DEFAULT_JPX_MARGIN_SETTINGS = {
+    # PDF解析のプロセス数（1 なら直列）
+    'PARSE_WORKERS': 1,
+    # 申込日（週の最終営業日）から公開を確認し始めるまでの日数（通常は翌週火曜に公開）
+    'EARLIEST_PUBLICATION_DAYS': 4,
+    # 申込日からこの日数を過ぎても404なら、その日は休場とみなして同じ週の前の営業日を確認する
+    'PUBLICATION_LAG_DAYS': 6,
+    # 404 を記憶する時間。公開待ちの間は一定、公開予定を過ぎたら確認のたびに倍にする
+    'NOT_FOUND_TTL_HOURS': 20,
+    'NOT_FOUND_TTL_MAX_DAYS': 30,
+}
+
+_REQUEST_HEADERS = {
+    'User-Agent': (
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+        'AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/120.0.0.0 Safari/537.36'
+    )
+}
+
+# HEAD による事前確認の結果
+PROBE_AVAILABLE = 'available'
+PROBE_NOT_FOUND = 'not_found'
+PROBE_NOT_MODIFIED = 'not_modified'
+PROBE_UNKNOWN = 'unknown'   # HEAD 非対応・通信エラー等。GET で確認する
+
+
+def margin_settings() -> dict:
+    from django.conf import settings
+
+    return {**DEFAULT_JPX_MARGIN_SETTINGS, **getattr(settings, 'JPX_MARGIN_SETTINGS', {})}
+
+
 def build_jpx_pdf_url(record_date: date) -> str:
     """指定日付のJPX信用残高PDFのURLを生成"""
     date_str = record_date.strftime('%Y%m%d')
     return JPX_MARGIN_PDF_BASE_URL.format(date=date_str)
 
 
+def weekly_candidate_dates(start: date, end: date) -> List[List[date]]:
+    """
+    [start, end] の週ごとの申込日候補を古い週から返す。
+
+    申込日は週の最終営業日（通常は金曜、祝日なら木曜など）。祝日表を持たないため、
+    各週の平日を金曜→月曜の順に並べ、金曜が end 以前の週だけを対象にする。
+    """
+    weeks = []
+    friday = start + timedelta(days=(4 - start.weekday()) % 7)
+    while friday <= end:
+        candidates = [friday - timedelta(days=i) for i in range(5)]
+        weeks.append([d for d in candidates if d >= start])
+        friday += timedelta(days=7)
+    return [week for week in weeks if week]
+
+
+def not_found_ttl(record_date: date, not_found_count: int, today: Optional[date] = None) -> timedelta:
+    """
+    404 を記憶する時間。
+
+    公開予定（申込日 + PUBLICATION_LAG_DAYS）までは公開待ちとして NOT_FOUND_TTL_HOURS ごとに確認し、
+    それを過ぎた後は確認のたびに間隔を倍にする（休場日は最終的に NOT_FOUND_TTL_MAX_DAYS ごと）。
+    """
+    from django.utils import timezone
+
+    conf = margin_settings()
+    today = today or timezone.localdate()
+    base = timedelta(hours=conf['NOT_FOUND_TTL_HOURS'])
+    overdue_since = record_date + timedelta(days=conf['PUBLICATION_LAG_DAYS'])
+    if today < overdue_since:
+        return base
+    exponent = min(max(not_found_count - 1, 0), 16)
+    return min(base * (2 ** exponent), timedelta(days=conf['NOT_FOUND_TTL_MAX_DAYS']))
+
+
+def _validators(response) -> Dict[str, str]:
+    """条件付きリクエスト用の ETag / Last-Modified"""
+    return {
+        'etag': response.headers.get('ETag', ''),
+        'last_modified': response.headers.get('Last-Modified', ''),
+    }
+
+
+# 1回の INSERT で送る行数（SQLite はパラメータ数の上限に合わせて Django 側でさらに分割する）
+BULK_BATCH_SIZE = 1000
+
+# force=True の upsert で上書きする列（created_at は残す）
+_UPSERT_FIELDS = ['stock_name', 'short_balance', 'long_balance', 'margin_ratio', 'updated_at']
+
+
+def compute_margin_ratios(
+    long_balances: Sequence[int], short_balances: Sequence[int]
+) -> List[Optional[Decimal]]:
+    """
+    信用倍率（買い残 / 売り残、小数点2桁）を全銘柄まとめて計算する。
+
+    MarginData.save() と同じ結果（Decimal.quantize の既定＝偶数丸め、
+    売り残が0以下なら None）になるよう、100倍した商と余りを整数のまま求めて丸める。
+    bulk_create は save() を呼ばないため、取込時はこちらで倍率を埋める。
+    """
+    longs = np.asarray(long_balances, dtype=np.int64)
+    shorts = np.asarray(short_balances, dtype=np.int64)
+    valid = shorts > 0
+    divisor = np.where(valid, shorts, 1)
+
+    quotient, remainder = np.divmod(np.abs(longs) * 100, divisor)
+    twice = remainder * 2
+    round_up = (twice > divisor) | ((twice == divisor) & (quotient % 2 == 1))
+    cents = np.sign(longs) * (quotient + round_up)
+
+    return [
+        Decimal(int(c)).scaleb(-2) if ok else None
+        for c, ok in zip(cents.tolist(), valid.tolist())
+    ]
+
+
 def get_recent_dates(days: int = 40) -> List[date]:
     """
     直近N日分の日付リストを返す（古い順）。
@@ -65,6 +178,64 @@ def get_recent_dates(days: int = 40) -> List[date]:
     return [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
 
 
+# 行の種別（_classify_lines で1行1回だけ判定する）
+_KIND_CODE = 'code'          # 5桁コード（数値としても扱う）
+_KIND_NUM = 'num'            # 整数（カンマ区切り可）
+_KIND_COMMA_NUM = 'comma_num'  # カンマで始まる整数（数字で始まらないので銘柄名探索では読み飛ばさない）
+_KIND_ISIN = 'isin'          # ISINコード
+_KIND_MARKET = 'market'      # 市場区分（英字1文字）
+_KIND_EMPTY = 'empty'        # 空行（欠損）
+_KIND_DASH = 'dash'          # 欠損記号 ―, -, －
+_KIND_TRI_NUM = 'tri_num'    # 数字で始まり ▲/△ を含む行
+_KIND_TRI = 'tri'            # ▲/△ を含むその他の行
+_KIND_DIGIT_TEXT = 'digit_text'  # 数字で始まるその他の行
+_KIND_TEXT = 'text'          # 銘柄名・見出しなど
+
+# 上の種別を1回の fullmatch で判定する（先に書いたものが優先）
+_LINE_RE = re.compile(
+    r'(?P<code>\d{5})'
+    r'|(?P<num>\d[\d,]*)'
+    r'|(?P<comma_num>,[\d,]*\d[\d,]*)'
+    r'|(?P<isin>JP[A-Z0-9]+)'
+    r'|(?P<market>[A-Za-z])'
+    r'|(?P<empty>)'
+    r'|(?P<dash>[―\-－])'
+    r'|(?P<tri_num>\d[^▲△]*[▲△].*)'
+    r'|(?P<tri>[^▲△]*[▲△].*)'
+    r'|(?P<digit_text>\d.*)',
+    re.DOTALL,
+)
+_DIGITS_RE = re.compile(r'\d+')
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x1f\x7f]')
+
+# 銘柄名を逆方向に探すときに読み飛ばす種別（空行・市場区分・ISIN・数字で始まる行）
+_NAME_SKIP_KINDS = frozenset({
+    _KIND_EMPTY, _KIND_MARKET, _KIND_ISIN, _KIND_CODE, _KIND_NUM, _KIND_TRI_NUM, _KIND_DIGIT_TEXT,
+})
+# 数値列として収集する種別
+_NUM_KINDS = frozenset({_KIND_CODE, _KIND_NUM, _KIND_COMMA_NUM})
+_MISSING_KINDS = frozenset({_KIND_EMPTY, _KIND_DASH})
+_TRI_KINDS = frozenset({_KIND_TRI_NUM, _KIND_TRI})
+
+
+def _classify_lines(lines: List[str]) -> List[str]:
+    """各行の種別を返す"""
+    return [m.lastgroup if m else _KIND_TEXT for m in map(_LINE_RE.fullmatch, lines)]
+
+
+def _parse_page_range(pdf_path: str, start: int, stop: int) -> List[Dict]:
+    """ページ範囲 [start, stop) を解析する（プロセスプールの子プロセスから呼ぶ）"""
+    parser = JPXMarginPDFParser()
+    doc = fitz.open(pdf_path)
+    try:
+        records = []
+        for page_num in range(start, stop):
+            records.extend(parser._parse_page(doc[page_num]))
+        return records
+    finally:
+        doc.close()
+
+
 class JPXMarginPDFParser:
     """
     JPX 信用取引残高PDFのパーサー。
@@ -72,11 +243,19 @@ class JPXMarginPDFParser:
     PDFは横向き（landscape）で、各銘柄のデータが縦方向に1値1行で格納されている。
     PyMuPDF の get_text("text") でページ全体のテキストを取得し、
     5桁コードを起点にして前後の行から銘柄名・残高を抽出する。
+
+    各行の種別はページごとに1回だけ判定し（_classify_lines）、
+    コード検出・銘柄名探索・数値収集はその結果を参照する。
+    workers > 1 のときはページ範囲をプロセスプールに分けて解析する
+    （各プロセスが自分で PDF を開く）。
     """
 
     # 各銘柄の数値列数（合計売前週比〜制度信用買前週比まで12列）
     _NUM_COLS = 12
 
+    def __init__(self, workers: int = 1):
+        self.workers = max(1, workers)
+
     def parse_pdf_file(self, pdf_path: str) -> List[Dict]:
         """
         PDFファイルからすべての銘柄の信用残高データを抽出する。
@@ -99,19 +278,52 @@ class JPXMarginPDFParser:
             return []
 
         total_pages = len(doc)
-        logger.info(f"PDF解析開始: {total_pages} ページ")
-        all_records = []
-        for page_num in range(total_pages):
-            page = doc[page_num]
-            records = self._parse_page(page)
-            all_records.extend(records)
-            if records:
-                logger.debug(f"  ページ {page_num + 1}: {len(records)} 件")
+        workers = self._effective_workers(total_pages)
+        logger.info(f"PDF解析開始: {total_pages} ページ (workers={workers})")
+        if workers > 1:
+            doc.close()
+            all_records = self._parse_parallel(pdf_path, total_pages, workers)
+        else:
+            all_records = []
+            for page_num in range(total_pages):
+                page = doc[page_num]
+                records = self._parse_page(page)
+                all_records.extend(records)
+                if records:
+                    logger.debug(f"  ページ {page_num + 1}: {len(records)} 件")
+            doc.close()
 
-        doc.close()
         logger.info(f"PDF解析完了: {total_pages} ページ / {len(all_records)} 件")
         return all_records
 
+    def _effective_workers(self, total_pages: int) -> int:
+        """
+        実際に使うプロセス数。django-q のワーカー（daemon プロセス）は子プロセスを
+        作れないため、その中では直列で解析する。
+        """
+        import multiprocessing
+
+        if self.workers <= 1 or total_pages < 2:
+            return 1
+        if multiprocessing.current_process().daemon:
+            return 1
+        return min(self.workers, total_pages)
+
+    def _parse_parallel(self, pdf_path: str, total_pages: int, workers: int) -> List[Dict]:
+        """ページを連続した範囲に分けてプロセスプールで解析し、ページ順に連結する"""
+        from concurrent.futures import ProcessPoolExecutor
+
+        bounds = [total_pages * i // workers for i in range(workers + 1)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_parse_page_range, pdf_path, bounds[i], bounds[i + 1])
+                for i in range(workers)
+            ]
+            all_records = []
+            for future in futures:
+                all_records.extend(future.result())
+        return all_records
+
     def _parse_page(self, page) -> List[Dict]:
         """
         1ページ分のテキストを解析する。
@@ -123,15 +335,18 @@ class JPXMarginPDFParser:
         raw_text = page.get_text("text")
         if not raw_text:
             return []
+        return self._parse_lines([ln.strip() for ln in raw_text.split('\n')])
 
-        lines = [ln.strip() for ln in raw_text.split('\n')]
+    def _parse_lines(self, lines: List[str]) -> List[Dict]:
+        """ページの行リストから銘柄レコードを抽出する"""
+        kinds = _classify_lines(lines)
         records = []
         i = 0
         n = len(lines)
 
         while i < n:
             # 5桁コード行を探す
-            if not re.match(r'^\d{5}$', lines[i]):
+            if kinds[i] != _KIND_CODE:
                 i += 1
                 continue
 
@@ -144,16 +359,16 @@ class JPXMarginPDFParser:
             stock_code = lines[i][:4]  # 先頭4桁が証券コード
 
             # 銘柄名: コードの直前の行を逆方向に探す
-            stock_name = self._find_stock_name(lines, i)
+            stock_name = self._find_stock_name(lines, i, kinds)
 
             i += 1  # 5桁コードの次へ
 
             # ISINコード（JP...）をスキップ
-            if i < n and re.match(r'^JP[A-Z0-9]+$', lines[i]):
+            if i < n and kinds[i] == _KIND_ISIN:
                 i += 1
 
             # 数値を最大12個収集
-            nums, i = self._collect_nums(lines, i, n)
+            nums, i = self._collect_nums(lines, i, n, kinds)
 
             # nums[0]=合計売残高, nums[2]=合計買残高
             if len(nums) >= 3 and nums[0] is not None and nums[2] is not None:
@@ -166,23 +381,23 @@ class JPXMarginPDFParser:
 
         return records
 
-    def _find_stock_name(self, lines: List[str], code_idx: int) -> str:
+    def _find_stock_name(self, lines: List[str], code_idx: int,
+                         kinds: Optional[List[str]] = None) -> str:
         """5桁コード行の直前から銘柄名を探す（逆方向）"""
+        if kinds is None:
+            kinds = _classify_lines(lines)
         j = code_idx - 1
         while j >= 0:
-            line = lines[j]
             # 空行・1文字市場区分・ISINコード・数値行はスキップ
-            if (not line
-                    or re.match(r'^[A-Za-z]$', line)
-                    or re.match(r'^JP[A-Z0-9]+$', line)
-                    or re.match(r'^\d', line)):
+            if kinds[j] in _NAME_SKIP_KINDS:
                 j -= 1
                 continue
             # 制御文字除去して返す
-            return re.sub(r'[\x00-\x1f\x7f]', '', line).strip()
+            return _CONTROL_CHARS_RE.sub('', lines[j]).strip()
         return ''
 
-    def _collect_nums(self, lines: List[str], start: int, end: int) -> Tuple[List, int]:
+    def _collect_nums(self, lines: List[str], start: int, end: int,
+                      kinds: Optional[List[str]] = None) -> Tuple[List, int]:
         """
         start行目から数値を最大 _NUM_COLS 個収集する。
 
@@ -192,41 +407,43 @@ class JPXMarginPDFParser:
           欠損: ―, -, 0
         非数値行に当たったら収集終了。
         """
+        if kinds is None:
+            kinds = _classify_lines(lines)
         nums: List[Optional[int]] = []
         i = start
         while i < end and len(nums) < self._NUM_COLS:
             val = lines[i]
+            kind = kinds[i]
 
             # ▲ (U+25B2, 黒三角) または △ (U+25B3, 白三角) を含む行
             # パターン1: "138,288,700 ▲ 11,491,400" → 正の数と負の数が同一行
             # パターン2: "▲ 3,200"                  → 負の数のみ
             # パターン3: "▲" (単独)                  → 次行に数値
-            if '▲' in val or '△' in val:
+            if kind in _TRI_KINDS:
                 tri = '▲' if '▲' in val else '△'
                 parts = val.split(tri, 1)
                 pre = parts[0].replace(',', '').strip()
                 post = parts[1].replace(',', '').strip() if len(parts) > 1 else ''
 
-                if pre and re.match(r'^\d+$', pre):
+                if pre and _DIGITS_RE.fullmatch(pre):
                     # パターン1: 三角の前にも数値あり → 正の数として追加
                     nums.append(int(pre))
-                    if len(nums) < self._NUM_COLS and re.match(r'^\d+$', post):
+                    if len(nums) < self._NUM_COLS and _DIGITS_RE.fullmatch(post):
                         nums.append(-int(post))
-                elif re.match(r'^\d+$', post):
+                elif _DIGITS_RE.fullmatch(post):
                     # パターン2: 三角＋数値 → 負の数
                     nums.append(-int(post))
                 # パターン3: 数字なし → 次行に数値がある場合も含め何も追加せずスキップ
                 i += 1
                 continue
 
-            clean = val.replace(',', '')
-            if re.match(r'^\d+$', clean):
-                nums.append(int(clean))
+            if kind in _NUM_KINDS:
+                nums.append(int(val.replace(',', '')))
                 i += 1
                 continue
 
             # 欠損記号
-            if val in ('―', '-', '－', ''):
+            if kind in _MISSING_KINDS:
                 nums.append(None)
                 i += 1
                 continue
@@ -239,18 +456,77 @@ class JPXMarginPDFParser:
 class JPXMarginService:
     """
     JPX信用倍率データの取得・保存を管理するサービス。
+
+    上流（JPX）へのリクエストを減らすため、
+    - 404（未公開）は MarginFetchLog に記憶し、next_check_at までは再取得しない
+    - ダウンロード前に HEAD で公開有無を確認し、取得済みなら ETag / Last-Modified で
+      条件付きにして、変わっていなければ本体（数MBのPDF）を取得しない
+    - 日次の確認（fetch_recent）は週ごとの申込日候補だけを見る
     """
 
     def __init__(self):
-        self.parser = JPXMarginPDFParser()
+        self.parser = JPXMarginPDFParser(workers=margin_settings()['PARSE_WORKERS'])
+        # 上流へ送った HEAD / GET の数（日次タスクのログ・テスト用）
+        self.upstream_requests = 0
+
+    def fetch_recent(self, days: int = 40, force: bool = False) -> Dict:
+        """
+        直近 days 日の申込日を週ごとに確認して取得する（日次タスク・コマンド用）。
+
+        取得済みの週は確認しない（force=True なら条件付きで再確認する）。
+        未取得の週は金曜から確認し、公開予定を過ぎても404なら休場とみなして前の営業日を確認する。
+        定常状態では公開待ちの週の確認だけになり、上流へのリクエストは1日1〜2回程度。
+
+        Returns:
+            {'success': int, 'skipped': int, 'not_found': int, 'fail': int, 'requests': int}
+        """
+        from django.utils import timezone
+        from margin_tracking.models import MarginFetchLog
+
+        conf = margin_settings()
+        today = timezone.localdate()
+        start = today - timedelta(days=days - 1)
+        end = today - timedelta(days=conf['EARLIEST_PUBLICATION_DAYS'])
+        saved = set(
+            MarginFetchLog.objects
+            .filter(record_date__range=(start, today), status='success')
+            .values_list('record_date', flat=True)
+        )
+
+        summary = {'success': 0, 'skipped': 0, 'not_found': 0, 'fail': 0}
+        requests_before = self.upstream_requests
+        for week in weekly_candidate_dates(start, end):
+            done = [d for d in week if d in saved]
+            if done and not force:
+                summary['skipped'] += 1
+                continue
+
+            for candidate in done or week:
+                result = self.fetch_and_save(candidate, force=force)
+                if result.get('skipped'):
+                    summary['skipped'] += 1
+                elif result.get('not_found'):
+                    summary['not_found'] += 1
+                    overdue = today >= candidate + timedelta(days=conf['PUBLICATION_LAG_DAYS'])
+                    if overdue:
+                        continue  # 休場日の可能性 → 同じ週の前の営業日
+                elif result['success']:
+                    summary['success'] += 1
+                else:
+                    summary['fail'] += 1
+                    logger.warning(f"取得失敗: {candidate} - {result.get('error')}")
+                break
+
+        summary['requests'] = self.upstream_requests - requests_before
+        return summary
 
     def fetch_and_save(self, record_date: date, force: bool = False) -> Dict:
         """
         指定日のJPX信用残高PDFを取得してDBに保存する。
 
         Args:
-            record_date: 申込日（木曜日）
-            force:       既存データがある場合も上書き
+            record_date: 申込日（週の最終営業日）
+            force:       既存データがある場合も上書き（404の記憶も無視する）
 
         Returns:
             {
@@ -261,12 +537,13 @@ class JPXMarginService:
                 'pdf_url': str,
                 'error': str or None,
             }
+            取得済みなら 'skipped'（条件付きリクエストで未更新なら 'not_modified' も）、
+            未公開なら 'not_found'（記憶した404で確認を省いたら 'cached' も）が True。
         """
         from django.utils import timezone
-        from margin_tracking.models import MarginData, MarginFetchLog
+        from margin_tracking.models import MarginFetchLog
 
         pdf_url = build_jpx_pdf_url(record_date)
-        logger.info(f"信用残高データ取得開始: {record_date} ({pdf_url})")
 
         # 取得ログを作成（または更新）
         log, _ = MarginFetchLog.objects.get_or_create(
@@ -284,23 +561,36 @@ class JPXMarginService:
                 'error': None,
                 'skipped': True,
             }
+        if (log.status == 'not_found' and not force
+                and log.next_check_at and log.next_check_at > timezone.now()):
+            logger.debug(f"PDF未公開（記憶済み）: {record_date} 次回確認 {log.next_check_at}")
+            return {'success': False, 'created': 0, 'updated': 0, 'total': 0,
+                    'pdf_url': pdf_url, 'error': None, 'not_found': True, 'cached': True}
 
+        logger.info(f"信用残高データ取得開始: {record_date} ({pdf_url})")
+        previously_saved = log.status == 'success'
         log.status = 'running'
         log.pdf_url = pdf_url
         log.error_message = ''
         log.save(update_fields=['status', 'pdf_url', 'error_message'])
 
+        # HEAD で公開有無・更新有無を確認してから本体を取得する
+        state, validators = self._probe_pdf(pdf_url, log if previously_saved else None)
+        if state == PROBE_NOT_FOUND:
+            return self._mark_not_found(log, pdf_url)
+        if state == PROBE_NOT_MODIFIED:
+            logger.info(f"PDF未更新のためスキップ: {record_date}")
+            log.status = 'success'
+            log.completed_at = timezone.now()
+            log.save(update_fields=['status', 'completed_at'])
+            return {'success': True, 'created': 0, 'updated': 0, 'total': log.total_records,
+                    'pdf_url': pdf_url, 'error': None, 'skipped': True, 'not_modified': True}
+
         # PDF取得
-        pdf_path, not_found = self._download_pdf(pdf_url)
+        pdf_path, not_found, downloaded_validators = self._download_pdf(pdf_url)
         if not pdf_path:
             if not_found:
-                # 404 = JPXが当該週のデータを未公開（祝日・休場等）。正常扱い。
-                log.status = 'failed'
-                log.error_message = 'PDF未公開 (404)'
-                log.completed_at = timezone.now()
-                log.save(update_fields=['status', 'error_message', 'completed_at'])
-                return {'success': False, 'created': 0, 'updated': 0, 'total': 0,
-                        'pdf_url': pdf_url, 'error': None, 'not_found': True}
+                return self._mark_not_found(log, pdf_url)
             error_msg = f"PDFダウンロード失敗: {pdf_url}"
             logger.error(error_msg)
             log.status = 'failed'
@@ -309,6 +599,7 @@ class JPXMarginService:
             log.save(update_fields=['status', 'error_message', 'completed_at'])
             return {'success': False, 'created': 0, 'updated': 0, 'total': 0,
                     'pdf_url': pdf_url, 'error': error_msg, 'not_found': False}
+        validators = downloaded_validators or validators
 
         # PDF解析
         try:
@@ -342,15 +633,27 @@ class JPXMarginService:
         # DB保存
         created_count, updated_count = self._save_records(records, record_date, force)
 
+        # 前週比・52週zスコア等（取込んだ週以降）。失敗しても取込自体は成功扱い
+        try:
+            from margin_tracking.services.margin_analytics import refresh_margin_analytics
+            refresh_margin_analytics(record_date)
+        except Exception as e:
+            logger.error(f"信用残高の分析値の計算に失敗: {record_date} {e}", exc_info=True)
+
         # ログ更新
         total = created_count + updated_count
         log.status = 'success'
         log.records_created = created_count
         log.records_updated = updated_count
         log.total_records = total
+        log.not_found_count = 0
+        log.next_check_at = None
+        log.etag = validators.get('etag', '')[:200]
+        log.last_modified = validators.get('last_modified', '')[:100]
         log.completed_at = timezone.now()
         log.save(update_fields=['status', 'records_created', 'records_updated',
-                                'total_records', 'completed_at'])
+                                'total_records', 'not_found_count', 'next_check_at',
+                                'etag', 'last_modified', 'completed_at'])
 
         logger.info(
             f"信用残高データ保存完了: {record_date} "
@@ -365,24 +668,74 @@ class JPXMarginService:
             'error': None,
         }
 
-    def _download_pdf(self, url: str) -> Tuple[Optional[str], bool]:
+    def _mark_not_found(self, log, pdf_url: str) -> Dict:
+        """404 = JPXが当該日のデータを未公開（公開前・祝日・休場等）。正常扱いで、確認間隔を記憶する。"""
+        from django.utils import timezone
+
+        now = timezone.now()
+        log.status = 'not_found'
+        log.error_message = 'PDF未公開 (404)'
+        log.not_found_count += 1
+        log.next_check_at = now + not_found_ttl(log.record_date, log.not_found_count)
+        log.completed_at = now
+        log.save(update_fields=['status', 'error_message', 'not_found_count',
+                                'next_check_at', 'completed_at'])
+        return {'success': False, 'created': 0, 'updated': 0, 'total': 0,
+                'pdf_url': pdf_url, 'error': None, 'not_found': True}
+
+    def _probe_pdf(self, url: str, saved_log=None) -> Tuple[str, Dict[str, str]]:
+        """
+        HEAD で公開有無を確認する。saved_log（取得済みのログ）があれば
+        If-None-Match / If-Modified-Since を付け、更新がなければ PROBE_NOT_MODIFIED を返す。
+
+        Returns:
+            (PROBE_*, {'etag': ..., 'last_modified': ...})
+        """
+        headers = dict(_REQUEST_HEADERS)
+        if saved_log is not None:
+            if saved_log.etag:
+                headers['If-None-Match'] = saved_log.etag
+            if saved_log.last_modified:
+                headers['If-Modified-Since'] = saved_log.last_modified
+
+        self.upstream_requests += 1
+        try:
+            response = requests.head(url, headers=headers, timeout=30, allow_redirects=True)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"PDF事前確認(HEAD)エラー: {e}")
+            return PROBE_UNKNOWN, {}
+
+        if response.status_code == 404:
+            logger.info(f"PDF未公開 (404): {url}")
+            return PROBE_NOT_FOUND, {}
+        if response.status_code == 304:
+            return PROBE_NOT_MODIFIED, {}
+        if response.status_code != 200:
+            return PROBE_UNKNOWN, {}
+
+        validators = _validators(response)
+        # 条件付きヘッダーを無視するサーバーでも、値が同じなら未更新とみなす
+        if saved_log is not None:
+            if saved_log.etag and validators['etag'] == saved_log.etag:
+                return PROBE_NOT_MODIFIED, validators
+            if (not saved_log.etag and saved_log.last_modified
+                    and validators['last_modified'] == saved_log.last_modified):
+                return PROBE_NOT_MODIFIED, validators
+        return PROBE_AVAILABLE, validators
+
+    def _download_pdf(self, url: str) -> Tuple[Optional[str], bool, Dict[str, str]]:
         """
         PDFをダウンロードして一時ファイルパスを返す。
 
         Returns:
-            (path, not_found)
+            (path, not_found, validators)
             - path: ダウンロード済みの一時ファイルパス。失敗時はNone。
             - not_found: True = 404（未公開）。False = その他エラー。
+            - validators: レスポンスの ETag / Last-Modified
         """
+        self.upstream_requests += 1
         try:
-            headers = {
-                'User-Agent': (
-                    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
-                    'AppleWebKit/537.36 (KHTML, like Gecko) '
-                    'Chrome/120.0.0.0 Safari/537.36'
-                )
-            }
-            response = requests.get(url, headers=headers, timeout=60)
+            response = requests.get(url, headers=_REQUEST_HEADERS, timeout=60)
             response.raise_for_status()
 
             # 一時ファイルに保存
@@ -391,54 +744,84 @@ class JPXMarginService:
                 f.write(response.content)
 
             logger.info(f"PDFダウンロード完了: {len(response.content)} bytes -> {path}")
-            return path, False
+            return path, False, _validators(response)
 
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
                 logger.info(f"PDF未公開 (404): {url}")
-                return None, True  # 未公開は正常扱い
+                return None, True, {}  # 未公開は正常扱い
             logger.error(f"PDFダウンロードHTTPエラー: {e}")
-            return None, False
+            return None, False, {}
         except requests.exceptions.RequestException as e:
             logger.error(f"PDFダウンロードエラー: {e}")
-            return None, False
+            return None, False, {}
 
     def _save_records(
         self, records: List[Dict], record_date: date, force: bool
     ) -> Tuple[int, int]:
-        """抽出したレコードをDBに保存する。重複は更新する。"""
-        from margin_tracking.models import MarginData
+        """
+        抽出したレコードを一括で DB に保存する。
+
+        週次PDFは約4,000銘柄あり、1行ずつ get_or_create / update_or_create すると
+        行数×2回のクエリになっていた。既存の銘柄コードを1回の SELECT で取得し、
+        信用倍率を compute_margin_ratios でまとめて計算したうえで bulk_create する。
+
+        - force=True:  (record_date, stock_code) の衝突は上書き（update_conflicts）
+        - force=False: 既存データは更新しない（ignore_conflicts）
+
+        同じ銘柄コードが PDF 内に複数ある場合は、従来の結果に合わせて
+        force=True なら後の行、force=False なら先の行を採用する。
 
-        created_count = 0
-        updated_count = 0
+        Returns:
+            (created_count, updated_count)
+        """
+        from django.db import transaction
+        from margin_tracking.models import MarginData
 
+        unique: Dict[str, Dict] = {}
         for rec in records:
-            stock_code = rec['stock_code']
-            defaults = {
-                'stock_name': rec.get('stock_name', ''),
-                'short_balance': rec['short_balance'],
-                'long_balance': rec['long_balance'],
-            }
+            if force or rec['stock_code'] not in unique:
+                unique[rec['stock_code']] = rec
+        if not unique:
+            return 0, 0
+
+        rows = list(unique.values())
+        ratios = compute_margin_ratios(
+            [rec['long_balance'] for rec in rows],
+            [rec['short_balance'] for rec in rows],
+        )
 
-            if force:
-                obj, created = MarginData.objects.update_or_create(
+        with transaction.atomic():
+            existing = set(
+                MarginData.objects
+                .filter(record_date=record_date)
+                .values_list('stock_code', flat=True)
+            )
+            objs = [
+                MarginData(
                     record_date=record_date,
-                    stock_code=stock_code,
-                    defaults=defaults,
+                    stock_code=rec['stock_code'],
+                    stock_name=rec.get('stock_name', ''),
+                    short_balance=rec['short_balance'],
+                    long_balance=rec['long_balance'],
+                    margin_ratio=ratio,
                 )
-            else:
-                obj, created = MarginData.objects.get_or_create(
-                    record_date=record_date,
-                    stock_code=stock_code,
-                    defaults=defaults,
+                for rec, ratio in zip(rows, ratios)
+                if force or rec['stock_code'] not in existing
+            ]
+            if force:
+                MarginData.objects.bulk_create(
+                    objs,
+                    batch_size=BULK_BATCH_SIZE,
+                    update_conflicts=True,
+                    unique_fields=['record_date', 'stock_code'],
+                    update_fields=_UPSERT_FIELDS,
                 )
-                if not created:
-                    # 既存データは更新しない（forceなし）
-                    continue
-
-            if created:
-                created_count += 1
             else:
-                updated_count += 1
+                # SELECT 後に並行して作られた行はそのまま残す
+                MarginData.objects.bulk_create(
+                    objs, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True,
+                )
 
-        return created_count, updated_count
+        updated_count = len(existing.intersection(unique)) if force else 0
+        return len(objs) - updated_count, updated_count
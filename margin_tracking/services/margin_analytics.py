@@ -0,0 +1,253 @@
+"""
+信用残高の分析値（前週比・52週zスコア・52週パーセンタイル）と複数銘柄の読み出し
+
+分析API・信用倍率APIは銘柄ごとに生の MarginData を読み、倍率や推移を Python で組み立てていた。
+分析値は取込時（JPXMarginService.fetch_and_save）に申込日単位でまとめて計算して
+MarginData に保存し、読み出し側は列を読むだけにする。
+
+- 前週比: 直前の申込日の同銘柄との差（買い残・売り残・信用倍率）。前週にない銘柄は None
+- 52週zスコア: 直近52申込日（当週を含む）の信用倍率の平均・標準偏差（母標準偏差）に対する当週の位置
+- 52週パーセンタイル: 同じ期間で当週の倍率以下だった週の割合（0〜100）
+
+zスコア・パーセンタイルは倍率のある週が MIN_HISTORY_WEEKS 未満なら None。
+計算は申込日×銘柄の行列（numpy）で全銘柄まとめて行い、bulk_update で書き込む。
+"""
+import logging
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from django.db.models import Max
+
+from margin_tracking.models import MarginData
+
+logger = logging.getLogger(__name__)
+
+WINDOW_WEEKS = 52
+MIN_HISTORY_WEEKS = 8
+
+# 1回に計算する申込日数（読み込むのは窓の分を足した WINDOW_WEEKS + CHUNK_WEEKS 週分）
+CHUNK_WEEKS = 26
+UPDATE_BATCH_SIZE = 500
+
+ANALYTICS_FIELDS = [
+    'long_change', 'short_change', 'ratio_change', 'ratio_zscore_52w', 'ratio_percentile_52w',
+]
+
+# 一括APIで1回に受け付ける銘柄数
+MAX_BULK_CODES = 300
+
+
+def refresh_margin_analytics(since: date, until: Optional[date] = None) -> int:
+    """
+    since 以降（until まで）の申込日の分析値を計算し直す。
+
+    取込んだ週より後の週がある場合（過去分の再取得）は、その週の前週比・52週値も変わるため
+    since 以降をすべて計算し直す。
+
+    Returns:
+        更新した行数
+    """
+    qs = MarginData.objects.filter(record_date__gte=since)
+    if until:
+        qs = qs.filter(record_date__lte=until)
+    targets = sorted(set(qs.values_list('record_date', flat=True).order_by()))
+
+    updated = 0
+    for i in range(0, len(targets), CHUNK_WEEKS):
+        updated += _refresh_dates(targets[i:i + CHUNK_WEEKS])
+    return updated
+
+
+def _refresh_dates(targets: List[date]) -> int:
+    """連続した申込日 targets の分析値を計算して保存する"""
+    history = list(
+        MarginData.objects
+        .filter(record_date__lt=targets[0])
+        .values_list('record_date', flat=True)
+        .distinct()
+        .order_by('-record_date')[:WINDOW_WEEKS - 1]
+    )
+    dates = sorted(history) + targets
+    date_index = {d: i for i, d in enumerate(dates)}
+
+    rows = list(
+        MarginData.objects
+        .filter(record_date__gte=dates[0], record_date__lte=dates[-1])
+        .values_list('pk', 'record_date', 'stock_code', 'long_balance', 'short_balance', 'margin_ratio')
+        .order_by()
+    )
+    codes = sorted({row[2] for row in rows})
+    code_index = {c: j for j, c in enumerate(codes)}
+
+    shape = (len(dates), len(codes))
+    pks = np.full(shape, -1, dtype=np.int64)
+    longs = np.full(shape, np.nan)
+    shorts = np.full(shape, np.nan)
+    cents = np.full(shape, np.nan)  # 信用倍率×100（整数値）。前週比を丸め誤差なく出すため
+    for pk, record_date, code, long_balance, short_balance, ratio in rows:
+        i, j = date_index[record_date], code_index[code]
+        pks[i, j] = pk
+        longs[i, j] = long_balance
+        shorts[i, j] = short_balance
+        if ratio is not None:
+            cents[i, j] = int(ratio * 100)
+
+    ratios = cents / 100
+    objs = []
+    first_target = len(history)
+    for t in range(first_target, len(dates)):
+        present = np.flatnonzero(pks[t] >= 0)
+        if not present.size:
+            continue
+        stats = _window_stats(ratios[max(0, t - WINDOW_WEEKS + 1):t + 1], ratios[t])
+        if t > 0:
+            long_change = longs[t] - longs[t - 1]
+            short_change = shorts[t] - shorts[t - 1]
+            ratio_change = cents[t] - cents[t - 1]
+        else:
+            long_change = short_change = ratio_change = np.full(len(codes), np.nan)
+
+        for j in present:
+            objs.append(MarginData(
+                pk=int(pks[t, j]),
+                long_change=_int_or_none(long_change[j]),
+                short_change=_int_or_none(short_change[j]),
+                ratio_change=(
+                    None if np.isnan(ratio_change[j]) else Decimal(int(ratio_change[j])).scaleb(-2)
+                ),
+                ratio_zscore_52w=_round_or_none(stats['zscore'][j], 4),
+                ratio_percentile_52w=_round_or_none(stats['percentile'][j], 1),
+            ))
+
+    MarginData.objects.bulk_update(objs, ANALYTICS_FIELDS, batch_size=UPDATE_BATCH_SIZE)
+    logger.info(f"信用残高の分析値を更新: {targets[0]}〜{targets[-1]} {len(objs)}件")
+    return len(objs)
+
+
+def _window_stats(window: np.ndarray, current: np.ndarray) -> Dict[str, np.ndarray]:
+    """窓（週×銘柄）の倍率に対する当週の zスコア・パーセンタイル（銘柄ごと）"""
+    valid = ~np.isnan(window)
+    count = valid.sum(axis=0)
+    enough = (count >= MIN_HISTORY_WEEKS) & ~np.isnan(current)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, window, 0).sum(axis=0) / count
+        std = np.sqrt(np.where(valid, (window - mean) ** 2, 0).sum(axis=0) / count)
+        zscore = np.where(std > 0, (current - mean) / std, 0.0)
+        percentile = (valid & (window <= current)).sum(axis=0) / count * 100
+
+    return {
+        'zscore': np.where(enough, zscore, np.nan),
+        'percentile': np.where(enough, percentile, np.nan),
+    }
+
+
+def _int_or_none(value) -> Optional[int]:
+    return None if np.isnan(value) else int(value)
+
+
+def _round_or_none(value, digits: int) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+# ------------------------------------------------------------------
+# 読み出し
+# ------------------------------------------------------------------
+def normalize_code(code: str) -> str:
+    """4桁コードに正規化（5桁の場合は末尾を除く）"""
+    code = code.strip()
+    if len(code) == 5 and code.isdigit():
+        code = code[:4]
+    return code
+
+
+def latest_margin_ratios(codes: Iterable[str]) -> Dict[str, Optional[float]]:
+    """最新の申込日の信用倍率（指定銘柄だけを IN で引く）"""
+    codes = list({c for c in codes if c})
+    latest_date = MarginData.objects.aggregate(d=Max('record_date'))['d']
+    if not codes or not latest_date:
+        return {}
+    return {
+        code: float(ratio) if ratio is not None else None
+        for code, ratio in (
+            MarginData.objects
+            .filter(record_date=latest_date, stock_code__in=codes)
+            .values_list('stock_code', 'margin_ratio')
+        )
+    }
+
+
+def margin_series(codes: Iterable[str], weeks: int = 26) -> Dict:
+    """
+    複数銘柄の直近 weeks 申込日分の推移を列形式で返す。
+
+    Returns:
+        {
+            'dates': ['2026-01-09', ...],            # 古い順（全銘柄共通の軸）
+            'codes': ['7203', ...],                  # データのある銘柄（指定順）
+            'margin_ratio':  [[...], ...],           # codes × dates（ない週は None）
+            'long_balance':  [[...], ...],
+            'short_balance': [[...], ...],
+            'ratio_change':  [[...], ...],
+            'latest': {                              # 銘柄ごとの最新週（codes の順）
+                'date': [...], 'margin_ratio': [...], 'ratio_change': [...],
+                'ratio_zscore_52w': [...], 'ratio_percentile_52w': [...],
+            },
+        }
+    """
+    requested = list(dict.fromkeys(normalize_code(c) for c in codes if c.strip()))
+    dates = sorted(
+        MarginData.objects
+        .values_list('record_date', flat=True)
+        .distinct()
+        .order_by('-record_date')[:weeks]
+    )
+    result = {
+        'dates': [d.isoformat() for d in dates],
+        'codes': [],
+        'margin_ratio': [],
+        'long_balance': [],
+        'short_balance': [],
+        'ratio_change': [],
+        'latest': {
+            'date': [], 'margin_ratio': [], 'ratio_change': [],
+            'ratio_zscore_52w': [], 'ratio_percentile_52w': [],
+        },
+    }
+    if not requested or not dates:
+        return result
+
+    by_code: Dict[str, Dict[date, tuple]] = {}
+    for row in (
+        MarginData.objects
+        .filter(stock_code__in=requested, record_date__gte=dates[0])
+        .values_list('stock_code', 'record_date', 'margin_ratio', 'long_balance', 'short_balance',
+                     'ratio_change', 'ratio_zscore_52w', 'ratio_percentile_52w')
+        .order_by()
+    ):
+        by_code.setdefault(row[0], {})[row[1]] = row
+
+    def _float(value):
+        return float(value) if value is not None else None
+
+    for code in requested:
+        rows = by_code.get(code)
+        if not rows:
+            continue
+        aligned = [rows.get(d) for d in dates]
+        result['codes'].append(code)
+        result['margin_ratio'].append([_float(r[2]) if r else None for r in aligned])
+        result['long_balance'].append([r[3] if r else None for r in aligned])
+        result['short_balance'].append([r[4] if r else None for r in aligned])
+        result['ratio_change'].append([_float(r[5]) if r else None for r in aligned])
+
+        latest = rows[max(rows)]
+        result['latest']['date'].append(latest[1].isoformat())
+        result['latest']['margin_ratio'].append(_float(latest[2]))
+        result['latest']['ratio_change'].append(_float(latest[5]))
+        result['latest']['ratio_zscore_52w'].append(latest[6])
+        result['latest']['ratio_percentile_52w'].append(latest[7])
+
+    return result
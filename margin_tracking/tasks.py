@@ -1,14 +1,14 @@
 """
 信用倍率データの定期取得タスク（Django-Q）
 
-毎日早朝に過去40日分をチェックし、未取得分を取得する。
-JPXの公開日は木曜が多いが固定ではないため日次で総当たり確認する。
+毎日、過去40日分の申込日（週の最終営業日）のうち未取得の週だけを確認して取得する。
+404（未公開）は記憶して間隔を空けて再確認し、取得済みの週には問い合わせない
+（JPXMarginService.fetch_recent）。
 
 スケジュール登録: apps.py の ready() から setup_margin_fetch_schedule() を呼ぶ。
 """
 
 import logging
-from datetime import date, timedelta
 
 logger = logging.getLogger(__name__)
 
@@ -16,43 +16,23 @@ logger = logging.getLogger(__name__)
 def fetch_daily_margin_data():
     """
     過去40日分の信用倍率データを取得する Django-Q タスク。
-    毎日 07:30 JST に実行。未取得の日のみ取得（スキップ機能あり）。
+    未取得の週の申込日のみ確認する（定常状態では上流へのリクエストは1日1〜2回）。
     """
     from margin_tracking.services.jpx_margin_service import JPXMarginService
 
     logger.info("信用倍率データ取得タスク開始")
-    service = JPXMarginService()
-
-    today = date.today()
-    target_dates = [today - timedelta(days=i) for i in range(39, -1, -1)]  # 過去40日
-
-    success = fail = skipped = not_found = 0
-
-    for target_date in target_dates:
-        try:
-            result = service.fetch_and_save(target_date, force=False)
-            if result.get('skipped'):
-                skipped += 1
-            elif result.get('not_found'):
-                not_found += 1
-            elif result['success']:
-                success += 1
-                logger.info(
-                    f"取得完了: {target_date} "
-                    f"新規={result['created']} 更新={result['updated']}"
-                )
-            else:
-                fail += 1
-                logger.warning(f"取得失敗: {target_date} - {result.get('error')}")
-        except Exception as exc:
-            fail += 1
-            logger.error(f"タスクエラー ({target_date}): {exc}", exc_info=True)
+    try:
+        result = JPXMarginService().fetch_recent(days=40)
+    except Exception as exc:
+        logger.error(f"タスクエラー: {exc}", exc_info=True)
+        return {'success': 0, 'skipped': 0, 'not_found': 0, 'fail': 1, 'requests': 0}
 
     logger.info(
         f"信用倍率データ取得タスク完了: "
-        f"成功={success} スキップ={skipped} 未公開={not_found} 失敗={fail}"
+        f"成功={result['success']} スキップ={result['skipped']} "
+        f"未公開={result['not_found']} 失敗={result['fail']} リクエスト={result['requests']}"
     )
-    return {'success': success, 'skipped': skipped, 'not_found': not_found, 'fail': fail}
+    return result
 
 
 def setup_margin_fetch_schedule():
@@ -4,5 +4,6 @@ from . import views
 app_name = 'margin_tracking'
 
 urlpatterns = [
+    path('api/bulk/', views.margin_bulk_api, name='margin_bulk_api'),
     path('api/<str:stock_code>/', views.margin_data_api, name='margin_data_api'),
 ]
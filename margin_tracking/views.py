@@ -8,6 +8,15 @@ from django.views.decorators.http import require_GET
 from django.contrib.auth.decorators import login_required
 
 from .models import MarginData
+from .services.margin_analytics import MAX_BULK_CODES, margin_series, normalize_code
+
+
+def _weeks_param(request, default=26):
+    try:
+        weeks = int(request.GET.get('weeks', default))
+        return max(4, min(weeks, 104))  # 4〜104週の範囲に制限
+    except (ValueError, TypeError):
+        return default
 
 
 @login_required
@@ -20,16 +29,8 @@ def margin_data_api(request, stock_code):
     Query params:
       weeks: 取得週数（デフォルト: 26 = 約半年）
     """
-    try:
-        weeks = int(request.GET.get('weeks', 26))
-        weeks = max(4, min(weeks, 104))  # 4〜104週の範囲に制限
-    except (ValueError, TypeError):
-        weeks = 26
-
-    # 4桁コードに正規化（5桁の場合は末尾を除く）
-    code = stock_code.strip()
-    if len(code) == 5 and code.isdigit():
-        code = code[:4]
+    weeks = _weeks_param(request)
+    code = normalize_code(stock_code)
 
     records = (
         MarginData.objects
@@ -43,7 +44,8 @@ def margin_data_api(request, stock_code):
             'date': rec.record_date.strftime('%Y-%m-%d'),
             'short_balance': rec.short_balance,
             'long_balance': rec.long_balance,
-            'margin_ratio': round(rec.long_balance / rec.short_balance, 2) if rec.short_balance and rec.short_balance > 0 else None,
+            'margin_ratio': float(rec.margin_ratio) if rec.margin_ratio is not None else None,
+            'ratio_change': float(rec.ratio_change) if rec.ratio_change is not None else None,
         })
 
     return JsonResponse({
@@ -52,3 +54,27 @@ def margin_data_api(request, stock_code):
         'count': len(data),
         'data': data,
     })
+
+
+@login_required
+@require_GET
+def margin_bulk_api(request):
+    """
+    複数銘柄の信用倍率推移を列形式（日付軸を共有する配列）で返す。
+
+    GET /margin/api/bulk/?codes=7203,6758&weeks=26
+    Query params:
+      codes: カンマ区切りの銘柄コード（最大 MAX_BULK_CODES 件）
+      weeks: 取得週数（デフォルト: 26）
+
+    銘柄数に関わらずクエリは数回（申込日の軸 + IN での一括取得）。
+    形式は margin_analytics.margin_series を参照。
+    """
+    codes = [c for c in request.GET.get('codes', '').split(',') if c.strip()]
+    if not codes:
+        return JsonResponse({'error': 'codes を指定してください'}, status=400)
+    if len(codes) > MAX_BULK_CODES:
+        return JsonResponse({'error': f'codes は{MAX_BULK_CODES}件までです'}, status=400)
+
+    weeks = _weeks_param(request)
+    return JsonResponse({'weeks': weeks, **margin_series(codes, weeks)})
@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.db.models import Count
-from .models import StockDiary, Transaction, StockSplit, DiaryNote, PushSubscription, DiaryNotification, NotificationLog
+from .models import StockDiary, Transaction, StockSplit, DiaryNote, PushSubscription, DiaryNotification, NotificationLog, StockQuote
 from django.contrib import messages
 
 class TransactionInline(admin.TabularInline):
@@ -860,4 +860,11 @@ class NotificationLogAdmin(admin.ModelAdmin):
             f'{count}件の古いログを削除しました。',
             messages.SUCCESS
         )
-    delete_old_logs.short_description = '30日以上前のログを削除'
\ No newline at end of file
+    delete_old_logs.short_description = '30日以上前のログを削除'
+
+@admin.register(StockQuote)
+class StockQuoteAdmin(admin.ModelAdmin):
+    """株価キャッシュ（時価評価の入力）の確認用"""
+    list_display = ['symbol', 'price', 'previous_close', 'currency', 'fetched_at']
+    search_fields = ['symbol']
+    ordering = ['-fetched_at']
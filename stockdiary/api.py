@@ -217,7 +217,18 @@ def get_stock_price(request, stock_code):
             
             # 現在価格を取得
             price = meta.get('regularMarketPrice', 0)
-            
+
+            # 取得した株価は株価キャッシュへ流し、時価評価（ValuationService）で再利用する
+            try:
+                from .services.quote_service import QuoteService
+                QuoteService.store(
+                    stock_code, price,
+                    previous_close=meta.get('chartPreviousClose'),
+                    currency=meta.get('currency'),
+                )
+            except Exception as e:
+                logger.warning("株価キャッシュの保存に失敗 (%s): %s", stock_code, e)
+
             return JsonResponse({
                 'success': True,
                 'price': price,
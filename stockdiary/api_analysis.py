@@ -114,7 +114,15 @@ def _fetch_margin_data(symbol: str, weeks: int = 8) -> dict | None:
     latest = rows[0]
     history = [_row(m) for m in reversed(rows)]  # 古い→新しい
     return {
-        'latest': _row(latest),
+        # 前週比・52週zスコア/パーセンタイルは取込時に計算済み（履歴が足りない週は None）
+        'latest': {
+            **_row(latest),
+            'long_change': latest.long_change,
+            'short_change': latest.short_change,
+            'ratio_change': float(latest.ratio_change) if latest.ratio_change is not None else None,
+            'ratio_zscore_52w': latest.ratio_zscore_52w,
+            'ratio_percentile_52w': latest.ratio_percentile_52w,
+        },
         'history': history,  # 直近 weeks 週（古い順）
         'note': '信用倍率 = 買い残 / 売り残。1倍未満は売り長（取組良好）、'
                 '高倍率・買い残増は将来の戻り売り圧力（上値の重し）の目安。',
@@ -169,23 +177,59 @@ def _fetch_yfinance_news(stock_symbol: str, limit: int = 10) -> list[dict]:
 @_require_analysis_key
 def holdings(request):
     """
-    現在保有中の銘柄一覧。
+    現在保有中の銘柄一覧（株価キャッシュによる時価評価付き）。
 
     GET /api/analysis/holdings/
     Authorization: Bearer <key>
+
+    時価は StockQuote（株価キャッシュ）から1クエリで引く（外部APIは叩かない）。
+    キャッシュに無い銘柄は取得原価で評価し priced=false を返す。
+    weight（構成比 %）はユーザー×通貨ごと、sectors は通貨×業種ごとの集計。
     """
+    from .services.valuation_service import ValuationService
+
     diaries = (
         StockDiary.objects
         .filter(user__isnull=False, current_quantity__gt=0)
         .order_by('-first_purchase_date')
         .values(
-            'id', 'stock_symbol', 'stock_name', 'sector',
+            'id', 'stock_symbol', 'stock_name', 'sector', 'currency',
             'current_quantity', 'average_purchase_price',
             'realized_profit', 'first_purchase_date',
             'user__username',
         )
     )
     rows = list(diaries)
+    valuation = ValuationService.value_positions([
+        {
+            'id': d['id'],
+            'symbol': d['stock_symbol'],
+            'sector': d['sector'],
+            'currency': d['currency'],
+            'group': d['user__username'],
+            'quantity': d['current_quantity'],
+            'avg_cost': d['average_purchase_price'],
+        }
+        for d in rows if d['average_purchase_price']
+    ])
+    positions = valuation['positions']
+
+    def _valuation_fields(diary_id):
+        v = positions.get(diary_id)
+        if not v:
+            return {
+                'price': None, 'market_value': None, 'unrealized_pnl': None,
+                'unrealized_pnl_pct': None, 'weight': None, 'day_change': None,
+                'day_change_pct': None, 'priced': False, 'quoted_at': None,
+            }
+        return {
+            **{k: v[k] for k in (
+                'price', 'market_value', 'unrealized_pnl', 'unrealized_pnl_pct',
+                'weight', 'day_change', 'day_change_pct', 'priced',
+            )},
+            'quoted_at': v['quoted_at'].isoformat() if v['quoted_at'] else None,
+        }
+
     return JsonResponse({
         'count': len(rows),
         'holdings': [
@@ -194,14 +238,21 @@ def holdings(request):
                 'symbol': d['stock_symbol'],
                 'name': d['stock_name'],
                 'sector': d['sector'],
+                'currency': d['currency'],
                 'quantity': float(d['current_quantity']),
                 'avg_cost': float(d['average_purchase_price']) if d['average_purchase_price'] else None,
                 'realized_profit': float(d['realized_profit']),
                 'since': d['first_purchase_date'].isoformat() if d['first_purchase_date'] else None,
                 'user': d['user__username'],
+                **_valuation_fields(d['id']),
             }
             for d in rows
         ],
+        'sectors': valuation['sectors'],
+        'totals': {
+            currency: {**t, 'as_of': t['as_of'].isoformat() if t['as_of'] else None}
+            for currency, t in valuation['totals'].items()
+        },
     })
 
 
@@ -379,22 +430,17 @@ def list_diaries(request):
     if want_tags:
         qs = qs.filter(tags__name__in=want_tags).distinct()
 
-    # 最新週の信用倍率をまとめて引く（JPX週次は全銘柄同一 record_date のため1クエリ）
-    margin_map = {}
+    rows = list(qs.order_by('stock_symbol'))
+
+    # 最新週の信用倍率は一覧の銘柄だけを引く（JPX週次は全銘柄同一 record_date）
     try:
-        from django.db.models import Max
-        from margin_tracking.models import MarginData
-        latest_date = MarginData.objects.aggregate(d=Max('record_date'))['d']
-        if latest_date:
-            margin_map = {
-                m.stock_code: float(m.margin_ratio) if m.margin_ratio is not None else None
-                for m in MarginData.objects.filter(record_date=latest_date)
-            }
+        from margin_tracking.services.margin_analytics import latest_margin_ratios
+        margin_map = latest_margin_ratios(d.stock_symbol for d in rows)
     except Exception:
         margin_map = {}
 
     diaries = []
-    for d in qs.order_by('stock_symbol'):
+    for d in rows:
         diaries.append({
             'symbol': d.stock_symbol,
             'name': d.stock_name,
@@ -0,0 +1,25 @@
+# stockdiary/management/commands/refresh_quotes.py
+from django.core.management.base import BaseCommand
+
+from stockdiary.services.quote_service import QuoteService
+
+
+class Command(BaseCommand):
+    help = '保有銘柄の株価キャッシュ（StockQuote）を yfinance から一括更新する'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--symbols',
+            type=str,
+            default='',
+            help='更新する銘柄コード（カンマ区切り）。省略時は保有中の全銘柄',
+        )
+
+    def handle(self, *args, **options):
+        symbols = [s.strip() for s in options['symbols'].split(',') if s.strip()] or None
+        result = QuoteService.refresh(symbols)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"株価キャッシュ更新: {result['stored']}/{result['requested']} 銘柄"
+            )
+        )
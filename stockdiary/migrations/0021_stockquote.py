@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-19 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stockdiary', '0020_earnings_calendar_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockQuote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=50, unique=True, verbose_name='銘柄コード')),
+                ('price', models.DecimalField(decimal_places=4, max_digits=14, verbose_name='現在値')),
+                ('previous_close', models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True, verbose_name='前日終値')),
+                ('currency', models.CharField(default='JPY', max_length=3, verbose_name='通貨')),
+                ('fetched_at', models.DateTimeField(db_index=True, verbose_name='取得日時')),
+            ],
+            options={
+                'verbose_name': '株価キャッシュ',
+                'verbose_name_plural': '株価キャッシュ',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-19 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stockdiary', '0021_stockquote'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockdiary',
+            index=models.Index(fields=['updated_at'], name='stockdiary__updated_1a56f4_idx'),
+        ),
+    ]
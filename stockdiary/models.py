@@ -121,6 +121,7 @@ class StockDiary(models.Model):
             models.Index(fields=['user', 'current_quantity']),
             models.Index(fields=['user', '-updated_at']),
             models.Index(fields=['user', 'is_excluded']),
+            models.Index(fields=['updated_at']),  # 開示インジケーターの差分同期
         ]
         verbose_name = '株式日記'
         verbose_name_plural = '株式日記'
@@ -829,3 +830,25 @@ class ReasonVersion(models.Model):
             return None
 
         return cls.objects.create(diary=diary, content=previous_content or '')
+
+
+class StockQuote(models.Model):
+    """銘柄ごとの直近株価キャッシュ（時価評価の入力）。
+
+    一覧・ダッシュボード・分析APIは表示のたびに外部APIを叩かず、このテーブルを
+    銘柄コードで1クエリ join して時価評価する（ValuationService）。
+    値の更新は QuoteService.refresh（refresh_quotes コマンド / 株価取得API）が担う。
+    """
+    symbol = models.CharField('銘柄コード', max_length=50, unique=True)
+    price = models.DecimalField('現在値', max_digits=14, decimal_places=4)
+    previous_close = models.DecimalField('前日終値', max_digits=14, decimal_places=4,
+                                         null=True, blank=True)
+    currency = models.CharField('通貨', max_length=3, default='JPY')
+    fetched_at = models.DateTimeField('取得日時', db_index=True)
+
+    class Meta:
+        verbose_name = '株価キャッシュ'
+        verbose_name_plural = '株価キャッシュ'
+
+    def __str__(self):
+        return f'{self.symbol} {self.price} ({self.fetched_at:%Y-%m-%d %H:%M})'
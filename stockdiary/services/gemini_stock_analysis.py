@@ -1,13 +1,14 @@
 """
 Gemini APIを使った複数銘柄の投資比較分析サービス
 """
-from google import genai
 import logging
 import json
 import re
 from django.conf import settings
 from typing import Dict, List, Any, Optional
 
+from earnings_analysis.services.llm_gateway import get_llm_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,7 +28,7 @@ class GeminiStockAnalyzer:
             return
 
         try:
-            self.client = genai.Client(api_key=api_key)
+            self.client = get_llm_client(api_key)
             self.model = "gemini-2.5-flash-lite"
             logger.info("GeminiStockAnalyzer: API初期化完了")
         except Exception as e:
@@ -67,6 +68,8 @@ class GeminiStockAnalyzer:
                 if parsed.get('api_success'):
                     logger.info("Gemini API分析完了")
                     return parsed
+            # 解釈できなかった応答はキャッシュから消し、再比較で取り直す
+            self.client.gateway.invalidate(self.model, prompt)
         except Exception as e:
             logger.error(f"Gemini API呼び出しエラー: {e}")
 
@@ -1,10 +1,23 @@
 # stockdiary/services/notification_service.py
-from django.utils import timezone
-from datetime import timedelta
+"""
+通知送信サービス（リマインダー・Thesis 期日・月次レビュー）
+
+各ジョブは対象を1〜2クエリで集めてから、BATCH_SIZE 件ごとに
+NotificationLog の bulk_create（リマインダーは消化済みの UPDATE も同じトランザクション）と、
+Push 購読のあるユーザー分の PushDispatcher への受け渡しを行う。
+ジョブの所要時間はユーザー数ごとのクエリではなく送る通知の件数で決まる。
+"""
+import calendar
 import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
 
-from ..models import DiaryNotification, NotificationLog
-from ..api_views import send_push_notification
+from ..models import DiaryNotification, NotificationLog, PushSubscription, Thesis
+from .push_dispatcher import PushDispatcher, PushMessage
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +29,12 @@ THESIS_NOTIFICATION_COOLDOWN_DAYS = 7
 THESIS_GRACE_DAYS = 14
 
 
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
 class NotificationService:
     """通知送信サービス（リマインダー・Thesis 期日・月次レビュー）"""
 
@@ -43,16 +62,11 @@ class NotificationService:
             'total_errors': total_errors,
             'details': results
         }
-    
+
     @classmethod
     def process_reminder_notifications(cls):
-        """リマインダー通知を処理"""
+        """リマインダー通知を処理（送ったリマインダーは1回の UPDATE で無効化する）"""
         now = timezone.now()
-        sent = 0
-        errors = 0
-        error_details = []
-        
-        logger.info(f"リマインダー通知処理開始: {now}")
 
         # 期限が過ぎた未送信の有効リマインダーを取得。
         # qcluster が一時停止しても復帰後に確実に拾えるよう下限 window は設けない。
@@ -62,131 +76,32 @@ class NotificationService:
             last_sent__isnull=True,
             remind_at__lte=now,
             remind_at__gt=now - timedelta(days=cls.REMINDER_GRACE_DAYS)
-        ).select_related('diary', 'diary__user')
-        
-        logger.info(f"対象リマインダー数: {reminders.count()}")
-        
-        for reminder in reminders:
-            try:
-                logger.info(f"リマインダー処理中: ID={reminder.id}, "
-                        f"銘柄={reminder.diary.stock_name}, "
-                        f"ユーザー={reminder.diary.user.username}")
-                
-                # 過去24時間以内に送信済みかチェック
-                if cls._is_recently_sent(reminder):
-                    logger.info(f"  → スキップ: 最近送信済み (last_sent={reminder.last_sent})")
-                    continue
-                
-                # 通知送信
-                success = cls._send_notification(
-                    user=reminder.diary.user,
-                    title=f"📌 {reminder.diary.stock_name} のリマインダー",
-                    message=reminder.message or f"{reminder.diary.stock_name}を確認しましょう",
-                    url=f"/stockdiary/{reminder.diary.id}/",
-                    notification=reminder
-                )
-                
-                if success:
-                    sent += 1
-                    logger.info(f"  → 送信成功")
-                    # リマインダーは1回のみなので無効化
-                    reminder.is_active = False
-                    reminder.last_sent = now
-                    reminder.save()
-                else:
-                    errors += 1
-                    error_msg = f"送信失敗: ID={reminder.id}"
-                    logger.error(f"  → {error_msg}")
-                    error_details.append(error_msg)
-                    
-            except Exception as e:
-                error_msg = f"リマインダー送信エラー (ID={reminder.id}): {str(e)}"
-                logger.error(error_msg, exc_info=True)
-                error_details.append(error_msg)
-                errors += 1
-        
-        result = {
-            'sent': sent, 
-            'errors': errors,
-            'error_details': error_details
-        }
-        
-        logger.info(f"リマインダー通知処理完了: {result}")
-        
-        return result
-    
-    @classmethod
-    def _is_recently_sent(cls, notification, hours=24):
-        """最近送信済みかチェック"""
-        if not notification.last_sent:
-            return False
-        
-        time_diff = timezone.now() - notification.last_sent
-        return time_diff < timedelta(hours=hours)
-    
-    @classmethod
-    def _send_notification(cls, user, title, message, url, notification):
-        """プッシュ通知を送信"""
-        try:
-            logger.info(f"  通知送信開始: ユーザー={user.username}, タイトル={title}")
-            
-            # NotificationLog を記録
-            notification_log = NotificationLog.objects.create(
-                notification=notification,
-                user=user,
-                title=title,
-                message=message,
-                url=url,
-                is_read=False
-            )
-            logger.info(f"    ✓ NotificationLog記録完了 (ID: {notification_log.id})")
-            
-            # プッシュサブスクリプションをチェック
-            from stockdiary.models import PushSubscription
-            subscriptions = PushSubscription.objects.filter(
-                user=user,
-                is_active=True
-            )
-            
-            logger.info(f"    プッシュサブスクリプション数: {subscriptions.count()}")
-            
-            if not subscriptions.exists():
-                logger.warning(
-                    f"    ⚠️ プッシュサブスクリプションなし: user={user.username} "
-                    f"（アプリ内通知ログのみ記録済み・端末プッシュは未配信）"
-                )
-                # アプリ内通知は記録済みなので成功扱い（リマインダーは消化する）
-                return True
-
-            # プッシュ通知送信
-            from stockdiary.api_views import send_push_notification
-
-            success_count = send_push_notification(
-                user=user,
-                title=title,
-                message=message,
-                url=url,
-                tag=f'notification-{notification.id}',
-                notification_id=notification_log.id
+        ).values_list('id', 'message', 'diary_id', 'diary__stock_name', 'diary__user_id')
+
+        entries = (
+            (
+                NotificationLog(
+                    notification_id=reminder_id,
+                    user_id=user_id,
+                    title=f"📌 {stock_name} のリマインダー",
+                    message=message or f"{stock_name}を確認しましょう",
+                    url=f"/stockdiary/{diary_id}/",
+                    is_read=False,
+                ),
+                f'notification-{reminder_id}',
             )
+            for reminder_id, message, diary_id, stock_name, user_id in reminders
+        )
 
-            logger.info(f"    プッシュ通知送信結果: {success_count}デバイス")
-
-            if success_count > 0:
-                logger.info(f"  ✅ プッシュ通知送信成功")
-                return True
-            else:
-                # 購読はあるのに 0 件成功 = 配信失敗。原因特定のため WARNING で明示。
-                # （詳細な失敗理由は send_push_notification 側でログ済み）
-                logger.warning(
-                    f"  ⚠️ プッシュ通知が1件も配信できなかった: user={user.username} "
-                    f"（購読 {subscriptions.count()} 件・アプリ内ログは記録済み）"
-                )
-                return True
-            
-        except Exception as e:
-            logger.error(f"  ❌ 通知送信エラー: {str(e)}", exc_info=True)
-            return False
+        def mark_sent(logs):
+            # リマインダーは1回のみなので無効化
+            DiaryNotification.objects.filter(
+                pk__in=[log.notification_id for log in logs]
+            ).update(is_active=False, last_sent=now, updated_at=now)
+
+        result = cls._deliver(entries, 'リマインダー', on_saved=mark_sent)
+        logger.info(f"リマインダー通知処理完了: {result}")
+        return result
 
     @classmethod
     def process_thesis_due_notifications(cls):
@@ -197,79 +112,49 @@ class NotificationService:
         （ユーザーが検証を後回しにしても毎日飛んでうるさくならないように）。
         THESIS_GRACE_DAYS 以上前に期日を過ぎた仮説は通知しない（長期停止復帰後の一斉送信防止）。
         """
-        from ..models import Thesis, NotificationLog
-        from ..api_views import send_push_notification as _send_push
-
         today = timezone.localdate()
         now = timezone.now()
-        sent = 0
-        errors = 0
-        error_details = []
 
-        due_theses = Thesis.objects.filter(
+        due_theses = list(Thesis.objects.filter(
             status=Thesis.STATUS_OPEN,
             review_due_date__isnull=False,
             review_due_date__lte=today,
             review_due_date__gte=today - timedelta(days=THESIS_GRACE_DAYS),
-        ).select_related('diary', 'diary__user')
-
-        logger.info(f"検証期日到来仮説数: {due_theses.count()}")
-
-        for thesis in due_theses:
-            try:
-                user = thesis.diary.user
-                # thesis_verify URL に直リンク（ワンタップで検証フォームへ）
-                url = f'/stockdiary/{thesis.diary_id}/thesis/{thesis.id}/verify/'
-
-                # COOLDOWN_DAYS 以内に同じ Thesis の通知を送済みならスキップ。
-                # DiaryNotification FK は null 可（disclosure 通知と同パターン）。
-                already_sent = NotificationLog.objects.filter(
-                    user=user,
-                    url=url,
-                    sent_at__gte=now - timedelta(days=THESIS_NOTIFICATION_COOLDOWN_DAYS),
-                ).exists()
-                if already_sent:
-                    continue
-
-                title = f'📊 {thesis.diary.stock_name} の仮説を検証しましょう'
-                message = thesis.claim[:100]
-
-                # アプリ内通知ログを記録（notification FK は null = リマインダー以外の通知）
-                log = NotificationLog.objects.create(
-                    user=user,
-                    title=title,
-                    message=message,
-                    url=url,
+        ).values_list('id', 'diary_id', 'claim', 'diary__stock_name', 'diary__user_id'))
+
+        logger.info(f"検証期日到来仮説数: {len(due_theses)}")
+
+        def verify_url(thesis_id, diary_id):
+            # thesis_verify URL に直リンク（ワンタップで検証フォームへ）
+            return f'/stockdiary/{diary_id}/thesis/{thesis_id}/verify/'
+
+        # COOLDOWN_DAYS 以内に同じ Thesis の通知を送済みならスキップ（1クエリでまとめて判定）。
+        # DiaryNotification FK は null 可（disclosure 通知と同パターン）。
+        already_sent = set()
+        for chunk in _chunks(due_theses, 500):
+            already_sent.update(NotificationLog.objects.filter(
+                user_id__in={row[4] for row in chunk},
+                url__in=[verify_url(row[0], row[1]) for row in chunk],
+                sent_at__gte=now - timedelta(days=THESIS_NOTIFICATION_COOLDOWN_DAYS),
+            ).values_list('user_id', 'url'))
+
+        entries = [
+            (
+                # アプリ内通知ログ（notification FK は null = リマインダー以外の通知）
+                NotificationLog(
+                    user_id=user_id,
+                    title=f'📊 {stock_name} の仮説を検証しましょう',
+                    message=claim[:100],
+                    url=verify_url(thesis_id, diary_id),
                     is_read=False,
-                )
-
-                # Push 送信（購読がなければアプリ内ログのみで完了）
-                from stockdiary.models import PushSubscription
-                if PushSubscription.objects.filter(user=user, is_active=True).exists():
-                    _send_push(
-                        user=user,
-                        title=title,
-                        message=message,
-                        url=url,
-                        tag=f'thesis-due-{thesis.id}',
-                        notification_id=log.id,
-                    )
-                    logger.info(f'✅ Thesis Push 送信: thesis_id={thesis.id}, user={user.username}')
-                else:
-                    logger.info(
-                        f'✅ Thesis アプリ内通知記録（Push 購読なし）: '
-                        f'thesis_id={thesis.id}, user={user.username}'
-                    )
-
-                sent += 1
-
-            except Exception as e:
-                error_msg = f'Thesis {thesis.id} 通知エラー: {str(e)}'
-                logger.error(error_msg, exc_info=True)
-                errors += 1
-                error_details.append(error_msg)
+                ),
+                f'thesis-due-{thesis_id}',
+            )
+            for thesis_id, diary_id, claim, stock_name, user_id in due_theses
+            if (user_id, verify_url(thesis_id, diary_id)) not in already_sent
+        ]
 
-        result = {'sent': sent, 'errors': errors, 'error_details': error_details}
+        result = cls._deliver(entries, 'Thesis 期日通知')
         logger.info(f'Thesis 期日通知完了: {result}')
         return result
 
@@ -282,92 +167,103 @@ class NotificationService:
         1通送る。デイリー通知（process_thesis_due_notifications）が「個別の催促」なのに対し、
         こちらは「今月の全体観」を提供する月1の通知。
 
-        0件のユーザーには送らない。
+        ユーザーごとの件数は1回の集計クエリで出す。0件のユーザーには送らない。
         """
-        import calendar
-        from django.contrib.auth import get_user_model
-        from ..models import Thesis, NotificationLog
-
-        User = get_user_model()
         today = timezone.localdate()
         # 当月末日を計算
         last_day = calendar.monthrange(today.year, today.month)[1]
         month_end = today.replace(day=last_day)
 
-        sent = 0
-        errors = 0
-        error_details = []
-
-        # Thesis が1件以上ある全ユーザーを対象にする
-        user_ids = Thesis.objects.filter(
-            status=Thesis.STATUS_OPEN,
-        ).values_list('diary__user_id', flat=True).distinct()
-
-        logger.info(f'月次レビュー通知: 対象ユーザー数={len(list(user_ids))}')
+        # 当月末までに期日が来る仮説（超過分も含む）と、うち期日超過（今日より前）の件数
+        counts = list(
+            Thesis.objects.filter(
+                status=Thesis.STATUS_OPEN,
+                review_due_date__isnull=False,
+                review_due_date__lte=month_end,
+            )
+            .values('diary__user_id')
+            .annotate(
+                due_by_month_end=Count('id'),
+                overdue=Count('id', filter=Q(review_due_date__lt=today)),
+            )
+            .order_by('diary__user_id')
+        )
 
-        for user in User.objects.filter(pk__in=user_ids):
-            try:
-                open_theses = Thesis.objects.filter(
-                    diary__user=user,
-                    status=Thesis.STATUS_OPEN,
-                )
-                # 当月末までに期日が来る仮説（超過分も含む）
-                due_by_month_end = open_theses.filter(
-                    review_due_date__lte=month_end,
-                    review_due_date__isnull=False,
-                ).count()
-                # うち期日超過（今日より前）
-                overdue = open_theses.filter(
-                    review_due_date__lt=today,
-                    review_due_date__isnull=False,
-                ).count()
-
-                if due_by_month_end == 0:
-                    continue
-
-                # メッセージ組み立て
-                if overdue > 0:
-                    message = (
-                        f'今月{due_by_month_end}件の仮説が答え合わせ時期です'
-                        f'（うち{overdue}件は期日超過）'
-                    )
-                else:
-                    message = f'今月{due_by_month_end}件の仮説が答え合わせ時期です'
-
-                title = '📅 今月の仮説レビュー'
-                url = '/stockdiary/karte/'
-
-                log = NotificationLog.objects.create(
-                    user=user,
-                    title=title,
+        logger.info(f'月次レビュー通知: 対象ユーザー数={len(counts)}')
+
+        entries = []
+        for row in counts:
+            message = f'今月{row["due_by_month_end"]}件の仮説が答え合わせ時期です'
+            if row['overdue'] > 0:
+                message += f'（うち{row["overdue"]}件は期日超過）'
+            entries.append((
+                NotificationLog(
+                    user_id=row['diary__user_id'],
+                    title='📅 今月の仮説レビュー',
                     message=message,
-                    url=url,
+                    url='/stockdiary/karte/',
                     is_read=False,
-                )
+                ),
+                'monthly-thesis-review',
+            ))
 
-                from stockdiary.models import PushSubscription
-                if PushSubscription.objects.filter(user=user, is_active=True).exists():
-                    from stockdiary.api_views import send_push_notification as _push
-                    _push(
-                        user=user,
-                        title=title,
-                        message=message,
-                        url=url,
-                        tag='monthly-thesis-review',
-                        notification_id=log.id,
-                    )
-                    logger.info(f'✅ 月次レビュー Push 送信: user={user.username}')
-                else:
-                    logger.info(f'✅ 月次レビュー アプリ内通知（Push 購読なし）: user={user.username}')
-
-                sent += 1
+        result = cls._deliver(entries, '月次レビュー通知')
+        logger.info(f'月次レビュー通知完了: {result}')
+        return result
+
+    @classmethod
+    def _deliver(cls, entries, label, on_saved=None):
+        """
+        (NotificationLog, Push の tag) を BATCH_SIZE 件ごとに記録して Push する。
+
+        NotificationLog は bulk_create で書き、on_saved（リマインダーの消化など）も同じ
+        トランザクションで呼ぶ。Push は有効な購読があるユーザーの分だけ PushDispatcher に
+        まとめて渡す（購読がなければアプリ内ログのみで完了）。
+
+        Returns:
+            dict: sent（記録した通知数）, pushed（配信できた端末数）, errors, error_details
+        """
+        result = {'sent': 0, 'pushed': 0, 'errors': 0, 'error_details': []}
+        dispatcher = PushDispatcher()
 
+        for chunk in _chunks(entries, dispatcher.batch_size):
+            logs = [log for log, _ in chunk]
+            try:
+                with transaction.atomic():
+                    NotificationLog.objects.bulk_create(logs)
+                    if on_saved:
+                        on_saved(logs)
             except Exception as e:
-                error_msg = f'月次レビュー通知エラー (user={user.pk}): {str(e)}'
+                error_msg = f'{label}の記録エラー ({len(logs)}件): {str(e)}'
                 logger.error(error_msg, exc_info=True)
-                errors += 1
-                error_details.append(error_msg)
+                result['errors'] += len(logs)
+                result['error_details'].append(error_msg)
+                continue
+            result['sent'] += len(logs)
+
+            subscribed = set(PushSubscription.objects.filter(
+                user_id__in={log.user_id for log in logs}, is_active=True,
+            ).values_list('user_id', flat=True))
+            messages = [
+                PushMessage(
+                    user_id=log.user_id,
+                    title=log.title,
+                    message=log.message,
+                    url=log.url,
+                    tag=tag,
+                    notification_id=log.id,
+                )
+                for log, tag in chunk
+                if log.user_id in subscribed
+            ]
+            if not messages:
+                continue
+            try:
+                result['pushed'] += dispatcher.send(messages).sent
+            except Exception as e:
+                # アプリ内通知は記録済みなので送信数には含める（詳細は PushDispatcher 側でもログ）
+                error_msg = f'{label}の Push 送信エラー ({len(messages)}件): {str(e)}'
+                logger.error(error_msg, exc_info=True)
+                result['error_details'].append(error_msg)
 
-        result = {'sent': sent, 'errors': errors, 'error_details': error_details}
-        logger.info(f'月次レビュー通知完了: {result}')
-        return result
\ No newline at end of file
+        return result
@@ -0,0 +1,267 @@
+"""
+Web Push の並列送信。
+
+send_push_notification は購読ごとに pywebpush.webpush を直列に呼び（1件ごとにプッシュサービスへの
+HTTPS リクエストと VAPID 鍵の読み込み）、成功・失効のたびに subscription.save() していた。
+月次レビューや Thesis 期日の通知では購読が数千件あると数分かかっていた。
+
+PushDispatcher は複数ユーザー宛てのメッセージをまとめて受け取り、
+
+- 宛先の購読を1クエリで読み、送信は上限付きのスレッドプールで並列に行う
+- プッシュサービスのホスト（fcm.googleapis.com など）ごとに requests.Session を使い回し、
+  接続（TLS ハンドシェイク）を再利用する。VAPID 鍵の読み込みは1回だけ
+- BATCH_SIZE 件ごとに、成功した購読の last_used 更新と 404/410 の購読の無効化を
+  それぞれ1回の UPDATE で行う
+- 1回の送信の配信待ち時間（p50/p95/p99/max）を PushRunResult に集計してログに出す
+
+DB へのアクセスは呼び出し元のスレッドだけで行う（ワーカースレッドは HTTP のみ）。
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from pywebpush import WebPushException, webpush
+
+from ..models import PushSubscription
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PUSH_DISPATCH_SETTINGS = {
+    # 同時に送信する数（プッシュサービスへの同時接続数の上限）
+    'WORKERS': 16,
+    # 1件の送信のタイムアウト（秒）
+    'TIMEOUT_SECONDS': 10,
+    # last_used 更新・失効購読の無効化をまとめる件数
+    'BATCH_SIZE': 500,
+}
+
+# 購読が失効している（端末側で解除・期限切れ）ことを示すステータス
+EXPIRED_STATUSES = (404, 410)
+
+
+def dispatch_settings() -> dict:
+    conf = getattr(settings, 'WEBPUSH_SETTINGS', {}).get('DISPATCH', {})
+    return {**DEFAULT_PUSH_DISPATCH_SETTINGS, **conf}
+
+
+@dataclass
+class PushMessage:
+    """1ユーザー宛ての通知（ユーザーの有効な購読すべてに送る）"""
+    user_id: int
+    title: str
+    message: str
+    url: str = '/'
+    tag: str = 'notification'
+    notification_id: Optional[int] = None
+
+    def payload(self) -> str:
+        return json.dumps({
+            'title': self.title,
+            'message': self.message,
+            'url': self.url,
+            'tag': self.tag,
+            'notification_id': self.notification_id,
+            'icon': '/static/images/icon-192.svg',
+            'badge': '/static/images/badge-72.png',
+        })
+
+
+@dataclass
+class PushRunResult:
+    """1回の送信の結果"""
+    sent: int = 0
+    failed: int = 0
+    expired: int = 0
+    # ユーザーID → 配信できた購読数
+    sent_by_user: Dict[int, int] = field(default_factory=dict)
+    latencies: List[float] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    def latency_percentiles(self) -> Dict[str, float]:
+        """配信待ち時間（ミリ秒）の p50/p95/p99/max"""
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return {}
+
+        def at(q):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 1)
+
+        return {'p50_ms': at(0.50), 'p95_ms': at(0.95), 'p99_ms': at(0.99), 'max_ms': round(ordered[-1] * 1000, 1)}
+
+    def summary(self) -> dict:
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'expired': self.expired,
+            'elapsed_seconds': round(self.elapsed_seconds, 2),
+            **self.latency_percentiles(),
+        }
+
+
+@dataclass
+class _Delivery:
+    subscription_id: int
+    user_id: int
+    ok: bool = False
+    expired: bool = False
+    latency: float = 0.0
+
+
+class PushDispatcher:
+    """複数ユーザー宛ての Web Push を並列に送る"""
+
+    def __init__(self, workers: int = None, timeout: float = None, batch_size: int = None):
+        conf = dispatch_settings()
+        self.workers = max(1, int(workers or conf['WORKERS']))
+        self.timeout = float(timeout or conf['TIMEOUT_SECONDS'])
+        self.batch_size = max(1, int(batch_size or conf['BATCH_SIZE']))
+        self._sessions: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+
+    def send(self, messages: Iterable[PushMessage]) -> PushRunResult:
+        started = time.monotonic()
+        result = PushRunResult()
+        messages = list(messages)
+        if not messages:
+            return result
+
+        vapid_private_key = settings.WEBPUSH_SETTINGS.get('VAPID_PRIVATE_KEY')
+        if not vapid_private_key:
+            # VAPID 鍵が未設定なら明示的にログを残す（無言の未配信を防ぐ）
+            logger.error(
+                "PushDispatcher: VAPID_PRIVATE_KEY が未設定のため送信できません (宛先 %d ユーザー)",
+                len({m.user_id for m in messages}),
+            )
+            return result
+        vapid = self._load_vapid(vapid_private_key)
+        vapid_sub = f'mailto:{settings.WEBPUSH_SETTINGS.get("VAPID_ADMIN_EMAIL")}'
+
+        jobs = self._jobs(messages)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for start in range(0, len(jobs), self.batch_size):
+                    batch = jobs[start:start + self.batch_size]
+                    deliveries = list(pool.map(
+                        lambda job: self._deliver(job[0], job[1], job[2], vapid, vapid_sub), batch
+                    ))
+                    self._record(deliveries, result)
+        finally:
+            self._close_sessions()
+
+        result.elapsed_seconds = time.monotonic() - started
+        log = logger.warning if result.failed else logger.info
+        log("PushDispatcher: 送信結果 %s", result.summary())
+        return result
+
+    def _jobs(self, messages: List[PushMessage]) -> list:
+        """(購読, ペイロード, メッセージ) のリスト（宛先の購読は1クエリで読む）"""
+        subscriptions: Dict[int, list] = {}
+        for sub in PushSubscription.objects.filter(
+            user_id__in={m.user_id for m in messages}, is_active=True
+        ).only('id', 'user_id', 'endpoint', 'p256dh', 'auth'):
+            subscriptions.setdefault(sub.user_id, []).append(sub)
+        return [
+            (sub, message.payload(), message)
+            for message in messages
+            for sub in subscriptions.get(message.user_id, [])
+        ]
+
+    @staticmethod
+    def _load_vapid(private_key: str):
+        """VAPID 鍵を1回だけ読み込む（読めなければ文字列のまま webpush に渡し、送信ごとのエラーにする）"""
+        try:
+            from py_vapid import Vapid
+            return Vapid.from_string(private_key=private_key)
+        except Exception as e:
+            logger.error("PushDispatcher: VAPID_PRIVATE_KEY を読み込めません: %s", e)
+            return private_key
+
+    def _session(self, endpoint: str) -> requests.Session:
+        """プッシュサービスのホストごとの Session（接続を使い回す）"""
+        host = urlparse(endpoint).netloc
+        with self._sessions_lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+            return session
+
+    def _close_sessions(self):
+        with self._sessions_lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def _deliver(self, sub: PushSubscription, payload: str, message: PushMessage, vapid, vapid_sub) -> _Delivery:
+        delivery = _Delivery(subscription_id=sub.id, user_id=sub.user_id)
+        parsed = urlparse(sub.endpoint)
+        started = time.monotonic()
+        try:
+            webpush(
+                subscription_info={
+                    'endpoint': sub.endpoint,
+                    'keys': {'p256dh': sub.p256dh, 'auth': sub.auth},
+                },
+                data=payload,
+                vapid_private_key=vapid,
+                # webpush は claims に aud（送信先オリジン）を書き込むため送信ごとに作る
+                vapid_claims={'sub': vapid_sub, 'aud': f'{parsed.scheme}://{parsed.netloc}'},
+                timeout=self.timeout,
+                requests_session=self._session(sub.endpoint),
+            )
+            delivery.ok = True
+        except WebPushException as e:
+            status_code = e.response.status_code if e.response is not None else None
+            if status_code in EXPIRED_STATUSES:
+                # 端末側で購読が失効済み → 無効化
+                logger.info(
+                    "PushDispatcher: 失効した購読を無効化 (user_id=%s, status=%s, sub_id=%s)",
+                    sub.user_id, status_code, sub.id,
+                )
+                delivery.expired = True
+            else:
+                # それ以外（VAPID 鍵不正/401/400 等）は原因特定のため必ずログ
+                body = e.response.text if e.response is not None else ''
+                logger.error(
+                    "PushDispatcher: WebPush 送信失敗 (user_id=%s, status=%s, sub_id=%s, tag=%s): %s",
+                    sub.user_id, status_code, sub.id, message.tag, body or str(e),
+                )
+        except Exception as e:
+            # 鍵フォーマット不正・接続エラーなど WebPushException 以外も握りつぶさずログ
+            logger.error(
+                "PushDispatcher: 想定外のエラー (user_id=%s, sub_id=%s): %s",
+                sub.user_id, sub.id, e, exc_info=True,
+            )
+        delivery.latency = time.monotonic() - started
+        return delivery
+
+    @staticmethod
+    def _record(deliveries: List[_Delivery], result: PushRunResult):
+        """バッチの結果を集計し、last_used 更新と失効購読の無効化をそれぞれ1回の UPDATE で行う"""
+        delivered = [d.subscription_id for d in deliveries if d.ok]
+        expired = [d.subscription_id for d in deliveries if d.expired]
+        if delivered:
+            # update() は auto_now を通らないので明示する
+            PushSubscription.objects.filter(pk__in=delivered).update(last_used=timezone.now())
+        if expired:
+            PushSubscription.objects.filter(pk__in=expired).update(is_active=False)
+
+        for d in deliveries:
+            result.latencies.append(d.latency)
+            if d.ok:
+                result.sent += 1
+                result.sent_by_user[d.user_id] = result.sent_by_user.get(d.user_id, 0) + 1
+            else:
+                result.failed += 1
+                result.expired += d.expired
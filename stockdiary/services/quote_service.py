@@ -0,0 +1,164 @@
+"""
+株価キャッシュ（StockQuote）の読み書きを担当するサービス。
+
+表示系（一覧・ダッシュボード・分析API）は get_quotes で DB から1クエリで読むだけにし、
+外部API（yfinance）への問い合わせは refresh にまとめる（日記ごとに上流を叩かない）。
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _to_decimal(value):
+    """float/str を Decimal に変換する。NaN/None/不正値は None。"""
+    if value is None:
+        return None
+    try:
+        d = Decimal(str(value))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+    if d.is_nan() or d.is_infinite():
+        return None
+    return d.quantize(Decimal('0.0001'))
+
+
+class QuoteService:
+    """StockQuote（銘柄コード単位の直近株価）のキャッシュ層。"""
+
+    # yf.download に一度に渡すティッカー数（URL長と応答サイズの上限を避ける）
+    DOWNLOAD_CHUNK = 100
+
+    @staticmethod
+    def normalize(symbol):
+        return (symbol or '').strip().upper()
+
+    @classmethod
+    def get_quotes(cls, symbols):
+        """銘柄コード群のキャッシュ済み株価を1クエリで返す。
+
+        Returns:
+            {symbol: {'price', 'previous_close', 'currency', 'fetched_at'}}
+            （キャッシュに無い銘柄はキーごと含まれない）
+        """
+        from ..models import StockQuote
+
+        wanted = {cls.normalize(s) for s in symbols if s}
+        if not wanted:
+            return {}
+        return {
+            row['symbol']: row
+            for row in StockQuote.objects.filter(symbol__in=wanted).values(
+                'symbol', 'price', 'previous_close', 'currency', 'fetched_at',
+            )
+        }
+
+    @classmethod
+    def store_many(cls, quotes):
+        """株価をまとめて upsert する。
+
+        Args:
+            quotes: [{'symbol', 'price', 'previous_close'(任意), 'currency'(任意)}]
+
+        Returns:
+            保存件数
+        """
+        from ..models import StockQuote
+        from ..utils import detect_currency
+
+        now = timezone.now()
+        rows = {}
+        for q in quotes:
+            symbol = cls.normalize(q.get('symbol'))
+            price = _to_decimal(q.get('price'))
+            if not symbol or price is None or price <= 0:
+                continue
+            rows[symbol] = StockQuote(
+                symbol=symbol,
+                price=price,
+                previous_close=_to_decimal(q.get('previous_close')),
+                currency=q.get('currency') or detect_currency(symbol),
+                fetched_at=now,
+            )
+        if not rows:
+            return 0
+        StockQuote.objects.bulk_create(
+            list(rows.values()),
+            update_conflicts=True,
+            unique_fields=['symbol'],
+            update_fields=['price', 'previous_close', 'currency', 'fetched_at'],
+        )
+        return len(rows)
+
+    @classmethod
+    def store(cls, symbol, price, previous_close=None, currency=None):
+        """1銘柄分の株価を upsert する（株価取得APIの結果をキャッシュへ流す用途）。"""
+        return cls.store_many([{
+            'symbol': symbol, 'price': price,
+            'previous_close': previous_close, 'currency': currency,
+        }])
+
+    @staticmethod
+    def held_symbols():
+        """いずれかのユーザーが保有中（数量>0）の銘柄コード一覧。"""
+        from ..models import StockDiary
+
+        return sorted(
+            s for s in StockDiary.objects.filter(current_quantity__gt=0)
+            .exclude(stock_symbol='')
+            .values_list('stock_symbol', flat=True).distinct()
+            if s
+        )
+
+    @classmethod
+    def refresh(cls, symbols=None):
+        """yfinance から終値・前日終値をまとめて取得してキャッシュを更新する。
+
+        symbols 省略時は保有中の全銘柄。DOWNLOAD_CHUNK 件ずつ yf.download で
+        一括取得するため、銘柄数が増えても上流へのリクエストはチャンク数で済む。
+
+        Returns:
+            {'requested': int, 'stored': int}
+        """
+        import yfinance as yf
+        from ..utils import is_japanese_stock
+
+        symbols = [cls.normalize(s) for s in (symbols if symbols is not None else cls.held_symbols())]
+        symbols = sorted({s for s in symbols if s})
+        stored = 0
+
+        for i in range(0, len(symbols), cls.DOWNLOAD_CHUNK):
+            chunk = symbols[i:i + cls.DOWNLOAD_CHUNK]
+            ticker_map = {
+                (f"{s}.T" if is_japanese_stock(s) else s): s for s in chunk
+            }
+            try:
+                frame = yf.download(
+                    list(ticker_map.keys()), period='5d', interval='1d',
+                    group_by='ticker', auto_adjust=False, progress=False, threads=True,
+                )
+            except Exception as e:
+                logger.warning("株価の一括取得に失敗 (%d銘柄): %s", len(chunk), e)
+                continue
+            if frame is None or frame.empty:
+                continue
+
+            quotes = []
+            for ticker, symbol in ticker_map.items():
+                try:
+                    closes = frame[ticker]['Close'].dropna()
+                except KeyError:
+                    continue
+                if closes.empty:
+                    continue
+                quotes.append({
+                    'symbol': symbol,
+                    'price': float(closes.iloc[-1]),
+                    'previous_close': float(closes.iloc[-2]) if len(closes) >= 2 else None,
+                })
+            stored += cls.store_many(quotes)
+
+        logger.info("株価キャッシュ更新: %d/%d 銘柄", stored, len(symbols))
+        return {'requested': len(symbols), 'stored': stored}
@@ -0,0 +1,202 @@
+"""
+保有ポジションの時価評価（含み損益・構成比・前日比）を計算するサービス。
+
+従来の「評価額」は 保有数 × 平均取得単価（＝取得原価）で、時価ではなかった。
+ここでは保有ポジション全体と株価キャッシュ（StockQuote）を1回の join で突き合わせ、
+pandas で全銘柄を一括計算する（日記ごとに外部APIを叩かない）。
+
+- 株価キャッシュに無い銘柄は取得原価で評価し（含み損益0）、priced=False で区別する。
+- 構成比（weight）は group（例: ユーザー）× 通貨ごとに計算する。為替換算はしない。
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .quote_service import QuoteService
+
+logger = logging.getLogger(__name__)
+
+_POSITION_COLUMNS = ['id', 'symbol', 'sector', 'currency', 'group', 'quantity', 'avg_cost']
+
+
+def _round(value, digits=2):
+    return round(float(value), digits)
+
+
+def _pct(numerator, denominator):
+    return _round(numerator / denominator * 100) if denominator else None
+
+
+def _to_datetime(value):
+    """pandas.Timestamp を datetime に戻す（テンプレート・JSON 側で扱いやすくする）。"""
+    if value is None or pd.isna(value):
+        return None
+    return value.to_pydatetime() if hasattr(value, 'to_pydatetime') else value
+
+
+class ValuationService:
+    """保有ポジションを株価キャッシュで時価評価する。"""
+
+    @staticmethod
+    def positions_from_diaries(diaries, cash_only=False, group=None):
+        """StockDiary 群から保有中（数量>0）のポジション dict を作る。
+
+        Args:
+            cash_only: True なら現物のみの集計フィールド（cash_only_*）を使う
+            group: 構成比の母集団を分けるキーを返す関数（省略時は全体で1グループ）
+        """
+        positions = []
+        for d in diaries:
+            if cash_only:
+                quantity = d.cash_only_current_quantity
+                avg_cost = d.cash_only_average_purchase_price
+            else:
+                quantity = d.current_quantity
+                avg_cost = d.average_purchase_price
+            if not quantity or quantity <= 0 or not avg_cost:
+                continue
+            positions.append({
+                'id': d.id,
+                'symbol': d.stock_symbol,
+                'sector': d.sector,
+                'currency': d.currency,
+                'group': group(d) if group else 0,
+                'quantity': quantity,
+                'avg_cost': avg_cost,
+            })
+        return positions
+
+    @classmethod
+    def value_positions(cls, positions, quotes=None):
+        """ポジション群を時価評価する。
+
+        Args:
+            positions: [{'id', 'symbol', 'sector', 'currency', 'quantity', 'avg_cost', 'group'(任意)}]
+            quotes: QuoteService.get_quotes 互換の dict（省略時はキャッシュから1クエリで取得）
+
+        Returns:
+            {
+              'positions': {id: {'price', 'market_value', 'cost_basis', 'unrealized_pnl',
+                                 'unrealized_pnl_pct', 'weight', 'day_change',
+                                 'day_change_pct', 'priced', 'quoted_at'}},
+              'sectors': [{'currency', 'sector', 'market_value', 'cost_basis',
+                           'unrealized_pnl', 'unrealized_pnl_pct', 'day_change',
+                           'weight', 'position_count'}],   # 時価の大きい順
+              'totals': {currency: {'market_value', 'cost_basis', 'unrealized_pnl',
+                                    'unrealized_pnl_pct', 'day_change', 'day_change_pct',
+                                    'position_count', 'priced_count', 'as_of'}},
+            }
+        """
+        empty = {'positions': {}, 'sectors': [], 'totals': {}}
+        if not positions:
+            return empty
+
+        df = pd.DataFrame.from_records(positions)
+        for col in _POSITION_COLUMNS:
+            if col not in df.columns:
+                df[col] = 0 if col == 'group' else None
+        df['symbol'] = df['symbol'].fillna('').map(QuoteService.normalize)
+        df['sector'] = df['sector'].fillna('').replace('', '未分類')
+        df['currency'] = df['currency'].fillna('JPY')
+        df['quantity'] = df['quantity'].astype(float)
+        df['avg_cost'] = df['avg_cost'].astype(float)
+
+        if quotes is None:
+            quotes = QuoteService.get_quotes(df['symbol'].unique())
+        if quotes:
+            qdf = pd.DataFrame.from_records(list(quotes.values()))
+            qdf = qdf[['symbol', 'price', 'previous_close', 'fetched_at']]
+            qdf['price'] = qdf['price'].astype(float)
+            qdf['previous_close'] = pd.to_numeric(qdf['previous_close'], errors='coerce').astype(float)
+            df = df.merge(qdf, on='symbol', how='left')
+        else:
+            df['price'] = np.nan
+            df['previous_close'] = np.nan
+            df['fetched_at'] = None
+
+        df['priced'] = df['price'].notna()
+        df['price'] = df['price'].fillna(df['avg_cost'])
+        df['cost_basis'] = df['quantity'] * df['avg_cost']
+        df['market_value'] = df['quantity'] * df['price']
+        df['unrealized_pnl'] = df['market_value'] - df['cost_basis']
+        has_prev = df['priced'] & df['previous_close'].notna()
+        df['day_change'] = (df['quantity'] * (df['price'] - df['previous_close'])).where(has_prev, 0.0)
+        prev_value = df['market_value'] - df['day_change']
+
+        group_total = df.groupby(['group', 'currency'])['market_value'].transform('sum')
+        df['weight'] = np.where(group_total > 0, df['market_value'] / group_total * 100, 0.0)
+        df['unrealized_pnl_pct'] = np.where(df['cost_basis'] > 0, df['unrealized_pnl'] / df['cost_basis'] * 100, np.nan)
+        df['day_change_pct'] = np.where(has_prev & (prev_value > 0), df['day_change'] / prev_value * 100, np.nan)
+
+        result_positions = {}
+        for row in df.itertuples(index=False):
+            result_positions[row.id] = {
+                'price': _round(row.price, 4),
+                'market_value': _round(row.market_value),
+                'cost_basis': _round(row.cost_basis),
+                'unrealized_pnl': _round(row.unrealized_pnl),
+                'unrealized_pnl_pct': None if np.isnan(row.unrealized_pnl_pct) else _round(row.unrealized_pnl_pct),
+                'weight': _round(row.weight),
+                'day_change': _round(row.day_change),
+                'day_change_pct': None if np.isnan(row.day_change_pct) else _round(row.day_change_pct),
+                'priced': bool(row.priced),
+                'quoted_at': _to_datetime(row.fetched_at) if row.priced else None,
+            }
+
+        sums = ['market_value', 'cost_basis', 'unrealized_pnl', 'day_change']
+        currency_mv = df.groupby('currency')['market_value'].sum()
+        sector_df = (
+            df.groupby(['currency', 'sector'])
+            .agg(**{c: (c, 'sum') for c in sums}, position_count=('id', 'count'))
+            .reset_index()
+            .sort_values('market_value', ascending=False)
+        )
+        sectors = []
+        for row in sector_df.itertuples(index=False):
+            sectors.append({
+                'currency': row.currency,
+                'sector': row.sector,
+                'market_value': _round(row.market_value),
+                'cost_basis': _round(row.cost_basis),
+                'unrealized_pnl': _round(row.unrealized_pnl),
+                'unrealized_pnl_pct': _pct(row.unrealized_pnl, row.cost_basis),
+                'day_change': _round(row.day_change),
+                'weight': _pct(row.market_value, currency_mv[row.currency]) or 0.0,
+                'position_count': int(row.position_count),
+            })
+
+        totals = {}
+        for currency, g in df.groupby('currency'):
+            market_value = g['market_value'].sum()
+            day_change = g['day_change'].sum()
+            quoted = g.loc[g['priced'], 'fetched_at']
+            totals[currency] = {
+                'market_value': _round(market_value),
+                'cost_basis': _round(g['cost_basis'].sum()),
+                'unrealized_pnl': _round(g['unrealized_pnl'].sum()),
+                'unrealized_pnl_pct': _pct(g['unrealized_pnl'].sum(), g['cost_basis'].sum()),
+                'day_change': _round(day_change),
+                'day_change_pct': _pct(day_change, market_value - day_change),
+                'position_count': int(len(g)),
+                'priced_count': int(g['priced'].sum()),
+                'as_of': _to_datetime(quoted.min()) if len(quoted) else None,
+            }
+
+        return {'positions': result_positions, 'sectors': sectors, 'totals': totals}
+
+    @classmethod
+    def value_diaries(cls, diaries, cash_only=False, group=None):
+        """positions_from_diaries → value_positions のショートカット。"""
+        return cls.value_positions(cls.positions_from_diaries(diaries, cash_only=cash_only, group=group))
+
+
+def attach_valuation(diaries, valuation):
+    """value_positions の結果を各 diary に ``diary.valuation`` として付与する。
+
+    保有していない・評価対象外の diary には None を付与する（テンプレートで分岐しやすく）。
+    """
+    positions = valuation.get('positions', {})
+    for diary in diaries:
+        diary.valuation = positions.get(diary.id)
+    return diaries
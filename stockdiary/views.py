@@ -216,6 +216,11 @@ class StockDiaryListView(LoginRequiredMixin, ListView):
         from .views_earnings import attach_next_earnings
         attach_next_earnings(context['diaries'])
 
+        # 時価評価（含み損益・構成比）。保有中の全ポジションを株価キャッシュと1回で
+        # 突き合わせ、表示中のページ分の diary に valuation を付与する（外部APIは叩かない）。
+        # 合計はダッシュボードで表示するので一覧では持たない。
+        self._attach_valuation(context['diaries'])
+
         # フォーム用のスピードダイアルアクション
         context['form_actions'] = [
             {
@@ -278,6 +283,16 @@ class StockDiaryListView(LoginRequiredMixin, ListView):
 
         return context
 
+    def _attach_valuation(self, diaries):
+        """保有全体を時価評価して diaries に valuation を付与する（構成比は保有全体に対する割合）。"""
+        from .services.valuation_service import ValuationService, attach_valuation
+        valuation = ValuationService.value_diaries(
+            StockDiary.objects.filter(
+                user=self.request.user, is_excluded=False, current_quantity__gt=0,
+            )
+        )
+        attach_valuation(diaries, valuation)
+
     @staticmethod
     def _compute_record_streak(user):
         """直近の連続記録日数を返す（記録のあった日＝継続記録 or 日記作成日）。
@@ -352,7 +367,8 @@ class StockDiaryListView(LoginRequiredMixin, ListView):
                         page_obj = paginator.get_page(page_number)
                     except (EmptyPage, PageNotAnInteger):
                         page_obj = paginator.get_page(1)
-                    
+
+                    self._attach_valuation(page_obj.object_list)
                     data = []
                     for diary in page_obj:
                         try:
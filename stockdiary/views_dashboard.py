@@ -34,21 +34,50 @@ TAG_AXIS_COLORS = {
 
 
 
-def build_tag_performance(diaries, limit=15):
+def _cash_current_value(diary, cash_stats, market_values=None):
+    """現物保有分の評価額。
+
+    market_values（{diary_id: 時価}）に載っていれば時価、無ければ従来どおり
+    取得原価（保有数 × 平均取得単価）で評価する。保有なしは 0。
+    """
+    if market_values and diary.id in market_values:
+        return market_values[diary.id]
+    if cash_stats['current_quantity'] > 0 and cash_stats['average_purchase_price']:
+        return cash_stats['current_quantity'] * cash_stats['average_purchase_price']
+    return Decimal('0')
+
+
+def build_market_values(diaries):
+    """現物保有を株価キャッシュで時価評価し、(valuation, {diary_id: 時価}) を返す。
+
+    ValuationService が保有全体を1回の join で評価する。株価キャッシュに無い銘柄は
+    market_values に含めない（_cash_current_value が取得原価へフォールバックする）。
+    """
+    from .services.valuation_service import ValuationService
+
+    valuation = ValuationService.value_diaries(diaries, cash_only=True)
+    market_values = {
+        diary_id: Decimal(str(v['market_value']))
+        for diary_id, v in valuation['positions'].items()
+        if v['priced']
+    }
+    return valuation, market_values
+
+
+def build_tag_performance(diaries, limit=15, market_values=None):
     """タグ別の通算成績（思考の分類 × 結果）を集計して返す。
 
     「@地政学リスクで買った銘柄は勝てているか」を可視化する自己分析。
     realized_profit はライフタイム値（通算）である点に注意（呼び出し側でラベリング）。
     TradingDashboardView と AnnualReviewView で共有する。
+    market_values を渡すと保有分を時価で評価する（build_market_values 参照）。
     """
     tag_stats = {}
     for diary in diaries:
         cash_stats = diary.calculate_cash_only_stats()
         total_invested = cash_stats['total_buy_amount']
         total_sell = cash_stats['total_sell_amount']
-        current_value = Decimal('0')
-        if cash_stats['current_quantity'] > 0 and cash_stats['average_purchase_price']:
-            current_value = cash_stats['current_quantity'] * cash_stats['average_purchase_price']
+        current_value = _cash_current_value(diary, cash_stats, market_values)
         realized = float(cash_stats['realized_profit'] or 0)
         is_sold = bool(total_sell and total_sell > 0)
 
@@ -151,6 +180,13 @@ class TradingDashboardView(LoginRequiredMixin, TemplateView):
         # 全日記（円建てのみ）
         all_diaries = StockDiary.objects.filter(user=user, currency='JPY')
 
+        # ========== 時価評価（株価キャッシュ・現物のみ） ==========
+        # 保有中の現物ポジションを StockQuote と1回で突き合わせる（外部APIは叩かない）。
+        valuation, market_values = build_market_values(
+            all_diaries.filter(cash_only_current_quantity__gt=0)
+        )
+        portfolio_valuation = valuation['totals'].get('JPY')
+
         # ========== CompanyMasterから業種情報を取得 ==========
         from company_master.models import CompanyMaster
 
@@ -192,10 +228,8 @@ class TradingDashboardView(LoginRequiredMixin, TemplateView):
             # 総売却額
             total_cash_sell_amount += cash_stats['total_sell_amount']
             
-            # 現在の評価額（保有数 × 平均取得単価）
-            if cash_stats['current_quantity'] > 0 and cash_stats['average_purchase_price']:
-                current_value = cash_stats['current_quantity'] * cash_stats['average_purchase_price']
-                total_current_value += current_value
+            # 現在の評価額（時価。株価キャッシュが無ければ 保有数 × 平均取得単価）
+            total_current_value += _cash_current_value(diary, cash_stats, market_values)
 
         # ✅ ROI = (売却総額 + 評価額 - 総投資額) / 総投資額 × 100
         if total_cash_invested > 0:
@@ -282,9 +316,7 @@ class TradingDashboardView(LoginRequiredMixin, TemplateView):
             # ✅ ROI計算：(売却総額 + 評価額 - 総投資額) / 総投資額 × 100
             total_invested = cash_stats['total_buy_amount']
             total_sell = cash_stats['total_sell_amount']
-            current_value = Decimal('0')
-            if cash_stats['current_quantity'] > 0 and cash_stats['average_purchase_price']:
-                current_value = cash_stats['current_quantity'] * cash_stats['average_purchase_price']
+            current_value = _cash_current_value(diary, cash_stats, market_values)
             
             roi = Decimal('0')
             if total_invested > 0:
@@ -335,9 +367,7 @@ class TradingDashboardView(LoginRequiredMixin, TemplateView):
             
             total_invested = cash_stats['total_buy_amount']
             total_sell = cash_stats['total_sell_amount']
-            current_value = Decimal('0')
-            if cash_stats['current_quantity'] > 0 and cash_stats['average_purchase_price']:
-                current_value = cash_stats['current_quantity'] * cash_stats['average_purchase_price']
+            current_value = _cash_current_value(diary, cash_stats, market_values)
             
             sector_stats[sector]['total_invested'] += total_invested
             sector_stats[sector]['total_sell_amount'] += total_sell
@@ -483,9 +513,7 @@ class TradingDashboardView(LoginRequiredMixin, TemplateView):
             cash_stats = diary.calculate_cash_only_stats()
             total_invested = cash_stats['total_buy_amount']
             total_sell = cash_stats['total_sell_amount']
-            current_value = Decimal('0')
-            if cash_stats['current_quantity'] > 0 and cash_stats['average_purchase_price']:
-                current_value = cash_stats['current_quantity'] * cash_stats['average_purchase_price']
+            current_value = _cash_current_value(diary, cash_stats, market_values)
             realized = float(cash_stats['realized_profit'] or 0)
             is_sold = bool(total_sell and total_sell > 0)
 
@@ -551,6 +579,8 @@ class TradingDashboardView(LoginRequiredMixin, TemplateView):
             'winning_count': winning_count,
             'sold_count': sold_count,
             'profit_factor': profit_factor,
+            'portfolio_valuation': portfolio_valuation,
+            'sector_valuation': [s for s in valuation['sectors'] if s['currency'] == 'JPY'],
             'tag_analysis': tag_analysis,
             'sector_analysis': sector_analysis,
             'profitable_sectors': profitable_sectors,
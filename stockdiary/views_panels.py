@@ -37,6 +37,9 @@ def _get_securities_code(stock_symbol):
 def _sentiment_tone_trend(doc, current_score):
     """同一銘柄の前回の重要開示（有報・半報）と比較した経営トーンの変化を返す。
 
+    前回分は履歴のスコアを使うが、感情分析結果キャッシュに現在の辞書で分析した結果が
+    あればそちらを使う（辞書を編集した後も、同じ辞書で計算したスコア同士を比べる）。
+
     Returns:
         dict | None: {'delta': float, 'label': '改善'|'悪化'|'横ばい', 'prev_score': float}
     """
@@ -53,15 +56,30 @@ def _sentiment_tone_trend(doc, current_score):
             document__doc_type_code__in=IMPORTANT_DOC_TYPE_CODES,
             document__file_date__lt=doc.file_date,
         )
+        .select_related('document')
         .order_by('-document__file_date', '-analysis_date')
         .first()
     )
     if not prev or prev.overall_score is None:
         return None
 
-    delta = float(current_score) - float(prev.overall_score)
+    prev_score = float(prev.overall_score)
+    try:
+        from earnings_analysis.services.sentiment_analyzer import get_sentiment_dict_singleton
+        from earnings_analysis.services.sentiment_cache import get_result_cache
+
+        store = get_result_cache()
+        cached = store and store.get_for_document(
+            prev.document.doc_id, get_sentiment_dict_singleton().version
+        )
+        if cached and cached.get('overall_score') is not None:
+            prev_score = float(cached['overall_score'])
+    except Exception as e:
+        logger.debug(f"感情分析キャッシュ参照失敗（履歴のスコアを使用）: {e}")
+
+    delta = float(current_score) - prev_score
     label = '改善' if delta > 0.05 else ('悪化' if delta < -0.05 else '横ばい')
-    return {'delta': delta, 'label': label, 'prev_score': float(prev.overall_score)}
+    return {'delta': delta, 'label': label, 'prev_score': prev_score}
 
 
 @login_required
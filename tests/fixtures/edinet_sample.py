@@ -0,0 +1,107 @@
+"""EDINET 有価証券報告書と同規模の XBRL インスタンス文書を生成するテスト用フィクスチャ。
+
+実際の有報インスタンス（jpcrp/jppfs、連結・個別、当期・前期・セグメント別）を模して、
+context 数百・数値ファクト数千・HTML エスケープされたテキストブロック数十件（合計数MB）を作る。
+実書類をリポジトリに置かずに、実サイズでの抽出コスト（ベンチマーク）を測るためのもの。
+"""
+import random
+
+NS = {
+    'xbrli': 'http://www.xbrl.org/2003/instance',
+    'xbrldi': 'http://xbrl.org/2006/xbrldi',
+    'iso4217': 'http://www.xbrl.org/2003/iso4217',
+    'jppfs_cor': 'http://disclosure.edinet-fsa.go.jp/taxonomy/jppfs/2023-12-01/jppfs_cor',
+    'jpcrp_cor': 'http://disclosure.edinet-fsa.go.jp/taxonomy/jpcrp/2023-12-01/jpcrp_cor',
+    'jpdei_cor': 'http://disclosure.edinet-fsa.go.jp/taxonomy/jpdei/2013-08-31/jpdei_cor',
+}
+
+# 抽出対象になる主要科目（百万円単位・decimals=-6）
+KEY_FACTS = {
+    'NetSales': 3_000_000,
+    'OperatingIncome': 250_000,
+    'ProfitLoss': 180_000,
+    'TotalAssets': 5_000_000,
+    'Liabilities': 2_800_000,
+    'NetAssets': 2_200_000,
+    'NetCashProvidedByUsedInOperatingActivities': 320_000,
+    'NetCashProvidedByUsedInInvestingActivities': -150_000,
+    'NetCashProvidedByUsedInFinancingActivities': -90_000,
+}
+
+TEXT_BLOCKS = [
+    'BusinessRisksTextBlock',
+    'BusinessPolicyBusinessEnvironmentIssuesAddressedEtcTextBlock',
+    'ManagementAnalysisOfFinancialPositionOperatingResultsAndCashFlowsTextBlock',
+    'ResearchAndDevelopmentActivitiesTextBlock',
+    'OverviewOfCorporateGovernanceTextBlock',
+    'DividendPolicyTextBlock',
+    'SegmentInformationTextBlock',
+    'DescriptionOfBusinessTextBlock',
+]
+
+_PARAGRAPH = (
+    '当連結会計年度における我が国経済は、雇用・所得環境の改善により緩やかな回復基調で推移しました。'
+    '営業活動によるキャッシュ・フローは、税金等調整前当期純利益の計上等により増加しました。'
+    '投資活動によるキャッシュ・フローは、有形固定資産の取得による支出等により減少しました。'
+    '財務活動によるキャッシュ・フローは、配当金の支払等により減少しました。'
+)
+
+
+def build_instance_document(facts=4000, contexts=300, text_blocks=48, text_kb=40, seed=7) -> bytes:
+    """実サイズ相当の XBRL インスタンス文書（bytes）を返す。"""
+    rng = random.Random(seed)
+    ns_decl = ' '.join(f'xmlns:{p}="{uri}"' for p, uri in NS.items())
+    parts = [f'<?xml version="1.0" encoding="UTF-8"?>\n<xbrli:xbrl {ns_decl}>']
+
+    context_ids = ['CurrentYearDuration', 'Prior1YearDuration', 'CurrentYearInstant', 'Prior1YearInstant']
+    parts.append(
+        '<xbrli:context id="CurrentYearDuration"><xbrli:entity><xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E00001-000</xbrli:identifier></xbrli:entity>'
+        '<xbrli:period><xbrli:startDate>2024-04-01</xbrli:startDate><xbrli:endDate>2025-03-31</xbrli:endDate></xbrli:period></xbrli:context>'
+        '<xbrli:context id="Prior1YearDuration"><xbrli:entity><xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E00001-000</xbrli:identifier></xbrli:entity>'
+        '<xbrli:period><xbrli:startDate>2023-04-01</xbrli:startDate><xbrli:endDate>2024-03-31</xbrli:endDate></xbrli:period></xbrli:context>'
+        '<xbrli:context id="CurrentYearInstant"><xbrli:entity><xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E00001-000</xbrli:identifier></xbrli:entity>'
+        '<xbrli:period><xbrli:instant>2025-03-31</xbrli:instant></xbrli:period></xbrli:context>'
+        '<xbrli:context id="Prior1YearInstant"><xbrli:entity><xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E00001-000</xbrli:identifier></xbrli:entity>'
+        '<xbrli:period><xbrli:instant>2024-03-31</xbrli:instant></xbrli:period></xbrli:context>'
+    )
+    for i in range(contexts - len(context_ids)):
+        cid = f'CurrentYearDuration_Segment{i}Member'
+        context_ids.append(cid)
+        parts.append(
+            f'<xbrli:context id="{cid}"><xbrli:entity><xbrli:identifier scheme="http://disclosure.edinet-fsa.go.jp">E00001-000</xbrli:identifier>'
+            f'<xbrli:segment><xbrldi:explicitMember dimension="jpcrp_cor:OperatingSegmentsAxis">jpcrp_cor:Segment{i}Member</xbrldi:explicitMember></xbrli:segment></xbrli:entity>'
+            '<xbrli:period><xbrli:startDate>2024-04-01</xbrli:startDate><xbrli:endDate>2025-03-31</xbrli:endDate></xbrli:period></xbrli:context>'
+        )
+    parts.append(
+        '<xbrli:unit id="JPY"><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unit>'
+        '<xbrli:unit id="shares"><xbrli:measure>xbrli:shares</xbrli:measure></xbrli:unit>'
+        '<xbrli:unit id="JPYPerShares"><xbrli:divide><xbrli:unitNumerator><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unitNumerator>'
+        '<xbrli:unitDenominator><xbrli:measure>xbrli:shares</xbrli:measure></xbrli:unitDenominator></xbrli:divide></xbrli:unit>'
+    )
+
+    for name, value in KEY_FACTS.items():
+        for cid, factor in (('CurrentYearDuration', 1.0), ('Prior1YearDuration', 0.9)):
+            if name in ('TotalAssets', 'Liabilities', 'NetAssets'):
+                cid = cid.replace('Duration', 'Instant')
+            parts.append(
+                f'<jppfs_cor:{name} contextRef="{cid}" unitRef="JPY" decimals="-6">{int(value * factor)}</jppfs_cor:{name}>'
+            )
+
+    # その他の数値ファクト（科目数 ~800、セグメント別）
+    for i in range(facts):
+        prefix = 'jppfs_cor' if i % 3 else 'jpcrp_cor'
+        name = f'AccountItem{i % 800}Of{"Group" if i % 2 else "Company"}'
+        cid = rng.choice(context_ids)
+        parts.append(
+            f'<{prefix}:{name} contextRef="{cid}" unitRef="JPY" decimals="-6">{rng.randint(-500000, 500000)}</{prefix}:{name}>'
+        )
+
+    # HTML エスケープされたテキストブロック
+    body = ('&lt;p&gt;' + _PARAGRAPH + '&lt;/p&gt;') * max(1, (text_kb * 1024) // (len(_PARAGRAPH.encode()) + 16))
+    for i in range(text_blocks):
+        name = TEXT_BLOCKS[i % len(TEXT_BLOCKS)]
+        cid = 'CurrentYearDuration' if i < len(TEXT_BLOCKS) else context_ids[4 + i % max(1, len(context_ids) - 4)]
+        parts.append(f'<jpcrp_cor:{name} contextRef="{cid}">{body}</jpcrp_cor:{name}>')
+
+    parts.append('</xbrli:xbrl>')
+    return '\n'.join(parts).encode('utf-8')
@@ -0,0 +1,198 @@
+"""感情分析・包括分析のジョブ投入（services/analysis_jobs.py）のテスト。
+
+なぜこのテストがあるか:
+  start_analysis / start_comprehensive_analysis はリクエストごとに gunicorn ワーカー内で
+  daemon スレッドを起動しており、同時実行数の上限も背圧もなく、ワーカーの再起動でジョブが消えていた。
+  django-q の専用キュー（優先レーン）へ投入するようにしたので、
+  - スレッドを起動せずレーンに応じたキューへ積むこと
+  - 同じ書類の待機中・処理中ジョブには合流すること（落ちたジョブは除く）
+  - 落ちたかどうかは処理中セッションの最終更新で判断し、キューで待っているだけの
+    セッションは古くても落ちたとみなさないこと
+  - 上限を超えたら busy（API は 429）を返すこと
+  - 再配送されたジョブが完了済みセッションを分析し直さないこと
+  - 進行状況を get_progress で読めること
+  を固定する。
+"""
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from django_q import tasks as q_tasks
+from rest_framework.test import APIClient
+
+from earnings_analysis import tasks
+from earnings_analysis.models import DocumentMetadata, FinancialAnalysisSession, SentimentAnalysisSession
+from earnings_analysis.services.analysis_jobs import LANE_BATCH, claim_session
+from earnings_analysis.services.comprehensive_analyzer import ComprehensiveAnalysisService
+from earnings_analysis.services.sentiment_analyzer import SentimentAnalysisService
+
+
+def make_document(doc_id):
+    return DocumentMetadata.objects.create(
+        doc_id=doc_id,
+        edinet_code='E02144',
+        securities_code='72030',
+        company_name='テスト株式会社',
+        ordinance_code='010',
+        form_code='030000',
+        doc_type_code='120',
+        period_start=date(2024, 4, 1),
+        period_end=date(2025, 3, 31),
+        submit_date_time=datetime(2025, 6, 20, tzinfo=dt_timezone.utc),
+        file_date=date(2025, 6, 20),
+        doc_description='有価証券報告書',
+        legal_status='1',
+        withdrawal_status='0',
+        xbrl_flag=True,
+    )
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """django-q へ投入したタスク（関数名・引数・キュー名）を記録する"""
+    calls = []
+
+    def fake_async_task(func, *args, **kwargs):
+        calls.append({'func': func, 'args': args, 'cluster': kwargs.get('cluster')})
+        return 'task-id'
+
+    monkeypatch.setattr(q_tasks, 'async_task', fake_async_task)
+    monkeypatch.setattr(
+        'threading.Thread.start', lambda self: pytest.fail('リクエスト内でスレッドを起動した'),
+    )
+    return calls
+
+
+@pytest.fixture
+def service():
+    return SentimentAnalysisService()
+
+
+@pytest.mark.django_db
+class TestSubmit:
+    def test_sentiment_is_queued_on_interactive_lane(self, queued, service):
+        make_document('S100JOB1')
+
+        result = service.start_analysis('S100JOB1', user_ip='127.0.0.1')
+
+        session = SentimentAnalysisSession.objects.get(session_id=result['session_id'])
+        assert result['status'] == 'started' and not result['deduplicated']
+        assert session.processing_status == 'PENDING'
+        assert queued == [{
+            'func': 'earnings_analysis.tasks.run_sentiment_analysis_task',
+            'args': (session.id, '127.0.0.1'),
+            'cluster': 'analysis',
+        }]
+
+    def test_same_document_joins_in_flight_job(self, queued, service):
+        make_document('S100JOB2')
+
+        first = service.start_analysis('S100JOB2')
+        second = service.start_analysis('S100JOB2', force=True)
+
+        assert second['session_id'] == first['session_id']
+        assert second['deduplicated'] is True
+        assert len(queued) == 1
+        assert SentimentAnalysisSession.objects.count() == 1
+
+    def test_stale_in_flight_job_is_ignored(self, queued, service):
+        doc = make_document('S100JOB3')
+        stale = SentimentAnalysisSession.objects.create(document=doc, processing_status='PROCESSING')
+        # timeout + retry（600 + 900 秒）を過ぎても更新がない
+        SentimentAnalysisSession.objects.filter(pk=stale.pk).update(
+            updated_at=timezone.now() - timedelta(minutes=30)
+        )
+
+        result = service.start_analysis('S100JOB3')
+
+        assert result['session_id'] != stale.session_id
+        assert len(queued) == 1
+
+    @pytest.mark.parametrize('status, updated_ago', [
+        ('PENDING', timedelta(hours=2)),       # キューで待っているだけ
+        ('PROCESSING', timedelta(minutes=5)),  # 長い分析だが進行状況は更新されている
+    ])
+    def test_old_but_live_job_is_joined(self, queued, service, status, updated_ago):
+        doc = make_document('S100JOB9')
+        live = SentimentAnalysisSession.objects.create(document=doc, processing_status=status)
+        SentimentAnalysisSession.objects.filter(pk=live.pk).update(
+            created_at=timezone.now() - timedelta(hours=3),
+            updated_at=timezone.now() - updated_ago,
+        )
+
+        result = service.start_analysis('S100JOB9')
+
+        assert result['session_id'] == str(live.session_id)
+        assert result['deduplicated'] is True
+        assert queued == []
+
+    def test_busy_when_in_flight_limit_reached(self, queued, service, settings, user):
+        settings.ANALYSIS_JOB_SETTINGS = {'MAX_IN_FLIGHT': 1}
+        make_document('S100JOB4')
+        make_document('S100JOB5')
+        service.start_analysis('S100JOB4')
+
+        assert service.start_analysis('S100JOB5')['status'] == 'busy'
+        assert len(queued) == 1
+
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(reverse('copomo:sentiment-start'), {'doc_id': 'S100JOB5'}, format='json')
+        assert response.status_code == 429
+        assert response.json()['status'] == 'busy'
+
+    def test_comprehensive_batch_lane(self, queued):
+        make_document('S100JOB6')
+
+        result = ComprehensiveAnalysisService().start_comprehensive_analysis('S100JOB6', lane=LANE_BATCH)
+
+        session = FinancialAnalysisSession.objects.get(session_id=result['session_id'])
+        assert queued[0]['func'] == 'earnings_analysis.tasks.run_comprehensive_analysis_task'
+        assert queued[0]['args'][0] == session.id
+        assert queued[0]['cluster'] == 'analysis_batch'
+
+    def test_enqueue_failure_marks_session_failed(self, monkeypatch, service):
+        make_document('S100JOB7')
+
+        def broken(*args, **kwargs):
+            raise RuntimeError('broker down')
+
+        monkeypatch.setattr(q_tasks, 'async_task', broken)
+        with pytest.raises(Exception):
+            service.start_analysis('S100JOB7')
+
+        session = SentimentAnalysisSession.objects.get()
+        assert session.processing_status == 'FAILED'
+        # 失敗したセッションには合流しない
+        assert claim_session(SentimentAnalysisSession, session.id) is False
+
+
+@pytest.mark.django_db
+class TestWorker:
+    def test_task_runs_pending_session_and_skips_completed(self, monkeypatch):
+        doc = make_document('S100RUN1')
+        pending = SentimentAnalysisSession.objects.create(document=doc, processing_status='PENDING')
+        done = SentimentAnalysisSession.objects.create(document=doc, processing_status='COMPLETED')
+        executed = []
+        monkeypatch.setattr(
+            SentimentAnalysisService, '_execute_analysis',
+            lambda self, session_id, user_ip=None: executed.append(session_id),
+        )
+
+        tasks.run_sentiment_analysis_task(pending.id)
+        tasks.run_sentiment_analysis_task(done.id)  # ワーカー再起動後の再配送
+        tasks.run_sentiment_analysis_task(999999)
+
+        assert executed == [pending.id]
+
+    def test_progress_reports_queue_position(self, queued, service):
+        make_document('S100POS1')
+        make_document('S100POS2')
+        service.start_analysis('S100POS1')
+        second = service.start_analysis('S100POS2')
+
+        progress = service.get_progress(second['session_id'])
+
+        assert progress['status'] == 'PENDING'
+        assert '前に1件' in progress['message']
@@ -0,0 +1,258 @@
+"""新規開示の自動分析パイプライン（services/analysis_pipeline.py）のテスト。
+
+なぜこのテストがあるか:
+  DisclosureSync はイベントごとに分析タスクを積み、qcluster の2ワーカーが
+  取得 → 解析 → 感情分析 → 保存を1書類ずつ直列に処理していた。
+  取得（スレッド）・解析（プロセス）・書込（バッチ）の3段に分けたので、
+  - 子プロセスでの解析結果が従来と同じテーブル（財務・ファクト・感情履歴）に残ること
+  - 分析済みの部分は再実行しないこと、1書類の失敗で全体が止まらないこと
+  - 書込がバッチ単位であること、バックログと段ごとの所要時間が残ること
+  - django-q のワーカー（daemon プロセス）の中でもプロセスプールを作らずに動くこと
+  - 結果が揃わない書類は MAX_ATTEMPTS 回でバックログから外れること（毎時取り直さない）
+  - 直近の実行メトリクスが別プロセス（run_disclosure_analysis --status）から読めること
+    （Django のキャッシュはプロセスごとの LocMemCache なのでファイルに残す）
+  - 財務とテキストの両方が要る書類でも XBRL の ZIP は1回しか展開・解析しないこと
+  を固定する。
+"""
+import io
+import json
+import zipfile
+from datetime import date, datetime, timezone as dt_timezone
+from types import SimpleNamespace
+
+import pytest
+from django.core.management import call_command
+
+from earnings_analysis import tasks
+from earnings_analysis.models import (
+    CompanyFinancialData, DisclosureEvent, DocumentMetadata, SentimentAnalysisHistory, XBRLFact,
+)
+from earnings_analysis.services import analysis_pipeline
+from earnings_analysis.services.analysis_pipeline import (
+    analysis_backlog, analyze_xbrl_payload, backlog_depth, last_run_metrics, metrics_path,
+    run_analysis_pipeline,
+)
+from earnings_analysis.services.xbrl_extractor import EDINETXBRLService, XBRLFinancialExtractor
+
+TEXT = (
+    '当期は増収増益を達成し、業績は好調に推移しました。新製品の販売が拡大し、受注も堅調です。'
+    '今後も持続的成長を目指し、収益性の改善に取り組みます。'
+) * 3
+
+XBRL = f'''<?xml version="1.0" encoding="UTF-8"?>
+<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+            xmlns:jppfs_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jppfs/2023-12-01/jppfs_cor"
+            xmlns:jpcrp_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jpcrp/2023-12-01/jpcrp_cor">
+  <xbrli:context id="CurrentYearDuration">
+    <xbrli:entity><xbrli:identifier scheme="x">E1</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2024-04-01</xbrli:startDate><xbrli:endDate>2025-03-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:unit id="JPY"><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unit>
+  <jppfs_cor:NetCashProvidedByUsedInOperatingActivities contextRef="CurrentYearDuration" unitRef="JPY" decimals="-6">500000000</jppfs_cor:NetCashProvidedByUsedInOperatingActivities>
+  <jppfs_cor:NetSales contextRef="CurrentYearDuration" unitRef="JPY" decimals="-6">1200000000</jppfs_cor:NetSales>
+  <jpcrp_cor:BusinessPolicyTextBlock contextRef="CurrentYearDuration">{TEXT}</jpcrp_cor:BusinessPolicyTextBlock>
+</xbrli:xbrl>'''.encode()
+# 本文（テキストブロック）がない XBRL。語彙感情分析の結果がいつまでも揃わない
+XBRL_WITHOUT_TEXT = b'\n'.join(line for line in XBRL.split(b'\n') if b'TextBlock' not in line)
+
+
+def make_disclosure(doc_id, xbrl_flag=True, doc_type_code='120'):
+    doc = DocumentMetadata.objects.create(
+        doc_id=doc_id,
+        edinet_code='E02144',
+        securities_code='72030',
+        company_name='テスト株式会社',
+        ordinance_code='010',
+        form_code='030000',
+        doc_type_code=doc_type_code,
+        period_start=date(2024, 4, 1),
+        period_end=date(2025, 3, 31),
+        submit_date_time=datetime(2025, 6, 20, tzinfo=dt_timezone.utc),
+        file_date=date(2025, 6, 20),
+        doc_description='有価証券報告書',
+        legal_status='1',
+        withdrawal_status='0',
+        xbrl_flag=xbrl_flag,
+    )
+    DisclosureEvent.objects.create(
+        securities_code='72030', doc_id=doc_id, file_date=doc.file_date,
+        doc_type_code=doc_type_code, doc_type_name='有価証券報告書',
+    )
+    return doc
+
+
+@pytest.fixture
+def downloads(monkeypatch, settings, tmp_path):
+    """EDINET へ取りに行かず、サンプル XBRL を返す（取得した doc_id を記録）"""
+    settings.DISCLOSURE_ANALYSIS_PIPELINE = {
+        **settings.DISCLOSURE_ANALYSIS_PIPELINE, 'METRICS_PATH': str(tmp_path / 'metrics' / 'last_run.json'),
+    }
+    fetched = []
+
+    def fake_download(document):
+        fetched.append(document.doc_id)
+        if document.doc_id.endswith('X'):
+            raise ConnectionError('download failed')
+        if document.doc_id.endswith('N'):
+            return XBRL_WITHOUT_TEXT, 0.01
+        return XBRL, 0.01
+
+    monkeypatch.setattr(analysis_pipeline, '_download', fake_download)
+    return fetched
+
+
+class TestAnalysisPipeline:
+    def test_saves_financial_facts_and_sentiment(self, downloads):
+        doc = make_disclosure('S100AAA1')
+        assert backlog_depth() == 1
+
+        summary = run_analysis_pipeline(analysis_backlog(), cpu_workers=0)
+
+        financial = CompanyFinancialData.objects.get(document=doc)
+        assert financial.operating_cf == 500_000_000
+        assert XBRLFact.objects.filter(document=doc).count() == 2
+        history = SentimentAnalysisHistory.objects.get(document=doc)
+        assert history.sentiment_label == 'positive'
+        assert summary['financial_saved'] == 1 and summary['sentiment_saved'] == 1
+        assert (summary['backlog_before'], summary['backlog_after']) == (1, 0)
+        assert set(summary['stages']) == {'download', 'parse', 'sentiment', 'write'}
+        assert last_run_metrics() == summary
+
+    def test_process_pool(self, downloads):
+        """解析は子プロセスで行い、結果（Decimal・ファクト・感情分析）が pickle で戻る"""
+        docs = [make_disclosure(f'S100PP{i}0') for i in range(3)]
+
+        summary = run_analysis_pipeline(analysis_backlog(), io_workers=2, cpu_workers=2)
+
+        assert summary['failed'] == 0
+        assert CompanyFinancialData.objects.filter(document__in=docs).count() == 3
+        assert SentimentAnalysisHistory.objects.filter(document__in=docs).count() == 3
+        assert backlog_depth() == 0
+
+    def test_only_missing_parts_are_analyzed(self, downloads, monkeypatch):
+        done = make_disclosure('S100DONE')
+        CompanyFinancialData.objects.create(document=done, period_type='annual')
+        SentimentAnalysisHistory.objects.create(document=done, overall_score=0.1, sentiment_label='neutral')
+        half = make_disclosure('S100HALF')
+        CompanyFinancialData.objects.create(document=half, period_type='annual')
+        make_disclosure('S100NOXB', xbrl_flag=False)
+        make_disclosure('S100EXTR', doc_type_code='180')
+
+        requested = []
+        original = analysis_pipeline.analyze_xbrl_payload
+        monkeypatch.setattr(
+            analysis_pipeline, 'analyze_xbrl_payload',
+            lambda payload, info, fin, sent: requested.append((fin, sent)) or original(payload, info, fin, sent),
+        )
+        run_analysis_pipeline(DocumentMetadata.objects.all(), cpu_workers=0)
+
+        # 分析済みは取得もしない。財務済み・財務諸表のない書類は感情分析だけ行う
+        assert sorted(downloads) == ['S100EXTR', 'S100HALF']
+        assert requested == [(False, True), (False, True)]
+        assert CompanyFinancialData.objects.filter(document=half).count() == 1
+        assert SentimentAnalysisHistory.objects.filter(document=half).count() == 1
+
+    def test_failed_download_does_not_stop_others(self, downloads):
+        make_disclosure('S100BADX')
+        ok = make_disclosure('S100GOOD')
+
+        summary = run_analysis_pipeline(analysis_backlog(), cpu_workers=0)
+
+        assert summary['failed'] == 1
+        assert SentimentAnalysisHistory.objects.filter(document=ok).exists()
+        assert summary['backlog_after'] == 1
+
+    def test_writes_in_batches(self, downloads):
+        for i in range(5):
+            make_disclosure(f'S100WB{i}0')
+
+        summary = run_analysis_pipeline(analysis_backlog(), cpu_workers=0, write_batch_size=2)
+
+        assert summary['stages']['write']['count'] == 3
+        assert SentimentAnalysisHistory.objects.count() == 5
+
+
+    def test_runs_inline_inside_daemon_worker(self, downloads, monkeypatch):
+        """daemon プロセスでは ProcessPoolExecutor を作ると AssertionError になるため直列で解析する"""
+        def forbidden(*args, **kwargs):
+            raise AssertionError('daemonic processes are not allowed to have children')
+
+        monkeypatch.setattr(analysis_pipeline, 'ProcessPoolExecutor', forbidden)
+        monkeypatch.setattr(analysis_pipeline.multiprocessing, 'current_process',
+                            lambda: SimpleNamespace(daemon=True))
+        doc = make_disclosure('S100DMN1')
+
+        summary = run_analysis_pipeline(analysis_backlog(), cpu_workers=2)
+
+        assert summary['failed'] == 0
+        assert SentimentAnalysisHistory.objects.filter(document=doc).exists()
+
+    def test_incomplete_documents_leave_backlog_after_max_attempts(self, downloads, settings):
+        settings.DISCLOSURE_ANALYSIS_PIPELINE = {**settings.DISCLOSURE_ANALYSIS_PIPELINE, 'MAX_ATTEMPTS': 2}
+        no_text = make_disclosure('S100NOTN')
+        failing = make_disclosure('S100FALX')
+        make_disclosure('S100DONE')
+
+        run_analysis_pipeline(analysis_backlog(), cpu_workers=0)
+        assert set(analysis_backlog().values_list('doc_id', flat=True)) == {'S100NOTN', 'S100FALX'}
+
+        run_analysis_pipeline(analysis_backlog(), cpu_workers=0)
+        summary = run_analysis_pipeline(analysis_backlog(), cpu_workers=0)
+
+        assert summary['documents'] == 0
+        assert sorted(downloads) == sorted(['S100NOTN', 'S100FALX', 'S100DONE'] + ['S100NOTN', 'S100FALX'])
+        no_text.refresh_from_db()
+        failing.refresh_from_db()
+        assert (no_text.analysis_attempts, failing.analysis_attempts) == (2, 2)
+        # 財務データは保存済み（揃わなかったのは感情分析だけ）
+        assert CompanyFinancialData.objects.filter(document=no_text).exists()
+
+    def test_metrics_are_shared_through_a_file(self, downloads):
+        """別プロセスの --status でも読めるよう、メトリクスはプロセス内のキャッシュではなくファイルに残す"""
+        assert last_run_metrics() is None
+        make_disclosure('S100MET1')
+
+        summary = run_analysis_pipeline(analysis_backlog(), cpu_workers=0)
+
+        assert json.loads(metrics_path().read_text()) == summary
+        out = io.StringIO()
+        call_command('run_disclosure_analysis', '--status', stdout=out)
+        assert "'financial_saved': 1" in out.getvalue()
+        assert 'バックログ: 0件' in out.getvalue()
+
+    def test_zip_is_parsed_once_for_financial_and_text(self, monkeypatch):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('XBRL/PublicDoc/jpcrp030000-asr-001_E02144-000.xbrl', XBRL)
+        payload = buffer.getvalue()
+        expected_text = EDINETXBRLService()._extract_text_from_bytes(payload)
+        indexed = []
+        original = XBRLFinancialExtractor._index_zip_member
+
+        def counting(self, zip_file, file_info, keep_facts=False):
+            indexed.append(file_info.filename)
+            return original(self, zip_file, file_info, keep_facts=keep_facts)
+
+        monkeypatch.setattr(XBRLFinancialExtractor, '_index_zip_member', counting)
+        monkeypatch.setattr(analysis_pipeline, '_xbrl_service', None)
+
+        result = analyze_xbrl_payload(payload, {'doc_id': 'S100ZIP1'}, True, True)
+
+        assert len(indexed) == 1
+        assert result['financial_data']['operating_cf'] == 500_000_000
+        assert result['sentiment']['sentiment_label'] == 'positive'
+        # テキストは従来の _extract_text_from_bytes と同じものを使う
+        assert EDINETXBRLService()._extract_comprehensive_from_bytes(payload, include_text=True)['xbrl_text'] \
+            == expected_text
+
+
+class TestPipelineTask:
+    def test_task_limits_to_given_events(self, downloads):
+        make_disclosure('S100EVT1')
+        make_disclosure('S100EVT2')
+        event = DisclosureEvent.objects.get(doc_id='S100EVT1')
+
+        tasks.run_disclosure_analysis_pipeline_task([event.id])
+
+        assert downloads == ['S100EVT1']
+        assert backlog_depth() == 1
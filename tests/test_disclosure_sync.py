@@ -2,6 +2,9 @@
 import pytest
 from datetime import date, datetime, timedelta, timezone as dt_timezone
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from stockdiary.models import StockDiary, NotificationLog
 from earnings_analysis.models import DocumentMetadata, DisclosureEvent
 from earnings_analysis.services.disclosure_sync import (
@@ -101,6 +104,78 @@ class TestDiaryDisclosureUpdate:
         assert diary.latest_disclosure_date is None
 
 
+class TestIncrementalSync:
+    """ウォーターマーク以降に更新された書類・日記の銘柄だけを再計算する"""
+
+    def test_noop_run_is_single_query(self, sample_diary, django_assert_num_queries):
+        make_document(securities_code='72030', file_date=date.today())
+        update_diary_disclosure_status()
+        with django_assert_num_queries(1):
+            assert update_diary_disclosure_status() == 0
+
+    def test_only_touched_symbols_recomputed(self, sample_diary, another_user, monkeypatch):
+        from earnings_analysis.services import disclosure_sync
+
+        StockDiary.objects.create(user=another_user, stock_symbol='9984', stock_name='ソフトバンクグループ')
+        make_document(doc_id='S100TOYO', securities_code='72030', file_date=date.today())
+        update_diary_disclosure_status()
+
+        fetched = []
+        original = disclosure_sync._fetch_latest_disclosures
+        monkeypatch.setattr(
+            disclosure_sync, '_fetch_latest_disclosures',
+            lambda codes: fetched.append(sorted(codes)) or original(codes),
+        )
+        make_document(doc_id='S100SOFT', securities_code='99840', file_date=date.today())
+        make_document(doc_id='S100UNTR', securities_code='11110', file_date=date.today())  # 誰も記録していない
+        assert update_diary_disclosure_status() == 1
+        assert fetched == [['99840']]
+
+    def test_new_diary_picks_up_existing_disclosure(self, user):
+        make_document(securities_code='72030', file_date=date.today())
+        update_diary_disclosure_status()
+
+        diary = StockDiary.objects.create(user=user, stock_symbol='7203', stock_name='トヨタ自動車')
+        assert update_diary_disclosure_status() == 1
+        diary.refresh_from_db()
+        assert diary.latest_disclosure_date == date.today()
+
+    def test_withdrawn_document_reverts_indicator(self, sample_diary):
+        doc = make_document(securities_code='72030', file_date=date.today())
+        update_diary_disclosure_status()
+
+        doc.withdrawal_status = '1'
+        doc.save()  # 取り下げで updated_at が進む
+        assert update_diary_disclosure_status() == 1
+        sample_diary.refresh_from_db()
+        assert sample_diary.latest_disclosure_date is None
+
+    def test_full_recomputes_without_changes(self, sample_diary):
+        make_document(securities_code='72030', file_date=date.today())
+        update_diary_disclosure_status()
+        # updated_at を進めずに値だけ壊す
+        StockDiary.objects.filter(pk=sample_diary.pk).update(latest_disclosure_date=None)
+
+        assert update_diary_disclosure_status() == 0
+        assert update_diary_disclosure_status(full=True) == 1
+
+    def test_diaries_updated_in_one_statement(self, user):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        for i, symbol in enumerate(['7203', '9984', '6758']):
+            StockDiary.objects.create(user=user, stock_symbol=symbol, stock_name=f'銘柄{i}')
+            make_document(doc_id=f'S100MUL{i}', securities_code=symbol + '0', file_date=date.today())
+
+        with CaptureQueriesContext(connection) as ctx:
+            assert update_diary_disclosure_status() == 3
+        diary_updates = [
+            q for q in ctx.captured_queries
+            if q['sql'].startswith('UPDATE') and 'stockdiary' in q['sql'].split('SET')[0]
+        ]
+        assert len(diary_updates) == 1
+
+
 class TestDisclosureEvents:
     """Stage 1b: 新規開示のイベント化"""
 
@@ -182,6 +257,89 @@ class TestNotificationFanOut:
         update_diary_disclosure_status()
         assert NotificationLog.objects.filter(user=another_user).count() == 0
 
+    def _events_for(self, user, symbols):
+        """symbols（4桁）の日記と当日の有報イベントを作り、通知は消しておく"""
+        for i, symbol in enumerate(symbols):
+            StockDiary.objects.create(user=user, stock_symbol=symbol, stock_name=f'銘柄{symbol}')
+            make_document(securities_code=f'{symbol}0', doc_id=f'S100FAN{i}',
+                          doc_type_code='120', file_date=date.today())
+        update_diary_disclosure_status()
+        NotificationLog.objects.all().delete()
+        return list(DisclosureEvent.objects.all())
+
+    def test_fan_out_query_count_is_independent_of_events(self, user, another_user):
+        """イベント数・ユーザー数によらず、日記の取得1回 + bulk_create だけで済む"""
+        events = self._events_for(user, ['7203', '9984', '6758', '8306'])
+        for symbol in ['7203', '9984']:
+            StockDiary.objects.create(user=another_user, stock_symbol=symbol, stock_name=f'銘柄{symbol}')
+
+        with CaptureQueriesContext(connection) as ctx:
+            created = fan_out_disclosure_notifications(events, digest=False)
+
+        statements = [q['sql'].split()[0] for q in ctx.captured_queries]
+        assert statements.count('SELECT') == 1
+        assert statements.count('INSERT') == 1
+
+        assert created == 6
+        assert NotificationLog.objects.filter(user=user).count() == 4
+        assert NotificationLog.objects.filter(user=another_user).count() == 2
+
+    def test_digest_collapses_per_user(self, user, another_user):
+        events = self._events_for(user, ['7203', '9984', '6758'])
+        diary = StockDiary.objects.create(user=another_user, stock_symbol='7203', stock_name='トヨタ自動車')
+
+        fan_out_disclosure_notifications(events, digest=True)
+
+        digest = NotificationLog.objects.get(user=user)
+        assert '3件' in digest.title
+        assert all(f'銘柄{s}' in digest.message for s in ['7203', '9984', '6758'])
+        assert digest.url == '/stockdiary/'
+        assert digest.disclosure_event_id == min(e.id for e in events)
+        # 1銘柄だけのユーザーは通常の通知
+        single = NotificationLog.objects.get(user=another_user)
+        assert 'トヨタ自動車' in single.title
+        assert single.url == f'/stockdiary/{diary.id}/'
+
+    def test_digest_rerun_does_not_duplicate(self, user):
+        events = self._events_for(user, ['7203', '9984'])
+        fan_out_disclosure_notifications(events, digest=True)
+        fan_out_disclosure_notifications(list(reversed(events)), digest=True)
+        assert NotificationLog.objects.filter(user=user).count() == 1
+
+    def test_digest_is_per_file_date_and_counts_events(self, user):
+        StockDiary.objects.create(user=user, stock_symbol='7203', stock_name='トヨタ自動車')
+        StockDiary.objects.create(user=user, stock_symbol='9984', stock_name='ソフトバンクグループ')
+        today, yesterday = date.today(), date.today() - timedelta(days=1)
+        events = [
+            DisclosureEvent.objects.create(securities_code='72030', doc_id=doc_id, file_date=day,
+                                           doc_type_code=code, doc_type_name=name)
+            for doc_id, day, code, name in [
+                ('S100DG01', today, '120', '有価証券報告書'),
+                ('S100DG02', today, '130', '訂正有価証券報告書'),
+                ('S100DG03', yesterday, '160', '半期報告書'),
+            ]
+        ]
+        events.append(DisclosureEvent.objects.create(
+            securities_code='99840', doc_id='S100DG04', file_date=yesterday,
+            doc_type_code='120', doc_type_name='有価証券報告書'))
+
+        fan_out_disclosure_notifications(events, digest=True)
+
+        logs = {log.disclosure_event.file_date: log for log in NotificationLog.objects.filter(user=user)}
+        assert set(logs) == {today, yesterday}
+        # 1銘柄に2件の開示でも「1銘柄」ではなく件数で数える
+        assert '2件' in logs[today].title
+        assert 'トヨタ自動車' in logs[today].message
+        assert logs[today].disclosure_event_id == events[0].id
+        assert '2件' in logs[yesterday].title
+        assert logs[yesterday].disclosure_event_id == events[2].id
+
+    def test_digest_setting_is_default(self, user, settings):
+        settings.DISCLOSURE_NOTIFICATION_DIGEST = True
+        events = self._events_for(user, ['7203', '9984'])
+        fan_out_disclosure_notifications(events)
+        assert NotificationLog.objects.filter(user=user).count() == 1
+
 
 class TestAutoXBRLAnalysis:
     """新規開示イベントの XBRL 財務分析自動実行"""
@@ -264,7 +422,8 @@ class TestAutoXBRLAnalysis:
 
         assert len(queued) == 1
         func, args = queued[0]
-        assert func == 'earnings_analysis.tasks.auto_analyze_disclosure_task'
+        assert func == 'earnings_analysis.tasks.run_disclosure_analysis_pipeline_task'
+        assert args == ([DisclosureEvent.objects.get().id],)
 
 
 class TestXBRLAnalyzableGuard:
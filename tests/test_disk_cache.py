@@ -0,0 +1,62 @@
+"""ディスクキャッシュの共通部品（earnings_analysis/services/disk_cache.py）のテスト。
+
+なぜこのテストがあるか:
+  書類アーカイブ・感情分析結果・LLM 応答のキャッシュは、それぞれ原子的な書き込みと
+  mtime による LRU 削除を同じように書き写していた。disk_cache にまとめたので、
+  - 書き込みが一時ファイルを残さず、失敗しても途中のファイルを残さないこと
+  - 上限を超えたら最終アクセスの古いものから消し、読んだものは残ること
+  - 3つのキャッシュがこの部品で容量を管理していること
+  を固定する。
+"""
+import os
+import time
+
+import pytest
+
+from earnings_analysis.services import disk_cache
+from earnings_analysis.services.document_archive import DocumentArchiveStore
+from earnings_analysis.services.llm_gateway import LLMResponseCache
+from earnings_analysis.services.sentiment_cache import SentimentResultCache
+
+
+def test_atomic_write_leaves_no_temp_files(tmp_path, monkeypatch):
+    path = tmp_path / 'ab' / 'entry.gz'
+    disk_cache.write_gzip(path, b'payload' * 100)
+
+    assert disk_cache.read_gzip(path) == b'payload' * 100
+
+    def broken(src, dst):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(disk_cache.os, 'replace', broken)
+    with pytest.raises(OSError):
+        disk_cache.write_gzip(path, b'other')
+
+    assert disk_cache.read_gzip(path) == b'payload' * 100
+    assert [p.name for p in path.parent.iterdir()] == ['entry.gz']
+
+
+def test_evicts_least_recently_used(tmp_path):
+    lru = disk_cache.LRUDirectory(tmp_path, '*/*.gz', max_bytes=10 ** 6, label='テスト')
+    paths = [tmp_path / 'aa' / f'{i}.gz' for i in range(3)]
+    for i, path in enumerate(paths):
+        disk_cache.write_gzip(path, os.urandom(1000))
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+    disk_cache.touch(paths[0])  # 0 を最近使ったことにする
+
+    assert lru.evict(max_bytes=lru.stats()['bytes'] - 1) == 1
+
+    assert [p.exists() for p in paths] == [True, False, True]
+    assert lru.stats()['files'] == 2
+
+
+@pytest.mark.parametrize('make_store', [
+    lambda root: DocumentArchiveStore(root),
+    lambda root: SentimentResultCache(root),
+    lambda root: LLMResponseCache(root, ttl_seconds=60, max_bytes=10 ** 6),
+], ids=['archive', 'sentiment', 'llm'])
+def test_caches_share_the_lru(tmp_path, make_store):
+    store = make_store(tmp_path)
+
+    assert isinstance(store._lru, disk_cache.LRUDirectory)
+    assert store._lru.max_bytes == store.max_bytes
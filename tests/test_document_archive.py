@@ -0,0 +1,127 @@
+"""EDINET 書類ファイルのローカルアーカイブ（DocumentArchiveStore）のテスト。
+
+なぜこのテストがあるか:
+  包括分析・感情分析・パネル表示・再分析が同じ doc_id の XBRL ZIP を毎回
+  EDINET からダウンロードし直していた。(doc_id, 書類タイプ) 単位のディスク
+  アーカイブを挟んだので、2回目以降は API を叩かないこと、壊れたファイルや
+  エラー応答を返さない／保存しないこと、容量上限で古いものから消えることを固定する。
+"""
+import gzip
+import os
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+
+from earnings_analysis.models import DocumentMetadata
+from earnings_analysis.services.document_archive import DocumentArchiveStore
+from earnings_analysis.services.document_service import EdinetDocumentService
+from earnings_analysis.services.edinet_api import EdinetAPIClient
+from earnings_analysis.services.xbrl_extractor import EDINETXBRLService
+from stockdiary.models import StockDiary
+
+ZIP_BYTES = b'PK\x03\x04' + b'x' * 2000
+
+
+@pytest.fixture
+def archive_root(tmp_path, settings):
+    settings.EDINET_ARCHIVE_SETTINGS = {'ROOT': str(tmp_path / 'archive'), 'MAX_BYTES': 10 ** 9}
+    return tmp_path / 'archive'
+
+
+class TestDocumentArchiveStore:
+    def test_roundtrip_is_compressed_and_deduplicated(self, tmp_path):
+        store = DocumentArchiveStore(tmp_path)
+        digest = store.put('S100AAAA', 1, ZIP_BYTES)
+        store.put('S100BBBB', 1, ZIP_BYTES)  # 同一内容は blob を共有
+
+        assert store.get('S100AAAA', 1) == ZIP_BYTES
+        assert store.get('S100BBBB', 1) == ZIP_BYTES
+        assert store.get('S100AAAA', 2) is None
+        assert store.stats()['blobs'] == 1
+        blob = store._blob_path(digest)
+        assert blob.stat().st_size < len(ZIP_BYTES)
+        assert gzip.decompress(blob.read_bytes()) == ZIP_BYTES
+
+    def test_corrupted_blob_is_discarded(self, tmp_path):
+        store = DocumentArchiveStore(tmp_path)
+        digest = store.put('S100AAAA', 1, ZIP_BYTES)
+        store._blob_path(digest).write_bytes(gzip.compress(b'tampered'))
+
+        assert store.get('S100AAAA', 1) is None
+        assert not store._blob_path(digest).exists()
+        assert not store._ref_path('S100AAAA', 1).exists()
+
+    def test_lru_eviction_keeps_recently_used(self, tmp_path):
+        store = DocumentArchiveStore(tmp_path, max_bytes=10 ** 9)
+        docs = {f'S100000{i}': bytes([i]) * 5000 + b'%d' % i for i in range(3)}
+        for n, (doc_id, data) in enumerate(docs.items()):
+            digest = store.put(doc_id, 2, data)
+            # mtime を明示的にずらす（ファイルシステムの時刻分解能に依存しない）
+            os.utime(store._blob_path(digest), (1000 + n, 1000 + n))
+
+        # 最古の S1000000 を読むと最新扱いになり、次に古い S1000001 が消える
+        assert store.get('S1000000', 2) is not None
+        size = store.stats()['bytes']
+        store.evict(max_bytes=size - 1)
+
+        assert store.get('S1000001', 2) is None
+        assert store.get('S1000000', 2) == docs['S1000000']
+        assert store.get('S1000002', 2) == docs['S1000002']
+
+    def test_error_response_is_not_stored(self, tmp_path):
+        store = DocumentArchiveStore(tmp_path)
+        data = store.get_or_fetch('S100AAAA', 1, lambda: b'{"metadata": {"status": "404"}}')
+        assert data.startswith(b'{')
+        assert store.get('S100AAAA', 1) is None
+
+
+class TestArchiveConsumers:
+    def test_xbrl_service_downloads_once(self, archive_root):
+        document = mock.Mock(doc_id='S100XBRL', xbrl_flag=True)
+        service = EDINETXBRLService()
+        with mock.patch.object(EdinetAPIClient, 'get_document', return_value=ZIP_BYTES) as get_document, \
+             mock.patch.object(service, '_extract_comprehensive_from_bytes', return_value={'financial_data': {}}), \
+             mock.patch.object(service, '_extract_text_from_bytes', return_value={}):
+            service.get_comprehensive_analysis_from_document(document)
+            service.get_xbrl_text_from_document(document)
+            service.get_comprehensive_analysis_from_document(document)
+
+        assert get_document.call_count == 1
+
+    def test_document_service_reads_through_archive(self, archive_root):
+        pdf = b'%PDF-1.7' + b'y' * 100
+        service = EdinetDocumentService()
+        with mock.patch.object(EdinetAPIClient, 'get_document', return_value=pdf) as get_document:
+            first = service.download_document('S100PDF1', 'pdf')
+            second = service.download_document('S100PDF1', 'pdf')
+
+        assert first['data'] == second['data'] == pdf
+        assert get_document.call_count == 1
+
+
+@pytest.mark.django_db
+class TestPrefetchCommand:
+    def _document(self, doc_id, securities_code, doc_type_code='120'):
+        return DocumentMetadata.objects.create(
+            doc_id=doc_id, edinet_code='E00001', securities_code=securities_code,
+            company_name='テスト株式会社', doc_type_code=doc_type_code,
+            submit_date_time=datetime.now(dt_timezone.utc), file_date=date.today(),
+            doc_description='テスト書類', legal_status='1', withdrawal_status='0',
+            xbrl_flag=True, pdf_flag=True,
+        )
+
+    def test_prefetch_pulls_only_tracked_important_disclosures(self, archive_root, user):
+        StockDiary.objects.create(user=user, stock_symbol='7203', stock_name='トヨタ自動車')
+        self._document('S100HELD', '72030')
+        self._document('S100OTHR', '99990')           # 日記に無い銘柄
+        self._document('S100EXTR', '72030', '180')    # 重要開示以外
+
+        with mock.patch.object(EdinetAPIClient, 'get_document', return_value=ZIP_BYTES) as get_document:
+            call_command('prefetch_edinet_archives')
+            call_command('prefetch_edinet_archives')  # 再実行は保存済みのため取得しない
+
+        assert [c.args[0] for c in get_document.call_args_list] == ['S100HELD']
+        store = DocumentArchiveStore(archive_root)
+        assert store.get('S100HELD', 1) == ZIP_BYTES
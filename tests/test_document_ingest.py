@@ -0,0 +1,146 @@
+"""書類一覧の一括取り込み（document_ingest.upsert_documents）のテスト。
+
+なぜこのテストがあるか:
+  daily_update / collect_initial_data の取り込みを、チャンクごとの
+  select_for_update + bulk_update + bulk_create(ignore_conflicts) から
+  doc_id の upsert（INSERT ... ON CONFLICT DO UPDATE）に置き換えた。
+  既存行で更新する列が従来どおり区分のみであること、1日分が少ない文数で入ること、
+  取り込み速度が BatchExecution に残ること、upsert が DB エラーになったときの
+  チャンク処理へのフォールバックで書類が取り込めることを固定する。
+"""
+from datetime import date, timedelta
+
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
+
+from earnings_analysis.models import BatchExecution, DocumentMetadata
+from earnings_analysis.services.document_ingest import upsert_documents
+
+
+def api_row(i, **overrides):
+    row = {
+        'docID': f'S1{i:06d}',
+        'edinetCode': 'E02144',
+        'secCode': '72030',
+        'filerName': 'テスト株式会社',
+        'fundCode': None,
+        'ordinanceCode': '010',
+        'formCode': '030000',
+        'docTypeCode': '120',
+        'periodStart': '2024-04-01',
+        'periodEnd': '2025-03-31',
+        'submitDateTime': '2025-06-20 15:00',
+        'docDescription': '有価証券報告書',
+        'xbrlFlag': '1',
+        'pdfFlag': '1',
+        'attachDocFlag': '0',
+        'englishDocFlag': '0',
+        'csvFlag': '1',
+        'legalStatus': '1',
+        'withdrawalStatus': '0',
+        'docInfoEditStatus': '0',
+        'disclosureStatus': '0',
+    }
+    row.update(overrides)
+    return row
+
+
+class TestUpsertDocuments:
+    def test_creates_then_updates_status_only(self):
+        file_date = date(2025, 6, 20)
+        stats = upsert_documents([api_row(1), api_row(2)], file_date)
+        assert stats['rows'] == 2
+        assert stats['batches'] == 1
+
+        # 再取得時: 区分は更新、提出者名などは初回の値を保持
+        upsert_documents([api_row(1, withdrawalStatus='1', filerName='別名')], date(2025, 6, 21))
+
+        doc = DocumentMetadata.objects.get(doc_id='S1000001')
+        assert doc.withdrawal_status == '1'
+        assert doc.company_name == 'テスト株式会社'
+        assert doc.file_date == file_date
+        assert doc.fund_code == ''
+        assert doc.xbrl_flag is True and doc.attach_doc_flag is False
+        assert DocumentMetadata.objects.count() == 2
+
+    def test_duplicate_doc_ids_in_one_batch(self):
+        rows = [api_row(1), api_row(1, legalStatus='2')]
+        assert upsert_documents(rows, date(2025, 6, 20))['rows'] == 1
+        assert DocumentMetadata.objects.get(doc_id='S1000001').legal_status == '2'
+
+    def test_full_day_in_few_statements(self):
+        rows = (api_row(i) for i in range(2500))  # ジェネレータでも読める
+        with CaptureQueriesContext(connection) as ctx:
+            stats = upsert_documents(rows, date(2025, 6, 20), batch_size=2000)
+
+        assert stats['rows'] == 2500
+        assert stats['batches'] == 2
+        assert stats['rows_per_second'] > 0
+        assert DocumentMetadata.objects.count() == 2500
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        # チャンク毎の SELECT / UPDATE は無く、INSERT 文の数は DB のパラメータ上限だけで決まる
+        # （PostgreSQL は 2000 行 / 文、SQLite は Django が上限に合わせて分割する）
+        assert not any(q['sql'].startswith(('SELECT', 'UPDATE')) for q in ctx.captured_queries)
+        fields = [f for f in DocumentMetadata._meta.concrete_fields if not f.primary_key]
+        per_statement = min(2000, connection.ops.bulk_batch_size(fields, [None] * 2000))
+        assert len(inserts) == -(-2000 // per_statement) + -(-500 // per_statement)
+
+
+class TestDailyUpdateRecordsThroughput:
+    def test_batch_execution_has_rows_per_second(self, monkeypatch):
+        from django.core.management import call_command
+        from earnings_analysis.management.commands import daily_update
+
+        monkeypatch.setattr(
+            daily_update.Command, '_execute_update_with_retry',
+            lambda self, target_date, api_version, retry_count: [api_row(i) for i in range(30)],
+        )
+        monkeypatch.setattr(daily_update.Command, '_update_disclosure_indicators', lambda self: None)
+        target = date.today() - timedelta(days=1)
+        call_command('daily_update', date=target.isoformat(), skip_company_update=True)
+
+        batch = BatchExecution.objects.get(batch_date=target)
+        assert batch.status == 'SUCCESS'
+        assert batch.processed_count == 30
+        assert batch.ingest_rows_per_second > 0
+        assert batch.ingest_seconds is not None
+        assert DocumentMetadata.objects.count() == 30
+
+
+class TestFallbackWhenUpsertFails:
+    """upsert が DB エラーになったときのチャンク処理（document_from_api で新規行を作る）"""
+
+    def failing_upsert(self, *args, **kwargs):
+        raise DatabaseError('upsert failed')
+
+    def test_daily_update_falls_back_to_chunks(self, monkeypatch):
+        from django.core.management import call_command
+        from earnings_analysis.management.commands import daily_update
+
+        monkeypatch.setattr(daily_update, 'upsert_documents', self.failing_upsert)
+        monkeypatch.setattr(
+            daily_update.Command, '_execute_update_with_retry',
+            lambda self, target_date, api_version, retry_count: [api_row(i) for i in range(30)],
+        )
+        monkeypatch.setattr(daily_update.Command, '_update_disclosure_indicators', lambda self: None)
+        target = date.today() - timedelta(days=1)
+        call_command('daily_update', date=target.isoformat(), skip_company_update=True, chunk_size=10)
+
+        assert BatchExecution.objects.get(batch_date=target).status == 'SUCCESS'
+        assert DocumentMetadata.objects.count() == 30
+        assert DocumentMetadata.objects.get(doc_id='S1000001').company_name == 'テスト株式会社'
+
+    def test_collect_initial_data_falls_back_to_chunks(self, monkeypatch):
+        from earnings_analysis.management.commands import collect_initial_data
+
+        monkeypatch.setattr(collect_initial_data, 'upsert_documents', self.failing_upsert)
+        command = collect_initial_data.Command()
+        command.chunk_size = 10
+        command.max_retries = 1
+        target = date(2025, 6, 20)
+
+        processed = command._collect_date_data_with_retry(target, lambda: [api_row(i) for i in range(25)])
+
+        assert processed == 25
+        assert BatchExecution.objects.get(batch_date=target).status == 'SUCCESS'
+        assert DocumentMetadata.objects.count() == 25
@@ -0,0 +1,133 @@
+"""EDINET バックフィル（collect_initial_data）の先読み・共有レート制限・再開のテスト。
+
+なぜこのテストがあるか:
+  collect_initial_data は日付を1日ずつ「API 取得（2秒間隔待ち）→ DB 取り込み」と直列に進めていた。
+  --concurrency で後続日の取得をスレッドで先行させるようにしたので、
+  - 間隔制限（トークンバケット）がクライアント・スレッドをまたいで共有されること
+  - 先読みしても日付順に取り込まれ、取得と取り込みが重なること
+  - 完了済みの日をチェックポイントとして飛ばし、中断後に残りから再開できること
+  を固定する。
+"""
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from earnings_analysis.management.commands import collect_initial_data
+from earnings_analysis.models import BatchExecution, DocumentMetadata
+from earnings_analysis.services.edinet_api import EdinetAPIClient
+from earnings_analysis.services.rate_limiter import TokenBucket, get_rate_limiter
+
+
+def api_row(doc_id):
+    return {
+        'docID': doc_id, 'edinetCode': 'E02144', 'secCode': '72030', 'filerName': 'テスト株式会社',
+        'fundCode': None, 'ordinanceCode': '010', 'formCode': '030000', 'docTypeCode': '120',
+        'periodStart': None, 'periodEnd': None, 'submitDateTime': '2025-06-20 15:00',
+        'docDescription': '有価証券報告書', 'xbrlFlag': '1', 'pdfFlag': '1', 'attachDocFlag': '0',
+        'englishDocFlag': '0', 'csvFlag': '0', 'legalStatus': '1', 'withdrawalStatus': '0',
+        'docInfoEditStatus': '0', 'disclosureStatus': '0',
+    }
+
+
+class TestTokenBucket:
+    def test_waits_are_reserved_in_order(self):
+        clock = [0.0]
+        slept = []
+        bucket = TokenBucket(rate=0.5, capacity=1, clock=lambda: clock[0], sleep=slept.append)
+
+        assert [bucket.acquire() for _ in range(3)] == [0.0, 2.0, 4.0]
+        assert slept == [2.0, 4.0]
+
+        # 十分時間が経てば容量まで補充される（それ以上は貯まらない）
+        clock[0] = 100.0
+        assert bucket.acquire() == 0.0
+        assert bucket.acquire() == 2.0
+
+    def test_rate_is_shared_across_threads(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)])
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # 20回 / 50回毎秒（最初の1回は即時）
+        assert time.monotonic() - started >= 19 / 50 * 0.95
+
+    def test_clients_share_one_bucket_per_host(self):
+        a = EdinetAPIClient.create_v2_client()
+        b = EdinetAPIClient.create_v2_client()
+        v1 = EdinetAPIClient.create_v1_client()
+        assert a.rate_limiter is b.rate_limiter
+        assert a.rate_limiter is not v1.rate_limiter
+        assert a.rate_limiter.rate == pytest.approx(1 / a.min_interval)
+        assert get_rate_limiter('edinet:api.edinet-fsa.go.jp', a.rate_limiter.rate) is a.rate_limiter
+
+
+@pytest.fixture
+def command(monkeypatch):
+    """API を使わずに日付範囲処理だけを動かす collect_initial_data"""
+    fetched = []
+    lock = threading.Lock()
+
+    def fake_fetch(self, service, date_str):
+        time.sleep(0.1)  # API 応答待ち相当
+        with lock:
+            fetched.append(date_str)
+        return [api_row(f'S{date_str.replace("-", "")[2:]}{i}') for i in range(2)]
+
+    monkeypatch.setattr(collect_initial_data.Command, '_fetch_documents_safe', fake_fetch)
+    monkeypatch.setattr(collect_initial_data, 'EdinetDocumentService', lambda prefer_v1=False: object())
+
+    cmd = collect_initial_data.Command()
+    cmd.chunk_size = 100
+    cmd.max_retries = 3
+    cmd.concurrency = 1
+    cmd.api_version = 'v2'
+    cmd.initial_memory = 0
+    cmd.fetched = fetched
+    return cmd
+
+
+class TestBackfillPipeline:
+    start = date(2025, 6, 2)
+    end = date(2025, 6, 7)
+
+    def test_prefetch_ingests_every_day_in_order(self, command):
+        command.concurrency = 3
+        started = time.monotonic()
+        command._process_date_range(None, self.start, self.end)
+        elapsed = time.monotonic() - started
+
+        batches = list(BatchExecution.objects.order_by('batch_date'))
+        assert [b.batch_date for b in batches] == [self.start + timedelta(days=i) for i in range(6)]
+        assert all(b.status == 'SUCCESS' and b.processed_count == 2 for b in batches)
+        assert DocumentMetadata.objects.count() == 12
+        assert DocumentMetadata.objects.get(doc_id='S2506020').file_date == self.start
+        # 直列なら 6 × 0.1 秒以上かかる取得が重なっている
+        assert elapsed < 0.45
+
+    def test_resume_skips_completed_days(self, command):
+        for i in range(3):
+            BatchExecution.objects.create(
+                batch_date=self.start + timedelta(days=i), status='SUCCESS', processed_count=5,
+            )
+        BatchExecution.objects.create(batch_date=self.start + timedelta(days=3), status='FAILED')
+
+        command.concurrency = 2
+        command._process_date_range(None, self.start, self.end)
+
+        assert sorted(command.fetched) == ['2025-06-05', '2025-06-06', '2025-06-07']
+        assert BatchExecution.objects.filter(status='SUCCESS').count() == 6
+        # 完了済みの日の記録は書き換えない
+        assert BatchExecution.objects.get(batch_date=self.start).processed_count == 5
+
+    def test_sequential_mode_unchanged(self, command):
+        command._process_date_range(None, self.start, self.start + timedelta(days=1))
+        assert command.fetched == ['2025-06-02', '2025-06-03']
+        assert DocumentMetadata.objects.count() == 4
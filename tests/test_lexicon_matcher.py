@@ -0,0 +1,238 @@
+"""感情辞書の多パターン照合（LexiconMatcher）のテスト。
+
+なぜこのテストがあるか:
+  TransparentSentimentAnalyzer._find_basic_words は語彙ごとに本文全体を text.find で走査し、
+  出現ごとに処理済み位置すべてと重なりを調べていた（語彙数 × 本文長 + ヒット数²）。
+  辞書をトライの正規表現にして1回の走査で全出現を求めるようにしたので、
+  検出結果（語彙・件数・順序、長い語彙優先の重なり除外、文脈語の除外）と
+  search_words の出現回数が従来の実装と一致すること、有報1冊分の本文での速度を固定する。
+  辞書を読み込み直したら（語彙数が同じでも）新しい語彙で照合することも固定する。
+  文脈パターン（改善・悪化・否定）も辞書読み込み時にコンパイルした ContextPatternMatcher に置き換え、
+  文レベル分析は文書全体の一致を切り出して使う（文ごとに再走査しない）ので、
+  パターンごとの一致・件数・スコアと文レベルの結果が従来と一致することを固定する。
+"""
+import random
+import time
+
+import re
+
+import pytest
+
+from earnings_analysis.services.lexicon_matcher import ContextPatternMatcher, LexiconMatcher
+from earnings_analysis.services.sentiment_analyzer import (
+    TransparentSentimentAnalyzer,
+    TransparentSentimentDictionary,
+)
+from tests.fixtures.edinet_sample import _PARAGRAPH
+
+
+def legacy_find_basic_words(analyzer, text, context_matches):
+    """置き換え前の _find_basic_words（比較用）"""
+    matches = []
+    context_words = {word for word, _, _, _ in context_matches}
+    sorted_words = sorted(analyzer.dictionary.sentiment_dict.items(), key=lambda x: len(x[0]), reverse=True)
+    processed_positions = set()
+    for word, score in sorted_words:
+        if len(word) < 1 or word in context_words:
+            continue
+        word_positions = []
+        start = 0
+        while True:
+            pos = text.find(word, start)
+            if pos == -1:
+                break
+            word_end = pos + len(word)
+            if not any(pos < end and word_end > start_pos for start_pos, end in processed_positions):
+                word_positions.append((pos, word_end))
+            start = pos + 1
+        if word_positions:
+            count = min(len(word_positions), analyzer.config.max_word_count_weight)
+            matches.append((word, score, '基本語彙', count))
+            processed_positions.update(word_positions)
+    return matches
+
+
+def legacy_find_context_patterns(dictionary, text):
+    """置き換え前の _find_context_patterns（比較用）"""
+    matches = []
+    for pattern in dictionary.improvement_patterns:
+        found = list(re.finditer(pattern, text, re.IGNORECASE))
+        if found:
+            matches.append((found[0].group(), 0.7, '改善表現', len(found)))
+    for pattern in dictionary.deterioration_patterns:
+        found = list(re.finditer(pattern, text, re.IGNORECASE))
+        if found:
+            matches.append((found[0].group(), -0.6, '悪化表現', len(found)))
+    for pattern in dictionary.negation_patterns:
+        found = list(re.finditer(pattern, text, re.IGNORECASE))
+        if found:
+            matched_text = found[0].group()
+            positive = any(w in matched_text.lower() for w in ['成長', '増収', '増益', '改善', '回復', '向上'])
+            matches.append((matched_text, -0.4 if positive else 0.4, '否定表現', len(found)))
+    return matches
+
+
+def legacy_search_words(dictionary, text):
+    return [
+        (word, score, text.count(word))
+        for word, score in dictionary.sentiment_dict.items() if word in text
+    ]
+
+
+CORPUS = [
+    '当期は大幅増収増益となり、過去最高益を更新しました。',
+    '赤字転落は回避したものの、営業損失の改善には至らず、減収幅の縮小にとどまりました。',
+    '業績悪化に歯止めがかかり、低迷からの脱却が見えてきました。',
+    '増収の鈍化と成長の鈍化が続き、好調に陰りが見られます。',
+    'ああああ',
+    '',
+    '受注は堅調で、黒字化・黒字転換を果たし、V字回復を達成しました。増収増収増収。',
+]
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return TransparentSentimentAnalyzer()
+
+
+def random_corpus(words, n=200, seed=11):
+    """辞書語と地の文をでたらめに連結した本文（部分重なりを多く含む）"""
+    rng = random.Random(seed)
+    fillers = ['の', 'が', '、', '。', '幅', '大幅', '当期は', 'から', '化']
+    texts = []
+    for _ in range(n):
+        parts = [rng.choice(words) if rng.random() < 0.6 else rng.choice(fillers) for _ in range(rng.randint(1, 30))]
+        texts.append(''.join(parts))
+    return texts
+
+
+class TestLexiconMatcher:
+    def test_find_all_matches_every_occurrence(self):
+        matcher = LexiconMatcher(['増収', '増', '収益', '大幅増収', 'ああ'])
+        found = matcher.find_all('大幅増収益、ああああ')
+        assert found == {
+            '大幅増収': [0], '増': [2], '増収': [2], '収益': [3], 'ああ': [6, 7, 8],
+        }
+
+    def test_count_non_overlapping_matches_str_count(self):
+        matcher = LexiconMatcher(['ああ'])
+        text = 'あああああ'
+        starts = matcher.find_all(text)['ああ']
+        assert LexiconMatcher.count_non_overlapping('ああ', starts) == text.count('ああ') == 2
+
+    def test_empty_dictionary(self):
+        assert LexiconMatcher([]).find_all('増収') == {}
+
+
+class TestFindBasicWordsEquivalence:
+    def test_fixture_corpus(self, analyzer):
+        for text in CORPUS:
+            assert analyzer._find_basic_words(text, []) == legacy_find_basic_words(analyzer, text, [])
+
+    def test_random_corpus(self, analyzer):
+        words = list(analyzer.dictionary.sentiment_dict)
+        for text in random_corpus(words):
+            assert analyzer._find_basic_words(text, []) == legacy_find_basic_words(analyzer, text, [])
+            assert analyzer.dictionary.search_words(text) == legacy_search_words(analyzer.dictionary, text)
+
+    def test_context_words_excluded(self, analyzer):
+        text = '赤字縮小が進み、赤字の改善と増益を確保しました。'
+        context = [('赤字縮小', 0.8, '文脈パターン', 1)]
+        result = analyzer._find_basic_words(text, context)
+        assert result == legacy_find_basic_words(analyzer, text, context)
+        assert '赤字縮小' not in [word for word, _, _, _ in result]
+
+    def test_same_length_words_follow_dictionary_order(self, analyzer, tmp_path):
+        """同じ長さで重なる語は辞書順に先取りする（短い語は空いた位置だけ数える）"""
+        csv_path = tmp_path / 'dict.csv'
+        csv_path.write_text('word,score\nBCD,0.5\nABC,-0.5\nA,0.1\n', encoding='utf-8')
+        custom = TransparentSentimentAnalyzer()
+        custom.dictionary = TransparentSentimentDictionary(str(csv_path))
+
+        text = 'ABCD ABC'
+        assert custom._find_basic_words(text, []) == legacy_find_basic_words(custom, text, [])
+        assert custom._find_basic_words(text, []) == [
+            ('BCD', 0.5, '基本語彙', 1), ('ABC', -0.5, '基本語彙', 1), ('A', 0.1, '基本語彙', 1),
+        ]
+
+    def test_reload_with_same_size_rebuilds_matcher(self, analyzer, tmp_path):
+        """語彙数が同じでも、読み込み直した辞書の語彙で照合する"""
+        csv_path = tmp_path / 'dict.csv'
+        csv_path.write_text('word,score\n増収,0.5\n減益,-0.5\n', encoding='utf-8')
+        custom = TransparentSentimentAnalyzer()
+        custom.dictionary = TransparentSentimentDictionary(str(csv_path))
+        assert custom._find_basic_words('増収と減益と黒字', []) == [
+            ('増収', 0.5, '基本語彙', 1), ('減益', -0.5, '基本語彙', 1),
+        ]
+
+        csv_path.write_text('word,score\n増収,0.5\n黒字,0.6\n', encoding='utf-8')
+        custom.dictionary.load_dictionary()
+
+        assert custom._find_basic_words('増収と減益と黒字', []) == [
+            ('増収', 0.5, '基本語彙', 1), ('黒字', 0.6, '基本語彙', 1),
+        ]
+
+
+CONTEXT_CORPUS = [
+    '減収幅の縮小が続き、赤字の改善と損失縮小を達成しました。業績悪化からの回復も見えています。',
+    '増収の鈍化、増益の遅れ、好調に陰りが出ており、成長の勢いは鈍化しました。',
+    '赤字ではない。減益ではなく、増収には至らず、成長とは言えない状況です。',
+    '無配からの復配を果たし、赤字からの黒字転換も実現。悪化に歯止めがかかりました。',
+    '減収減益の改善改善',
+]
+
+
+class TestContextPatternEquivalence:
+    def test_document_level(self, analyzer):
+        words = list(analyzer.dictionary.sentiment_dict)
+        for text in CONTEXT_CORPUS + random_corpus(words + CONTEXT_CORPUS, n=100, seed=5):
+            assert analyzer._find_context_patterns(text) == legacy_find_context_patterns(analyzer.dictionary, text)
+
+    def test_sentence_level_reuses_document_hits(self, analyzer):
+        text = '\n'.join(CONTEXT_CORPUS * 3) + '。  赤字の改善が進みました  。'
+        matcher = analyzer.dictionary.context_matcher
+        hits = matcher.scan(text)
+        spans = analyzer._split_sentence_spans(text)
+
+        assert [sentence for sentence, _ in spans] == analyzer._split_sentences(text)
+        for sentence, start in spans:
+            assert text[start:start + len(sentence)] == sentence
+            within = matcher.hits_within(hits, start, start + len(sentence))
+            assert matcher.summarize(within) == legacy_find_context_patterns(analyzer.dictionary, sentence)
+
+        sentences = [sentence for sentence, _ in spans]
+        reused = analyzer._analyze_sentences(
+            sentences, [matcher.hits_within(hits, start, start + len(s)) for s, start in spans]
+        )
+        assert reused == analyzer._analyze_sentences(sentences)
+
+    def test_hit_crossing_range_requests_rescan(self):
+        matcher = ContextPatternMatcher(['赤字。縮小'], [], [])
+        hits = matcher.scan('前期は赤字。縮小した')
+        assert matcher.hits_within(hits, 0, 6) is None
+        assert matcher.hits_within(hits, 8, 11) == []
+
+
+@pytest.mark.slow
+class TestLexiconMatcherBenchmark:
+    """有報1冊分（約20万字）の本文での比較"""
+
+    def test_matcher_is_faster_than_per_word_scan(self, analyzer):
+        words = list(analyzer.dictionary.sentiment_dict)
+        rng = random.Random(3)
+        text = ''.join(
+            _PARAGRAPH + rng.choice(words) + 'となりました。' for _ in range(1000)
+        )
+
+        started = time.perf_counter()
+        legacy = legacy_find_basic_words(analyzer, text, [])
+        legacy_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = analyzer._find_basic_words(text, [])
+        matcher_seconds = time.perf_counter() - started
+
+        print(f"\n語彙照合 {len(words)}語 / {len(text)}字: "
+              f"従来 {legacy_seconds:.3f}s → トライ照合 {matcher_seconds:.3f}s")
+        assert result == legacy
+        assert matcher_seconds * 3 < legacy_seconds
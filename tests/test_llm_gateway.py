@@ -0,0 +1,286 @@
+"""Gemini 呼び出しの共通ゲートウェイ（llm_gateway）のテスト。
+
+なぜこのテストがあるか:
+  レポート生成・ブレイクアウト判定・銘柄比較などは genai.Client を直接呼んでいて、
+  同じプロンプト（レポートの再生成、同じ開示の同時分析、同じ銘柄の再比較）でも毎回
+  API の待ち時間とクォータを使っていた。全呼び出しをゲートウェイに通し、応答キャッシュ・
+  シングルフライト・モデルごとの上限・メトリクスを入れたので、
+  - 同じ (モデル, プロンプト, 設定) はキャッシュから返し、どれかが違えば呼ぶこと
+  - 期限切れ・空の応答・解釈できなかった応答はキャッシュから返さないこと
+    （レポート・見解・AI Expert・ブレイクアウト・銘柄比較のどれでも）
+  - 使われなくなったロックファイルは evict で消え、使用中のものは残ること
+  - 同時に来た同じ呼び出しは1回だけ API を呼び、先行が失敗したら各自で呼ぶこと
+  - モデルごとの同時実行数を超えないこと
+  - 呼び出し回数・トークン数を集計し、バッチの終わりにログへ出してリセットすること
+  - 各サービスがゲートウェイ経由で呼ぶこと
+  を固定する。
+"""
+import logging
+import os
+import threading
+import time
+
+import pytest
+from google import genai
+
+from earnings_analysis.services import llm_gateway
+from earnings_analysis.services.ai_expert_analyzer import AIExpertAnalyzer
+from earnings_analysis.services.breakout_detector import BREAKOUT_PATTERNS, BreakoutDetector
+from earnings_analysis.services.gemini_insights import GeminiInsightsGenerator
+from earnings_analysis.services.gemini_service import GeminiReportGenerator
+from earnings_analysis.services.llm_gateway import (
+    FakeLLMClient, LLMGateway, LLMResponseCache, get_llm_gateway, log_llm_metrics,
+)
+from stockdiary.services.gemini_stock_analysis import GeminiStockAnalyzer
+
+MODEL = 'gemini-test'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(tmp_path / 'llm', ttl_seconds=3600, max_bytes=10 * 1024 ** 2)
+
+
+def make_gateway(cache, responder=None, delay=0.0, **kwargs):
+    kwargs.setdefault('default_limits', {'CONCURRENCY': 8, 'RPM': 0})
+    return LLMGateway(FakeLLMClient(responder or (lambda model, prompt: f'answer: {prompt}'), delay),
+                      cache=cache, **kwargs)
+
+
+class TestResponseCache:
+    def test_identical_call_is_served_from_cache(self, cache):
+        gateway = make_gateway(cache)
+        config = genai.types.GenerateContentConfig(temperature=0.7, max_output_tokens=4000)
+
+        first = gateway.generate_content(MODEL, 'トヨタを分析', config)
+        second = gateway.generate_content(MODEL, 'トヨタを分析',
+                                          genai.types.GenerateContentConfig(temperature=0.7, max_output_tokens=4000))
+
+        assert (first.cached, second.cached) == (False, True)
+        assert second.text == first.text == 'answer: トヨタを分析'
+        assert second.usage_metadata.prompt_token_count == first.usage_metadata.prompt_token_count
+        assert len(gateway.backend.calls) == 1
+
+        # モデル・プロンプト・設定のどれかが違えば呼ぶ
+        gateway.generate_content('gemini-other', 'トヨタを分析', config)
+        gateway.generate_content(MODEL, 'ホンダを分析', config)
+        gateway.generate_content(MODEL, 'トヨタを分析', genai.types.GenerateContentConfig(temperature=0.2))
+        gateway.generate_content(MODEL, 'トヨタを分析', config, cache=False)
+        assert len(gateway.backend.calls) == 5
+
+    def test_cache_is_shared_between_gateways(self, cache):
+        make_gateway(cache).generate_content(MODEL, 'prompt')
+        other = make_gateway(cache)
+
+        assert other.generate_content(MODEL, 'prompt').cached
+        assert other.backend.calls == []
+
+    def test_expired_and_empty_responses_are_not_served(self, tmp_path):
+        expired = LLMResponseCache(tmp_path / 'llm', ttl_seconds=-1, max_bytes=10 * 1024 ** 2)
+        gateway = make_gateway(expired)
+        gateway.generate_content(MODEL, 'prompt')
+        assert not gateway.generate_content(MODEL, 'prompt').cached
+
+        gateway = make_gateway(LLMResponseCache(tmp_path / 'llm2', 3600, 10 * 1024 ** 2),
+                               responder=lambda model, prompt: '')
+        gateway.generate_content(MODEL, 'prompt')
+        gateway.generate_content(MODEL, 'prompt')
+        assert len(gateway.backend.calls) == 2
+
+    def test_invalidate(self, cache):
+        gateway = make_gateway(cache)
+        gateway.generate_content(MODEL, 'prompt')
+
+        gateway.invalidate(MODEL, 'prompt')
+
+        assert not gateway.generate_content(MODEL, 'prompt').cached
+
+    def test_evicts_least_recently_used(self, cache):
+        gateway = make_gateway(cache, responder=lambda model, prompt: prompt * 200)
+        for i in range(3):
+            gateway.generate_content(MODEL, f'prompt-{i}-' + 'x' * 50)
+            time.sleep(0.02)
+        gateway.generate_content(MODEL, 'prompt-0-' + 'x' * 50)  # 0 を最近使ったことにする
+        sizes = sorted(p.stat().st_size for p in cache.results_dir.glob('*/*.json.gz'))
+
+        assert cache.evict(max_bytes=sum(sizes) - 1) == 1
+
+        assert gateway.generate_content(MODEL, 'prompt-0-' + 'x' * 50).cached
+        assert not gateway.generate_content(MODEL, 'prompt-1-' + 'x' * 50).cached
+
+    def test_idle_lock_files_are_removed_on_evict(self, cache):
+        gateway = make_gateway(cache)
+        for i in range(3):
+            gateway.generate_content(MODEL, f'prompt-{i}')
+        locks = sorted(cache.locks_dir.glob('*.lock'))
+        assert len(locks) == 3
+        idle = time.time() - llm_gateway.LOCK_IDLE_SECONDS - 60
+        for path in locks[:2]:
+            os.utime(path, (idle, idle))
+
+        with cache.lock(locks[0].stem):  # 使用中のロックは消さない
+            cache.evict()
+
+        assert sorted(cache.locks_dir.glob('*.lock')) == [locks[0], locks[2]]
+        cache.evict()
+        assert sorted(cache.locks_dir.glob('*.lock')) == [locks[0], locks[2]]  # 使った時点で新しくなる
+
+
+class TestSingleFlight:
+    def run_concurrently(self, call, count):
+        barrier = threading.Barrier(count)
+        results, errors = [], []
+
+        def worker():
+            barrier.wait()
+            try:
+                results.append(call())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def test_concurrent_identical_calls_share_one_request(self, cache):
+        gateway = make_gateway(cache, delay=0.3)
+
+        results, errors = self.run_concurrently(lambda: gateway.generate_content(MODEL, 'prompt'), 5)
+
+        assert errors == [] and len(results) == 5
+        assert len(gateway.backend.calls) == 1
+        assert {r.text for r in results} == {'answer: prompt'}
+        assert sum(r.deduped for r in results) + sum(r.cached for r in results) == 4
+
+    def test_followers_call_themselves_when_leader_fails(self, cache):
+        failures = []
+
+        def responder(model, prompt):
+            if not failures:
+                failures.append(prompt)
+                raise RuntimeError('quota exceeded')
+            return 'ok'
+
+        gateway = make_gateway(cache, responder=responder, delay=0.2)
+
+        results, errors = self.run_concurrently(lambda: gateway.generate_content(MODEL, 'prompt'), 3)
+
+        assert len(errors) == 1 and str(errors[0]) == 'quota exceeded'
+        assert [r.text for r in results] == ['ok', 'ok']
+        assert gateway.metrics.summary()[MODEL]['errors'] == 1
+
+    def test_concurrency_limit_per_model(self, cache):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def responder(model, prompt):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            return 'ok'
+
+        gateway = make_gateway(cache, responder=responder, limits={MODEL: {'CONCURRENCY': 2}})
+        counter = iter(range(100))
+
+        results, errors = self.run_concurrently(
+            lambda: gateway.generate_content(MODEL, f'prompt {next(counter)}'), 6)
+
+        assert errors == [] and len(results) == 6
+        assert peak[0] == 2
+
+
+def test_metrics(cache):
+    gateway = make_gateway(cache)
+    gateway.generate_content(MODEL, 'a' * 400)
+    gateway.generate_content(MODEL, 'a' * 400)
+    gateway.generate_content(MODEL, 'b' * 40)
+
+    stats = gateway.metrics.summary()[MODEL]
+
+    assert (stats['calls'], stats['cache_hits'], stats['errors']) == (2, 1, 0)
+    assert stats['prompt_tokens'] == 100 + 10
+    assert stats['output_tokens'] == len('answer: ' + 'a' * 400) // 4 + len('answer: ' + 'b' * 40) // 4
+    assert stats['max_seconds'] >= stats['avg_seconds'] >= 0
+
+
+def test_metrics_are_logged_and_reset_per_batch(settings, tmp_path, monkeypatch, caplog):
+    settings.LLM_GATEWAY_SETTINGS = {
+        **settings.LLM_GATEWAY_SETTINGS, 'BACKEND': 'fake', 'CACHE_ROOT': str(tmp_path / 'llm'),
+    }
+    monkeypatch.setattr(llm_gateway, '_gateways', {})
+    gateway = get_llm_gateway('test-key')
+    gateway.generate_content(MODEL, 'prompt')
+    gateway.generate_content(MODEL, 'prompt')
+
+    with caplog.at_level(logging.INFO, logger=llm_gateway.logger.name):
+        logged = log_llm_metrics('テスト')
+
+    assert (logged[MODEL]['calls'], logged[MODEL]['cache_hits']) == (1, 1)
+    assert f'LLMメトリクス（テスト）: model={MODEL} 呼び出し1 キャッシュ1' in caplog.text
+    # 次のバッチは 0 から数える
+    assert gateway.metrics.summary() == {}
+    assert log_llm_metrics('テスト') == {}
+
+
+class TestServices:
+    @pytest.fixture
+    def backend(self, settings, tmp_path, monkeypatch):
+        settings.GEMINI_API_KEY = 'test-key'
+        settings.LLM_GATEWAY_SETTINGS = {
+            **settings.LLM_GATEWAY_SETTINGS, 'BACKEND': 'fake', 'CACHE_ROOT': str(tmp_path / 'llm'),
+        }
+        monkeypatch.setattr(llm_gateway, '_gateways', {})
+        return get_llm_gateway('test-key').backend
+
+    def test_report_regeneration_uses_cached_response(self, backend):
+        backend.responder = lambda model, prompt: (
+            '{"overall_score": 70, "signal": "positive", "summary": "増益", '
+            '"key_points": ["売上増", "利益増"], "sections": []}'
+        )
+        disclosure = {'company_name': 'トヨタ', 'company_code': '7203', 'disclosure_date': '2026-05-08',
+                      'title': '決算短信', 'summary': '増収増益', 'content': '売上高 12,345百万円'}
+
+        first = GeminiReportGenerator().generate_report(disclosure, 'earnings')
+        again = GeminiReportGenerator().generate_report(disclosure, 'earnings')
+
+        assert first['success'] and again['success']
+        assert again['data'] == first['data']
+        assert len(backend.calls) == 1
+        assert isinstance(backend.calls[0][2], genai.types.GenerateContentConfig)
+
+    def test_unparsable_report_is_not_cached(self, backend):
+        backend.responder = lambda model, prompt: 'ごめんなさい'
+        disclosure = {'company_name': 'トヨタ', 'company_code': '7203', 'disclosure_date': '2026-05-08',
+                      'title': '決算短信', 'summary': '増収増益', 'content': '本文'}
+
+        assert not GeminiReportGenerator().generate_report(disclosure, 'earnings')['api_success']
+        GeminiReportGenerator().generate_report(disclosure, 'earnings')
+
+        assert len(backend.calls) == 2
+
+    @pytest.mark.parametrize('call', [
+        lambda: GeminiStockAnalyzer().analyze_stocks([{'code': '7203', 'stock_name': 'トヨタ'}]),
+        lambda: GeminiInsightsGenerator().generate_investment_insights(
+            {'overall_score': 0.4, 'sentiment_label': 'positive', 'statistics': {}}, {'company_name': 'トヨタ'}),
+        lambda: AIExpertAnalyzer().analyze_document_comprehensive('本文', {'company_name': 'トヨタ'}, {}),
+        lambda: BreakoutDetector()._get_gemini_analysis(
+            {'investment_grade': 'A', 'overall_score': 80}, [next(iter(BREAKOUT_PATTERNS))], {}),
+    ], ids=['stock_comparison', 'insights', 'ai_expert', 'breakout'])
+    def test_unparsable_response_is_not_replayed(self, backend, call):
+        backend.responder = lambda model, prompt: 'ごめんなさい'
+
+        call()
+        call()
+
+        assert len(backend.calls) == 2
+
+    def test_stock_comparison_goes_through_gateway(self, backend):
+        analyzer = GeminiStockAnalyzer()
+
+        assert analyzer.client.gateway.backend is backend
@@ -0,0 +1,303 @@
+"""信用残高の分析値（前週比・52週zスコア/パーセンタイル）と複数銘柄APIのテスト。
+
+なぜこのテストがあるか:
+  信用倍率の推移は銘柄ごとに1リクエスト・1クエリで読み、前週比などは呼び出し側が
+  毎回計算していた。また list_diaries は最新週の全銘柄（約4,000行）を読んでいた。
+  分析値を取込時に申込日単位で計算して MarginData に保存し、複数銘柄を列形式で
+  返す /margin/api/bulk/ を追加したので、
+  - 保存される分析値が銘柄ごとの素朴な計算（下の reference_analytics）と一致すること
+  - 取込（fetch_and_save）で取込んだ週以降が計算し直されること
+  - 一括APIが日付軸に揃えた配列を返し、銘柄数に関わらずクエリ数が一定であること
+  - list_diaries が一覧の銘柄だけを引くこと
+  を固定する。
+"""
+import json
+import random
+import statistics
+from datetime import date, timedelta
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from margin_tracking.models import MarginData
+from margin_tracking.services import margin_analytics
+from margin_tracking.services.jpx_margin_service import JPXMarginService
+from margin_tracking.services.margin_analytics import (
+    MAX_BULK_CODES, MIN_HISTORY_WEEKS, WINDOW_WEEKS, refresh_margin_analytics,
+)
+from stockdiary import api_analysis
+from stockdiary.models import StockDiary
+
+User = get_user_model()
+pytestmark = pytest.mark.django_db
+
+FIRST_FRIDAY = date(2025, 1, 3)
+
+
+def fridays(count, first=FIRST_FRIDAY):
+    return [first + timedelta(days=7 * i) for i in range(count)]
+
+
+def make_history(weeks=60, codes=('1301', '7203', '9984'), seed=0):
+    """週次データ。9984 は一部の週が欠け、売り残0（倍率なし）の週がある"""
+    rng = random.Random(seed)
+    rows = []
+    for d in fridays(weeks):
+        for code in codes:
+            if code == '9984' and rng.random() < 0.2:
+                continue
+            short = 0 if code == '9984' and rng.random() < 0.1 else rng.randint(1_000, 900_000)
+            rows.append(MarginData(
+                record_date=d, stock_code=code, stock_name=code,
+                short_balance=short, long_balance=rng.randint(1_000, 2_000_000),
+            ))
+    for row in rows:
+        row.save()
+    return rows
+
+
+def reference_analytics():
+    """銘柄ごとに素朴に計算した分析値 {(date, code): {...}}"""
+    rows = list(MarginData.objects.all())
+    dates = sorted({r.record_date for r in rows})
+    by_key = {(r.record_date, r.stock_code): r for r in rows}
+    expected = {}
+    for t, d in enumerate(dates):
+        window = dates[max(0, t - WINDOW_WEEKS + 1):t + 1]
+        for (rd, code), row in by_key.items():
+            if rd != d:
+                continue
+            prev = by_key.get((dates[t - 1], code)) if t > 0 else None
+            values = [
+                float(by_key[(w, code)].margin_ratio) for w in window
+                if (w, code) in by_key and by_key[(w, code)].margin_ratio is not None
+            ]
+            zscore = percentile = None
+            if row.margin_ratio is not None and len(values) >= MIN_HISTORY_WEEKS:
+                current = float(row.margin_ratio)
+                std = statistics.pstdev(values)
+                zscore = (current - statistics.fmean(values)) / std if std > 0 else 0.0
+                percentile = sum(v <= current for v in values) / len(values) * 100
+            expected[(d, code)] = {
+                'long_change': row.long_balance - prev.long_balance if prev else None,
+                'short_change': row.short_balance - prev.short_balance if prev else None,
+                'ratio_change': (
+                    row.margin_ratio - prev.margin_ratio
+                    if prev and row.margin_ratio is not None and prev.margin_ratio is not None else None
+                ),
+                'ratio_zscore_52w': zscore,
+                'ratio_percentile_52w': percentile,
+            }
+    return expected
+
+
+def stored_analytics():
+    return {
+        (r.record_date, r.stock_code): {
+            'long_change': r.long_change,
+            'short_change': r.short_change,
+            'ratio_change': r.ratio_change,
+            'ratio_zscore_52w': r.ratio_zscore_52w,
+            'ratio_percentile_52w': r.ratio_percentile_52w,
+        }
+        for r in MarginData.objects.all()
+    }
+
+
+def assert_matches_reference():
+    expected = reference_analytics()
+    stored = stored_analytics()
+    assert stored.keys() == expected.keys()
+    for key, want in expected.items():
+        got = stored[key]
+        for field in ('long_change', 'short_change', 'ratio_change'):
+            assert got[field] == want[field], (key, field)
+        for field, tolerance in (('ratio_zscore_52w', 1e-4), ('ratio_percentile_52w', 0.051)):
+            if want[field] is None:
+                assert got[field] is None, (key, field)
+            else:
+                assert got[field] == pytest.approx(want[field], abs=tolerance), (key, field)
+
+
+class TestRefreshMarginAnalytics:
+    def test_matches_reference(self, monkeypatch):
+        # チャンク境界をまたぐ
+        monkeypatch.setattr(margin_analytics, 'CHUNK_WEEKS', 7)
+        make_history()
+
+        updated = refresh_margin_analytics(FIRST_FRIDAY)
+
+        assert updated == MarginData.objects.count()
+        assert_matches_reference()
+        row = MarginData.objects.get(record_date=fridays(60)[-1], stock_code='7203')
+        assert row.ratio_zscore_52w is not None and 0 < row.ratio_percentile_52w <= 100
+        # 最初の週は前週比なし、履歴が足りない週は zスコアなし
+        first = MarginData.objects.get(record_date=FIRST_FRIDAY, stock_code='7203')
+        assert (first.long_change, first.ratio_change, first.ratio_zscore_52w) == (None, None, None)
+
+    def test_constant_ratio_has_zero_zscore(self):
+        for d in fridays(10):
+            MarginData.objects.create(record_date=d, stock_code='1301', short_balance=100, long_balance=200)
+
+        refresh_margin_analytics(FIRST_FRIDAY)
+
+        latest = MarginData.objects.get(record_date=fridays(10)[-1])
+        assert (latest.ratio_zscore_52w, latest.ratio_percentile_52w) == (0.0, 100.0)
+        assert str(latest.ratio_change) == '0.00'
+
+    def test_since_limits_updated_dates(self):
+        make_history(weeks=20)
+        since = fridays(20)[15]
+
+        with CaptureQueriesContext(connection) as ctx:
+            updated = refresh_margin_analytics(since)
+
+        assert updated == MarginData.objects.filter(record_date__gte=since).count()
+        assert not MarginData.objects.filter(record_date__lt=since, long_change__isnull=False).exists()
+        assert MarginData.objects.filter(record_date__gte=since, long_change__isnull=False).exists()
+        # 対象日・窓の日付・データ各1回 + bulk_update（銘柄×週では増えない）
+        selects = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        assert len(selects) == 3
+
+    def test_command_backfills_all_weeks(self, capsys):
+        make_history(weeks=12)
+
+        call_command('compute_margin_analytics')
+
+        assert f'{MarginData.objects.count()} 件' in capsys.readouterr().out
+        assert_matches_reference()
+
+    def test_fetch_and_save_refreshes_new_week(self, monkeypatch, tmp_path):
+        make_history(weeks=12, codes=('7203',))
+        refresh_margin_analytics(FIRST_FRIDAY)
+        new_week = fridays(13)[-1]
+
+        pdf = tmp_path / 'margin.pdf'
+        pdf.write_bytes(b'%PDF')
+        service = JPXMarginService()
+        monkeypatch.setattr(service, '_probe_pdf', lambda url, log=None: ('available', {}))
+        monkeypatch.setattr(service, '_download_pdf', lambda url: (str(pdf), False, {}))
+        monkeypatch.setattr(service.parser, 'parse_pdf_file', lambda path: [
+            {'stock_code': '7203', 'stock_name': 'トヨタ自動車', 'short_balance': 1_000, 'long_balance': 9_000},
+        ])
+
+        assert service.fetch_and_save(new_week)['success']
+
+        prev = MarginData.objects.get(record_date=fridays(12)[-1])
+        row = MarginData.objects.get(record_date=new_week)
+        assert row.long_change == 9_000 - prev.long_balance
+        assert row.ratio_change == row.margin_ratio - prev.margin_ratio
+        assert row.ratio_zscore_52w is not None
+        assert_matches_reference()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username='margin_bulk', password='p', email='mb@example.com')
+
+
+class TestMarginBulkApi:
+    def test_columnar_response_aligned_to_dates(self, client, user):
+        client.force_login(user)
+        for d in fridays(3):
+            MarginData.objects.create(record_date=d, stock_code='7203', short_balance=100, long_balance=150)
+        # 6758 は2週目が欠け、3週目は売り残0
+        MarginData.objects.create(record_date=fridays(3)[0], stock_code='6758', short_balance=100, long_balance=50)
+        MarginData.objects.create(record_date=fridays(3)[2], stock_code='6758', short_balance=0, long_balance=50)
+        refresh_margin_analytics(FIRST_FRIDAY)
+
+        response = client.get(reverse('margin_tracking:margin_bulk_api'),
+                              {'codes': '67580,7203,0000', 'weeks': '4'})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body['dates'] == [d.isoformat() for d in fridays(3)]
+        assert body['codes'] == ['6758', '7203']  # 5桁は4桁に、データのない銘柄は除く
+        assert body['margin_ratio'] == [[0.5, None, None], [1.5, 1.5, 1.5]]
+        assert body['long_balance'][0] == [50, None, 50]
+        assert body['ratio_change'][1] == [None, 0.0, 0.0]
+        assert body['latest']['date'] == [fridays(3)[2].isoformat()] * 2
+        assert body['latest']['margin_ratio'] == [None, 1.5]
+
+    def test_query_count_does_not_grow_with_codes(self, client, user):
+        client.force_login(user)
+        codes = [f'{1000 + i}' for i in range(200)]
+        MarginData.objects.bulk_create([
+            MarginData(record_date=d, stock_code=c, short_balance=100, long_balance=100)
+            for d in fridays(5) for c in codes
+        ])
+        url = reverse('margin_tracking:margin_bulk_api')
+
+        with CaptureQueriesContext(connection) as few:
+            client.get(url, {'codes': ','.join(codes[:2])})
+        with CaptureQueriesContext(connection) as many:
+            response = client.get(url, {'codes': ','.join(codes)})
+
+        assert len(response.json()['codes']) == 200
+        assert len(many.captured_queries) == len(few.captured_queries)
+
+    def test_rejects_missing_or_too_many_codes(self, client, user):
+        client.force_login(user)
+        url = reverse('margin_tracking:margin_bulk_api')
+
+        assert client.get(url).status_code == 400
+        too_many = ','.join(str(1000 + i) for i in range(MAX_BULK_CODES + 1))
+        assert client.get(url, {'codes': too_many}).status_code == 400
+
+    def test_login_required(self, client):
+        response = client.get(reverse('margin_tracking:margin_bulk_api'), {'codes': '7203'})
+
+        assert response.status_code == 302
+
+    def test_single_code_api_uses_stored_ratio(self, client, user):
+        client.force_login(user)
+        MarginData.objects.create(record_date=fridays(2)[0], stock_code='7203', short_balance=8, long_balance=1)
+        MarginData.objects.create(record_date=fridays(2)[1], stock_code='7203', short_balance=8, long_balance=3)
+        refresh_margin_analytics(FIRST_FRIDAY)
+
+        data = client.get(reverse('margin_tracking:margin_data_api', args=['7203'])).json()['data']
+
+        # 0.125 → 0.12, 0.375 → 0.38（保存値と同じ偶数丸め）
+        assert [row['margin_ratio'] for row in data] == [0.12, 0.38]
+        assert [row['ratio_change'] for row in data] == [None, 0.26]
+
+
+def test_list_diaries_reads_only_listed_codes(settings, user):
+    settings.ANALYSIS_API_KEY = 'testkey'
+    StockDiary.objects.create(user=user, stock_name='トヨタ自動車', stock_symbol='7203', reason='')
+    latest = fridays(2)[1]
+    MarginData.objects.create(record_date=fridays(2)[0], stock_code='7203', short_balance=100, long_balance=100)
+    MarginData.objects.create(record_date=latest, stock_code='7203', short_balance=100, long_balance=250)
+    MarginData.objects.bulk_create([
+        MarginData(record_date=latest, stock_code=f'{2000 + i}', short_balance=1, long_balance=1)
+        for i in range(50)
+    ])
+    request = RequestFactory().get('/api/analysis/diaries/', HTTP_AUTHORIZATION='Bearer testkey')
+
+    with CaptureQueriesContext(connection) as ctx:
+        body = json.loads(api_analysis.list_diaries(request).content)
+
+    assert body['diaries'][0]['margin_ratio'] == 2.5
+    margin_queries = [q['sql'] for q in ctx.captured_queries
+                      if 'margin_tracking_margindata' in q['sql'] and 'stock_code' in q['sql']]
+    assert len(margin_queries) == 1
+    assert ' IN (' in margin_queries[0]
+
+
+def test_diary_detail_latest_includes_analytics():
+    for d in fridays(10):
+        MarginData.objects.create(record_date=d, stock_code='1942', short_balance=100, long_balance=100)
+    MarginData.objects.create(record_date=fridays(11)[-1], stock_code='1942', short_balance=100, long_balance=300)
+    refresh_margin_analytics(FIRST_FRIDAY)
+
+    latest = api_analysis._fetch_margin_data('1942')['latest']
+
+    assert latest['ratio_change'] == 2.0
+    assert latest['long_change'] == 200
+    assert latest['ratio_percentile_52w'] == 100.0
+    assert latest['ratio_zscore_52w'] > 3
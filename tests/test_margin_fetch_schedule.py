@@ -0,0 +1,267 @@
+"""JPX 信用残高PDFの取得スケジュール・404記憶・条件付きリクエストのテスト。
+
+なぜこのテストがあるか:
+  日次タスクは過去40日の全暦日について PDF を GET しており、404（土日・祝日・未公開）は
+  MarginFetchLog に failed として残るだけなので、毎朝40回近く JPX へ問い合わせていた。
+  週ごとの申込日候補だけを確認し、404 を back-off 付きで記憶し、取得済みのPDFは
+  HEAD + ETag / Last-Modified の条件付きで確認するようにしたので、
+  - 定常状態の日次実行で JPX へのリクエストが1日1〜2回に収まること
+  - 金曜が祝日の週は、公開予定を過ぎてから前の営業日（木曜）を取得すること
+  - 404 の記憶中は問い合わせず、公開予定を過ぎたら確認間隔を延ばすこと
+  - 未更新のPDFは本体を取得しないこと
+  を固定する。
+"""
+import re
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+import requests
+from django.utils import timezone
+
+from margin_tracking import tasks
+from margin_tracking.models import MarginData, MarginFetchLog
+from margin_tracking.services import jpx_margin_service
+from margin_tracking.services.jpx_margin_service import (
+    JPXMarginPDFParser, JPXMarginService, not_found_ttl, weekly_candidate_dates,
+)
+
+JST = ZoneInfo('Asia/Tokyo')
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, content=b''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f'{self.status_code}', response=self)
+
+
+class FakeJPX:
+    """申込日 → ETag で公開済みのPDFを表す JPX の代わり。HEAD / GET を記録する。"""
+
+    def __init__(self, published=()):
+        self.published = {d: f'"etag-{d:%Y%m%d}"' for d in published}
+        self.calls = []
+        self.head_status = None  # HEAD に固定のステータスを返す（HEAD 非対応の再現）
+
+    @staticmethod
+    def _date(url):
+        return datetime.strptime(re.search(r'syumatsu(\d{8})00', url).group(1), '%Y%m%d').date()
+
+    def head(self, url, headers=None, **kwargs):
+        d = self._date(url)
+        self.calls.append(('HEAD', d))
+        if self.head_status:
+            return FakeResponse(self.head_status)
+        if d not in self.published:
+            return FakeResponse(404)
+        etag = self.published[d]
+        if (headers or {}).get('If-None-Match') == etag:
+            return FakeResponse(304)
+        return FakeResponse(200, {'ETag': etag, 'Last-Modified': 'Tue, 24 Mar 2026 07:30:00 GMT'})
+
+    def get(self, url, headers=None, **kwargs):
+        d = self._date(url)
+        self.calls.append(('GET', d))
+        if d not in self.published:
+            return FakeResponse(404)
+        return FakeResponse(200, {'ETag': self.published[d]}, b'%PDF-1.7')
+
+
+@pytest.fixture
+def jpx(monkeypatch):
+    fake = FakeJPX()
+    monkeypatch.setattr(jpx_margin_service.requests, 'head', fake.head)
+    monkeypatch.setattr(jpx_margin_service.requests, 'get', fake.get)
+    monkeypatch.setattr(
+        JPXMarginPDFParser, 'parse_pdf_file',
+        lambda self, path: [{'stock_code': '7203', 'stock_name': 'トヨタ自動車',
+                             'short_balance': 100, 'long_balance': 250}],
+    )
+    return fake
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """timezone.now() を指定日の 15:00 JST（日次タスクの実行時刻）に固定する"""
+    def set_day(day):
+        now = datetime.combine(day, time(15, 0), tzinfo=JST)
+        monkeypatch.setattr(timezone, 'now', lambda: now)
+        return now
+    return set_day
+
+
+def fridays(first, count):
+    return [first + timedelta(days=7 * i) for i in range(count)]
+
+
+class TestCalendar:
+    def test_weekly_candidates(self):
+        weeks = weekly_candidate_dates(date(2026, 3, 4), date(2026, 3, 21))
+
+        assert weeks == [
+            [date(2026, 3, 6), date(2026, 3, 5), date(2026, 3, 4)],
+            [date(2026, 3, 13) - timedelta(days=i) for i in range(5)],
+            [date(2026, 3, 20) - timedelta(days=i) for i in range(5)],
+        ]
+        # 金曜が end より後の週（まだ公開されない週）は含めない
+        assert weekly_candidate_dates(date(2026, 3, 16), date(2026, 3, 19)) == []
+
+    def test_not_found_ttl_backs_off_after_publication_is_overdue(self):
+        friday = date(2026, 3, 20)
+
+        # 公開待ちの間は毎日の実行で確認する
+        assert not_found_ttl(friday, 3, today=date(2026, 3, 24)) == timedelta(hours=20)
+        # 公開予定を過ぎたら確認のたびに倍、上限あり
+        assert not_found_ttl(friday, 1, today=date(2026, 3, 26)) == timedelta(hours=20)
+        assert not_found_ttl(friday, 3, today=date(2026, 3, 26)) == timedelta(hours=80)
+        assert not_found_ttl(friday, 40, today=date(2026, 5, 1)) == timedelta(days=30)
+
+
+@pytest.mark.django_db
+class TestFetchRecent:
+    def test_steady_state_makes_at_most_two_requests_per_day(self, jpx, clock):
+        def publish_until(day):
+            # 金曜申込分は翌週火曜 16:30 公開 → 15:00 の実行で見えるのは水曜から
+            jpx.published = {
+                d: f'"etag-{d}"' for d in fridays(date(2026, 1, 9), 12) if d + timedelta(days=5) <= day
+            }
+
+        publish_until(date(2026, 3, 2))
+        clock(date(2026, 3, 2))
+        cold = JPXMarginService().fetch_recent(days=40)
+        assert cold['success'] == 5 and cold['fail'] == 0
+
+        per_day = {}
+        for offset in range(1, 28):
+            day = date(2026, 3, 2) + timedelta(days=offset)
+            publish_until(day)
+            clock(day)
+            jpx.calls.clear()
+            per_day[day] = tasks.fetch_daily_margin_data()['requests']
+            assert per_day[day] == len(jpx.calls)
+
+        assert max(per_day.values()) <= 2
+        # 公開予定日（翌週火曜）に HEAD、翌日 HEAD + GET。それ以外の日は問い合わせない
+        assert per_day[date(2026, 3, 10)] == 1
+        assert per_day[date(2026, 3, 11)] == 2
+        assert per_day[date(2026, 3, 12)] == 0
+        assert sum(per_day.values()) == 4 * 3
+        assert MarginFetchLog.objects.filter(status='success').count() == 9
+        assert not MarginFetchLog.objects.filter(record_date__week_day__in=[1, 7]).exists()
+
+    def test_holiday_friday_falls_back_to_thursday(self, jpx, clock):
+        # 2026/3/20（金）は春分の日。申込日は 3/19（木）
+        jpx.published = {date(2026, 3, 13): '"a"', date(2026, 3, 19): '"b"'}
+
+        clock(date(2026, 3, 24))
+        JPXMarginService().fetch_recent(days=12)
+        # 公開予定（金曜 + 6日）までは木曜を確認しない
+        assert ('HEAD', date(2026, 3, 19)) not in jpx.calls
+        assert MarginFetchLog.objects.get(record_date=date(2026, 3, 20)).status == 'not_found'
+
+        clock(date(2026, 3, 26))
+        jpx.calls.clear()
+        result = JPXMarginService().fetch_recent(days=12)
+
+        assert jpx.calls == [('HEAD', date(2026, 3, 20)), ('HEAD', date(2026, 3, 19)), ('GET', date(2026, 3, 19))]
+        assert result['success'] == 1
+        assert MarginData.objects.filter(record_date=date(2026, 3, 19)).exists()
+
+        clock(date(2026, 3, 27))
+        jpx.calls.clear()
+        assert JPXMarginService().fetch_recent(days=12)['requests'] == 0
+
+    def test_force_rechecks_saved_weeks_conditionally(self, jpx, clock):
+        jpx.published = {date(2026, 3, 13): '"a"'}
+        clock(date(2026, 3, 18))
+        JPXMarginService().fetch_recent(days=7)
+
+        jpx.calls.clear()
+        result = JPXMarginService().fetch_recent(days=7, force=True)
+
+        assert jpx.calls == [('HEAD', date(2026, 3, 13))]
+        assert result['skipped'] == 1
+
+
+@pytest.mark.django_db
+class TestFetchAndSave:
+    def test_not_found_is_remembered(self, jpx, clock):
+        clock(date(2026, 3, 17))
+        service = JPXMarginService()
+
+        first = service.fetch_and_save(date(2026, 3, 13))
+        second = service.fetch_and_save(date(2026, 3, 13))
+
+        assert first['not_found'] and not first.get('cached')
+        assert second['not_found'] and second['cached']
+        assert jpx.calls == [('HEAD', date(2026, 3, 13))]
+        log = MarginFetchLog.objects.get(record_date=date(2026, 3, 13))
+        assert (log.status, log.not_found_count) == ('not_found', 1)
+        assert log.next_check_at == timezone.now() + timedelta(hours=20)
+
+        # force は記憶を無視して確認する
+        service.fetch_and_save(date(2026, 3, 13), force=True)
+        assert len(jpx.calls) == 2
+
+    def test_published_after_not_found_resets_cache(self, jpx, clock):
+        clock(date(2026, 3, 17))
+        JPXMarginService().fetch_and_save(date(2026, 3, 13))
+
+        jpx.published[date(2026, 3, 13)] = '"a"'
+        clock(date(2026, 3, 18))
+        result = JPXMarginService().fetch_and_save(date(2026, 3, 13))
+
+        assert result['success'] and result['created'] == 1
+        log = MarginFetchLog.objects.get(record_date=date(2026, 3, 13))
+        assert (log.status, log.not_found_count, log.next_check_at) == ('success', 0, None)
+        assert log.etag == '"a"'
+        assert log.last_modified == ''  # GET のレスポンスの値を保存する
+
+    def test_unchanged_pdf_is_not_downloaded(self, jpx, clock):
+        clock(date(2026, 3, 18))
+        jpx.published[date(2026, 3, 13)] = '"a"'
+        service = JPXMarginService()
+        service.fetch_and_save(date(2026, 3, 13))
+        jpx.calls.clear()
+
+        result = service.fetch_and_save(date(2026, 3, 13), force=True)
+
+        assert result['not_modified'] and result['total'] == 1
+        assert jpx.calls == [('HEAD', date(2026, 3, 13))]
+        assert MarginFetchLog.objects.get(record_date=date(2026, 3, 13)).status == 'success'
+
+        # 差し替えられたPDFは取得し直す
+        jpx.published[date(2026, 3, 13)] = '"b"'
+        jpx.calls.clear()
+        result = service.fetch_and_save(date(2026, 3, 13), force=True)
+        assert result['updated'] == 1
+        assert jpx.calls == [('HEAD', date(2026, 3, 13)), ('GET', date(2026, 3, 13))]
+        assert MarginFetchLog.objects.get(record_date=date(2026, 3, 13)).etag == '"b"'
+
+    def test_head_not_supported_falls_back_to_get(self, jpx, clock):
+        clock(date(2026, 3, 18))
+        jpx.head_status = 405
+        jpx.published[date(2026, 3, 13)] = '"a"'
+
+        result = JPXMarginService().fetch_and_save(date(2026, 3, 13))
+
+        assert result['success']
+        assert jpx.calls == [('HEAD', date(2026, 3, 13)), ('GET', date(2026, 3, 13))]
+
+
+@pytest.mark.django_db
+def test_command_reports_upstream_requests(jpx, clock, capsys):
+    from django.core.management import call_command
+
+    jpx.published = {date(2026, 3, 13): '"a"'}
+    clock(date(2026, 3, 18))
+
+    call_command('fetch_margin_data', '--days', '7')
+
+    assert 'JPXへのリクエスト: 2回' in capsys.readouterr().out
+    assert MarginFetchLog.objects.get().record_date == date(2026, 3, 13)
@@ -0,0 +1,141 @@
+"""JPX 信用残高の一括取込（JPXMarginService._save_records）のテスト。
+
+なぜこのテストがあるか:
+  週次PDF（約4,000銘柄）を1行ずつ get_or_create / update_or_create しており、
+  取込が行数×2回のクエリになっていた。信用倍率をまとめて計算し bulk_create で
+  upsert するようにしたので、
+  - 倍率が MarginData.save() の計算（Decimal・偶数丸め・売り残0は None）と一致すること
+  - force=False は既存行を変えず、force=True は上書きすること（件数も従来どおり）
+  - 1週分が数回のクエリで入ること
+  を固定する。
+"""
+import math
+import random
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from margin_tracking.models import MarginData
+from margin_tracking.services.jpx_margin_service import (
+    BULK_BATCH_SIZE, JPXMarginService, compute_margin_ratios,
+)
+
+RECORD_DATE = date(2026, 3, 19)
+
+
+def legacy_ratio(long_balance, short_balance):
+    """MarginData.save() と同じ計算"""
+    obj = MarginData(long_balance=long_balance, short_balance=short_balance)
+    if obj.short_balance and obj.short_balance > 0:
+        return (Decimal(str(obj.long_balance)) / Decimal(str(obj.short_balance))).quantize(Decimal('0.01'))
+    return None
+
+
+def make_records(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            'stock_code': f'{1000 + i:04d}',
+            'stock_name': f'銘柄{i}',
+            'short_balance': rng.choice([0, rng.randint(1, 500), rng.randint(1, 50_000_000)]),
+            'long_balance': rng.choice([0, rng.randint(1, 500), rng.randint(1, 50_000_000)]),
+        }
+        for i in range(n)
+    ]
+
+
+class TestComputeMarginRatios:
+    def test_matches_model_save(self):
+        pairs = [(r['long_balance'], r['short_balance']) for r in make_records(5000)]
+        # 丸めの境界（x.xx5 ちょうど）と売り残0・負値
+        pairs += [(1, 8), (3, 8), (5, 8), (7, 8), (1001, 400), (1003, 400), (150, 100), (10, 0), (-5, 8)]
+
+        ratios = compute_margin_ratios([p[0] for p in pairs], [p[1] for p in pairs])
+
+        assert ratios == [legacy_ratio(long, short) for long, short in pairs]
+        assert str(ratios[-3]) == '1.50'
+
+    def test_empty(self):
+        assert compute_margin_ratios([], []) == []
+
+
+@pytest.mark.django_db
+class TestSaveRecords:
+    def test_week_lands_in_few_queries(self):
+        records = make_records(4000)
+
+        with CaptureQueriesContext(connection) as ctx:
+            created, updated = JPXMarginService()._save_records(records, RECORD_DATE, force=False)
+
+        assert (created, updated) == (4000, 0)
+        # SELECT 1回 + INSERT はバッチ数だけ（SQLite はパラメータ上限でさらに分割される）
+        fields = [f for f in MarginData._meta.concrete_fields if not f.primary_key]
+        batch = min(BULK_BATCH_SIZE, connection.ops.bulk_batch_size(fields, [MarginData()] * 4000))
+        statements = [q['sql'].split()[0] for q in ctx.captured_queries]
+        assert statements.count('SELECT') == 1
+        assert statements.count('INSERT') == math.ceil(4000 / batch)
+        assert set(statements) <= {'SELECT', 'INSERT', 'SAVEPOINT', 'RELEASE'}
+        saved = MarginData.objects.get(stock_code='1007')
+        assert saved.margin_ratio == legacy_ratio(records[7]['long_balance'], records[7]['short_balance'])
+        assert saved.created_at and saved.updated_at
+
+    def test_force_false_keeps_existing_rows(self):
+        MarginData.objects.create(
+            record_date=RECORD_DATE, stock_code='1000', short_balance=100, long_balance=100,
+        )
+        records = [
+            {'stock_code': '1000', 'stock_name': '既存', 'short_balance': 100, 'long_balance': 300},
+            {'stock_code': '1001', 'stock_name': '新規', 'short_balance': 100, 'long_balance': 250},
+        ]
+
+        assert JPXMarginService()._save_records(records, RECORD_DATE, force=False) == (1, 0)
+        assert MarginData.objects.get(stock_code='1000').margin_ratio == Decimal('1.00')
+        assert MarginData.objects.get(stock_code='1001').margin_ratio == Decimal('2.50')
+
+    def test_force_true_overwrites(self):
+        kept = MarginData.objects.create(
+            record_date=RECORD_DATE, stock_code='1000', short_balance=100, long_balance=100,
+        )
+        MarginData.objects.create(
+            record_date=date(2026, 3, 12), stock_code='1000', short_balance=100, long_balance=100,
+        )
+        records = [
+            {'stock_code': '1000', 'stock_name': '更新', 'short_balance': 0, 'long_balance': 300},
+            {'stock_code': '1001', 'stock_name': '新規', 'short_balance': 100, 'long_balance': 250},
+        ]
+
+        assert JPXMarginService()._save_records(records, RECORD_DATE, force=True) == (1, 1)
+        row = MarginData.objects.get(record_date=RECORD_DATE, stock_code='1000')
+        assert row.pk == kept.pk
+        assert (row.stock_name, row.long_balance, row.margin_ratio) == ('更新', 300, None)
+        assert row.created_at == kept.created_at
+        # 別の申込日の行は触らない
+        assert MarginData.objects.get(record_date=date(2026, 3, 12)).long_balance == 100
+
+    def test_duplicate_codes_in_pdf(self):
+        records = [
+            {'stock_code': '1000', 'stock_name': '先', 'short_balance': 100, 'long_balance': 100},
+            {'stock_code': '1000', 'stock_name': '後', 'short_balance': 100, 'long_balance': 200},
+        ]
+        service = JPXMarginService()
+
+        assert service._save_records(records, RECORD_DATE, force=False) == (1, 0)
+        assert MarginData.objects.get().stock_name == '先'
+        service._save_records(records, RECORD_DATE, force=True)
+        assert MarginData.objects.get().stock_name == '後'
+
+    def test_fetch_and_save_logs_counts(self, monkeypatch, tmp_path):
+        pdf = tmp_path / 'margin.pdf'
+        pdf.write_bytes(b'%PDF')
+        service = JPXMarginService()
+        monkeypatch.setattr(service, '_probe_pdf', lambda url, log=None: ('available', {}))
+        monkeypatch.setattr(service, '_download_pdf', lambda url: (str(pdf), False, {}))
+        monkeypatch.setattr(service.parser, 'parse_pdf_file', lambda path: make_records(30))
+
+        result = service.fetch_and_save(RECORD_DATE)
+
+        assert (result['success'], result['created'], result['total']) == (True, 30, 30)
+        assert MarginData.objects.filter(record_date=RECORD_DATE).count() == 30
@@ -0,0 +1,151 @@
+"""通知ジョブ（NotificationService）の集合処理のテスト。
+
+なぜこのテストがあるか:
+  リマインダー・Thesis 期日・月次レビューの各ジョブは1件（1ユーザー）ずつ
+  save() / count() / exists() / Push 送信を繰り返していて、対象が増えるほど
+  クエリ数と所要時間が比例して伸びていた。集計クエリ + bulk_create + 1回の UPDATE +
+  PushDispatcher へのまとめ渡しに組み替えたので、
+  - クエリ数がユーザー数・通知数に比例しないこと
+  - Push は購読のあるユーザー分だけ、記録した NotificationLog の ID と tag を付けて渡すこと
+  - 送ったリマインダーは消化済みになり、記録に失敗したら消化しないこと
+  を固定する。（通知の対象・文面は test_thesis_due_notification.py で固定済み）
+"""
+import datetime
+import itertools
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from stockdiary.models import DiaryNotification, NotificationLog, PushSubscription, StockDiary, Thesis
+from stockdiary.services.notification_service import NotificationService
+from stockdiary.services.push_dispatcher import PushDispatcher, PushRunResult
+
+User = get_user_model()
+_serial = itertools.count()
+
+
+@pytest.fixture
+def pushed(monkeypatch):
+    """PushDispatcher.send に渡されたメッセージ（呼び出しごと）"""
+    calls = []
+
+    def send(self, messages):
+        calls.append(list(messages))
+        return PushRunResult(sent=len(calls[-1]))
+
+    monkeypatch.setattr(PushDispatcher, 'send', send)
+    return calls
+
+
+def make_diaries(count, subscribed=()):
+    diaries = []
+    for i in range(count):
+        n = next(_serial)
+        user = User.objects.create_user(username=f'notify{n}', email=f'notify{n}@example.com', password='p')
+        diaries.append(StockDiary.objects.create(user=user, stock_symbol='7203', stock_name=f'銘柄{i}'))
+        if i in subscribed:
+            PushSubscription.objects.create(user=user, endpoint=f'https://fcm.googleapis.com/send/{n}',
+                                            p256dh='k', auth='a')
+    return diaries
+
+
+def make_thesis(diary, days_offset):
+    return Thesis.objects.create(
+        diary=diary, claim='円安継続で輸出採算改善',
+        review_due_date=timezone.localdate() + datetime.timedelta(days=days_offset),
+    )
+
+
+def count_queries(job):
+    with CaptureQueriesContext(connection) as queries:
+        result = job()
+    return result, len(queries.captured_queries)
+
+
+class TestMonthlyReview:
+    def test_query_count_does_not_grow_with_users(self, pushed):
+        for diary in make_diaries(2):
+            make_thesis(diary, 0)
+        _, few = count_queries(NotificationService.send_monthly_review)
+        NotificationLog.objects.all().delete()
+
+        for diary in make_diaries(6):
+            make_thesis(diary, -2)
+            make_thesis(diary, 0)
+        result, many = count_queries(NotificationService.send_monthly_review)
+
+        assert result['sent'] == 8
+        assert many == few
+
+    def test_grouped_counts_and_push_only_to_subscribers(self, pushed):
+        subscribed, other = make_diaries(2, subscribed={0})
+        make_thesis(subscribed, -3)
+        make_thesis(subscribed, 0)
+        make_thesis(subscribed, 60)  # 来月以降は数えない
+        make_thesis(other, 0)
+
+        result = NotificationService.send_monthly_review()
+
+        assert (result['sent'], result['pushed']) == (2, 1)
+        log = NotificationLog.objects.get(user=subscribed.user)
+        assert log.message == '今月2件の仮説が答え合わせ時期です（うち1件は期日超過）'
+        [[message]] = pushed
+        assert (message.user_id, message.tag, message.notification_id) == \
+            (subscribed.user_id, 'monthly-thesis-review', log.id)
+
+
+class TestThesisDue:
+    def test_cooldown_is_checked_for_all_theses_at_once(self, pushed):
+        diaries = make_diaries(4, subscribed={0, 1, 2, 3})
+        theses = [make_thesis(diary, 0) for diary in diaries]
+        NotificationLog.objects.create(user=diaries[0].user, title='既送信', message='m',
+                                       url=f'/stockdiary/{diaries[0].id}/thesis/{theses[0].id}/verify/')
+
+        result, queries = count_queries(NotificationService.process_thesis_due_notifications)
+
+        assert result['sent'] == 3
+        assert {m.tag for m in pushed[0]} == {f'thesis-due-{t.id}' for t in theses[1:]}
+        assert all(NotificationLog.objects.get(pk=m.notification_id).url == m.url for m in pushed[0])
+        # 対象 / 送信済み判定 / bulk_create / 購読 と、トランザクション
+        assert queries <= 6
+
+
+class TestReminders:
+    def make_reminders(self, diaries):
+        return [
+            DiaryNotification.objects.create(diary=diary, remind_at=timezone.now() - datetime.timedelta(minutes=1))
+            for diary in diaries
+        ]
+
+    def test_reminders_are_logged_and_marked_in_bulk(self, pushed):
+        diaries = make_diaries(5, subscribed={1, 3})
+        reminders = self.make_reminders(diaries)
+
+        result, queries = count_queries(NotificationService.process_reminder_notifications)
+
+        assert (result['sent'], result['pushed'], result['errors']) == (5, 2, 0)
+        assert NotificationLog.objects.filter(notification__in=reminders).count() == 5
+        assert not DiaryNotification.objects.filter(is_active=True).exists()
+        assert not DiaryNotification.objects.filter(last_sent__isnull=True).exists()
+        assert {m.tag for m in pushed[0]} == {f'notification-{reminders[i].id}' for i in (1, 3)}
+        assert queries <= 6
+
+        # 消化済みなので再実行しても送らない
+        assert NotificationService.process_reminder_notifications()['sent'] == 0
+
+    def test_failed_batch_leaves_reminders_pending(self, pushed, monkeypatch):
+        self.make_reminders(make_diaries(2))
+
+        def broken(*args, **kwargs):
+            raise RuntimeError('db down')
+
+        monkeypatch.setattr(NotificationLog.objects, 'bulk_create', broken)
+
+        result = NotificationService.process_reminder_notifications()
+
+        assert (result['sent'], result['errors']) == (0, 2)
+        assert DiaryNotification.objects.filter(is_active=True, last_sent__isnull=True).count() == 2
+        assert pushed == []
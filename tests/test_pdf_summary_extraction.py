@@ -0,0 +1,228 @@
+"""PDFProcessor の要点抽出（summary_only）と並列ページ抽出のテスト。
+
+なぜこのテストがあるか:
+  TDnet レポート生成は PDF の先頭50ページを1ページずつ抽出してからプロンプトを作っていたが、
+  プロンプトに入るのは本文の先頭 20,000 文字だけで、決算短信の要点・数値は前半
+  （サマリー〜経営成績・財務諸表）にある。ページを1ページずつ抽出しながら読み、
+  注記事項・補足資料の見出しや文字数上限で止める要点抽出と、チャンク単位の並列抽出を入れたので、
+  - サマリーの「※ 注記事項」や目次の行（ページ番号が行末でも次の行でも）では止まらず、
+    本文の見出しの手前で止まること（目次は SUMMARY_MIN_PAGES 以降のページに置いて確かめる）
+  - ページ末の見出しの後にフッターのページ番号が来ても目次とみなさないこと
+  - 文字数上限に達したページで止まり、止めた後のページは抽出しないこと
+  - 並列抽出が直列と同じ順序・内容を返し、daemon プロセス内では直列に戻ること
+  - 打ち切った結果もキャッシュから使えること
+  を固定する。
+"""
+import multiprocessing
+import time
+from types import SimpleNamespace
+
+import pymupdf
+import pytest
+
+from earnings_analysis.services import pdf_processor
+from earnings_analysis.services.pdf_processor import SUMMARY_MAX_CHARS, PDFProcessor
+from earnings_analysis.services.tdnet_report_generator import TDNETReportGeneratorService
+
+
+def write_pdf(path, pages):
+    """pages: ページごとの行のリスト"""
+    doc = pymupdf.open()
+    for lines in pages:
+        page = doc.new_page(width=595, height=2400)
+        page.insert_text((36, 36), '\n'.join(lines), fontname='japan', fontsize=8)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+TOC_WITH_LEADERS = ['○添付資料の目次', '1．経営成績等の概況 ……………… 2',
+                    '(5) 連結財務諸表に関する注記事項 ……………… 10', '補足資料 15']
+# リーダーなしでページ番号が次の行に抽出される目次
+TOC_NUMBER_ON_OWN_LINE = ['○添付資料の目次', '1．経営成績等の概況', '2',
+                          '(5) 連結財務諸表に関する注記事項', '10', '補足資料', '１５']
+
+
+def kessan_pages(body_pages=4, note_pages=6, toc=TOC_WITH_LEADERS):
+    """決算短信の構成（サマリー2ページ・目次・本文・注記事項）"""
+    pages = [
+        ['2026年3月期 決算短信〔日本基準〕(連結)', '売上高 12,345百万円'],
+        ['※ 注記事項', '(1) 期中における重要な子会社の異動 : 無'],
+        toc,
+    ]
+    pages += [[f'経営成績 本文 {i + 1}', '営業利益は前期比で増加しました。'] for i in range(body_pages)]
+    pages.append(['連結キャッシュ・フロー計算書', '営業CF 1,000',
+                  '(5) 連結財務諸表に関する注記事項', '(継続企業の前提に関する注記)', '該当事項はありません。'])
+    pages += [[f'注記 {i + 1}', 'セグメント情報'] for i in range(note_pages)]
+    return pages
+
+
+def summary_pages(processor, path, max_pages=50):
+    return processor._extract_summary_pages(path, max_pages)[0]
+
+
+def all_pages(path):
+    return PDFProcessor()._extract_pages(path, 50)[0]
+
+
+@pytest.fixture
+def cache_dir(settings, tmp_path):
+    settings.TDNET_API_SETTINGS = {'CACHE_DIR': str(tmp_path / 'tdnet_cache'), 'EXTRACT_WORKERS': 1}
+    return tmp_path / 'tdnet_cache'
+
+
+class TestSummaryPages:
+    def test_stops_before_notes_heading(self, cache_dir, tmp_path):
+        path = write_pdf(tmp_path / 'kessan.pdf', kessan_pages())
+
+        texts = summary_pages(PDFProcessor(), path)
+
+        assert pdf_processor.SUMMARY_MIN_PAGES <= 2  # 目次のページでも打ち切りの判定をする
+        assert len(texts) == 8
+        assert '※ 注記事項' in texts[1] and '……' in texts[2]
+        assert '営業CF 1,000' in texts[-1]
+        assert '継続企業' not in texts[-1]
+        assert '注記 1' not in ''.join(texts)
+        # 要点抽出でなければ最後まで
+        assert len(all_pages(path)) == 14
+
+    def test_toc_with_page_number_on_its_own_line(self, cache_dir, tmp_path):
+        path = write_pdf(tmp_path / 'kessan.pdf', kessan_pages(toc=TOC_NUMBER_ON_OWN_LINE))
+
+        texts = summary_pages(PDFProcessor(), path)
+
+        assert len(texts) == 8
+        assert '補足資料' in texts[2]
+        assert '営業CF 1,000' in texts[-1] and '継続企業' not in texts[-1]
+
+    def test_heading_before_page_number_footer(self, cache_dir, tmp_path):
+        """本文ページ末の見出し + フッターのページ番号は目次ではない"""
+        pages = kessan_pages(body_pages=2, note_pages=0)[:-1]
+        pages += [['経営成績 本文 3', '営業利益は前期比で増加しました。', '補足資料', '5'], ['四半期推移']]
+        path = write_pdf(tmp_path / 'kessan.pdf', pages)
+
+        texts = summary_pages(PDFProcessor(), path)
+
+        assert len(texts) == 6
+        assert '経営成績 本文 3' in texts[-1] and '補足資料' not in texts[-1]
+        assert '四半期推移' not in ''.join(texts)
+
+    def test_pages_after_the_cut_are_not_extracted(self, cache_dir, tmp_path, monkeypatch):
+        path = write_pdf(tmp_path / 'kessan.pdf', kessan_pages())
+        processor = PDFProcessor()
+        extracted = []
+        raw_pages = processor._iter_raw_pages
+
+        def counting(pdf_path, pages):
+            for text in raw_pages(pdf_path, pages):
+                extracted.append(text)
+                yield text
+
+        monkeypatch.setattr(processor, '_iter_raw_pages', counting)
+
+        texts, total_pages, stopped = processor._extract_summary_pages(path, 50)
+
+        assert (len(texts), total_pages, stopped) == (8, 14, True)
+        assert len(extracted) == 8
+
+    def test_heading_at_top_of_page(self, cache_dir, tmp_path):
+        pages = kessan_pages(body_pages=2, note_pages=0)[:-1] + [['補足資料', '四半期推移']]
+        path = write_pdf(tmp_path / 'kessan.pdf', pages)
+
+        texts = summary_pages(PDFProcessor(), path)
+
+        assert len(texts) == 5
+        assert '四半期推移' not in ''.join(texts)
+
+    def test_stops_at_character_budget(self, cache_dir, tmp_path):
+        line = '売上高は前年同期比で増加した。' * 10
+        per_page = [line] * 20
+        path = write_pdf(tmp_path / 'long.pdf', [per_page] * 30)
+        page_chars = len(PDFProcessor().extract_text_from_pdf(path, max_pages=1)['text'])
+
+        texts = summary_pages(PDFProcessor(), path)
+
+        assert len(texts) == -(-SUMMARY_MAX_CHARS // page_chars)
+        assert sum(map(len, texts)) >= SUMMARY_MAX_CHARS
+
+    def test_parallel_matches_serial(self, settings, cache_dir, tmp_path, monkeypatch):
+        monkeypatch.setattr(pdf_processor, 'EXTRACT_CHUNK_PAGES', 2)
+        path = write_pdf(tmp_path / 'kessan.pdf', kessan_pages(body_pages=9, note_pages=4))
+        serial = all_pages(path)
+        serial_summary = summary_pages(PDFProcessor(), path)
+
+        settings.TDNET_API_SETTINGS = {'CACHE_DIR': str(cache_dir), 'EXTRACT_WORKERS': 3}
+        parallel = PDFProcessor()
+
+        assert list(parallel._iter_raw_pages(path, len(serial))) == serial
+        assert summary_pages(parallel, path) == serial_summary
+        # 途中で読むのをやめても残りのチャンクを待たずに戻る
+        pages = parallel._iter_raw_pages(path, len(serial))
+        assert next(pages) == serial[0]
+        pages.close()
+
+    def test_daemon_process_extracts_serially(self, settings, cache_dir, tmp_path, monkeypatch):
+        settings.TDNET_API_SETTINGS = {'CACHE_DIR': str(cache_dir), 'EXTRACT_WORKERS': 4}
+        monkeypatch.setattr(multiprocessing, 'current_process', lambda: SimpleNamespace(daemon=True))
+        monkeypatch.setattr(pdf_processor, '_extract_page_range',
+                            lambda *args: pytest.fail('daemon プロセスから子プロセスを起動した'))
+        path = write_pdf(tmp_path / 'kessan.pdf', kessan_pages(body_pages=9))
+
+        assert len(summary_pages(PDFProcessor(), path)) == 13
+
+
+class TestProcessPdfUrlSummary:
+    @pytest.fixture
+    def served(self, cache_dir, tmp_path, monkeypatch):
+        path = write_pdf(tmp_path / 'kessan.pdf', kessan_pages())
+        processor = PDFProcessor()
+        monkeypatch.setattr(processor, '_download', lambda url, headers=None: {
+            'not_modified': False, 'path': str(tmp_path / 'copy.pdf'), 'sha256': 'abc',
+            'size': 1, 'etag': '"v1"', 'last_modified': '',
+        })
+        monkeypatch.setattr(pdf_processor.os, 'remove', lambda p: None)
+        (tmp_path / 'copy.pdf').write_bytes(open(path, 'rb').read())
+        return processor
+
+    def test_stopped_result_is_cached(self, served):
+        first = served.process_pdf_url('https://example.com/k.pdf', max_pages=50, summary_only=True)
+        again = served.process_pdf_url('https://example.com/k.pdf', max_pages=50, summary_only=True)
+
+        assert (first['cache'], first['pages'], first['processed_pages']) == ('miss', 14, 8)
+        assert again['cache'] == 'hit' and again['text'] == first['text']
+        # 要点抽出と全ページ抽出は別々にキャッシュする
+        full = served.process_pdf_url('https://example.com/k.pdf', max_pages=50)
+        assert (full['cache'], full['processed_pages']) == ('miss', 14)
+        assert 'セグメント情報' in full['text']
+
+    def test_report_generation_uses_summary_extraction(self, settings, monkeypatch):
+        settings.GEMINI_API_KEY = None
+        service = TDNETReportGeneratorService()
+        calls = []
+        monkeypatch.setattr(service.pdf_processor, 'process_pdf_url', lambda *args, **kwargs: (
+            calls.append((args, kwargs)) or {'success': False, 'error': 'x'}))
+
+        service.generate_report_from_pdf_url('https://example.com/k.pdf', '7203', 'トヨタ', 'earnings', 't', None)
+
+        assert calls == [(('https://example.com/k.pdf', 50), {'summary_only': True})]
+
+
+@pytest.mark.slow
+class TestSummaryExtractionBenchmark:
+    def test_summary_extraction_is_faster_than_full(self, cache_dir, tmp_path):
+        rows = [f'{i:02d} 売上高 {i * 1234:,} 百万円 前期比 {i % 7}.{i % 10}%' for i in range(60)]
+        pages = kessan_pages(body_pages=6, note_pages=0)
+        pages += [[f'注記 {p}'] + rows for p in range(40)]
+        path = write_pdf(tmp_path / 'kessan.pdf', pages)
+        processor = PDFProcessor()
+
+        started = time.perf_counter()
+        full = processor.extract_text_from_pdf(path)
+        full_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        summary = summary_pages(processor, path)
+        summary_seconds = time.perf_counter() - started
+
+        print(f"\n{full['pages']}ページ: 全ページ {full_seconds:.3f}s → 要点 {len(summary)}ページ {summary_seconds:.3f}s")
+        assert len(summary) == 10
+        assert summary_seconds < full_seconds
@@ -0,0 +1,246 @@
+"""PDFProcessor の抽出テキストキャッシュとストリーミングダウンロードのテスト。
+
+なぜこのテストがあるか:
+  PDFProcessor は毎回 PDF 全体をメモリ（response.content）に読み込んでからディスクに書き、
+  最大50ページを PyMuPDF で抽出し直していた（キャッシュなし）。同じURLの再処理や、
+  別URLで配信される同一PDFでも毎回ダウンロードと抽出が走っていた。
+  URL → 本体ハッシュ → ページごとのテキスト の2段のキャッシュと条件付きGETを入れ、
+  ダウンロードをチャンク単位の書き出しにしたので、
+  - 確認間隔内の再処理は問い合わせず、過ぎたら条件付きGET（304）で抽出をしないこと
+  - 別URLの同一PDFは抽出済みのテキストを使うこと
+  - 内容が変わったPDF・より多くのページを求められた場合は抽出し直すこと
+  - 本体を response.content で読まず、一時ファイルを残さないこと
+  - テキスト・URL のキャッシュが上限を超えたら最終アクセスの古いものから消えること
+  - レポート再生成がキャッシュの全文を使うこと
+  を固定する。
+"""
+import os
+
+import pymupdf
+import pytest
+import requests
+
+from earnings_analysis.models import TDNETDisclosure
+from earnings_analysis.services import pdf_processor
+from earnings_analysis.services.pdf_processor import DOWNLOAD_CHUNK_SIZE, PDFProcessor
+from earnings_analysis.services.tdnet_report_generator import TDNETReportGeneratorService
+
+
+def pdf_bytes(pages, label):
+    doc = pymupdf.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f'{label} page {i + 1}')
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.chunk_sizes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def content(self):
+        raise AssertionError('PDF本体をメモリに読み込んだ')
+
+    def iter_content(self, chunk_size):
+        self.chunk_sizes.append(chunk_size)
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(str(self.status_code))
+
+
+class FakeServer:
+    """URL → (本体, ETag)。条件付きGETに 304 を返す"""
+
+    def __init__(self):
+        self.files = {}
+        self.calls = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        assert stream
+        self.calls.append((url, dict(headers or {})))
+        if url not in self.files:
+            return FakeResponse(404)
+        body, etag = self.files[url]
+        if (headers or {}).get('If-None-Match') == etag:
+            return FakeResponse(304)
+        return FakeResponse(200, body, {'ETag': etag, 'Last-Modified': 'Mon, 16 Mar 2026 06:00:00 GMT'})
+
+
+@pytest.fixture
+def cache_dir(settings, tmp_path):
+    settings.TDNET_API_SETTINGS = {'CACHE_DIR': str(tmp_path / 'tdnet_cache')}
+    return tmp_path / 'tdnet_cache'
+
+
+@pytest.fixture
+def server(monkeypatch):
+    fake = FakeServer()
+    monkeypatch.setattr(pdf_processor.requests, 'get', fake.get)
+    return fake
+
+
+@pytest.fixture
+def extractions(monkeypatch):
+    """PyMuPDF での抽出回数"""
+    calls = []
+    original = PDFProcessor._extract_pages
+
+    def counting(self, pdf_path, max_pages):
+        calls.append(max_pages)
+        return original(self, pdf_path, max_pages)
+
+    monkeypatch.setattr(PDFProcessor, '_extract_pages', counting)
+    return calls
+
+
+URL = 'https://www.release.tdnet.info/inbs/140120260316000001.pdf'
+
+
+class TestProcessPdfUrl:
+    def test_second_call_is_served_from_cache(self, cache_dir, server, extractions):
+        server.files[URL] = (pdf_bytes(3, 'kessan'), '"v1"')
+
+        first = PDFProcessor().process_pdf_url(URL)
+        second = PDFProcessor().process_pdf_url(URL)
+
+        assert first['cache'] == 'miss' and second['cache'] == 'hit'
+        assert second['text'] == first['text']
+        assert 'kessan page 3' in second['text']
+        assert (second['pages'], second['processed_pages'], second['pdf_path']) == (3, 3, None)
+        assert len(server.calls) == 1 and len(extractions) == 1
+
+    def test_expired_entry_is_revalidated_conditionally(self, settings, cache_dir, server, extractions):
+        server.files[URL] = (pdf_bytes(2, 'kessan'), '"v1"')
+        PDFProcessor().process_pdf_url(URL)
+        settings.TDNET_API_SETTINGS = {'CACHE_DIR': str(cache_dir), 'TEXT_CACHE_MAX_AGE_HOURS': 0}
+
+        result = PDFProcessor().process_pdf_url(URL)
+
+        assert result['cache'] == 'revalidated'
+        assert server.calls[-1][1] == {
+            'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 16 Mar 2026 06:00:00 GMT',
+        }
+        assert len(extractions) == 1
+
+        # 差し替えられたPDFは抽出し直す
+        server.files[URL] = (pdf_bytes(2, 'teisei'), '"v2"')
+        result = PDFProcessor().process_pdf_url(URL)
+        assert result['cache'] == 'miss' and 'teisei page 1' in result['text']
+        assert len(extractions) == 2
+
+    def test_same_pdf_behind_another_url_is_not_extracted_again(self, cache_dir, server, extractions):
+        body = pdf_bytes(2, 'kessan')
+        other = 'https://example.com/mirror/kessan.pdf'
+        server.files[URL] = (body, '"v1"')
+        server.files[other] = (body, '"mirror"')
+
+        first = PDFProcessor().process_pdf_url(URL)
+        mirrored = PDFProcessor().process_pdf_url(other)
+
+        assert mirrored['cache'] == 'dedup'
+        assert mirrored['text'] == first['text']
+        assert len(extractions) == 1
+        assert PDFProcessor().process_pdf_url(other)['cache'] == 'hit'
+
+    def test_page_limit(self, cache_dir, server, extractions):
+        server.files[URL] = (pdf_bytes(6, 'kessan'), '"v1"')
+
+        few = PDFProcessor().process_pdf_url(URL, max_pages=2)
+        fewer = PDFProcessor().process_pdf_url(URL, max_pages=1)
+        more = PDFProcessor().process_pdf_url(URL, max_pages=50)
+
+        assert (few['cache'], few['processed_pages'], few['pages']) == ('miss', 2, 6)
+        assert (fewer['cache'], fewer['processed_pages']) == ('hit', 1)
+        assert 'kessan page 2' not in fewer['text']
+        # キャッシュが足りないページ数は取得し直す
+        assert (more['cache'], more['processed_pages']) == ('miss', 6)
+        assert extractions == [2, 50]
+        assert PDFProcessor().process_pdf_url(URL, max_pages=10)['cache'] == 'hit'
+
+    def test_streams_to_disk_and_leaves_no_pdf(self, cache_dir, server, monkeypatch):
+        responses = []
+        original = server.get
+
+        def recording(*args, **kwargs):
+            responses.append(original(*args, **kwargs))
+            return responses[-1]
+
+        monkeypatch.setattr(pdf_processor.requests, 'get', recording)
+        server.files[URL] = (pdf_bytes(40, 'kessan'), '"v1"')
+
+        assert PDFProcessor().process_pdf_url(URL)['success']
+
+        assert responses[0].chunk_sizes == [DOWNLOAD_CHUNK_SIZE]
+        leftovers = [name for _, _, files in os.walk(cache_dir) for name in files
+                     if not name.endswith('.json')]
+        assert leftovers == []
+
+    def test_text_cache_is_bounded_lru(self, settings, cache_dir, server, extractions):
+        urls = [f'https://example.com/{name}.pdf' for name in ('a', 'b', 'c')]
+        for i, url in enumerate(urls):
+            server.files[url] = (pdf_bytes(2, f'doc{i}'), f'"{i}"')
+        PDFProcessor().process_pdf_url(urls[0])
+        one_text = sum(f.stat().st_size for f in (cache_dir / 'text').iterdir())
+        settings.TDNET_API_SETTINGS = {'CACHE_DIR': str(cache_dir), 'TEXT_CACHE_MAX_BYTES': one_text * 2 + 10}
+
+        PDFProcessor().process_pdf_url(urls[1])
+        os.utime(next((cache_dir / 'text').iterdir()), (0, 0))  # 一番古いアクセスにする
+        PDFProcessor().process_pdf_url(urls[0])  # 読んだものは新しくなる
+        PDFProcessor().process_pdf_url(urls[2])
+
+        assert len(list((cache_dir / 'text').glob('*.json'))) == 2
+        assert len(extractions) == 3
+        assert PDFProcessor().process_pdf_url(urls[0])['cache'] == 'hit'
+        assert PDFProcessor().process_pdf_url(urls[1])['cache'] == 'miss'
+        assert len(extractions) == 4
+
+    def test_download_failure(self, cache_dir, server):
+        result = PDFProcessor().process_pdf_url('https://example.com/missing.pdf')
+
+        assert not result['success']
+        assert result['error'] == 'PDFのダウンロードに失敗しました'
+        assert not PDFProcessor().cached_text('https://example.com/missing.pdf')
+
+    def test_broken_cache_file_is_ignored(self, cache_dir, server, extractions):
+        server.files[URL] = (pdf_bytes(1, 'kessan'), '"v1"')
+        PDFProcessor().process_pdf_url(URL)
+        for name in os.listdir(cache_dir / 'text'):
+            (cache_dir / 'text' / name).write_text('{broken')
+
+        result = PDFProcessor().process_pdf_url(URL)
+
+        assert result['success'] and 'kessan page 1' in result['text']
+        assert len(extractions) == 2
+
+
+def test_regenerate_uses_cached_full_text(settings, cache_dir, server):
+    settings.GEMINI_API_KEY = None
+    server.files[URL] = (pdf_bytes(2, 'kessan'), '"v1"')
+    # generate_report_from_pdf_url と同じ要点抽出
+    full_text = PDFProcessor().process_pdf_url(URL, summary_only=True)['text']
+    disclosure = TDNETDisclosure(
+        pdf_url=URL, summary='要約',
+        raw_data={'pdf_url': URL, 'extracted_text': full_text[:5]},
+    )
+    service = TDNETReportGeneratorService()
+
+    assert service._stored_text(disclosure) == full_text
+    assert len(server.calls) == 1
+
+    disclosure.pdf_url = 'https://example.com/uncached.pdf'
+    disclosure.raw_data['pdf_url'] = disclosure.pdf_url
+    assert service._stored_text(disclosure) == full_text[:5]
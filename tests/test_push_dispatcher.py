@@ -0,0 +1,203 @@
+"""Web Push の並列送信（stockdiary/services/push_dispatcher.py）のテスト。
+
+なぜこのテストがあるか:
+  send_push_notification は購読ごとに webpush を直列に呼び、成功・失効のたびに
+  subscription.save() していたため、数千件の購読への通知に数分かかっていた。
+  PushDispatcher に置き換えたので、
+  - 送信が並列に行われ、プッシュサービスのホストごとに接続（Session）を使い回すこと
+  - VAPID の aud が送信先ホストごとに正しいこと（claims を使い回して混ざらないこと）
+  - last_used 更新と 404/410 の購読の無効化がバッチごとに UPDATE 2回で済むこと
+  - 配信待ち時間のパーセンタイルを集計すること
+  - send_push_notification の戻り値（配信できた購読数）が変わらないこと
+  を固定する。
+"""
+import base64
+import datetime
+import json
+import threading
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from stockdiary.api_views import send_push_notification
+from stockdiary.models import PushSubscription
+from stockdiary.services import push_dispatcher
+from stockdiary.services.push_dispatcher import PushDispatcher, PushMessage
+
+User = get_user_model()
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def vapid_private_key() -> str:
+    key = ec.generate_private_key(ec.SECP256R1())
+    return b64(key.private_numbers().private_value.to_bytes(32, 'big'))
+
+
+def subscriber_keys():
+    """ブラウザ側の購読鍵（p256dh / auth）"""
+    public = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint,
+    )
+    return b64(public), b64(b'0123456789abcdef')
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.reason = 'Gone' if status_code == 410 else ''
+        self.text = ''
+
+
+class FakePushService:
+    """requests.Session の代わり。エンドポイントの末尾で応答ステータスを決める"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sessions = []
+        self.posts = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def session_class(self):
+        service = self
+
+        class Session:
+            def __init__(self):
+                self.host = None
+                self.closed = False
+                service.sessions.append(self)
+
+            def mount(self, prefix, adapter):
+                pass
+
+            def post(self, url, data=None, headers=None, timeout=None):
+                with service.lock:
+                    service.active += 1
+                    service.peak = max(service.peak, service.active)
+                    service.posts.append((self, url, headers))
+                time.sleep(service.delay)
+                with service.lock:
+                    service.active -= 1
+                status = url.rsplit('-', 1)[-1]
+                return FakeResponse(int(status) if status.isdigit() else 201)
+
+            def close(self):
+                self.closed = True
+
+        return Session
+
+
+@pytest.fixture
+def push_service(settings, monkeypatch):
+    settings.WEBPUSH_SETTINGS = {
+        'VAPID_PRIVATE_KEY': vapid_private_key(),
+        'VAPID_ADMIN_EMAIL': 'admin@example.com',
+        'DISPATCH': {'WORKERS': 8, 'TIMEOUT_SECONDS': 5, 'BATCH_SIZE': 500},
+    }
+    service = FakePushService()
+    monkeypatch.setattr(push_dispatcher.requests, 'Session', service.session_class())
+    return service
+
+
+def subscribe(user, endpoint):
+    p256dh, auth = subscriber_keys()
+    return PushSubscription.objects.create(user=user, endpoint=endpoint, p256dh=p256dh, auth=auth)
+
+
+def make_users(count, hosts=('fcm.googleapis.com', 'updates.push.services.mozilla.com')):
+    users = []
+    for i in range(count):
+        user = User.objects.create_user(username=f'push{i}', email=f'push{i}@example.com', password='p')
+        for host in hosts:
+            subscribe(user, f'https://{host}/send/{user.pk}-{host[:3]}')
+        users.append(user)
+    return users
+
+
+class TestPushDispatcher:
+    def test_sends_in_parallel_reusing_one_session_per_host(self, push_service):
+        push_service.delay = 0.05
+        users = make_users(4)
+
+        result = PushDispatcher().send([PushMessage(u.pk, '月次レビュー', '今月3件') for u in users])
+
+        assert (result.sent, result.failed) == (8, 0)
+        assert result.sent_by_user == {u.pk: 2 for u in users}
+        assert push_service.peak > 1
+        assert len(push_service.sessions) == 2
+        hosts_by_session = {}
+        for session, url, _ in push_service.posts:
+            hosts_by_session.setdefault(id(session), set()).add(url.split('/')[2])
+        assert all(len(hosts) == 1 for hosts in hosts_by_session.values())
+        assert all(session.closed for session in push_service.sessions)
+
+    def test_vapid_audience_matches_each_host(self, push_service):
+        make_users(1)
+
+        PushDispatcher().send([PushMessage(User.objects.get().pk, 't', 'm')])
+
+        for _, url, headers in push_service.posts:
+            token = headers['Authorization'].split('t=')[1].split(',')[0]
+            claims = json.loads(base64.urlsafe_b64decode(token.split('.')[1] + '=='))
+            assert claims['aud'] == 'https://' + url.split('/')[2]
+            assert claims['sub'] == 'mailto:admin@example.com'
+
+    def test_bookkeeping_uses_two_updates_per_batch(self, push_service):
+        user = User.objects.create_user(username='push', email='push@example.com', password='p')
+        ok = [subscribe(user, f'https://fcm.googleapis.com/send/ok{i}') for i in range(3)]
+        gone = subscribe(user, 'https://fcm.googleapis.com/send/gone-410')
+        missing = subscribe(user, 'https://fcm.googleapis.com/send/missing-404')
+        broken = subscribe(user, 'https://fcm.googleapis.com/send/broken-500')
+        before = timezone.now()
+        PushSubscription.objects.update(last_used=before - datetime.timedelta(days=30))
+
+        with CaptureQueriesContext(connection) as queries:
+            result = PushDispatcher(batch_size=3).send([PushMessage(user.pk, 't', 'm')])
+
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        assert len(updates) <= 2 * 2
+        assert (result.sent, result.failed, result.expired) == (3, 3, 2)
+        assert set(PushSubscription.objects.filter(is_active=False).values_list('pk', flat=True)) \
+            == {gone.pk, missing.pk}
+        assert PushSubscription.objects.get(pk=broken.pk).is_active
+        assert all(PushSubscription.objects.get(pk=s.pk).last_used >= before for s in ok)
+
+    def test_reports_latency_percentiles(self, push_service):
+        users = make_users(3)
+
+        summary = PushDispatcher().send([PushMessage(u.pk, 't', 'm') for u in users]).summary()
+
+        assert summary['sent'] == 6
+        assert 0 <= summary['p50_ms'] <= summary['p95_ms'] <= summary['p99_ms'] <= summary['max_ms']
+
+    def test_without_vapid_key_nothing_is_sent(self, settings, push_service):
+        settings.WEBPUSH_SETTINGS = {**settings.WEBPUSH_SETTINGS, 'VAPID_PRIVATE_KEY': ''}
+        users = make_users(1)
+
+        assert PushDispatcher().send([PushMessage(users[0].pk, 't', 'm')]).sent == 0
+        assert push_service.posts == []
+
+
+def test_send_push_notification_returns_delivered_count(push_service):
+    user = User.objects.create_user(username='push', email='push@example.com', password='p')
+    subscribe(user, 'https://fcm.googleapis.com/send/a')
+    subscribe(user, 'https://fcm.googleapis.com/send/b-410')
+    other = make_users(1)[0]
+
+    assert send_push_notification(user, 'タイトル', '本文', url='/stockdiary/', tag='t', notification_id=5) == 1
+
+    assert {url for _, url, _ in push_service.posts} == {
+        'https://fcm.googleapis.com/send/a', 'https://fcm.googleapis.com/send/b-410',
+    }
+    assert not PushSubscription.objects.get(endpoint__endswith='b-410').is_active
+    assert PushSubscription.objects.filter(user=other, is_active=True).count() == 2
@@ -0,0 +1,200 @@
+"""過去の開示書類の語彙感情分析一括作成（services/sentiment_backfill.py）のテスト。
+
+なぜこのテストがあるか:
+  経営トーンの履歴（SentimentAnalysisHistory）は run_lexicon_analysis で1書類ずつしか作れず、
+  過去分を揃えられなかった。書類を条件で選び、アーカイブ経由の本文抽出（スレッド）→
+  語彙感情分析（プロセスプール）→ bulk_create で一括作成するコマンドを追加したので、
+  - 対象の絞り込み（書類種別・提出日・日記の銘柄・履歴のある書類の除外）
+  - 子プロセスでの分析結果が履歴に残ること、失敗・テキストなしで止まらないこと
+  - 再実行で続きから処理すること（resume）と処理速度（書類/秒）の報告
+  - 本文のなかった書類は対象外として記録し、再実行のたびに読み直さないこと
+  - 本文抽出のスレッドが EDINETXBRLService を共有しないこと
+  を固定する。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone as dt_timezone
+
+import pytest
+from django.core.management import call_command
+
+from earnings_analysis.models import DocumentMetadata, SentimentAnalysisHistory
+from earnings_analysis.services import sentiment_backfill
+from earnings_analysis.services.sentiment_backfill import backfill_candidates, run_sentiment_backfill
+from stockdiary.models import StockDiary
+
+SECTIONS = {
+    'BusinessPolicyTextBlock': (
+        '当期は増収増益を達成し、業績は好調に推移しました。新製品の販売が拡大し、受注も堅調です。'
+        '今後も持続的成長を目指し、収益性の改善に取り組みます。'
+    ) * 3,
+}
+
+
+def make_document(doc_id, securities_code='72030', doc_type_code='120', file_date=date(2024, 6, 20)):
+    return DocumentMetadata.objects.create(
+        doc_id=doc_id,
+        edinet_code='E02144',
+        securities_code=securities_code,
+        company_name='テスト株式会社',
+        ordinance_code='010',
+        form_code='030000',
+        doc_type_code=doc_type_code,
+        period_start=date(2023, 4, 1),
+        period_end=date(2024, 3, 31),
+        submit_date_time=datetime(2024, 6, 20, tzinfo=dt_timezone.utc),
+        file_date=file_date,
+        doc_description='有価証券報告書',
+        legal_status='1',
+        withdrawal_status='0',
+        xbrl_flag=True,
+    )
+
+
+@pytest.fixture
+def loads(monkeypatch, tmp_path, settings):
+    """アーカイブ・EDINET を読まず、doc_id に応じたセクションを返す（読んだ doc_id を記録）"""
+    settings.SENTIMENT_RESULT_CACHE_SETTINGS = {'ROOT': str(tmp_path / 'sentiment')}
+    loaded = []
+
+    def fake_load(document):
+        loaded.append(document.doc_id)
+        if document.doc_id.endswith('X'):
+            raise ConnectionError('download failed')
+        if document.doc_id.endswith('E'):
+            return {}, 0.01
+        return dict(SECTIONS), 0.01
+
+    monkeypatch.setattr(sentiment_backfill, '_load_sections', fake_load)
+    return loaded
+
+
+@pytest.mark.django_db
+class TestCandidates:
+    def test_filters(self, user):
+        StockDiary.objects.create(user=user, stock_symbol='7203', stock_name='トヨタ自動車')
+        make_document('S100OLD1', file_date=date(2019, 6, 20))
+        make_document('S100NEW1', file_date=date(2024, 6, 20))
+        make_document('S100OTHR', securities_code='99990')
+        make_document('S100EXTR', doc_type_code='180')
+        done = make_document('S100DONE')
+        SentimentAnalysisHistory.objects.create(document=done, overall_score=0.1, sentiment_label='neutral')
+
+        def ids(**kwargs):
+            return list(backfill_candidates(**kwargs).values_list('doc_id', flat=True))
+
+        assert ids() == ['S100OLD1', 'S100NEW1', 'S100OTHR']
+        assert ids(since=date(2020, 1, 1), held_only=True) == ['S100NEW1']
+        assert ids(until=date(2020, 1, 1)) == ['S100OLD1']
+        assert ids(securities_codes=['99990']) == ['S100OTHR']
+        assert ids(doc_type_codes=['180']) == ['S100EXTR']
+
+
+@pytest.mark.django_db
+class TestRunBackfill:
+    def test_saves_histories_in_batches(self, loads):
+        for i in range(5):
+            make_document(f'S100BF{i}0')
+        make_document('S100BADX')
+        make_document('S100NOTE')
+        batches = []
+
+        summary = run_sentiment_backfill(
+            backfill_candidates(), cpu_workers=0, batch_size=2, progress=batches.append,
+        )
+
+        assert SentimentAnalysisHistory.objects.count() == 5
+        assert set(SentimentAnalysisHistory.objects.values_list('sentiment_label', flat=True)) == {'positive'}
+        assert (summary['documents'], summary['failed'], summary['skipped']) == (7, 1, 1)
+        assert summary['stages']['write']['count'] == 3
+        assert [b['sentiment_saved'] for b in batches] == [2, 4, 5]
+        assert summary['documents_per_second'] > 0
+
+    def test_process_pool(self, loads):
+        docs = [make_document(f'S100PP{i}0') for i in range(3)]
+
+        summary = run_sentiment_backfill(backfill_candidates(), io_workers=2, cpu_workers=2)
+
+        assert summary['failed'] == 0
+        assert SentimentAnalysisHistory.objects.filter(document__in=docs).count() == 3
+
+    def test_resume_skips_saved_documents(self, loads):
+        for i in range(4):
+            make_document(f'S100RS{i}0')
+
+        # 途中まで処理して中断した状態
+        run_sentiment_backfill(backfill_candidates()[:2], cpu_workers=0)
+        loads.clear()
+        run_sentiment_backfill(backfill_candidates(), cpu_workers=0)
+
+        assert sorted(loads) == ['S100RS20', 'S100RS30']
+        assert SentimentAnalysisHistory.objects.count() == 4
+
+    def test_documents_without_text_are_not_reloaded(self, loads):
+        make_document('S100TXT1')
+        empty = make_document('S100NOTE')
+
+        summary = run_sentiment_backfill(backfill_candidates(), cpu_workers=0)
+        loads.clear()
+        run_sentiment_backfill(backfill_candidates(), cpu_workers=0)
+
+        assert summary['skipped'] == 1
+        empty.refresh_from_db()
+        assert empty.sentiment_skipped
+        assert loads == []
+        assert list(backfill_candidates(include_skipped=True).values_list('doc_id', flat=True)) == ['S100NOTE']
+
+    def test_each_thread_has_its_own_xbrl_service(self, monkeypatch):
+        from earnings_analysis.services import xbrl_extractor
+
+        created = []
+
+        class FakeService:
+            def __init__(self):
+                created.append((threading.get_ident(), self))
+
+            def _load_xbrl_archive(self, doc_id):
+                return b''
+
+        monkeypatch.setattr(xbrl_extractor, 'EDINETXBRLService', FakeService)
+        monkeypatch.setattr(sentiment_backfill, '_local', threading.local())
+        barrier = threading.Barrier(2)
+
+        def load(document):
+            barrier.wait()  # 2スレッドで同時に読む
+            return sentiment_backfill._load_sections(document)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(load, [make_document('S100TH10'), make_document('S100TH20')]))
+
+        assert len(created) == 2
+        assert len({ident for ident, _ in created}) == 2
+
+
+@pytest.mark.django_db
+class TestCommand:
+    def test_reports_throughput(self, loads, capsys):
+        make_document('S100CMD1')
+        make_document('S100CMD2')
+
+        call_command('backfill_sentiment_history', '--dry-run')
+        assert '対象（履歴なし）: 2書類' in capsys.readouterr().out
+        assert not loads
+
+        call_command('backfill_sentiment_history', '--cpu-workers', '0', '--symbols', '7203')
+        out = capsys.readouterr().out
+        assert '書類/秒' in out
+        assert SentimentAnalysisHistory.objects.count() == 2
+
+        call_command('backfill_sentiment_history', '--cpu-workers', '0')
+        assert '対象（履歴なし）: 0書類' in capsys.readouterr().out
+
+    def test_retry_skipped(self, loads, capsys):
+        make_document('S100NOTE')
+        call_command('backfill_sentiment_history', '--cpu-workers', '0')
+        loads.clear()
+
+        call_command('backfill_sentiment_history', '--cpu-workers', '0')
+        assert '対象（履歴なし）: 0書類' in capsys.readouterr().out
+        call_command('backfill_sentiment_history', '--cpu-workers', '0', '--retry-skipped')
+        assert loads == ['S100NOTE']
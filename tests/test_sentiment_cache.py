@@ -0,0 +1,242 @@
+"""感情分析結果キャッシュ（services/sentiment_cache.py）のテスト。
+
+なぜこのテストがあるか:
+  start_analysis は同じ書類の完了セッションを1時間だけ再利用し、それ以降や本文が同じ
+  訂正報告書では語彙分析・AI 分析を最初からやり直していた。本文・辞書バージョン・設定の
+  ハッシュをキーにした結果キャッシュを run_lexicon_analysis・start_analysis の分析処理・
+  自動分析パイプラインで共有するようにしたので、
+  - 同じ本文なら書類が違っても分析し直さないこと
+  - 辞書の編集・設定の変更でキーが変わること（古い結果を引かない）
+  - AI 分析の失敗は保存しないこと、容量上限で古いものから消えること
+  - 経営トーンの前回比が現在の辞書で計算した前回スコアを使うこと
+  を固定する。
+"""
+import gzip
+import os
+from datetime import date, datetime, timezone as dt_timezone
+
+import pytest
+
+from earnings_analysis.models import DocumentMetadata, SentimentAnalysisHistory, SentimentAnalysisSession
+from earnings_analysis.services.sentiment_analyzer import (
+    AnalysisConfig, SentimentAnalysisService, TransparentSentimentAnalyzer, TransparentSentimentDictionary,
+)
+from earnings_analysis.services.sentiment_cache import (
+    SentimentResultCache, analyze_with_cache, get_result_cache, result_cache_key,
+)
+from stockdiary.views_panels import _sentiment_tone_trend
+
+SECTIONS = {
+    'BusinessPolicyTextBlock': '当期は増収増益を達成し、業績は好調に推移しました。受注も堅調です。',
+    'BusinessRisksTextBlock': '原材料価格の上昇により収益が悪化するリスクがあります。',
+}
+
+
+@pytest.fixture
+def cache_root(tmp_path, settings):
+    settings.SENTIMENT_RESULT_CACHE_SETTINGS = {'ROOT': str(tmp_path / 'sentiment'), 'MAX_BYTES': 10 ** 9}
+    return tmp_path / 'sentiment'
+
+
+@pytest.fixture
+def analyzer():
+    return TransparentSentimentAnalyzer()
+
+
+@pytest.fixture
+def counted(analyzer, monkeypatch):
+    """analyze_text_sections の呼び出し回数を数える"""
+    calls = []
+    original = analyzer.analyze_text_sections
+
+    def analyze(*args, **kwargs):
+        calls.append(args[0])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(analyzer, 'analyze_text_sections', analyze)
+    return calls
+
+
+def make_document(doc_id, securities_code='72030', file_date=date(2025, 6, 20)):
+    return DocumentMetadata.objects.create(
+        doc_id=doc_id,
+        edinet_code='E02144',
+        securities_code=securities_code,
+        company_name='テスト株式会社',
+        ordinance_code='010',
+        form_code='030000',
+        doc_type_code='120',
+        period_start=date(2024, 4, 1),
+        period_end=date(2025, 3, 31),
+        submit_date_time=datetime(2025, 6, 20, tzinfo=dt_timezone.utc),
+        file_date=file_date,
+        doc_description='有価証券報告書',
+        legal_status='1',
+        withdrawal_status='0',
+        xbrl_flag=True,
+    )
+
+
+class TestSentimentResultCache:
+    def test_roundtrip_is_compressed(self, tmp_path):
+        store = SentimentResultCache(tmp_path)
+        result = {'overall_score': 0.4, 'analysis_metadata': {'dictionary_version': 'v1'}}
+        store.put('ab' * 32, result, doc_id='S100AAAA')
+
+        assert store.get('ab' * 32) == result
+        assert store.get('cd' * 32) is None
+        assert store.get_for_document('S100AAAA', 'v1') == result
+        assert store.get_for_document('S100AAAA', 'v2') is None  # 別の辞書で分析した結果は返さない
+        assert gzip.decompress(store._result_path('ab' * 32).read_bytes()).startswith(b'{')
+
+    def test_corrupted_entry_is_discarded(self, tmp_path):
+        store = SentimentResultCache(tmp_path)
+        store.put('ab' * 32, {'overall_score': 0.1})
+        store._result_path('ab' * 32).write_bytes(b'not gzip')
+
+        assert store.get('ab' * 32) is None
+        assert not store._result_path('ab' * 32).exists()
+
+    def test_lru_eviction_keeps_recently_used(self, tmp_path):
+        store = SentimentResultCache(tmp_path)
+        keys = [f'{i:02d}' * 32 for i in range(3)]
+        for n, key in enumerate(keys):
+            store.put(key, {'overall_score': n, 'padding': str(n) * 2000}, doc_id=f'S100000{n}')
+            os.utime(store._result_path(key), (1000 + n, 1000 + n))
+
+        assert store.get(keys[0]) is not None
+        store.evict(max_bytes=store.stats()['bytes'] - 1)
+
+        assert store.get(keys[1]) is None
+        assert store.get(keys[0]) is not None and store.get(keys[2]) is not None
+        # 結果の消えた書類参照は引いたときに掃除する
+        assert store.get_for_document('S1000001', None) is None
+        assert not store._ref_path('S1000001').exists()
+
+
+class TestCacheKey:
+    def test_dictionary_edit_changes_key(self, tmp_path):
+        csv_path = tmp_path / 'dict.csv'
+        csv_path.write_text('word,score\n増収,0.8\n減益,-0.8\n', encoding='utf-8')
+        analyzer = TransparentSentimentAnalyzer()
+        analyzer.dictionary = TransparentSentimentDictionary(str(csv_path))
+        before = result_cache_key(analyzer, SECTIONS, use_ai=False)
+
+        analyzer.dictionary.sentiment_dict['増収'] = 0.9  # 語彙数が同じでもスコアの変更で変わる
+        edited = result_cache_key(analyzer, SECTIONS, use_ai=False)
+        assert edited != before
+
+        analyzer.config = AnalysisConfig(positive_threshold=0.2)
+        assert result_cache_key(analyzer, SECTIONS, use_ai=False) != edited
+
+    def test_content_and_mode(self, analyzer):
+        key = result_cache_key(analyzer, SECTIONS, use_ai=False)
+        assert result_cache_key(analyzer, dict(reversed(list(SECTIONS.items()))), use_ai=False) == key
+        assert result_cache_key(analyzer, {**SECTIONS, 'Extra': '追加'}, use_ai=False) != key
+        assert result_cache_key(analyzer, SECTIONS, use_ai=True) != key
+        # 語彙分析のみなら書類情報はキーに含めない（本文が同じ訂正報告書でも引ける）
+        assert result_cache_key(analyzer, SECTIONS, False, {'company_name': 'A'}) == key
+        assert (result_cache_key(analyzer, SECTIONS, True, {'company_name': 'A'})
+                != result_cache_key(analyzer, SECTIONS, True, {'company_name': 'B'}))
+
+
+class TestAnalyzeWithCache:
+    def test_same_sections_are_analyzed_once(self, cache_root, analyzer, counted):
+        first = analyze_with_cache(analyzer, SECTIONS, 's1', use_ai=False, doc_id='S100AAAA')
+        second = analyze_with_cache(analyzer, SECTIONS, 's2', use_ai=False, doc_id='S100BBBB')
+
+        assert len(counted) == 1
+        assert second['overall_score'] == first['overall_score']
+        assert second['analysis_metadata']['session_id'] == 's2'
+        assert second['analysis_metadata']['cache_hit'] is True
+        version = analyzer.dictionary.version
+        assert get_result_cache().get_for_document('S100BBBB', version)['overall_score'] == first['overall_score']
+
+    def test_failed_ai_analysis_is_not_cached(self, cache_root, analyzer, monkeypatch):
+        calls = []
+
+        def fake_sections(sections, session_id=None, document_info=None, use_ai=True):
+            calls.append(use_ai)
+            return {
+                'overall_score': 0.3, 'sentiment_label': 'positive',
+                'analysis_metadata': {'ai_analysis': {'attempted': True, 'success': len(calls) > 1}},
+            }
+
+        monkeypatch.setattr(analyzer, 'analyze_text_sections', fake_sections)
+        info = {'company_name': 'テスト株式会社'}
+        for _ in range(3):
+            analyze_with_cache(analyzer, SECTIONS, None, info, use_ai=True)
+
+        # 1回目は AI 失敗で保存せず、2回目の成功結果を3回目で使う
+        assert calls == [True, True]
+
+    def test_disabled(self, settings, analyzer, counted):
+        settings.SENTIMENT_RESULT_CACHE_SETTINGS = {'ENABLED': False}
+        analyze_with_cache(analyzer, SECTIONS, use_ai=False)
+        analyze_with_cache(analyzer, SECTIONS, use_ai=False)
+        assert len(counted) == 2
+
+
+class TestServiceIntegration:
+    def test_lexicon_analysis_reuses_result_for_same_sections(self, cache_root, monkeypatch, db):
+        service = SentimentAnalysisService()
+        monkeypatch.setattr(service.xbrl_service, 'get_xbrl_text_from_document', lambda doc: dict(SECTIONS))
+        calls = []
+        original = service.analyzer.analyze_text_sections
+        monkeypatch.setattr(
+            service.analyzer, 'analyze_text_sections',
+            lambda *a, **kw: calls.append(a) or original(*a, **kw),
+        )
+        original_doc = make_document('S100ORIG')
+        amended = make_document('S100AMND')
+
+        assert service.run_lexicon_analysis(original_doc)
+        assert service.run_lexicon_analysis(amended)
+
+        assert len(calls) == 1
+        scores = set(SentimentAnalysisHistory.objects.values_list('overall_score', flat=True))
+        assert len(scores) == 1
+
+    def test_execute_analysis_uses_cache(self, cache_root, monkeypatch, db):
+        service = SentimentAnalysisService()
+        monkeypatch.setattr(service.xbrl_service, 'get_xbrl_text_from_document', lambda doc: dict(SECTIONS))
+        doc = make_document('S100SESS')
+        analyzer = service.analyzer
+        lexicon = analyzer.analyze_text_sections(SECTIONS, None, None, use_ai=False)
+        lexicon['analysis_metadata']['ai_analysis'] = {'attempted': True, 'success': True}
+        info = {
+            'company_name': doc.company_name, 'doc_description': doc.doc_description,
+            'doc_type_code': doc.doc_type_code, 'submit_date': '2025-06-20',
+            'securities_code': doc.securities_code, 'edinet_code': doc.edinet_code,
+        }
+        get_result_cache().put(result_cache_key(analyzer, SECTIONS, True, info), lexicon)
+        monkeypatch.setattr(
+            analyzer, 'analyze_text_sections',
+            lambda *a, **kw: pytest.fail('キャッシュがあるのに再分析した'),
+        )
+
+        session = SentimentAnalysisSession.objects.create(document=doc, processing_status='PENDING')
+        service._execute_analysis(session.id)
+
+        session.refresh_from_db()
+        assert session.processing_status == 'COMPLETED'
+        assert session.analysis_result['analysis_metadata']['session_id'] == str(session.session_id)
+        assert session.analysis_result['analysis_metadata']['cache_hit'] is True
+        assert SentimentAnalysisHistory.objects.filter(document=doc).count() == 1
+
+
+class TestToneTrend:
+    def test_prefers_score_under_current_dictionary(self, cache_root, db):
+        prev_doc = make_document('S100PREV', file_date=date(2024, 6, 20))
+        doc = make_document('S100CURR')
+        SentimentAnalysisHistory.objects.create(document=prev_doc, overall_score=0.5, sentiment_label='positive')
+
+        assert _sentiment_tone_trend(doc, 0.4)['prev_score'] == 0.5
+
+        # 前回書類を現在の辞書で分析し直した結果がキャッシュにあれば、そのスコアと比べる
+        analyzer = TransparentSentimentAnalyzer()
+        analyze_with_cache(analyzer, SECTIONS, use_ai=False, doc_id=prev_doc.doc_id)
+        rescored = get_result_cache().get_for_document(prev_doc.doc_id, analyzer.dictionary.version)
+        trend = _sentiment_tone_trend(doc, 0.4)
+        assert trend['prev_score'] == pytest.approx(rescored['overall_score'])
+        assert trend['delta'] == pytest.approx(0.4 - rescored['overall_score'])
@@ -0,0 +1,370 @@
+"""TDNETレポートのまとめて生成（services/tdnet_report_pipeline.py）のテスト。
+
+なぜこのテストがあるか:
+  TDNETレポートは generate_report_from_disclosure / generate_report_from_pdf_url_task で
+  1開示ずつ直列に生成され、1件ごとに django-q のワーカーを1分以上占有していた。
+  複数の開示をまとめて受け取るパイプラインを入れたので、
+  - 重複した開示ID・同じ種別のレポートが既にある開示を生成しないこと
+    （並行したバッチが先に保存した場合も、(開示, 種別) の一意制約で二重に保存しないこと）
+  - PDFの取得・抽出を並列に行うこと
+  - 短い開示は同じ種別ごとに上限まで1回の LLM 呼び出しにまとめ、解釈できなかった分は1件ずつ生成し直すこと
+  - LLM 呼び出しが終わったまとまりから保存し、セクションはまとまりごとに1回の bulk_create で書くこと
+  - 実行記録に件/時が残り、管理画面に生成速度が出ること
+  - 実行の終わりに LLM の呼び出し回数・トークン数がログに出ること
+  - タスクは TASK_MAX_DISCLOSURES 件ごとに分けて投入し（qcluster の timeout に収める）、
+    止まった処理中のバッチは再配送で処理し直せて、管理画面を開くとエラーになること
+  を固定する。
+"""
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_q import tasks as q_tasks
+
+from earnings_analysis.models import TDNETDisclosure, TDNETReport, TDNETReportSection
+from earnings_analysis.models.tdnet import TDNETReportBatch
+from earnings_analysis.services import llm_gateway
+from earnings_analysis.services.gemini_service import GeminiReportGenerator
+from earnings_analysis.services.llm_gateway import get_llm_gateway
+from earnings_analysis.services.tdnet_report_pipeline import TDNETReportPipeline, queue_report_batch
+
+REPORT = {
+    'overall_score': 70, 'signal': 'positive', 'one_line_summary': '増益', 'summary': '増収増益',
+    'key_points': ['📈 売上増', '💰 利益増'],
+    'sections': [
+        {'section_type': 'overview', 'title': 'ポイント', 'content': '増益'},
+        {'section_type': 'risk', 'title': 'リスク・注意', 'content': '特になし'},
+    ],
+}
+
+
+def responder(model, prompt):
+    """まとめて生成のプロンプトには開示の数だけレポートを返す"""
+    if '# まとめて出力する形式' in prompt:
+        count = len(re.findall(r'^## 開示\d+$', prompt, re.MULTILINE))
+        return json.dumps({'reports': [{**REPORT, 'index': i} for i in range(1, count + 1)]}, ensure_ascii=False)
+    return json.dumps(REPORT, ensure_ascii=False)
+
+
+@pytest.fixture
+def backend(settings, tmp_path, monkeypatch):
+    settings.GEMINI_API_KEY = 'test-key'
+    settings.LLM_GATEWAY_SETTINGS = {
+        **settings.LLM_GATEWAY_SETTINGS, 'BACKEND': 'fake', 'CACHE_ROOT': str(tmp_path / 'llm'),
+    }
+    settings.TDNET_API_SETTINGS = {'CACHE_DIR': str(tmp_path / 'tdnet_cache'), 'EXTRACT_WORKERS': 1}
+    settings.TDNET_REPORT_PIPELINE = {
+        'FETCH_WORKERS': 4, 'LLM_WORKERS': 4,
+        'PACK_MAX_CONTENT_CHARS': 1000, 'PACK_PROMPT_CHARS': 3000, 'PACK_MAX_ITEMS': 5,
+    }
+    monkeypatch.setattr(llm_gateway, '_gateways', {})
+    fake = get_llm_gateway('test-key').backend
+    fake.responder = responder
+    return fake
+
+
+def make_disclosure(disclosure_id, disclosure_type='earnings', text='売上高 12,345百万円', pdf_url=''):
+    return TDNETDisclosure.objects.create(
+        disclosure_id=disclosure_id,
+        company_code='7203',
+        company_name='トヨタ自動車',
+        disclosure_date=datetime(2026, 5, 8, 6, 0, tzinfo=dt_timezone.utc),
+        disclosure_type=disclosure_type,
+        title=f'{disclosure_id} のお知らせ',
+        summary=text[:100],
+        raw_data={'extracted_text': text},
+        pdf_url=pdf_url,
+    )
+
+
+def batch_prompts(fake):
+    return [prompt for _, prompt, _ in fake.calls if '# まとめて出力する形式' in prompt]
+
+
+class TestPipeline:
+    def test_dedupes_and_skips_existing_reports(self, backend):
+        for i in range(4):
+            make_disclosure(f'D{i}')
+        TDNETReport.objects.create(
+            report_id='TDNET-EXISTING', disclosure=TDNETDisclosure.objects.get(disclosure_id='D3'),
+            title='既存', report_type='earnings', summary='既存',
+        )
+
+        stats = TDNETReportPipeline().run(['D0', 'D0', 'D1', 'D2', 'D3', 'MISSING'])
+
+        assert (stats['requested'], stats['skipped'], stats['generated'], stats['failed']) == (6, 3, 3, 0)
+        assert TDNETReport.objects.filter(disclosure__disclosure_id__in=['D0', 'D1', 'D2']).count() == 3
+        assert TDNETReportSection.objects.count() == 6
+        assert set(TDNETDisclosure.objects.filter(report_generated=True).values_list('disclosure_id', flat=True)) \
+            == {'D0', 'D1', 'D2'}
+        # 再実行しても生成済みは作らない
+        assert TDNETReportPipeline().run(['D0', 'D1'])['generated'] == 0
+
+    def test_report_saved_by_a_concurrent_batch_is_not_duplicated(self, backend, monkeypatch):
+        for i in range(2):
+            make_disclosure(f'C{i}')
+        pipeline = TDNETReportPipeline()
+        fetch_texts = pipeline._fetch_texts
+
+        def concurrent_batch_saves_first(items):
+            # 対象を選んだ後、生成中に別のバッチが C0 のレポートを保存した
+            TDNETReport.objects.create(
+                report_id='TDNET-CONCURRENT', disclosure=TDNETDisclosure.objects.get(disclosure_id='C0'),
+                title='並行', report_type='earnings', summary='並行',
+            )
+            fetch_texts(items)
+
+        monkeypatch.setattr(pipeline, '_fetch_texts', concurrent_batch_saves_first)
+
+        stats = pipeline.run(['C0', 'C1'])
+
+        assert (stats['generated'], stats['skipped'], stats['failed']) == (1, 1, 0)
+        assert TDNETReport.objects.filter(disclosure__disclosure_id='C0').get().report_id == 'TDNET-CONCURRENT'
+        assert TDNETReportSection.objects.count() == 2
+
+    def test_single_report_returns_the_concurrent_one(self, backend):
+        disclosure = make_disclosure('C2')
+        existing = TDNETReport.objects.create(
+            report_id='TDNET-CONCURRENT', disclosure=disclosure,
+            title='並行', report_type='earnings', summary='並行',
+        )
+        service = TDNETReportPipeline().service
+
+        report = service._save_report(disclosure, 'earnings', {'data': REPORT}, None)
+
+        assert report == existing
+        assert TDNETReport.objects.count() == 1
+
+    def test_short_disclosures_share_one_request(self, backend):
+        for i in range(3):
+            make_disclosure(f'E{i}')
+        make_disclosure('DIV', disclosure_type='dividend')
+        make_disclosure('LONG', text='売上高は前年同期比で増加した。' * 100)
+
+        stats = TDNETReportPipeline().run(['E0', 'E1', 'E2', 'DIV', 'LONG'])
+
+        assert stats['generated'] == 5
+        assert (stats['llm_requests'], stats['packed']) == (3, 3)
+        assert len(backend.calls) == 3
+        [packed] = batch_prompts(backend)
+        assert all(f'E{i} のお知らせ' in packed for i in range(3))
+        assert 'DIV' not in packed and 'LONG' not in packed
+        types = dict(TDNETReport.objects.values_list('disclosure__disclosure_id', 'report_type'))
+        assert types['DIV'] == 'dividend' and types['E0'] == 'earnings'
+
+    def test_packing_respects_item_and_char_limits(self, settings, backend):
+        settings.TDNET_REPORT_PIPELINE = {**settings.TDNET_REPORT_PIPELINE, 'PACK_MAX_ITEMS': 2}
+        for i in range(5):
+            make_disclosure(f'E{i}')
+
+        stats = TDNETReportPipeline().run([f'E{i}' for i in range(5)])
+
+        assert stats['llm_requests'] == 3
+        assert [len(re.findall(r'^## 開示\d+$', p, re.MULTILINE)) for p in batch_prompts(backend)] == [2, 2]
+
+        settings.TDNET_REPORT_PIPELINE = {
+            **settings.TDNET_REPORT_PIPELINE, 'PACK_MAX_ITEMS': 5, 'PACK_PROMPT_CHARS': 2000,
+        }
+        for i in range(3):
+            make_disclosure(f'F{i}', text='決算' * 450)  # 900 文字 → 合計 2,000 文字までなので2件ずつ
+
+        assert TDNETReportPipeline().run([f'F{i}' for i in range(3)], report_type='forecast')['llm_requests'] == 2
+
+    def test_llm_metrics_are_logged_after_the_run(self, backend, caplog):
+        for i in range(2):
+            make_disclosure(f'M{i}', text='売上高は前年同期比で増加した。' * 100)
+
+        with caplog.at_level('INFO', logger=llm_gateway.logger.name):
+            stats = TDNETReportPipeline().run(['M0', 'M1'])
+
+        llm = next(iter(stats['llm'].values()))
+        assert llm['calls'] == 2 and llm['prompt_tokens'] > 0
+        assert 'LLMメトリクス（レポートまとめて生成）' in caplog.text
+        assert get_llm_gateway('test-key').metrics.summary() == {}
+
+    def test_unparsed_reports_are_generated_one_by_one(self, backend):
+        def partial(model, prompt):
+            if '# まとめて出力する形式' in prompt:
+                return json.dumps({'reports': [{**REPORT, 'index': 2}, {'index': 1, 'summary': '不完全'}]})
+            return responder(model, prompt)
+
+        backend.responder = partial
+        for i in range(3):
+            make_disclosure(f'E{i}')
+
+        stats = TDNETReportPipeline().run(['E0', 'E1', 'E2'])
+
+        assert (stats['generated'], stats['failed']) == (3, 0)
+        assert stats['llm_requests'] == 1 + 2
+        single = [prompt for _, prompt, _ in backend.calls if '# まとめて出力する形式' not in prompt]
+        assert {re.search(r'タイトル: (E\d) のお知らせ', p).group(1) for p in single} == {'E0', 'E2'}
+
+    def test_sections_are_written_in_one_insert_per_group(self, backend):
+        for i in range(3):
+            make_disclosure(f'E{i}')
+        make_disclosure('LONG', text='売上高は前年同期比で増加した。' * 100)
+
+        with CaptureQueriesContext(connection) as queries:
+            TDNETReportPipeline().run(['E0', 'E1', 'E2', 'LONG'])
+
+        section_inserts = [q['sql'] for q in queries.captured_queries
+                           if q['sql'].startswith('INSERT INTO "earnings_tdnet_report_section"')]
+        assert len(section_inserts) == 2
+        assert TDNETReportSection.objects.count() == 8
+
+    def test_each_group_is_saved_as_it_completes(self, backend):
+        """途中でワーカーが止まっても、それまでに終わったまとまりのレポートは残る"""
+        for i in range(3):
+            make_disclosure(f'L{i}', text='売上高は前年同期比で増加した。' * 100)
+        saved = []
+
+        TDNETReportPipeline().run(
+            [f'L{i}' for i in range(3)],
+            progress=lambda stats: saved.append((stats['generated'], TDNETReport.objects.count())),
+        )
+
+        assert saved == [(1, 1), (2, 2), (3, 3)]
+
+    def test_pdfs_are_fetched_concurrently(self, backend, monkeypatch):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        pipeline = TDNETReportPipeline()
+
+        def process_pdf_url(url, max_pages=50, summary_only=False):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            return {'success': True, 'text': f'{url} の本文', 'pages': 3, 'processed_pages': 3}
+
+        monkeypatch.setattr(pipeline.service.pdf_processor, 'process_pdf_url', process_pdf_url)
+        for i in range(4):
+            make_disclosure(f'P{i}', pdf_url=f'https://www.release.tdnet.info/inbs/P{i}.pdf')
+
+        assert pipeline.run([f'P{i}' for i in range(4)])['generated'] == 4
+        assert peak[0] == 4
+        assert 'P3.pdf の本文' in batch_prompts(backend)[0]
+
+
+def test_parse_batch_response():
+    generator = GeminiReportGenerator.__new__(GeminiReportGenerator)
+    text = '```json\n' + json.dumps({'reports': [
+        {**REPORT, 'index': 3}, {**REPORT, 'index': 1}, {**REPORT, 'index': 3}, {**REPORT, 'index': 9},
+    ]}, ensure_ascii=False) + '\n```'
+
+    results = generator._parse_batch_response(text, 3)
+
+    assert [r is not None for r in results] == [True, False, True]
+    assert 'index' not in results[0]
+    assert generator._parse_batch_response('ごめんなさい', 2) == [None, None]
+
+
+class TestBatchTask:
+    @pytest.fixture
+    def run_tasks(self, monkeypatch):
+        monkeypatch.setattr(q_tasks, 'async_task', lambda func, *args, **kwargs: func(*args))
+
+    def test_queue_runs_and_records_throughput(self, backend, run_tasks, django_capture_on_commit_callbacks):
+        for i in range(3):
+            make_disclosure(f'E{i}')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            [batch] = queue_report_batch(['E0', 'E1', 'E1', 'E2'])
+
+        batch.refresh_from_db()
+        assert batch.disclosure_ids == ['E0', 'E1', 'E2']
+        assert batch.status == TDNETReportBatch.STATUS_DONE
+        assert (batch.generated_count, batch.skipped_count, batch.llm_requests) == (3, 0, 1)
+        assert batch.reports_per_hour > 0 and batch.finished_at
+
+    def test_redelivered_task_does_not_generate_again(self, backend):
+        make_disclosure('E0')
+        batch = TDNETReportBatch.objects.create(disclosure_ids=['E0'], status=TDNETReportBatch.STATUS_DONE)
+        from earnings_analysis.tasks import generate_tdnet_reports_task
+
+        assert generate_tdnet_reports_task(str(batch.batch_id)) is None
+        assert not TDNETReport.objects.exists()
+
+    def test_large_selection_is_split_into_bounded_tasks(self, settings, backend, monkeypatch,
+                                                         django_capture_on_commit_callbacks):
+        settings.TDNET_REPORT_PIPELINE = {**settings.TDNET_REPORT_PIPELINE, 'TASK_MAX_DISCLOSURES': 2}
+        queued = []
+        monkeypatch.setattr(q_tasks, 'async_task', lambda func, *args, **kwargs: queued.append(args[0]))
+
+        with django_capture_on_commit_callbacks(execute=True):
+            batches = queue_report_batch(['E0', 'E1', 'E2', 'E1', 'E3', 'E4'])
+
+        assert [batch.disclosure_ids for batch in batches] == [['E0', 'E1'], ['E2', 'E3'], ['E4']]
+        assert queued == [str(batch.batch_id) for batch in batches]
+
+    def test_stale_processing_batch_is_reclaimed_on_redelivery(self, backend):
+        from earnings_analysis.tasks import generate_tdnet_reports_task
+
+        make_disclosure('E0')
+        make_disclosure('E1')
+        live = TDNETReportBatch.objects.create(disclosure_ids=['E0'], status=TDNETReportBatch.STATUS_PROCESSING)
+        stale = TDNETReportBatch.objects.create(disclosure_ids=['E1'], status=TDNETReportBatch.STATUS_PROCESSING)
+        TDNETReportBatch.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        assert generate_tdnet_reports_task(str(live.batch_id)) is None
+        assert generate_tdnet_reports_task(str(stale.batch_id)) == TDNETReportBatch.STATUS_DONE
+        assert list(TDNETReport.objects.values_list('disclosure__disclosure_id', flat=True)) == ['E1']
+
+
+class TestAdmin:
+    @pytest.fixture
+    def staff_client(self, client):
+        get_user_model().objects.create_user(username='staff', password='p', email='s@example.com', is_staff=True)
+        client.login(username='staff', password='p')
+        return client
+
+    def test_selected_disclosures_are_queued(self, staff_client, monkeypatch, django_capture_on_commit_callbacks):
+        queued = []
+        monkeypatch.setattr(q_tasks, 'async_task', lambda func, *args, **kwargs: queued.append(args))
+        make_disclosure('E0')
+        make_disclosure('E1')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = staff_client.post(reverse('copomo:tdnet-admin-generate-batch'),
+                                         {'disclosure_ids': ['E0', 'E1']})
+
+        assert response.status_code == 302
+        batch = TDNETReportBatch.objects.get()
+        assert batch.disclosure_ids == ['E0', 'E1']
+        assert queued == [(str(batch.batch_id),)]
+
+    def test_disclosure_list_shows_throughput(self, staff_client):
+        disclosure = make_disclosure('E0')
+        TDNETReport.objects.create(report_id='TDNET-1', disclosure=disclosure, title='t',
+                                   report_type='earnings', summary='s')
+        TDNETReportBatch.objects.create(disclosure_ids=['E0'], status=TDNETReportBatch.STATUS_DONE,
+                                        generated_count=1, reports_per_hour=1800.0,
+                                        finished_at=disclosure.disclosure_date)
+
+        response = staff_client.get(reverse('copomo:tdnet-admin-disclosure-list'))
+
+        assert response.status_code == 200
+        assert response.context['throughput']['last_hour'] == 1
+        assert '1800.0件/時' in response.content.decode()
+
+    def test_stale_batches_are_marked_as_errors(self, staff_client):
+        stale = TDNETReportBatch.objects.create(disclosure_ids=['E0'], status=TDNETReportBatch.STATUS_PROCESSING)
+        TDNETReportBatch.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        live = TDNETReportBatch.objects.create(disclosure_ids=['E1'], status=TDNETReportBatch.STATUS_PROCESSING)
+
+        staff_client.get(reverse('copomo:tdnet-admin-disclosure-list'))
+
+        stale.refresh_from_db()
+        live.refresh_from_db()
+        assert (stale.status, live.status) == (TDNETReportBatch.STATUS_ERROR, TDNETReportBatch.STATUS_PROCESSING)
+        assert stale.finished_at is not None
@@ -0,0 +1,181 @@
+"""保有ポジションの時価評価（ValuationService / QuoteService）のテスト。
+
+なぜこのテストがあるか:
+  「評価額」は従来 保有数 × 平均取得単価（取得原価）で、時価ではなかった。
+  株価キャッシュ（StockQuote）と保有を1回で突き合わせて含み損益・構成比・前日比を
+  出すようにしたので、その計算と、キャッシュが無い銘柄で取得原価へ
+  フォールバックする挙動、各表示先（一覧・ダッシュボード・分析API）への配線を固定する。
+"""
+import json
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.test import RequestFactory
+from django.urls import reverse
+
+from stockdiary import api_analysis
+from stockdiary.models import StockDiary, StockQuote, Transaction
+from stockdiary.services.quote_service import QuoteService
+from stockdiary.services.valuation_service import ValuationService
+
+pytestmark = pytest.mark.django_db
+
+
+def _position(id_, symbol, qty, avg, sector='電気機器', currency='JPY', group=0):
+    return {
+        'id': id_, 'symbol': symbol, 'sector': sector, 'currency': currency,
+        'group': group, 'quantity': Decimal(qty), 'avg_cost': Decimal(avg),
+    }
+
+
+def _buy(user, symbol, qty, price, sector='電気機器'):
+    diary = StockDiary.objects.create(
+        user=user, stock_symbol=symbol, stock_name=f'銘柄{symbol}', sector=sector,
+    )
+    Transaction.objects.create(
+        diary=diary, transaction_type='buy', transaction_date=date(2026, 1, 5),
+        price=Decimal(price), quantity=Decimal(qty),
+    )
+    diary.refresh_from_db()
+    return diary
+
+
+class TestValuePositions:
+    def test_market_value_pnl_weight_and_day_change(self):
+        quotes = {
+            '7203': {'symbol': '7203', 'price': Decimal('2500'), 'previous_close': Decimal('2400'),
+                     'currency': 'JPY', 'fetched_at': None},
+            '6758': {'symbol': '6758', 'price': Decimal('900'), 'previous_close': None,
+                     'currency': 'JPY', 'fetched_at': None},
+        }
+        result = ValuationService.value_positions([
+            _position(1, '7203', '100', '2000', sector='輸送用機器'),
+            _position(2, '6758', '100', '1000'),
+        ], quotes=quotes)
+
+        toyota = result['positions'][1]
+        assert toyota['market_value'] == 250000.0
+        assert toyota['unrealized_pnl'] == 50000.0
+        assert toyota['unrealized_pnl_pct'] == 25.0
+        assert toyota['day_change'] == 10000.0
+        # 構成比: 250,000 / (250,000 + 90,000)
+        assert toyota['weight'] == round(250000 / 340000 * 100, 2)
+
+        sony = result['positions'][2]
+        assert sony['unrealized_pnl'] == -10000.0
+        assert sony['day_change'] == 0.0  # 前日終値なし
+        assert sony['day_change_pct'] is None
+
+        totals = result['totals']['JPY']
+        assert totals['market_value'] == 340000.0
+        assert totals['cost_basis'] == 300000.0
+        assert totals['unrealized_pnl'] == 40000.0
+        assert totals['priced_count'] == 2
+
+        sectors = {s['sector']: s for s in result['sectors']}
+        assert sectors['輸送用機器']['market_value'] == 250000.0
+        assert sectors['電気機器']['unrealized_pnl'] == -10000.0
+        # 時価の大きい順
+        assert [s['sector'] for s in result['sectors']] == ['輸送用機器', '電気機器']
+
+    def test_unquoted_position_falls_back_to_cost_basis(self):
+        result = ValuationService.value_positions([_position(1, '9999', '10', '500')], quotes={})
+        pos = result['positions'][1]
+        assert pos['priced'] is False
+        assert pos['market_value'] == 5000.0
+        assert pos['unrealized_pnl'] == 0.0
+        assert result['totals']['JPY']['priced_count'] == 0
+
+    def test_weight_is_per_group_and_currency(self):
+        quotes = {
+            s: {'symbol': s, 'price': Decimal('100'), 'previous_close': None,
+                'currency': 'JPY', 'fetched_at': None}
+            for s in ('1111', '2222', 'AAPL')
+        }
+        result = ValuationService.value_positions([
+            _position(1, '1111', '10', '100', group='a'),
+            _position(2, '2222', '30', '100', group='b'),
+            _position(3, 'AAPL', '5', '100', currency='USD', group='a'),
+        ], quotes=quotes)
+        assert result['positions'][1]['weight'] == 100.0
+        assert result['positions'][2]['weight'] == 100.0
+        assert result['positions'][3]['weight'] == 100.0
+        assert set(result['totals']) == {'JPY', 'USD'}
+
+    def test_empty_positions(self):
+        assert ValuationService.value_positions([]) == {'positions': {}, 'sectors': [], 'totals': {}}
+
+
+class TestQuoteCache:
+    def test_store_many_upserts_and_get_quotes_reads_in_one_query(self, django_assert_num_queries):
+        QuoteService.store('7203', 2500, previous_close=2400)
+        QuoteService.store_many([
+            {'symbol': '7203', 'price': 2600},
+            {'symbol': 'aapl', 'price': 190.5},
+            {'symbol': '6758', 'price': None},  # 不正値は無視
+        ])
+        assert StockQuote.objects.count() == 2
+
+        with django_assert_num_queries(1):
+            quotes = QuoteService.get_quotes(['7203', 'AAPL', '6758'])
+        assert quotes['7203']['price'] == Decimal('2600.0000')
+        assert quotes['AAPL']['currency'] == 'USD'
+        assert '6758' not in quotes
+
+    def test_valuation_uses_cached_quotes(self, user):
+        diary = _buy(user, '7203', '100', '2000')
+        QuoteService.store('7203', 2200, previous_close=2100)
+
+        result = ValuationService.value_diaries([diary])
+        pos = result['positions'][diary.id]
+        assert pos['priced'] is True
+        assert pos['unrealized_pnl'] == 20000.0
+        assert pos['day_change'] == 10000.0
+        assert pos['quoted_at'] is not None
+
+
+class TestValuationWiring:
+    def test_holdings_api_returns_market_valuation(self, settings, user):
+        settings.ANALYSIS_API_KEY = 'testkey'
+        diary = _buy(user, '7203', '100', '2000')
+        _buy(user, '6758', '10', '1000')
+        QuoteService.store('7203', 2500, previous_close=2500)
+
+        request = RequestFactory().get('/api/analysis/holdings/', HTTP_AUTHORIZATION='Bearer testkey')
+        body = json.loads(api_analysis.holdings(request).content)
+
+        rows = {h['symbol']: h for h in body['holdings']}
+        assert rows['7203']['market_value'] == 250000.0
+        assert rows['7203']['unrealized_pnl'] == 50000.0
+        assert rows['7203']['priced'] is True
+        assert rows['7203']['id'] == diary.id
+        assert rows['6758']['priced'] is False
+        assert body['totals']['JPY']['market_value'] == 260000.0
+        assert body['sectors'][0]['sector'] == '電気機器'
+
+    def test_dashboard_uses_market_value(self, authenticated_client, user):
+        _buy(user, '7203', '100', '2000')
+        QuoteService.store('7203', 3000)
+
+        response = authenticated_client.get(reverse('stockdiary:dashboard') + '?period=all')
+        assert response.status_code == 200
+        valuation = response.context['portfolio_valuation']
+        assert valuation['market_value'] == 300000.0
+        assert valuation['unrealized_pnl'] == 100000.0
+        # ROI も時価ベース: (0 + 300,000 - 200,000) / 200,000
+        assert response.context['total_roi'] == 50.0
+        content = response.content.decode()
+        assert '評価額（時価）' in content
+        assert '保有の業種構成' in content
+
+    def test_list_view_attaches_valuation(self, authenticated_client, user):
+        diary = _buy(user, '7203', '100', '2000')
+        QuoteService.store('7203', 1800)
+
+        response = authenticated_client.get(reverse('stockdiary:home'))
+        assert response.status_code == 200
+        shown = next(d for d in response.context['diaries'] if d.id == diary.id)
+        assert shown.valuation['unrealized_pnl'] == -20000.0
+        assert shown.valuation['weight'] == 100.0
+        assert '含み損益' in response.content.decode()
@@ -0,0 +1,250 @@
+"""XBRL ファクトストア（XBRLFact / xbrl_fact_store）のテスト。
+
+なぜこのテストがあるか:
+  XBRL 財務分析は書類ごとに ZIP を取得・解析するだけで、数値は CompanyFinancialData の
+  固定項目にしか残らず、複数年推移や企業横断の比較は書類の再解析が必要だった。
+  analyze_document で数値ファクト（要素 × コンテキスト）を XBRLFact に保存するようにしたので、
+  連結/個別・ディメンションの正規化、保存の冪等性、推移と期間分布の選び方
+  （要素の優先順・新しい書類・通期優先）を固定する。
+"""
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+
+import defusedxml.ElementTree as defused_ET
+import pytest
+
+from earnings_analysis.models import DocumentMetadata, XBRLFact
+from earnings_analysis.services.xbrl_extractor import XBRLFinancialExtractor
+from earnings_analysis.services.xbrl_fact_store import (
+    build_fact_insights,
+    company_series,
+    percentile_rank,
+    period_distribution,
+    save_document_facts,
+)
+
+FACT_DOC = b'''<?xml version="1.0" encoding="UTF-8"?>
+<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+            xmlns:xbrldi="http://xbrl.org/2006/xbrldi"
+            xmlns:iso4217="http://www.xbrl.org/2003/iso4217"
+            xmlns:jppfs_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jppfs/2023-12-01/jppfs_cor">
+  <xbrli:context id="CurrentYearDuration">
+    <xbrli:entity><xbrli:identifier scheme="x">E1</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2024-04-01</xbrli:startDate><xbrli:endDate>2025-03-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="CurrentYearDuration_NonConsolidatedMember">
+    <xbrli:entity><xbrli:identifier scheme="x">E1</xbrli:identifier>
+      <xbrli:segment><xbrldi:explicitMember dimension="jppfs_cor:ConsolidatedOrNonConsolidatedAxis">jppfs_cor:NonConsolidatedMember</xbrldi:explicitMember></xbrli:segment>
+    </xbrli:entity>
+    <xbrli:period><xbrli:startDate>2024-04-01</xbrli:startDate><xbrli:endDate>2025-03-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="CurrentYearDuration_SegAMember">
+    <xbrli:entity><xbrli:identifier scheme="x">E1</xbrli:identifier>
+      <xbrli:segment><xbrldi:explicitMember dimension="jpcrp_cor:OperatingSegmentsAxis">SegA</xbrldi:explicitMember></xbrli:segment>
+    </xbrli:entity>
+    <xbrli:period><xbrli:startDate>2024-04-01</xbrli:startDate><xbrli:endDate>2025-03-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="CurrentYearInstant">
+    <xbrli:entity><xbrli:identifier scheme="x">E1</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:instant>2025-03-31</xbrli:instant></xbrli:period>
+  </xbrli:context>
+  <xbrli:unit id="JPY"><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unit>
+  <jppfs_cor:NetSales contextRef="CurrentYearDuration" unitRef="JPY" decimals="-6">1200000000</jppfs_cor:NetSales>
+  <jppfs_cor:NetSales contextRef="CurrentYearDuration_NonConsolidatedMember" unitRef="JPY" decimals="-6">800000000</jppfs_cor:NetSales>
+  <jppfs_cor:NetSales contextRef="CurrentYearDuration_SegAMember" unitRef="JPY" decimals="-6">300000000</jppfs_cor:NetSales>
+  <jppfs_cor:Assets contextRef="CurrentYearInstant" unitRef="JPY" decimals="-6">5000000000</jppfs_cor:Assets>
+  <jppfs_cor:NetSales contextRef="CurrentYearDuration">&#x2014;</jppfs_cor:NetSales>
+</xbrli:xbrl>'''
+
+
+def make_document(doc_id, edinet_code='E02144', submitted=date(2025, 6, 20)):
+    return DocumentMetadata.objects.create(
+        doc_id=doc_id,
+        edinet_code=edinet_code,
+        securities_code='72030',
+        company_name='テスト株式会社',
+        ordinance_code='010',
+        form_code='030000',
+        doc_type_code='120',
+        submit_date_time=datetime.combine(submitted, datetime.min.time(), tzinfo=dt_timezone.utc),
+        file_date=submitted,
+        doc_description='有価証券報告書',
+        legal_status='1',
+        withdrawal_status='0',
+    )
+
+
+def fact(element, period_end, value, period_start=None, consolidated=True, dimensional=False,
+         context_ref=None):
+    return {
+        'element': element,
+        'context_ref': context_ref or f'{element}-{period_start}-{period_end}-{consolidated}-{dimensional}',
+        'period_start': period_start,
+        'period_end': period_end,
+        'is_instant': period_start is None,
+        'consolidated': consolidated,
+        'dimensional': dimensional,
+        'unit': 'JPY',
+        'scale': -6,
+        'value': Decimal(value),
+    }
+
+
+class TestCollectFacts:
+    def test_contexts_are_normalized(self):
+        extractor = XBRLFinancialExtractor()
+        facts = extractor.collect_facts(extractor.build_index(defused_ET.fromstring(FACT_DOC), keep_facts=True))
+        by_context = {(f['element'], f['context_ref']): f for f in facts}
+
+        consolidated = by_context[('NetSales', 'CurrentYearDuration')]
+        assert consolidated['value'] == Decimal('1200000000')
+        assert consolidated['consolidated'] is True
+        assert consolidated['dimensional'] is False
+        assert consolidated['period_start'] == '2024-04-01'
+        assert consolidated['period_end'] == '2025-03-31'
+        assert consolidated['unit'] == 'JPY'
+        assert consolidated['scale'] == -6
+
+        non_consolidated = by_context[('NetSales', 'CurrentYearDuration_NonConsolidatedMember')]
+        assert non_consolidated['consolidated'] is False
+        assert non_consolidated['dimensional'] is False
+
+        segment = by_context[('NetSales', 'CurrentYearDuration_SegAMember')]
+        assert segment['dimensional'] is True
+
+        assets = by_context[('Assets', 'CurrentYearInstant')]
+        assert assets['is_instant'] is True
+        assert assets['period_start'] is None
+
+        # unitRef の無い要素・数値でないテキストはファクトにしない
+        assert len(facts) == 4
+
+    def test_stream_index_collects_same_facts(self):
+        import io
+        extractor = XBRLFinancialExtractor()
+        dom = extractor.collect_facts(extractor.build_index(defused_ET.fromstring(FACT_DOC), keep_facts=True))
+        stream = extractor.collect_facts(extractor.build_stream_index(io.BytesIO(FACT_DOC), keep_facts=True))
+        assert stream == dom
+
+
+class TestSaveDocumentFacts:
+    def test_upsert_is_idempotent(self):
+        doc = make_document('S100FACT')
+        facts = [fact('NetSales', '2025-03-31', '100', period_start='2024-04-01')]
+
+        assert save_document_facts(doc, facts) == 1
+        facts[0]['value'] = Decimal('120')
+        assert save_document_facts(doc, facts) == 1
+
+        stored = XBRLFact.objects.get(document=doc)
+        assert stored.value == Decimal('120')
+        assert stored.edinet_code == 'E02144'
+        assert stored.period_end == date(2025, 3, 31)
+
+    def test_out_of_range_values_are_skipped(self):
+        doc = make_document('S100HUGE')
+        facts = [
+            fact('NetSales', '2025-03-31', '1e30', period_start='2024-04-01'),
+            fact('Assets', '2025-03-31', '500'),
+        ]
+        assert save_document_facts(doc, facts) == 1
+
+
+class TestQueries:
+    def test_series_prefers_priority_newer_document_and_full_year(self):
+        old = make_document('S100OLD', submitted=date(2024, 6, 20))
+        new = make_document('S100NEW', submitted=date(2025, 6, 20))
+        save_document_facts(old, [
+            fact('NetSales', '2024-03-31', '90', period_start='2023-04-01'),
+            fact('NetSales', '2023-03-31', '80', period_start='2022-04-01'),
+        ])
+        save_document_facts(new, [
+            fact('NetSales', '2025-03-31', '100', period_start='2024-04-01'),
+            # 訂正後の前期値（新しい書類を優先）
+            fact('NetSales', '2024-03-31', '95', period_start='2023-04-01'),
+            # 同じ期末の四半期値・下位候補・個別・セグメントは採らない
+            fact('NetSales', '2025-03-31', '30', period_start='2025-01-01'),
+            fact('Revenue', '2025-03-31', '999', period_start='2024-04-01'),
+            fact('NetSales', '2025-03-31', '70', period_start='2024-04-01', consolidated=False),
+            fact('NetSales', '2025-03-31', '10', period_start='2024-04-01', dimensional=True),
+        ])
+
+        series = company_series('E02144', 'net_sales')
+        assert [(s['period_end'], s['value']) for s in series] == [
+            (date(2023, 3, 31), Decimal('80')),
+            (date(2024, 3, 31), Decimal('95')),
+            (date(2025, 3, 31), Decimal('100')),
+        ]
+        assert len(company_series('E02144', 'net_sales', limit=2)) == 2
+
+        non_consolidated = company_series('E02144', 'net_sales', consolidated=False)
+        assert [s['value'] for s in non_consolidated] == [Decimal('70')]
+
+    def test_period_distribution_across_companies(self):
+        for i, (code, value) in enumerate([('E00001', '100'), ('E00002', '200'),
+                                            ('E00003', '300'), ('E00004', '400')]):
+            doc = make_document(f'S100D{i}', edinet_code=code)
+            # IFRS 企業は別要素名でも同じ指標として集計する
+            element = 'RevenueIFRS' if code == 'E00004' else 'NetSales'
+            save_document_facts(doc, [fact(element, '2025-03-31', value, period_start='2024-04-01')])
+
+        dist = period_distribution('net_sales', date(2025, 3, 31))
+        assert dist['sample_size'] == 4
+        assert dist['median'] == Decimal('250')
+        assert dist['p25'] == Decimal('175')
+        assert dist['p75'] == Decimal('325')
+        assert dist['values']['E00004'] == Decimal('400')
+
+        peers = period_distribution('net_sales', date(2025, 3, 31), edinet_codes=['E00001', 'E00002'])
+        assert peers['sample_size'] == 2
+        assert period_distribution('net_sales', date(2024, 3, 31))['sample_size'] == 0
+
+    def test_percentile_rank(self):
+        assert percentile_rank(300, [100, 200, 300, 400]) == 62.5
+        assert percentile_rank(None, [1]) is None
+        assert percentile_rank(1, []) is None
+
+    def test_build_fact_insights(self):
+        mine = make_document('S100MINE', edinet_code='E00001')
+        other = make_document('S100OTHR', edinet_code='E00002')
+        save_document_facts(mine, [
+            fact('NetSales', '2024-03-31', '90', period_start='2023-04-01'),
+            fact('NetSales', '2025-03-31', '100', period_start='2024-04-01'),
+        ])
+        save_document_facts(other, [fact('NetSales', '2025-03-31', '300', period_start='2024-04-01')])
+
+        insights = build_fact_insights(mine)
+        assert list(insights) == ['net_sales']
+        net_sales = insights['net_sales']
+        assert net_sales['series'] == [
+            {'period_end': '2024-03-31', 'value': 90.0},
+            {'period_end': '2025-03-31', 'value': 100.0},
+        ]
+        assert net_sales['peers']['sample_size'] == 2
+        assert net_sales['peers']['median'] == 200.0
+        assert net_sales['peers']['percentile'] == 25.0
+
+
+class TestAnalyzeDocumentPersistsFacts:
+    def test_facts_saved_and_insights_returned(self, monkeypatch):
+        from earnings_analysis.services.xbrl_analysis_service import XBRLAnalysisService
+
+        def _fake(self, document):
+            return {
+                'financial_data': {'net_sales': Decimal('100'), 'total_assets': Decimal('500')},
+                'text_sections': {},
+                'facts': [
+                    fact('NetSales', '2025-03-31', '100', period_start='2024-04-01'),
+                    fact('Assets', '2025-03-31', '500'),
+                ],
+            }
+        monkeypatch.setattr(
+            'earnings_analysis.services.xbrl_extractor.EDINETXBRLService.get_comprehensive_analysis_from_document',
+            _fake,
+        )
+        doc = make_document('S100ANLZ')
+        result = XBRLAnalysisService().analyze_document(doc)
+
+        assert result['ok'] is True
+        assert XBRLFact.objects.filter(document=doc).count() == 2
+        assert result['fact_insights']['net_sales']['series'][-1]['value'] == 100.0
@@ -0,0 +1,225 @@
+"""XBRL 要素インデックス（XBRLElementIndex）のテスト。
+
+なぜこのテストがあるか:
+  XBRLFinancialExtractor / CashFlowExtractor は、パターンごとに root.iter() と
+  名前空間ごとの findall で全要素を走査していた（パターン数 × 要素数）。文書を1回だけ
+  走査するインデックスに置き換えたので、検索結果（順序・重複除去を含む）が従来の
+  走査と一致すること、context / unit / decimals の解析、実サイズの書類での速度を固定する。
+  大きな書類向けの iterparse 版（from_stream）は、ツリー全体版と抽出結果が同一であることと、
+  ピークメモリが文書サイズに比例しないことを固定する。
+"""
+import io
+import time
+import tracemalloc
+import zipfile
+from decimal import Decimal
+
+import defusedxml.ElementTree as defused_ET
+import pytest
+
+from earnings_analysis.services.xbrl_extractor import CashFlowExtractor, XBRLFinancialExtractor
+from earnings_analysis.services.xbrl_index import XBRLElementIndex
+from tests.fixtures.edinet_sample import build_instance_document
+
+SMALL_DOC = b'''<?xml version="1.0" encoding="UTF-8"?>
+<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+            xmlns:xbrldi="http://xbrl.org/2006/xbrldi"
+            xmlns:jppfs_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jppfs/2023-12-01/jppfs_cor">
+  <xbrli:context id="CurrentYearDuration">
+    <xbrli:entity><xbrli:identifier scheme="x">E1</xbrli:identifier></xbrli:entity>
+    <xbrli:period><xbrli:startDate>2024-04-01</xbrli:startDate><xbrli:endDate>2025-03-31</xbrli:endDate></xbrli:period>
+  </xbrli:context>
+  <xbrli:context id="CurrentYearInstant_SegA">
+    <xbrli:entity><xbrli:identifier scheme="x">E1</xbrli:identifier>
+      <xbrli:segment><xbrldi:explicitMember dimension="jpcrp_cor:OperatingSegmentsAxis">SegA</xbrldi:explicitMember></xbrli:segment>
+    </xbrli:entity>
+    <xbrli:period><xbrli:instant>2025-03-31</xbrli:instant></xbrli:period>
+  </xbrli:context>
+  <xbrli:unit id="JPY"><xbrli:measure>iso4217:JPY</xbrli:measure></xbrli:unit>
+  <jppfs_cor:NetSales contextRef="CurrentYearDuration" unitRef="JPY" decimals="-6">1200</jppfs_cor:NetSales>
+  <jppfs_cor:TotalAssets contextRef="CurrentYearInstant_SegA" unitRef="JPY" decimals="-6">5000</jppfs_cor:TotalAssets>
+  <jppfs_cor:NetSales contextRef="CurrentYearInstant_SegA" unitRef="JPY" decimals="-6">1200</jppfs_cor:NetSales>
+</xbrli:xbrl>'''
+
+
+# ---- 従来実装（パターンごとの全走査）: 結果一致の基準とベンチマークの比較対象 ----
+
+NAMESPACES = XBRLFinancialExtractor().namespaces
+
+
+def legacy_find(root, pattern):
+    elements = [elem for elem in root.iter() if pattern in elem.tag]
+    for ns_uri in NAMESPACES.values():
+        elements.extend(root.findall(f".//{{{ns_uri}}}{pattern}"))
+    return list({(elem.tag, elem.text): elem for elem in elements}.values())
+
+
+def legacy_find_tag_or_text(root, pattern):
+    elements = [elem for elem in root.iter()
+                if pattern in elem.tag or (elem.text and pattern in elem.text)]
+    for ns_uri in NAMESPACES.values():
+        elements.extend(root.findall(f".//{{{ns_uri}}}{pattern}"))
+    return list({(elem.tag, elem.text): elem for elem in elements}.values())
+
+
+def all_patterns(extractor):
+    return (
+        extractor.text_element_patterns
+        + [p for ps in extractor.financial_elements.values() for p in ps]
+        + [p for ps in CashFlowExtractor().cashflow_elements.values() for p in ps]
+    )
+
+
+class TestXBRLElementIndex:
+    def test_contexts_units_and_facts(self):
+        index = XBRLElementIndex(defused_ET.fromstring(SMALL_DOC))
+
+        assert index.contexts['CurrentYearDuration']['period_end'] == '2025-03-31'
+        seg = index.contexts['CurrentYearInstant_SegA']
+        assert seg['instant'] == '2025-03-31'
+        assert seg['dimensions'] == {'jpcrp_cor:OperatingSegmentsAxis': 'SegA'}
+        assert index.units['JPY'] == 'JPY'
+
+        facts = index.facts('NetSales')
+        assert [f['context_ref'] for f in facts] == ['CurrentYearDuration', 'CurrentYearInstant_SegA']
+        assert facts[0]['decimals'] == '-6'
+        assert facts[0]['unit'] == 'JPY'
+        assert facts[0]['context']['start'] == '2024-04-01'
+
+    def test_find_matches_legacy_walk(self):
+        extractor = XBRLFinancialExtractor()
+        root = defused_ET.fromstring(build_instance_document(facts=300, contexts=20, text_blocks=8, text_kb=2))
+        index = extractor.build_index(root)
+
+        for pattern in all_patterns(extractor):
+            assert index.find(pattern) == legacy_find(root, pattern), pattern
+            assert index.find_tag_or_text(pattern) == legacy_find_tag_or_text(root, pattern), pattern
+
+    def test_comprehensive_extraction_on_sample(self):
+        data = XBRLFinancialExtractor()._extract_comprehensive_from_xml(build_instance_document(
+            facts=300, contexts=20, text_blocks=8, text_kb=2,
+        ))
+        financial = data['financial_data']
+        assert financial['operating_cf'] == Decimal('320000000000')
+        assert financial['investing_cf'] == Decimal('-150000000000')
+        assert len(data['text_sections']) == 8
+
+
+@pytest.mark.slow
+class TestXBRLIndexBenchmark:
+    """実サイズ（約2.7MB・数値ファクト4千件）の書類での検索コスト比較"""
+
+    def test_index_is_faster_than_per_pattern_walk(self):
+        extractor = XBRLFinancialExtractor()
+        root = defused_ET.fromstring(build_instance_document())
+        patterns = all_patterns(extractor)
+
+        started = time.perf_counter()
+        legacy = [legacy_find(root, p) for p in patterns]
+        legacy_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index = extractor.build_index(root)
+        indexed = [index.find(p) for p in patterns]
+        index_seconds = time.perf_counter() - started
+
+        print(f"\nXBRL検索 {len(patterns)}パターン / {index.element_count}要素: "
+              f"従来 {legacy_seconds:.3f}s → インデックス {index_seconds:.3f}s")
+        assert indexed == legacy
+        assert index_seconds * 3 < legacy_seconds
+
+
+def _zip_of(xml_bytes, name='XBRL/PublicDoc/jpcrp030000-asr-001.xbrl'):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(name, xml_bytes)
+    return buf.getvalue()
+
+
+class TestStreamingIndex:
+    """iterparse によるストリーミング抽出（大きなインスタンス文書向け）"""
+
+    NESTED_DOC = ('''<?xml version="1.0" encoding="UTF-8"?>
+<xbrli:xbrl xmlns:xbrli="http://www.xbrl.org/2003/instance"
+            xmlns:jpcrp_cor="http://disclosure.edinet-fsa.go.jp/taxonomy/jpcrp/2023-12-01/jpcrp_cor">
+  <jpcrp_cor:Wrapper>
+    <jpcrp_cor:BusinessRisksTextBlock contextRef="C">
+      <jpcrp_cor:Para>''' + '事業等のリスクについて記載します。' * 10 + '''</jpcrp_cor:Para>
+      <jpcrp_cor:Para>NetSales declined</jpcrp_cor:Para>
+    </jpcrp_cor:BusinessRisksTextBlock>
+  </jpcrp_cor:Wrapper>
+  <jpcrp_cor:Note>営業活動によるキャッシュ・フローは 1,200 百万円</jpcrp_cor:Note>
+</xbrli:xbrl>''').encode('utf-8')
+
+    def _both(self, xml_bytes):
+        extractor = XBRLFinancialExtractor()
+        dom = extractor.build_index(defused_ET.fromstring(xml_bytes))
+        stream = extractor.build_stream_index(io.BytesIO(xml_bytes))
+        return extractor, dom, stream
+
+    @pytest.mark.parametrize('doc', ['nested', 'sample'])
+    def test_lookups_match_full_tree(self, doc):
+        xml_bytes = self.NESTED_DOC if doc == 'nested' else build_instance_document(
+            facts=300, contexts=20, text_blocks=24, text_kb=2,
+        )
+        extractor, dom, stream = self._both(xml_bytes)
+
+        for pattern in all_patterns(extractor):
+            assert [e.tag for e in stream.find(pattern)] == [e.tag for e in dom.find(pattern)], pattern
+            assert [(e.tag, e.text) for e in stream.find_tag_or_text(pattern)] == \
+                   [(e.tag, e.text) for e in dom.find_tag_or_text(pattern)], pattern
+        assert stream.contexts == dom.contexts
+        assert stream.units == dom.units
+        assert extractor._extract_text_from_index(stream) == extractor._extract_text_from_index(dom)
+
+    def test_streaming_zip_extraction_is_identical(self):
+        zip_bytes = _zip_of(build_instance_document(facts=300, contexts=20, text_blocks=24, text_kb=4))
+
+        streamed = XBRLFinancialExtractor(streaming=True)._extract_comprehensive_from_zip(zip_bytes)
+        full = XBRLFinancialExtractor(streaming=False)._extract_comprehensive_from_zip(zip_bytes)
+        assert streamed == full
+        assert streamed['financial_data']['operating_cf'] == Decimal('320000000000')
+
+        assert XBRLFinancialExtractor(streaming=True)._extract_from_zip(zip_bytes) == \
+               XBRLFinancialExtractor(streaming=False)._extract_from_zip(zip_bytes)
+
+    def test_auto_mode_streams_only_large_members(self, monkeypatch):
+        zip_bytes = _zip_of(build_instance_document(facts=50, contexts=5, text_blocks=2, text_kb=1))
+        extractor = XBRLFinancialExtractor()
+        calls = []
+        monkeypatch.setattr(extractor, 'build_stream_index', lambda stream, **kwargs: calls.append(1) or
+                            XBRLFinancialExtractor.build_stream_index(extractor, stream, **kwargs))
+
+        extractor._extract_comprehensive_from_zip(zip_bytes)
+        assert calls == []
+        monkeypatch.setattr(XBRLFinancialExtractor, 'STREAMING_THRESHOLD_BYTES', 1)
+        extractor._extract_comprehensive_from_zip(zip_bytes)
+        assert calls == [1]
+
+    @pytest.mark.slow
+    def test_peak_memory_is_bounded(self):
+        """文書を大きくしてもストリーミング時のピークメモリはほぼ増えない"""
+        def peak(build):
+            tracemalloc.start()
+            try:
+                build()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        extractor = XBRLFinancialExtractor()
+        peaks = {}
+        for facts in (4000, 16000):
+            xml_bytes = build_instance_document(facts=facts, contexts=300, text_blocks=48, text_kb=20)
+            # 入力バイト列そのものは計測対象外（ZIP メンバーのストリームを模す）
+            peaks[facts] = (
+                peak(lambda: extractor.build_stream_index(io.BytesIO(xml_bytes))),
+                peak(lambda: extractor.build_index(defused_ET.fromstring(xml_bytes))),
+            )
+
+        small_stream, small_full = peaks[4000]
+        large_stream, large_full = peaks[16000]
+        print(f"\nピークメモリ 4千件: stream {small_stream / 1e6:.1f}MB / full {small_full / 1e6:.1f}MB, "
+              f"1.6万件: stream {large_stream / 1e6:.1f}MB / full {large_full / 1e6:.1f}MB")
+        assert large_stream < large_full / 3
+        assert large_stream < small_stream * 1.5